@@ -185,18 +185,76 @@ module SampleService {
         as_user - create the sample as a different user. Ignored if as_admin is not true. Neither
             the administrator nor the impersonated user need have permissions to the sample if a
             new version is saved.
+        skip_if_unchanged - if Sample.id is not null and the sample name and nodes are the same
+            as the latest version of the sample, do not save a new version and return the
+            address of the latest version. If prior_version is also supplied it must be the
+            latest version, or the save proceeds as normal.
      */
     typedef structure {
         Sample sample;
         int prior_version;
         boolean as_admin;
         user as_user;
+        boolean skip_if_unchanged;
     } CreateSampleParams;
 
     /* Create a new sample or a sample version. */
     funcdef create_sample(CreateSampleParams params) returns(SampleAddress address)
         authentication required;
 
+    /* A sample to save as part of a create_samples call.
+
+        sample - the sample to save.
+        prior_version - as for the create_sample method.
+     */
+    typedef structure {
+        Sample sample;
+        int prior_version;
+    } SampleToSave;
+
+    /* create_samples parameters.
+
+        samples - the samples to save. The rules for each sample are the same as for
+            create_sample. A sample ID may occur at most once.
+        as_admin - run the method as a service administrator. The user must have full
+            administration permissions.
+        as_user - create the samples as a different user. Ignored if as_admin is not true. Neither
+            the administrator nor the impersonated user need have permissions to the samples if
+            new versions are saved.
+     */
+    typedef structure {
+        list<SampleToSave> samples;
+        boolean as_admin;
+        user as_user;
+    } CreateSamplesParams;
+
+    /* The result of saving one sample in a create_samples call.
+
+        id - the ID of the sample.
+        version - the version of the sample, or null if the sample failed to save.
+        error - the reason the sample failed to save, or null if the sample saved successfully.
+     */
+    typedef structure {
+        sample_id id;
+        version version;
+        string error;
+    } CreateSamplesResult;
+
+    /* create_samples results.
+
+        results - the result for each sample, in the same order as the input samples.
+     */
+    typedef structure {
+        list<CreateSamplesResult> results;
+    } CreateSamplesResults;
+
+    /* Create many new samples and / or sample versions in one call.
+        All the samples are validated before any are saved; if any sample is invalid no samples
+        are saved. Permission, concurrency, and missing sample errors are reported per sample.
+     */
+    funcdef create_samples(CreateSamplesParams params) returns(CreateSamplesResults results)
+        authentication required;
+
     /* get_sample parameters.
         id - the ID of the sample to retrieve.
         version - the version of the sample to retrieve, or the most recent sample if omitted.
@@ -417,6 +475,70 @@ module SampleService {
     funcdef create_data_link(CreateDataLinkParams params) returns(CreateDataLinkResults results)
         authentication required;
 
+    /* A link to create as part of a create_data_links call.
+
+        upa - the workspace UPA of the object to be linked.
+        dataid - the dataid of the data to be linked, if any, within the object. If omitted the
+            entire object is linked to the sample.
+        id - the sample id.
+        version - the sample version.
+        node - the sample node.
+     */
+    typedef structure {
+        ws_upa upa;
+        data_id dataid;
+        sample_id id;
+        version version;
+        node_id node;
+    } DataLinkToCreate;
+
+    /* create_data_links parameters.
+
+        links - the links to create. Each data unit (the combination of the UPA and dataid) may
+            occur only once.
+        update - if false (the default), fail if a link already exists from any of the data
+            units. if true, expire the old links and create the new links, with the same semantics
+            as create_data_link.
+        as_admin - run the method as a service administrator. The user must have full
+            administration permissions.
+        as_user - create the links as a different user. Ignored if as_admin is not true. Neither
+            the administrator nor the impersonated user need have permissions to the data or
+            samples.
+     */
+    typedef structure {
+        list<DataLinkToCreate> links;
+        boolean update;
+        boolean as_admin;
+        user as_user;
+    } CreateDataLinksParams;
+
+    /* The result of creating a single link in a create_data_links call.
+
+        new_link - the new link.
+        expired_link_id - the ID of the link that was expired as part of the update, if any.
+     */
+    typedef structure {
+        DataLink new_link;
+        link_id expired_link_id;
+    } CreateDataLinksResult;
+
+    /* create_data_links results.
+
+        results - the results for each link, in the same order as the input.
+     */
+    typedef structure {
+        list<CreateDataLinksResult> results;
+    } CreateDataLinksResults;
+
+    /* Create many links from KBase Workspace objects to samples.
+
+        The permission requirements are the same as for create_data_link.
+        The links are created in a single database transaction. If any link cannot be created,
+        no links are created.
+     */
+    funcdef create_data_links(CreateDataLinksParams params)
+        returns(CreateDataLinksResults results) authentication required;
+
     /* propagate_data_links parameters.
 
         id - the sample id.
@@ -493,6 +615,10 @@ module SampleService {
         version - the sample version.
         effective_time - the effective time at which the query should be run - the default is
             the current time. Providing a time allows for reproducibility of previous results.
+        limit - the maximum number of links to return. If omitted all the links are returned.
+        resume_token - the resume_token returned with the prior page of links, if any, to get
+            the next page. The effective_time of the prior page is used, and if effective_time
+            is also provided it must match.
         as_admin - run the method as a service administrator. The user must have read
             administration permissions.
     */
@@ -500,6 +626,8 @@ module SampleService {
         sample_id id;
         version version;
         timestamp effective_time;
+        int limit;
+        string resume_token;
         boolean as_admin;
     } GetDataLinksFromSampleParams;
 
@@ -509,10 +637,13 @@ module SampleService {
         effective_time - the time at which the query was run. This timestamp, if saved, can be
             used when running the method again to ensure reproducible results. Note that changes
             to workspace permissions may cause results to change over time.
+        resume_token - if a limit was provided, a token to pass to the method to get the next
+            page of links, or null if there are no more links. The next page may be empty.
     */
     typedef structure {
         list<DataLink> links;
         timestamp effective_time;
+        string resume_token;
     } GetDataLinksFromSampleResults;
 
     /* Get data links to Workspace objects originating from a sample.
@@ -528,6 +659,10 @@ module SampleService {
         effective_time - the time at which the query was run. This timestamp, if saved, can be
             used when running the method again to enqure reproducible results. Note that changes
             to workspace permissions may cause results to change over time.
+        limit - the maximum number of links to return. If omitted all the links are returned.
+        resume_token - the resume_token returned with the prior page of links, if any, to get
+            the next page. The effective_time of the prior page is used, and if effective_time
+            is also provided it must match.
         as_admin - run the method as a service administrator. The user must have read
             administration permissions.
     */
@@ -535,6 +670,8 @@ module SampleService {
     typedef structure {
         list<SampleIdentifier> sample_ids;
         timestamp effective_time;
+        int limit;
+        string resume_token;
         boolean as_admin;
     } GetDataLinksFromSampleSetParams;
 
@@ -553,12 +690,18 @@ module SampleService {
         upa - the data UPA.
         effective_time - the effective time at which the query should be run - the default is
             the current time. Providing a time allows for reproducibility of previous results.
+        limit - the maximum number of links to return. If omitted all the links are returned.
+        resume_token - the resume_token returned with the prior page of links, if any, to get
+            the next page. The effective_time of the prior page is used, and if effective_time
+            is also provided it must match.
         as_admin - run the method as a service administrator. The user must have read
             administration permissions.
     */
     typedef structure {
         ws_upa upa;
         timestamp effective_time;
+        int limit;
+        string resume_token;
         boolean as_admin;
     } GetDataLinksFromDataParams;
 
@@ -567,10 +710,13 @@ module SampleService {
         links - the links.
         effective_time - the time at which the query was run. This timestamp, if saved, can be
             used when running the method again to ensure reproducible results.
+        resume_token - if a limit was provided, a token to pass to the method to get the next
+            page of links, or null if there are no more links. The next page may be empty.
     */
     typedef structure {
         list<DataLink> links;
         timestamp effective_time;
+        string resume_token;
     } GetDataLinksFromDataResults;
 
     /* Get data links to samples originating from Workspace data.
@@ -580,6 +726,49 @@ module SampleService {
     funcdef get_data_links_from_data(GetDataLinksFromDataParams params)
         returns(GetDataLinksFromDataResults results) authentication optional;
 
+    /* get_data_link_history parameters.
+
+        id - the sample ID. Links from any version of the sample are returned.
+        upa - the workspace UPA. Links from the object version are returned.
+        dataid - the dataid of the data unit within the object. Requires upa.
+        At least one of id or upa is required. If both are provided only links between the sample
+            and the object are returned.
+        limit - the maximum number of links to return. If omitted all the links are returned.
+        resume_token - the resume_token returned with the prior page of links, if any, to get
+            the next page.
+        as_admin - run the method as a service administrator. The user must have read
+            administration permissions.
+     */
+    typedef structure {
+        sample_id id;
+        ws_upa upa;
+        data_id dataid;
+        int limit;
+        string resume_token;
+        boolean as_admin;
+    } GetDataLinkHistoryParams;
+
+    /* get_data_link_history results.
+
+        links - the links, sorted by creation time and then link ID.
+        resume_token - if a limit was provided, a token to pass to the method to get the next page
+            of links, or null if there are no more links. The next page may be empty.
+     */
+    typedef structure {
+        list<DataLink> links;
+        string resume_token;
+    } GetDataLinkHistoryResults;
+
+    /* Get the history of the data links from a sample, a workspace object, or a data unit - all
+        the links ever created, expired or not.
+
+        If an upa is provided the user must have read permissions to the workspace object.
+        Otherwise the user must have read permissions to the sample, and only links to
+        workspace objects the user can read are returned.
+     */
+    funcdef get_data_link_history(GetDataLinkHistoryParams params)
+        returns(GetDataLinkHistoryResults results) authentication optional;
+
     /* get_sample_via_data parameters.
 
         upa - the workspace UPA of the target object.
@@ -144,6 +144,42 @@ class SampleService(object):
         return self._client.call_method('SampleService.create_sample',
                                         [params], self._service_ver, context)
 
+    def create_samples(self, params, context=None):
+        """
+        Create many new samples and / or sample versions in one call.
+        All the samples are validated before any are saved; if any sample is invalid no samples
+        are saved. Permission, concurrency, and missing sample errors are reported per sample.
+        :param params: instance of type "CreateSamplesParams" (create_samples
+           parameters. samples - the samples to save. The rules for each
+           sample are the same as for create_sample. A sample ID may occur at
+           most once. as_admin - run the method as a service administrator.
+           The user must have full administration permissions. as_user -
+           create the samples as a different user. Ignored if as_admin is not
+           true. Neither the administrator nor the impersonated user need
+           have permissions to the samples if new versions are saved.) ->
+           structure: parameter "samples" of list of type "SampleToSave" (A
+           sample to save as part of a create_samples call. sample - the
+           sample to save. prior_version - as for the create_sample method.)
+           -> structure: parameter "sample" of type "Sample" (A Sample, a
+           tree of SampleNodes. See create_sample.), parameter
+           "prior_version" of Long, parameter "as_admin" of type "boolean" (A
+           boolean value, 0 for false, 1 for true.), parameter "as_user" of
+           type "user" (A user's username.)
+        :returns: instance of type "CreateSamplesResults" (create_samples
+           results. results - the result for each sample, in the same order
+           as the input samples.) -> structure: parameter "results" of list
+           of type "CreateSamplesResult" (The result of saving one sample in
+           a create_samples call. id - the ID of the sample. version - the
+           version of the sample, or null if the sample failed to save. error
+           - the reason the sample failed to save, or null if the sample
+           saved successfully.) -> structure: parameter "id" of type
+           "sample_id" (A Sample ID. Must be globally unique. Always assigned
+           by the Sample service.), parameter "version" of type "version"
+           (The version of a sample. Always > 0.), parameter "error" of String
+        """
+        return self._client.call_method('SampleService.create_samples',
+                                        [params], self._service_ver, context)
+
     def get_sample(self, params, context=None):
         """
         Get a sample. If the version is omitted the most recent sample is returned.
@@ -547,6 +583,59 @@ class SampleService(object):
         return self._client.call_method('SampleService.create_data_link',
                                         [params], self._service_ver, context)
 
+    def create_data_links(self, params, context=None):
+        """
+        Create many links from KBase Workspace objects to samples.
+                The permission requirements are the same as for create_data_link.
+                The links are created in a single database transaction. If any link cannot be
+                created, no links are created.
+        :param params: instance of type "CreateDataLinksParams"
+           (create_data_links parameters. links - the links to create. Each
+           data unit (the combination of the UPA and dataid) may occur only
+           once. update - if false (the default), fail if a link already
+           exists from any of the data units. if true, expire the old links
+           and create the new links, with the same semantics as
+           create_data_link. as_admin - run the method as a service
+           administrator. The user must have full administration
+           permissions. as_user - create the links as a different user.
+           Ignored if as_admin is not true. Neither the administrator nor the
+           impersonated user need have permissions to the data or samples.)
+           -> structure: parameter "links" of list of type "DataLinkToCreate"
+           (A link to create as part of a create_data_links call. upa - the
+           workspace UPA of the object to be linked. dataid - the dataid of
+           the data to be linked, if any, within the object. If omitted the
+           entire object is linked to the sample. id - the sample id. version
+           - the sample version. node - the sample node.) -> structure:
+           parameter "upa" of type "ws_upa" (A KBase Workspace service Unique
+           Permanent Address (UPA). E.g. 5/6/7 where 5 is the workspace ID, 6
+           the object ID, and 7 the object version.), parameter "dataid" of
+           type "data_id" (An id for a unit of data within a KBase Workspace
+           object. A single object may contain many data units. A dataid is
+           expected to be unique within a single object. Must be less than
+           255 characters.), parameter "id" of type "sample_id" (A Sample ID.
+           Must be globally unique. Always assigned by the Sample service.),
+           parameter "version" of type "version" (The version of a sample.
+           Always > 0.), parameter "node" of type "node_id" (A SampleNode ID.
+           Must be unique within a Sample and be less than 255 characters.),
+           parameter "update" of type "boolean" (A boolean value, 0 for
+           false, 1 for true.), parameter "as_admin" of type "boolean" (A
+           boolean value, 0 for false, 1 for true.), parameter "as_user" of
+           type "user" (A user's username.)
+        :returns: instance of type "CreateDataLinksResults"
+           (create_data_links results. results - the results for each link,
+           in the same order as the input.) -> structure: parameter "results"
+           of list of type "CreateDataLinksResult" (The result of creating a
+           single link in a create_data_links call. new_link - the new link.
+           expired_link_id - the ID of the link that was expired as part of
+           the update, if any.) -> structure: parameter "new_link" of type
+           "DataLink" (A data link from a KBase workspace object to a sample.
+           See create_data_link.), parameter "expired_link_id" of type
+           "link_id" (A link ID. Must be globally unique. Always assigned by
+           the Sample service. Typically only of use to service admins.)
+        """
+        return self._client.call_method('SampleService.create_data_links',
+                                        [params], self._service_ver, context)
+
     def propagate_data_links(self, params, context=None):
         """
         Propagates data links from a previous sample to the current (latest) version
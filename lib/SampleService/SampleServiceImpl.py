@@ -12,13 +12,23 @@ from SampleService.core.api_translation import acls_from_dict as _acls_from_dict
 from SampleService.core.api_translation import acls_to_dict as _acls_to_dict
 from SampleService.core.api_translation import sample_to_dict as _sample_to_dict
 from SampleService.core.api_translation import create_sample_params as _create_sample_params
+from SampleService.core.api_translation import create_samples_params as _create_samples_params
+from SampleService.core.api_translation import (create_samples_results_to_dicts as
+                                                _create_samples_results_to_dicts)
 from SampleService.core.api_translation import validate_samples_params as _validate_samples_params
 from SampleService.core.api_translation import check_admin as _check_admin
 from SampleService.core.api_translation import (
     get_static_key_metadata_params as _get_static_key_metadata_params,
     create_data_link_params as _create_data_link_params,
-    get_datetime_from_epochmilliseconds_in_object as _get_datetime_from_epochmillseconds_in_object,
+    create_data_links_params as _create_data_links_params,
+    create_data_links_results_to_dicts as _create_data_links_results_to_dicts,
+    consistency_checker_status_to_dict as _consistency_checker_status_to_dict,
     links_to_dicts as _links_to_dicts,
+    stream_links_to_dicts as _stream_links_to_dicts,
+    get_link_page_params as _get_link_page_params,
+    link_resume_token as _link_resume_token,
+    get_link_history_params as _get_link_history_params,
+    link_history_resume_token as _link_history_resume_token,
     get_upa_from_object as _get_upa_from_object,
     get_data_unit_id_from_object as _get_data_unit_id_from_object,
     get_admin_request_from_object as _get_admin_request_from_object,
@@ -89,11 +99,15 @@ Note that usage of the administration flags will be logged by the service.
            administration permissions. as_user - create the sample as a
            different user. Ignored if as_admin is not true. Neither the
            administrator nor the impersonated user need have permissions to
-           the sample if a new version is saved.) -> structure: parameter
-           "sample" of type "Sample" (A Sample, consisting of a tree of
-           subsamples and replicates. id - the ID of the sample. user - the
-           user that saved the sample. node_tree - the tree(s) of sample
-           nodes in the sample. The the roots of all trees must be
+           the sample if a new version is saved. skip_if_unchanged - if
+           Sample.id is not null and the sample name and nodes are the same
+           as the latest version of the sample, do not save a new version and
+           return the address of the latest version. If prior_version is also
+           supplied it must be the latest version, or the save proceeds as
+           normal.) -> structure: parameter "sample" of type "Sample" (A
+           Sample, consisting of a tree of subsamples and replicates. id -
+           the ID of the sample. user - the user that saved the sample.
+           node_tree - the tree(s) of sample nodes in the sample. The the roots of all trees must be
            BioReplicate nodes. All the BioReplicate nodes must be at the
            start of the list, and all child nodes must occur after their
            parents in the list. name - the name of the sample. Must be less
@@ -171,7 +185,8 @@ Note that usage of the administration flags will be logged by the service.
            "version" (The version of a sample. Always > 0.), parameter
            "prior_version" of Long, parameter "as_admin" of type "boolean" (A
            boolean value, 0 for false, 1 for true.), parameter "as_user" of
-           type "user" (A user's username.)
+           type "user" (A user's username.), parameter "skip_if_unchanged" of
+           type "boolean" (A boolean value, 0 for false, 1 for true.)
         :returns: instance of type "SampleAddress" (A Sample ID and version.
            id - the ID of the sample. version - the version of the sample.)
            -> structure: parameter "id" of type "sample_id" (A Sample ID.
@@ -189,7 +204,8 @@ Note that usage of the administration flags will be logged by the service.
             # pretty annoying to test ctx.log_info is working, do it manually
             'create_sample', ctx.log_info, as_user=user, skip_check=not as_admin)
         ret = self._samples.save_sample(
-            sample, user if user else _UserID(ctx[_CTX_USER]), id_, prev_ver, as_admin=as_admin)
+            sample, user if user else _UserID(ctx[_CTX_USER]), id_, prev_ver, as_admin=as_admin,
+            skip_if_unchanged=bool(params.get('skip_if_unchanged')))
         address = {'id': str(ret[0]), 'version': ret[1]}
         #END create_sample
 
@@ -200,6 +216,60 @@ Note that usage of the administration flags will be logged by the service.
         # return the results
         return [address]
 
+    def create_samples(self, ctx, params):
+        """
+        Create many new samples and / or sample versions in one call.
+        All the samples are validated before any are saved; if any sample is invalid no samples
+        are saved. Permission, concurrency, and missing sample errors are reported per sample.
+        :param params: instance of type "CreateSamplesParams" (create_samples
+           parameters. samples - the samples to save. The rules for each
+           sample are the same as for create_sample. A sample ID may occur at
+           most once. as_admin - run the method as a service administrator.
+           The user must have full administration permissions. as_user -
+           create the samples as a different user. Ignored if as_admin is not
+           true. Neither the administrator nor the impersonated user need
+           have permissions to the samples if new versions are saved.) ->
+           structure: parameter "samples" of list of type "SampleToSave" (A
+           sample to save as part of a create_samples call. sample - the
+           sample to save. prior_version - as for the create_sample method.)
+           -> structure: parameter "sample" of type "Sample" (A Sample, a
+           tree of SampleNodes. See create_sample.), parameter
+           "prior_version" of Long, parameter "as_admin" of type "boolean" (A
+           boolean value, 0 for false, 1 for true.), parameter "as_user" of
+           type "user" (A user's username.)
+        :returns: instance of type "CreateSamplesResults" (create_samples
+           results. results - the result for each sample, in the same order
+           as the input samples.) -> structure: parameter "results" of list
+           of type "CreateSamplesResult" (The result of saving one sample in
+           a create_samples call. id - the ID of the sample. version - the
+           version of the sample, or null if the sample failed to save. error
+           - the reason the sample failed to save, or null if the sample
+           saved successfully.) -> structure: parameter "id" of type
+           "sample_id" (A Sample ID. Must be globally unique. Always assigned
+           by the Sample service.), parameter "version" of type "version"
+           (The version of a sample. Always > 0.), parameter "error" of String
+        """
+        # ctx is the context object
+        # return variables are: results
+        #BEGIN create_samples
+        samples = _create_samples_params(params)
+        as_admin, user = _get_admin_request_from_object(params, 'as_admin', 'as_user')
+        _check_admin(
+            self._user_lookup, ctx[_CTX_TOKEN], _AdminPermission.FULL,
+            # pretty annoying to test ctx.log_info is working, do it manually
+            'create_samples', ctx.log_info, as_user=user, skip_check=not as_admin)
+        ret = self._samples.save_samples(
+            samples, user if user else _UserID(ctx[_CTX_USER]), as_admin=as_admin)
+        results = {'results': _create_samples_results_to_dicts(ret)}
+        #END create_samples
+
+        # At some point might do deeper type checking...
+        if not isinstance(results, dict):
+            raise ValueError('Method create_samples return value ' +
+                             'results is not type dict as required.')
+        # return the results
+        return [results]
+
     def get_sample(self, ctx, params):
         """
         Get a sample. If the version is omitted the most recent sample is returned.
@@ -730,6 +800,80 @@ Note that usage of the administration flags will be logged by the service.
         # return the results
         return [results]
 
+    def create_data_links(self, ctx, params):
+        """
+        Create many links from KBase Workspace objects to samples.
+                The permission requirements are the same as for create_data_link.
+                The links are created in a single database transaction. If any link cannot be
+                created, no links are created.
+        :param params: instance of type "CreateDataLinksParams"
+           (create_data_links parameters. links - the links to create. Each
+           data unit (the combination of the UPA and dataid) may occur only
+           once. update - if false (the default), fail if a link already
+           exists from any of the data units. if true, expire the old links
+           and create the new links, with the same semantics as
+           create_data_link. as_admin - run the method as a service
+           administrator. The user must have full administration
+           permissions. as_user - create the links as a different user.
+           Ignored if as_admin is not true. Neither the administrator nor the
+           impersonated user need have permissions to the data or samples.)
+           -> structure: parameter "links" of list of type "DataLinkToCreate"
+           (A link to create as part of a create_data_links call. upa - the
+           workspace UPA of the object to be linked. dataid - the dataid of
+           the data to be linked, if any, within the object. If omitted the
+           entire object is linked to the sample. id - the sample id. version
+           - the sample version. node - the sample node.) -> structure:
+           parameter "upa" of type "ws_upa" (A KBase Workspace service Unique
+           Permanent Address (UPA). E.g. 5/6/7 where 5 is the workspace ID, 6
+           the object ID, and 7 the object version.), parameter "dataid" of
+           type "data_id" (An id for a unit of data within a KBase Workspace
+           object. A single object may contain many data units. A dataid is
+           expected to be unique within a single object. Must be less than
+           255 characters.), parameter "id" of type "sample_id" (A Sample ID.
+           Must be globally unique. Always assigned by the Sample service.),
+           parameter "version" of type "version" (The version of a sample.
+           Always > 0.), parameter "node" of type "node_id" (A SampleNode ID.
+           Must be unique within a Sample and be less than 255 characters.),
+           parameter "update" of type "boolean" (A boolean value, 0 for
+           false, 1 for true.), parameter "as_admin" of type "boolean" (A
+           boolean value, 0 for false, 1 for true.), parameter "as_user" of
+           type "user" (A user's username.)
+        :returns: instance of type "CreateDataLinksResults"
+           (create_data_links results. results - the results for each link,
+           in the same order as the input.) -> structure: parameter "results"
+           of list of type "CreateDataLinksResult" (The result of creating a
+           single link in a create_data_links call. new_link - the new link.
+           expired_link_id - the ID of the link that was expired as part of
+           the update, if any.) -> structure: parameter "new_link" of type
+           "DataLink" (A data link from a KBase workspace object to a sample.
+           See create_data_link.), parameter "expired_link_id" of type
+           "link_id" (A link ID. Must be globally unique. Always assigned by
+           the Sample service. Typically only of use to service admins.)
+        """
+        # ctx is the context object
+        # return variables are: results
+        #BEGIN create_data_links
+        links, update = _create_data_links_params(params)
+        as_admin, user = _get_admin_request_from_object(params, 'as_admin', 'as_user')
+        _check_admin(
+            self._user_lookup, ctx[_CTX_TOKEN], _AdminPermission.FULL,
+            # pretty annoying to test ctx.log_info is working, do it manually
+            'create_data_links', ctx.log_info, as_user=user, skip_check=not as_admin)
+        ret = self._samples.create_data_links(
+            user if user else _UserID(ctx[_CTX_USER]),
+            links,
+            update,
+            as_admin=as_admin)
+        results = {'results': _create_data_links_results_to_dicts(ret)}
+        #END create_data_links
+
+        # At some point might do deeper type checking...
+        if not isinstance(results, dict):
+            raise ValueError('Method create_data_links return value ' +
+                             'results is not type dict as required.')
+        # return the results
+        return [results]
+
     def propagate_data_links(self, ctx, params):
         """
         Propagates data links from a previous sample to the current (latest) version
@@ -897,63 +1041,76 @@ Note that usage of the administration flags will be logged by the service.
            version - the sample version. effective_time - the effective time
            at which the query should be run - the default is the current
            time. Providing a time allows for reproducibility of previous
-           results. as_admin - run the method as a service administrator. The
-           user must have read administration permissions.) -> structure:
-           parameter "id" of type "sample_id" (A Sample ID. Must be globally
-           unique. Always assigned by the Sample service.), parameter
-           "version" of type "version" (The version of a sample. Always >
-           0.), parameter "effective_time" of type "timestamp" (A timestamp
-           in epoch milliseconds.), parameter "as_admin" of type "boolean" (A
-           boolean value, 0 for false, 1 for true.)
+           results. limit - the maximum number of links to return. If omitted
+           all the links are returned. resume_token - the resume_token
+           returned with the prior page of links, if any, to get the next
+           page. The effective_time of the prior page is used, and if
+           effective_time is also provided it must match. as_admin - run the
+           method as a service administrator. The user must have read
+           administration permissions.) -> structure: parameter "id" of type
+           "sample_id" (A Sample ID. Must be globally unique. Always assigned
+           by the Sample service.), parameter "version" of type "version"
+           (The version of a sample. Always > 0.), parameter "effective_time"
+           of type "timestamp" (A timestamp in epoch milliseconds.),
+           parameter "limit" of Long, parameter "resume_token" of String,
+           parameter "as_admin" of type "boolean" (A boolean value, 0 for
+           false, 1 for true.)
         :returns: instance of type "GetDataLinksFromSampleResults"
            (get_data_links_from_sample results. links - the links.
            effective_time - the time at which the query was run. This
            timestamp, if saved, can be used when running the method again to
            ensure reproducible results. Note that changes to workspace
-           permissions may cause results to change over time.) -> structure:
-           parameter "links" of list of type "DataLink" (A data link from a
-           KBase workspace object to a sample. upa - the workspace UPA of the
-           linked object. dataid - the dataid of the linked data, if any,
-           within the object. If omitted the entire object is linked to the
-           sample. id - the sample id. version - the sample version. node -
-           the sample node. createdby - the user that created the link.
-           created - the time the link was created. expiredby - the user that
-           expired the link, if any. expired - the time the link was expired,
-           if at all.) -> structure: parameter "linkid" of type "link_id" (A
-           link ID. Must be globally unique. Always assigned by the Sample
-           service. Typically only of use to service admins.), parameter
-           "upa" of type "ws_upa" (A KBase Workspace service Unique Permanent
-           Address (UPA). E.g. 5/6/7 where 5 is the workspace ID, 6 the
-           object ID, and 7 the object version.), parameter "dataid" of type
-           "data_id" (An id for a unit of data within a KBase Workspace
-           object. A single object may contain many data units. A dataid is
-           expected to be unique within a single object. Must be less than
-           255 characters.), parameter "id" of type "sample_id" (A Sample ID.
-           Must be globally unique. Always assigned by the Sample service.),
-           parameter "version" of type "version" (The version of a sample.
-           Always > 0.), parameter "node" of type "node_id" (A SampleNode ID.
-           Must be unique within a Sample and be less than 255 characters.),
-           parameter "createdby" of type "user" (A user's username.),
-           parameter "created" of type "timestamp" (A timestamp in epoch
-           milliseconds.), parameter "expiredby" of type "user" (A user's
-           username.), parameter "expired" of type "timestamp" (A timestamp
-           in epoch milliseconds.), parameter "effective_time" of type
-           "timestamp" (A timestamp in epoch milliseconds.)
+           permissions may cause results to change over time. resume_token -
+           if a limit was provided, a token to pass to the method to get the
+           next page of links, or null if there are no more links. The next
+           page may be empty.) -> structure: parameter "links" of list of
+           type "DataLink" (A data link from a KBase workspace object to a
+           sample. upa - the workspace UPA of the linked object. dataid - the
+           dataid of the linked data, if any, within the object. If omitted
+           the entire object is linked to the sample. id - the sample id.
+           version - the sample version. node - the sample node. createdby -
+           the user that created the link. created - the time the link was
+           created. expiredby - the user that expired the link, if any.
+           expired - the time the link was expired, if at all.) -> structure:
+           parameter "linkid" of type "link_id" (A link ID. Must be globally
+           unique. Always assigned by the Sample service. Typically only of
+           use to service admins.), parameter "upa" of type "ws_upa" (A KBase
+           Workspace service Unique Permanent Address (UPA). E.g. 5/6/7 where
+           5 is the workspace ID, 6 the object ID, and 7 the object
+           version.), parameter "dataid" of type "data_id" (An id for a unit
+           of data within a KBase Workspace object. A single object may
+           contain many data units. A dataid is expected to be unique within
+           a single object. Must be less than 255 characters.), parameter
+           "id" of type "sample_id" (A Sample ID. Must be globally unique.
+           Always assigned by the Sample service.), parameter "version" of
+           type "version" (The version of a sample. Always > 0.), parameter
+           "node" of type "node_id" (A SampleNode ID. Must be unique within a
+           Sample and be less than 255 characters.), parameter "createdby" of
+           type "user" (A user's username.), parameter "created" of type
+           "timestamp" (A timestamp in epoch milliseconds.), parameter
+           "expiredby" of type "user" (A user's username.), parameter
+           "expired" of type "timestamp" (A timestamp in epoch
+           milliseconds.), parameter "effective_time" of type "timestamp" (A
+           timestamp in epoch milliseconds.), parameter "resume_token" of
+           String
         """
         # ctx is the context object
         # return variables are: results
         #BEGIN get_data_links_from_sample
         sid, ver = _get_sample_address_from_object(params, version_required=True)
-        dt = _get_datetime_from_epochmillseconds_in_object(params, 'effective_time')
+        dt, limit, after = _get_link_page_params(params)
         admin = _check_admin(
             self._user_lookup, ctx.get(_CTX_TOKEN), _AdminPermission.READ,
             # pretty annoying to test ctx.log_info is working, do it manually
             'get_data_links_from_sample', ctx.log_info, skip_check=not params.get('as_admin'))
         links, ts = self._samples.get_links_from_sample(
-            _get_user_from_object(ctx, _CTX_USER), _SampleAddress(sid, ver), dt, as_admin=admin)
-        results = {'links': _links_to_dicts(links),
+            _get_user_from_object(ctx, _CTX_USER), _SampleAddress(sid, ver), dt, as_admin=admin,
+            limit=limit, after=after)
+        results = {'links': _stream_links_to_dicts(links),
                    'effective_time': _datetime_to_epochmilliseconds(ts)
                    }
+        if limit:
+            results['resume_token'] = _link_resume_token(links, ts, limit)
         #END get_data_links_from_sample
 
         # At some point might do deeper type checking...
@@ -976,49 +1133,59 @@ Note that usage of the administration flags will be logged by the service.
            query was run. This timestamp, if saved, can be used when running
            the method again to enqure reproducible results. Note that changes
            to workspace permissions may cause results to change over time.
-           as_admin - run the method as a service administrator. The user
-           must have read administration permissions.) -> structure:
-           parameter "sample_ids" of list of type "SampleIdentifier" ->
-           structure: parameter "id" of type "sample_id" (A Sample ID. Must
-           be globally unique. Always assigned by the Sample service.),
-           parameter "version" of type "version" (The version of a sample.
-           Always > 0.), parameter "effective_time" of type "timestamp" (A
-           timestamp in epoch milliseconds.), parameter "as_admin" of type
-           "boolean" (A boolean value, 0 for false, 1 for true.)
+           limit - the maximum number of links to return. If omitted all the
+           links are returned. resume_token - the resume_token returned with
+           the prior page of links, if any, to get the next page. The
+           effective_time of the prior page is used, and if effective_time is
+           also provided it must match. as_admin - run the method as a
+           service administrator. The user must have read administration
+           permissions.) -> structure: parameter "sample_ids" of list of type
+           "SampleIdentifier" -> structure: parameter "id" of type
+           "sample_id" (A Sample ID. Must be globally unique. Always assigned
+           by the Sample service.), parameter "version" of type "version"
+           (The version of a sample. Always > 0.), parameter "effective_time"
+           of type "timestamp" (A timestamp in epoch milliseconds.),
+           parameter "limit" of Long, parameter "resume_token" of String,
+           parameter "as_admin" of type "boolean" (A boolean value, 0 for
+           false, 1 for true.)
         :returns: instance of type "GetDataLinksFromSampleResults"
            (get_data_links_from_sample results. links - the links.
            effective_time - the time at which the query was run. This
            timestamp, if saved, can be used when running the method again to
            ensure reproducible results. Note that changes to workspace
-           permissions may cause results to change over time.) -> structure:
-           parameter "links" of list of type "DataLink" (A data link from a
-           KBase workspace object to a sample. upa - the workspace UPA of the
-           linked object. dataid - the dataid of the linked data, if any,
-           within the object. If omitted the entire object is linked to the
-           sample. id - the sample id. version - the sample version. node -
-           the sample node. createdby - the user that created the link.
-           created - the time the link was created. expiredby - the user that
-           expired the link, if any. expired - the time the link was expired,
-           if at all.) -> structure: parameter "linkid" of type "link_id" (A
-           link ID. Must be globally unique. Always assigned by the Sample
-           service. Typically only of use to service admins.), parameter
-           "upa" of type "ws_upa" (A KBase Workspace service Unique Permanent
-           Address (UPA). E.g. 5/6/7 where 5 is the workspace ID, 6 the
-           object ID, and 7 the object version.), parameter "dataid" of type
-           "data_id" (An id for a unit of data within a KBase Workspace
-           object. A single object may contain many data units. A dataid is
-           expected to be unique within a single object. Must be less than
-           255 characters.), parameter "id" of type "sample_id" (A Sample ID.
-           Must be globally unique. Always assigned by the Sample service.),
-           parameter "version" of type "version" (The version of a sample.
-           Always > 0.), parameter "node" of type "node_id" (A SampleNode ID.
-           Must be unique within a Sample and be less than 255 characters.),
-           parameter "createdby" of type "user" (A user's username.),
-           parameter "created" of type "timestamp" (A timestamp in epoch
-           milliseconds.), parameter "expiredby" of type "user" (A user's
-           username.), parameter "expired" of type "timestamp" (A timestamp
-           in epoch milliseconds.), parameter "effective_time" of type
-           "timestamp" (A timestamp in epoch milliseconds.)
+           permissions may cause results to change over time. resume_token -
+           if a limit was provided, a token to pass to the method to get the
+           next page of links, or null if there are no more links. The next
+           page may be empty.) -> structure: parameter "links" of list of
+           type "DataLink" (A data link from a KBase workspace object to a
+           sample. upa - the workspace UPA of the linked object. dataid - the
+           dataid of the linked data, if any, within the object. If omitted
+           the entire object is linked to the sample. id - the sample id.
+           version - the sample version. node - the sample node. createdby -
+           the user that created the link. created - the time the link was
+           created. expiredby - the user that expired the link, if any.
+           expired - the time the link was expired, if at all.) -> structure:
+           parameter "linkid" of type "link_id" (A link ID. Must be globally
+           unique. Always assigned by the Sample service. Typically only of
+           use to service admins.), parameter "upa" of type "ws_upa" (A KBase
+           Workspace service Unique Permanent Address (UPA). E.g. 5/6/7 where
+           5 is the workspace ID, 6 the object ID, and 7 the object
+           version.), parameter "dataid" of type "data_id" (An id for a unit
+           of data within a KBase Workspace object. A single object may
+           contain many data units. A dataid is expected to be unique within
+           a single object. Must be less than 255 characters.), parameter
+           "id" of type "sample_id" (A Sample ID. Must be globally unique.
+           Always assigned by the Sample service.), parameter "version" of
+           type "version" (The version of a sample. Always > 0.), parameter
+           "node" of type "node_id" (A SampleNode ID. Must be unique within a
+           Sample and be less than 255 characters.), parameter "createdby" of
+           type "user" (A user's username.), parameter "created" of type
+           "timestamp" (A timestamp in epoch milliseconds.), parameter
+           "expiredby" of type "user" (A user's username.), parameter
+           "expired" of type "timestamp" (A timestamp in epoch
+           milliseconds.), parameter "effective_time" of type "timestamp" (A
+           timestamp in epoch milliseconds.), parameter "resume_token" of
+           String
         """
         # ctx is the context object
         # return variables are: results
@@ -1042,7 +1209,7 @@ Note that usage of the administration flags will be logged by the service.
                 "Malformed sample accessor - each sample must provide both an id and a version."
             )
 
-        dt = _get_datetime_from_epochmillseconds_in_object(params, 'effective_time')
+        dt, limit, after = _get_link_page_params(params)
 
         admin = _check_admin(
             self._user_lookup, ctx.get(_CTX_TOKEN), _AdminPermission.READ,
@@ -1052,12 +1219,15 @@ Note that usage of the administration flags will be logged by the service.
         sample_addresses = [_SampleAddress(sid, ver) for sid, ver in sample_ids]
 
         links, ts = self._samples.get_batch_links_from_sample_set(
-            _get_user_from_object(ctx, _CTX_USER), sample_addresses, dt, as_admin=admin)
+            _get_user_from_object(ctx, _CTX_USER), sample_addresses, dt, as_admin=admin,
+            limit=limit, after=after)
 
         results = {
-            'links': _links_to_dicts(links),
+            'links': _stream_links_to_dicts(links),
             'effective_time': _datetime_to_epochmilliseconds(ts)
             }
+        if limit:
+            results['resume_token'] = _link_resume_token(links, ts, limit)
 
         #END get_data_links_from_sample_set
 
@@ -1076,62 +1246,75 @@ Note that usage of the administration flags will be logged by the service.
            (get_data_links_from_data parameters. upa - the data UPA.
            effective_time - the effective time at which the query should be
            run - the default is the current time. Providing a time allows for
-           reproducibility of previous results. as_admin - run the method as
-           a service administrator. The user must have read administration
-           permissions.) -> structure: parameter "upa" of type "ws_upa" (A
-           KBase Workspace service Unique Permanent Address (UPA). E.g. 5/6/7
-           where 5 is the workspace ID, 6 the object ID, and 7 the object
-           version.), parameter "effective_time" of type "timestamp" (A
-           timestamp in epoch milliseconds.), parameter "as_admin" of type
-           "boolean" (A boolean value, 0 for false, 1 for true.)
+           reproducibility of previous results. limit - the maximum number of
+           links to return. If omitted all the links are returned.
+           resume_token - the resume_token returned with the prior page of
+           links, if any, to get the next page. The effective_time of the
+           prior page is used, and if effective_time is also provided it must
+           match. as_admin - run the method as a service administrator. The
+           user must have read administration permissions.) -> structure:
+           parameter "upa" of type "ws_upa" (A KBase Workspace service Unique
+           Permanent Address (UPA). E.g. 5/6/7 where 5 is the workspace ID, 6
+           the object ID, and 7 the object version.), parameter
+           "effective_time" of type "timestamp" (A timestamp in epoch
+           milliseconds.), parameter "limit" of Long, parameter
+           "resume_token" of String, parameter "as_admin" of type "boolean"
+           (A boolean value, 0 for false, 1 for true.)
         :returns: instance of type "GetDataLinksFromDataResults"
            (get_data_links_from_data results. links - the links.
            effective_time - the time at which the query was run. This
            timestamp, if saved, can be used when running the method again to
-           ensure reproducible results.) -> structure: parameter "links" of
-           list of type "DataLink" (A data link from a KBase workspace object
-           to a sample. upa - the workspace UPA of the linked object. dataid
-           - the dataid of the linked data, if any, within the object. If
-           omitted the entire object is linked to the sample. id - the sample
-           id. version - the sample version. node - the sample node.
-           createdby - the user that created the link. created - the time the
-           link was created. expiredby - the user that expired the link, if
-           any. expired - the time the link was expired, if at all.) ->
-           structure: parameter "linkid" of type "link_id" (A link ID. Must
-           be globally unique. Always assigned by the Sample service.
-           Typically only of use to service admins.), parameter "upa" of type
-           "ws_upa" (A KBase Workspace service Unique Permanent Address
-           (UPA). E.g. 5/6/7 where 5 is the workspace ID, 6 the object ID,
-           and 7 the object version.), parameter "dataid" of type "data_id"
-           (An id for a unit of data within a KBase Workspace object. A
-           single object may contain many data units. A dataid is expected to
-           be unique within a single object. Must be less than 255
-           characters.), parameter "id" of type "sample_id" (A Sample ID.
-           Must be globally unique. Always assigned by the Sample service.),
-           parameter "version" of type "version" (The version of a sample.
-           Always > 0.), parameter "node" of type "node_id" (A SampleNode ID.
-           Must be unique within a Sample and be less than 255 characters.),
-           parameter "createdby" of type "user" (A user's username.),
-           parameter "created" of type "timestamp" (A timestamp in epoch
-           milliseconds.), parameter "expiredby" of type "user" (A user's
-           username.), parameter "expired" of type "timestamp" (A timestamp
-           in epoch milliseconds.), parameter "effective_time" of type
-           "timestamp" (A timestamp in epoch milliseconds.)
+           ensure reproducible results. resume_token - if a limit was
+           provided, a token to pass to the method to get the next page of
+           links, or null if there are no more links. The next page may be
+           empty.) -> structure: parameter "links" of list of type "DataLink"
+           (A data link from a KBase workspace object to a sample. upa - the
+           workspace UPA of the linked object. dataid - the dataid of the
+           linked data, if any, within the object. If omitted the entire
+           object is linked to the sample. id - the sample id. version - the
+           sample version. node - the sample node. createdby - the user that
+           created the link. created - the time the link was created.
+           expiredby - the user that expired the link, if any. expired - the
+           time the link was expired, if at all.) -> structure: parameter
+           "linkid" of type "link_id" (A link ID. Must be globally unique.
+           Always assigned by the Sample service. Typically only of use to
+           service admins.), parameter "upa" of type "ws_upa" (A KBase
+           Workspace service Unique Permanent Address (UPA). E.g. 5/6/7 where
+           5 is the workspace ID, 6 the object ID, and 7 the object
+           version.), parameter "dataid" of type "data_id" (An id for a unit
+           of data within a KBase Workspace object. A single object may
+           contain many data units. A dataid is expected to be unique within
+           a single object. Must be less than 255 characters.), parameter
+           "id" of type "sample_id" (A Sample ID. Must be globally unique.
+           Always assigned by the Sample service.), parameter "version" of
+           type "version" (The version of a sample. Always > 0.), parameter
+           "node" of type "node_id" (A SampleNode ID. Must be unique within a
+           Sample and be less than 255 characters.), parameter "createdby" of
+           type "user" (A user's username.), parameter "created" of type
+           "timestamp" (A timestamp in epoch milliseconds.), parameter
+           "expiredby" of type "user" (A user's username.), parameter
+           "expired" of type "timestamp" (A timestamp in epoch
+           milliseconds.), parameter "effective_time" of type "timestamp" (A
+           timestamp in epoch milliseconds.), parameter "resume_token" of
+           String
         """
         # ctx is the context object
         # return variables are: results
         #BEGIN get_data_links_from_data
         upa = _get_upa_from_object(params)
-        dt = _get_datetime_from_epochmillseconds_in_object(params, 'effective_time')
+        dt, limit, after = _get_link_page_params(params)
         admin = _check_admin(
             self._user_lookup, ctx.get(_CTX_TOKEN), _AdminPermission.READ,
             # pretty annoying to test ctx.log_info is working, do it manually
             'get_data_links_from_data', ctx.log_info, skip_check=not params.get('as_admin'))
         links, ts = self._samples.get_links_from_data(
-            _get_user_from_object(ctx, _CTX_USER), upa, dt, as_admin=admin)
-        results = {'links': _links_to_dicts(links),
+            _get_user_from_object(ctx, _CTX_USER), upa, dt, as_admin=admin, limit=limit,
+            after=after)
+        results = {'links': _stream_links_to_dicts(links),
                    'effective_time': _datetime_to_epochmilliseconds(ts)
                    }
+        if limit:
+            results['resume_token'] = _link_resume_token(links, ts, limit)
         #END get_data_links_from_data
 
         # At some point might do deeper type checking...
@@ -1141,6 +1324,92 @@ Note that usage of the administration flags will be logged by the service.
         # return the results
         return [results]
 
+    def get_data_link_history(self, ctx, params):
+        """
+        Get the history of the data links from a sample, a workspace object, or a data unit - all
+               the links ever created, expired or not.
+               If an upa is provided the user must have read permissions to the workspace object.
+               Otherwise the user must have read permissions to the sample, and only links to
+               workspace objects the user can read are returned.
+        :param params: instance of type "GetDataLinkHistoryParams"
+           (get_data_link_history parameters. id - the sample ID. Links from
+           any version of the sample are returned. upa - the workspace UPA.
+           Links from the object version are returned. dataid - the dataid of
+           the data unit within the object. Requires upa. At least one of id
+           or upa is required. If both are provided only links between the
+           sample and the object are returned. limit - the maximum number of
+           links to return. If omitted all the links are returned.
+           resume_token - the resume_token returned with the prior page of
+           links, if any, to get the next page. as_admin - run the method as
+           a service administrator. The user must have read administration
+           permissions.) -> structure: parameter "id" of type "sample_id" (A
+           Sample ID. Must be globally unique. Always assigned by the Sample
+           service.), parameter "upa" of type "ws_upa" (A KBase Workspace
+           service Unique Permanent Address (UPA). E.g. 5/6/7 where 5 is the
+           workspace ID, 6 the object ID, and 7 the object version.),
+           parameter "dataid" of type "data_id" (An id for a unit of data
+           within a KBase Workspace object. A single object may contain many
+           data units. A dataid is expected to be unique within a single
+           object. Must be less than 255 characters.), parameter "limit" of
+           Long, parameter "resume_token" of String, parameter "as_admin" of
+           type "boolean" (A boolean value, 0 for false, 1 for true.)
+        :returns: instance of type "GetDataLinkHistoryResults"
+           (get_data_link_history results. links - the links, sorted by
+           creation time and then link ID. resume_token - if a limit was
+           provided, a token to pass to the method to get the next page of
+           links, or null if there are no more links. The next page may be
+           empty.) -> structure: parameter "links" of list of type "DataLink"
+           (A data link from a KBase workspace object to a sample. upa - the
+           workspace UPA of the linked object. dataid - the dataid of the
+           linked data, if any, within the object. If omitted the entire
+           object is linked to the sample. id - the sample id. version - the
+           sample version. node - the sample node. createdby - the user that
+           created the link. created - the time the link was created.
+           expiredby - the user that expired the link, if any. expired - the
+           time the link was expired, if at all.) -> structure: parameter
+           "linkid" of type "link_id" (A link ID. Must be globally unique.
+           Always assigned by the Sample service. Typically only of use to
+           service admins.), parameter "upa" of type "ws_upa" (A KBase
+           Workspace service Unique Permanent Address (UPA). E.g. 5/6/7 where
+           5 is the workspace ID, 6 the object ID, and 7 the object
+           version.), parameter "dataid" of type "data_id" (An id for a unit
+           of data within a KBase Workspace object. A single object may
+           contain many data units. A dataid is expected to be unique within
+           a single object. Must be less than 255 characters.), parameter
+           "id" of type "sample_id" (A Sample ID. Must be globally unique.
+           Always assigned by the Sample service.), parameter "version" of
+           type "version" (The version of a sample. Always > 0.), parameter
+           "node" of type "node_id" (A SampleNode ID. Must be unique within a
+           Sample and be less than 255 characters.), parameter "createdby" of
+           type "user" (A user's username.), parameter "created" of type
+           "timestamp" (A timestamp in epoch milliseconds.), parameter
+           "expiredby" of type "user" (A user's username.), parameter
+           "expired" of type "timestamp" (A timestamp in epoch
+           milliseconds.),parameter "resume_token" of String
+        """
+        # ctx is the context object
+        # return variables are: results
+        #BEGIN get_data_link_history
+        sample, upa, dataid, limit, after = _get_link_history_params(params)
+        admin = _check_admin(
+            self._user_lookup, ctx.get(_CTX_TOKEN), _AdminPermission.READ,
+            # pretty annoying to test ctx.log_info is working, do it manually
+            'get_data_link_history', ctx.log_info, skip_check=not params.get('as_admin'))
+        links = self._samples.get_link_history(
+            _get_user_from_object(ctx, _CTX_USER), sample, upa, dataid, as_admin=admin,
+            limit=limit, after=after)
+        results = {'links': _stream_links_to_dicts(links)}
+        if limit:
+            results['resume_token'] = _link_history_resume_token(links, limit)
+        #END get_data_link_history
+
+        # At some point might do deeper type checking...
+        if not isinstance(results, dict):
+            raise ValueError('Method get_data_link_history return value ' +
+                             'results is not type dict as required.')
+        # return the results
+        return [results]
+
     def get_sample_via_data(self, ctx, params):
         """
         Get a sample via a workspace object. Read permissions to a workspace object grants
@@ -1430,6 +1699,11 @@ Note that usage of the administration flags will be logged by the service.
                      'git_url': self.GIT_URL,
                      'git_commit_hash': self.GIT_COMMIT_HASH,
                      'servertime': _datetime_to_epochmilliseconds(_datetime.datetime.now(
-                         tz=_datetime.timezone.utc))}
+                         tz=_datetime.timezone.utc)),
+                     'consistency_checker': _consistency_checker_status_to_dict(
+                         self._samples.get_consistency_checker_status()),
+                     'sample_cache': self._samples.get_sample_cache_stats(),
+                     'shared_sample_cache': self._samples.get_shared_sample_cache_stats(),
+                     'read_repair': self._samples.get_read_repair_stats()}
         #END_STATUS
         return [returnVal]
@@ -6,6 +6,7 @@ import os
 import random as _random
 import sys
 import traceback
+from collections.abc import Iterator
 from getopt import getopt, GetoptError
 from multiprocessing import Process
 from os import environ
@@ -27,6 +28,8 @@ except ImportError:
 DEPLOY = 'KB_DEPLOYMENT_CONFIG'
 SERVICE = 'KB_SERVICE_NAME'
 AUTH = 'auth-service-url'
+# the approximate size of the chunks of a streamed response passed to the WSGI server
+STREAM_CHUNK_SIZE = 64 * 1024
 
 # Note that the error fields do not match the 2.0 JSONRPC spec
 
@@ -67,18 +70,64 @@ class JSONObjectEncoder(json.JSONEncoder):
         return json.JSONEncoder.default(self, obj)
 
 
+def is_streamed(response):
+    """
+    Returns True if any of the structures returned by the methods in a
+    response contain an iterator, such as data links streamed from the
+    database. Only the top level of each structure is checked.
+    """
+    responses = response if isinstance(response, list) else [response]
+    for r in responses:
+        for ret in r.get('result') or []:
+            if isinstance(ret, dict) and any(
+                    isinstance(v, Iterator) for v in ret.values()):
+                return True
+    return False
+
+
+def iterencode(obj, encoder=JSONObjectEncoder()):
+    """
+    Encodes an object to JSON in chunks. Iterators are encoded as arrays as
+    they are consumed, so their contents are never all held in memory.
+    """
+    if isinstance(obj, Iterator):
+        yield '['
+        for i, item in enumerate(obj):
+            yield (', ' if i else '') + encoder.encode(item)
+        yield ']'
+    elif isinstance(obj, dict):
+        yield '{'
+        for i, (k, v) in enumerate(obj.items()):
+            yield (', ' if i else '') + encoder.encode(k) + ': '
+            yield from iterencode(v, encoder)
+        yield '}'
+    elif isinstance(obj, (list, tuple)):
+        yield '['
+        for i, v in enumerate(obj):
+            if i:
+                yield ', '
+            yield from iterencode(v, encoder)
+        yield ']'
+    else:
+        yield encoder.encode(obj)
+
+
 class JSONRPCServiceCustom(JSONRPCService):
 
     def call(self, ctx, jsondata):
         """
         Calls jsonrpc service's method and returns its return value in a JSON
-        string or None if there is none.
+        string or None if there is none. If the return value contains an
+        iterator an iterator over chunks of the JSON string is returned
+        instead.
 
         Arguments:
         jsondata -- remote method call in jsonrpc format
         """
         result = self.call_py(ctx, jsondata)
         if result is not None:
+            if is_streamed(result):
+                return iterencode(result)
             return json.dumps(result, cls=JSONObjectEncoder)
 
         return None
@@ -347,6 +396,10 @@ class Application(object):
                              name='SampleService.create_sample',
                              types=[dict])
         self.method_authentication['SampleService.create_sample'] = 'required'  # noqa
+        self.rpc_service.add(impl_SampleService.create_samples,
+                             name='SampleService.create_samples',
+                             types=[dict])
+        self.method_authentication['SampleService.create_samples'] = 'required'  # noqa
         self.rpc_service.add(impl_SampleService.get_sample,
                              name='SampleService.get_sample',
                              types=[dict])
@@ -379,6 +432,10 @@ class Application(object):
                              name='SampleService.create_data_link',
                              types=[dict])
         self.method_authentication['SampleService.create_data_link'] = 'required'  # noqa
+        self.rpc_service.add(impl_SampleService.create_data_links,
+                             name='SampleService.create_data_links',
+                             types=[dict])
+        self.method_authentication['SampleService.create_data_links'] = 'required'  # noqa
         self.rpc_service.add(impl_SampleService.propagate_data_links,
                              name='SampleService.propagate_data_links',
                              types=[dict])
@@ -399,6 +456,10 @@ class Application(object):
                              name='SampleService.get_data_links_from_data',
                              types=[dict])
         self.method_authentication['SampleService.get_data_links_from_data'] = 'optional'  # noqa
+        self.rpc_service.add(impl_SampleService.get_data_link_history,
+                             name='SampleService.get_data_link_history',
+                             types=[dict])
+        self.method_authentication['SampleService.get_data_link_history'] = 'optional'  # noqa
         self.rpc_service.add(impl_SampleService.get_sample_via_data,
                              name='SampleService.get_sample_via_data',
                              types=[dict])
@@ -515,20 +576,47 @@ class Application(object):
         # print('Result from the method call is:\n%s\n' % \
         #    pprint.pformat(rpc_result))
 
+        response_headers = [
+            ('Access-Control-Allow-Origin', '*'),
+            ('Access-Control-Allow-Headers', environ.get(
+                'HTTP_ACCESS_CONTROL_REQUEST_HEADERS', 'authorization')),
+            ('content-type', 'application/json')]
+
+        if rpc_result and not isinstance(rpc_result, str):
+            # the length of a streamed response isn't known until it's sent
+            start_response(status, response_headers)
+            return self.stream_response(rpc_result, ctx)
+
         if rpc_result:
             response_body = rpc_result
         else:
             response_body = ''
 
-        response_headers = [
-            ('Access-Control-Allow-Origin', '*'),
-            ('Access-Control-Allow-Headers', environ.get(
-                'HTTP_ACCESS_CONTROL_REQUEST_HEADERS', 'authorization')),
-            ('content-type', 'application/json'),
-            ('content-length', str(len(response_body)))]
+        response_headers.append(('content-length', str(len(response_body))))
         start_response(status, response_headers)
         return [response_body.encode('utf8')]
 
+    def stream_response(self, chunks, context):
+        buf = []
+        size = 0
+        try:
+            for chunk in chunks:
+                buf.append(chunk)
+                size += len(chunk)
+                if size >= STREAM_CHUNK_SIZE:
+                    yield ''.join(buf).encode('utf8')
+                    buf = []
+                    size = 0
+        except Exception:
+            # the status and headers have already been sent, so all that can
+            # be done is to log the error and end the response early. The
+            # client will fail to parse the truncated response.
+            self.log(log.ERR, context,
+                     traceback.format_exc().split('\n')[0:-1])
+            return
+        if buf:
+            yield ''.join(buf).encode('utf8')
+
     def process_error(self, error, context, request, trace=None):
         if trace:
             self.log(log.ERR, context, trace.split('\n')[0:-1])
@@ -664,7 +752,8 @@ def process_async_cli(input_file_path, output_file_path, token):
     if 'error' in resp:
         exit_code = 500
     with open(output_file_path, "w") as f:
-        f.write(json.dumps(resp, cls=JSONObjectEncoder))
+        for chunk in iterencode(resp):
+            f.write(chunk)
     return exit_code
 
 if __name__ == "__main__":
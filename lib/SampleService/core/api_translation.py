@@ -5,6 +5,8 @@ Contains helper functions for translating between the SDK API and the core Sampl
 
 from uuid import UUID
 from typing import Dict, Any, Optional, Tuple, List, Callable, Union, cast as _cast
+from typing import Iterable, Iterator
+import base64 as _base64
 import datetime
 
 from SampleService.core.core_types import PrimitiveType
@@ -26,6 +28,7 @@ from SampleService.core.arg_checkers import (
 )
 from SampleService.core.data_link import DataLink
 from SampleService.core.errors import (
+    SampleError,
     IllegalParameterError as _IllegalParameterError,
     MissingParameterError as _MissingParameterError,
     UnauthorizedError as _UnauthorizedError,
@@ -144,6 +147,11 @@ def create_sample_params(params: Dict[str, Any]) -> Tuple[Sample, Optional[UUID]
     :raises IllegalParameterError: if any of the arguments are illegal.
     '''
     _check_params(params)
+    return _get_sample_to_save_from_object(params)
+
+
+def _get_sample_to_save_from_object(
+        params: Dict[str, Any]) -> Tuple[Sample, Optional[UUID], Optional[int]]:
     if type(params.get('sample')) != dict:
         raise _IllegalParameterError('params must contain sample key that maps to a structure')
     s = params['sample']
@@ -161,6 +169,49 @@ def create_sample_params(params: Dict[str, Any]) -> Tuple[Sample, Optional[UUID]
     return (s, id_, pv)
 
 
+def create_samples_params(
+        params: Dict[str, Any]) -> List[Tuple[Sample, Optional[UUID], Optional[int]]]:
+    '''
+    Process the input from the create_samples API call and translate it into standard types.
+
+    :param params: The unmarshalled JSON recieved from the API as part of the create_samples
+        call.
+    :returns: A list of tuples, one per sample, with the same contents as the tuple returned
+        from create_sample_params.
+    :raises IllegalParameterError: if any of the arguments are illegal.
+    '''
+    _check_params(params)
+    if type(params.get('samples')) != list or not params['samples']:
+        raise _IllegalParameterError('params must contain a non-empty list of samples')
+    ret = []
+    for i, s in enumerate(params['samples']):
+        if type(s) != dict:
+            raise _IllegalParameterError(f'Sample at index {i} is not a structure')
+        try:
+            ret.append(_get_sample_to_save_from_object(s))
+        except _IllegalParameterError as e:
+            raise _IllegalParameterError(
+                f'Error for sample at index {i}: ' + _cast(str, e.message)) from e
+    return ret
+
+
+def create_samples_results_to_dicts(
+        results: List[Tuple[UUID, Optional[int], Optional[SampleError]]]
+        ) -> List[Dict[str, Any]]:
+    '''
+    Translate the results of saving many samples into a list of dicts for the API.
+
+    :param results: the list of tuples of sample ID, version, and error, as returned by
+        Samples.save_samples.
+    :returns: the results as dicts with id, version, and error keys. version is None if the sample
+        failed to save and error is None if the sample saved successfully.
+    '''
+    return [{'id': str(id_),
+             'version': ver,
+             'error': str(err) if err else None,
+             } for id_, ver, err in results]
+
+
 def validate_samples_params(params: Dict[str, Any]) -> List[Sample]:
     '''
     Process the input from the validate_samples API call and translate it into standard types.
@@ -544,6 +595,77 @@ def create_data_link_params(params: Dict[str, Any]) -> Tuple[DataUnitID, SampleN
     return (duid, sna, bool(params.get('update')))
 
 
+def create_data_links_params(
+        params: Dict[str, Any]
+        ) -> Tuple[List[Tuple[DataUnitID, SampleNodeAddress]], bool]:
+    '''
+    Given a dict, extract the parameters to create parameters for creating many data links.
+
+    Expected keys:
+    links - a list of links, each of which has the keys expected by create_data_link_params
+        other than update.
+    update - whether the links should be updated
+
+    :param params: the parameters.
+    :returns: a tuple consisting of:
+        1) A list of tuples of the data unit ID and the sample node for each link,
+        2) A boolean that indicates whether the links should be updated if they already exist.
+    :raises MissingParameterError: if any of the required arguments are missing.
+    :raises IllegalParameterError: if any of the arguments are illegal.
+    '''
+    _check_params(params)
+    if type(params.get('links')) != list or not params['links']:
+        raise _IllegalParameterError('params must contain a non-empty list of links')
+    ret = []
+    for i, link in enumerate(params['links']):
+        if type(link) != dict:
+            raise _IllegalParameterError(f'Link at index {i} is not a structure')
+        try:
+            duid, sna, _ = create_data_link_params(link)
+        except (_MissingParameterError, _IllegalParameterError) as e:
+            raise type(e)(f'Error for link at index {i}: ' + _cast(str, e.message)) from e
+        ret.append((duid, sna))
+    return (ret, bool(params.get('update')))
+
+
+def create_data_links_results_to_dicts(
+        results: List[Tuple[DataLink, Optional[UUID]]]) -> List[Dict[str, Any]]:
+    '''
+    Translate the results of creating many data links into a list of dicts for the API.
+
+    :param results: the list of tuples of the new link and the ID of any expired link, as
+        returned by Samples.create_data_links.
+    :returns: the results as dicts with new_link and expired_link_id keys.
+    '''
+    if not results:
+        return []
+    links = links_to_dicts([link for link, _ in results])
+    return [{'new_link': link,
+             'expired_link_id': str(expid) if expid else None,
+             } for link, (_, expid) in zip(links, results)]
+
+
+def consistency_checker_status_to_dict(
+        status: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    '''
+    Translate the status of the database consistency checker into a dict for the API.
+
+    :param status: the status as returned by Samples.get_consistency_checker_status.
+    :returns: the status with times in epoch milliseconds and the last run duration in
+        milliseconds, or None if the status is None.
+    '''
+    if not status:
+        return None
+    lastrun = status['last_run']
+    dur = status['last_run_duration']
+    return {'holder': status['holder'],
+            'lease_expires': datetime_to_epochmilliseconds(status['lease_expires']),
+            'last_run': datetime_to_epochmilliseconds(lastrun) if lastrun else None,
+            'last_run_duration_ms': None if dur is None else round(dur.total_seconds() * 1000),
+            'repaired': status['repaired'],
+            }
+
+
 def get_data_unit_id_from_object(params: Dict[str, Any]) -> DataUnitID:
     '''
     Get a Data Unit ID from a parameter object. Expects an UPA in the key 'upa' and a data unit
@@ -590,22 +712,161 @@ def links_to_dicts(links: List[DataLink]) -> List[Dict[str, Any]]:
     :param links: the links.
     :returns: the list of dicts.
     '''
-    ret = []
-    for link in _cast(List[DataLink], _not_falsy_in_iterable(links, 'links')):
-        ex = datetime_to_epochmilliseconds(link.expired) if link.expired else None
-        ret.append({
-            'linkid': str(link.id),
-            'upa': str(link.duid.upa),
-            'dataid': link.duid.dataid,
-            'id': str(link.sample_node_address.sampleid),
-            'version': link.sample_node_address.version,
-            'node': link.sample_node_address.node,
-            'createdby': str(link.created_by),
-            'created': datetime_to_epochmilliseconds(link.created),
-            'expiredby': str(link.expired_by) if link.expired_by else None,
-            'expired': ex
-        })
-    return ret
+    return [_link_to_dict(link)
+            for link in _cast(List[DataLink], _not_falsy_in_iterable(links, 'links'))]
+
+
+def stream_links_to_dicts(links: Iterable[DataLink]) -> Iterable[Dict[str, Any]]:
+    '''
+    Translate links to dicts suitable for translating to JSON. If the links are an iterator, as
+    when the results of a link query are streamed from the database, the links are translated
+    as the returned iterator is consumed so they are never all held in memory. Otherwise this
+    is the same as links_to_dicts.
+
+    :param links: the links.
+    :returns: the list of dicts, or an iterator over the dicts if the links are an iterator.
+    '''
+    if not isinstance(links, Iterator):
+        return links_to_dicts(_cast(List[DataLink], links))
+    return (_link_to_dict(_cast(DataLink, _not_falsy(link, 'link'))) for link in links)
+
+
+def _link_to_dict(link: DataLink) -> Dict[str, Any]:
+    ex = datetime_to_epochmilliseconds(link.expired) if link.expired else None
+    return {
+        'linkid': str(link.id),
+        'upa': str(link.duid.upa),
+        'dataid': link.duid.dataid,
+        'id': str(link.sample_node_address.sampleid),
+        'version': link.sample_node_address.version,
+        'node': link.sample_node_address.node,
+        'createdby': str(link.created_by),
+        'created': datetime_to_epochmilliseconds(link.created),
+        'expiredby': str(link.expired_by) if link.expired_by else None,
+        'expired': ex
+    }
+
+
+def get_link_page_params(params: Dict[str, Any]
+                         ) -> Tuple[Optional[datetime.datetime], Optional[int], Optional[UUID]]:
+    '''
+    Get the effective time and paging parameters for a data link query from a parameter object.
+    Expects an optional epoch millisecond timestamp in the key 'effective_time', an optional
+    maximum number of links in the key 'limit', and an optional token returned with a prior page
+    of links in the key 'resume_token'.
+
+    :param params: the parameters.
+    :returns: a tuple of the effective time, the maximum number of links to return, and the ID
+        of the last link of the prior page. If a resume token is provided the effective time is
+        the effective time of the prior page.
+    :raises IllegalParameterError: if any of the parameters are illegal or the effective time
+        does not match the resume token.
+    '''
+    dt = get_datetime_from_epochmilliseconds_in_object(params, 'effective_time')
+    limit = _get_limit(params)
+    token = _get_resume_token(params)
+    if token is None:
+        return dt, limit, None
+    t, after = token
+    if dt and datetime_to_epochmilliseconds(dt) != t:
+        raise _IllegalParameterError('effective_time does not match the resume_token')
+    return datetime.datetime.fromtimestamp(t / 1000, tz=datetime.timezone.utc), limit, after
+
+
+def link_resume_token(
+        links: List[DataLink], effective_time: datetime.datetime, limit: Optional[int]
+        ) -> Optional[str]:
+    '''
+    Get a token that allows fetching the next page of a data link query.
+
+    :param links: the links returned by the query, sorted by the link ID.
+    :param effective_time: the effective time of the query.
+    :param limit: the maximum number of links the query could return.
+    :returns: the token, or None if there are no more links. If the number of links is equal to
+        the limit a token is always returned, even if the next page is empty.
+    '''
+    _not_falsy(effective_time, 'effective_time')
+    if not limit or len(links) < limit:
+        return None
+    return _resume_token(datetime_to_epochmilliseconds(effective_time), links[-1].id)
+
+
+def get_link_history_params(params: Dict[str, Any]) -> Tuple[
+        Optional[UUID],
+        Optional[UPA],
+        Optional[str],
+        Optional[int],
+        Optional[Tuple[datetime.datetime, UUID]]]:
+    '''
+    Get the parameters for a data link history query from a parameter object. Expects an
+    optional sample ID in the key 'id', an optional UPA in the key 'upa', an optional data unit
+    ID in the key 'dataid', an optional maximum number of links in the key 'limit', and an
+    optional token returned with a prior page of links in the key 'resume_token'.
+
+    :param params: the parameters.
+    :returns: a tuple of the sample ID, the UPA, the data unit ID, the maximum number of links
+        to return, and the creation time and ID of the last link of the prior page.
+    :raises MissingParameterError: if neither the sample ID nor the UPA is provided.
+    :raises IllegalParameterError: if any of the parameters are illegal.
+    '''
+    _check_params(params)
+    id_ = get_id_from_object(params, ID, name='id')
+    upa = params.get('upa')
+    upa = get_upa_from_object(params) if upa is not None else None
+    dataid = _check_string_int(params, 'dataid')
+    if not id_ and not upa:
+        raise _MissingParameterError('id or upa')
+    if dataid and not upa:
+        raise _IllegalParameterError('dataid requires an upa')
+    limit = _get_limit(params)
+    token = _get_resume_token(params)
+    after = None
+    if token:
+        after = (datetime.datetime.fromtimestamp(token[0] / 1000, tz=datetime.timezone.utc),
+                 token[1])
+    return id_, upa, dataid, limit, after
+
+
+def link_history_resume_token(links: List[DataLink], limit: Optional[int]) -> Optional[str]:
+    '''
+    Get a token that allows fetching the next page of a data link history query.
+
+    :param links: the links returned by the query, sorted by creation time and link ID.
+    :param limit: the maximum number of links the query could return.
+    :returns: the token, or None if there are no more links. If the number of links is equal to
+        the limit a token is always returned, even if the next page is empty.
+    '''
+    if not limit or len(links) < limit:
+        return None
+    return _resume_token(datetime_to_epochmilliseconds(links[-1].created), links[-1].id)
+
+
+def _get_limit(params: Dict[str, Any]) -> Optional[int]:
+    limit = params.get('limit')
+    if limit is not None and (type(limit) != int or limit < 1):
+        raise _IllegalParameterError('limit must be an integer > 0')
+    return limit
+
+
+# A resume token is an epoch millisecond time and a link ID, which together with the query
+# parameters identify where the next page of links starts.
+def _resume_token(epochms: int, linkid: UUID) -> str:
+    return _base64.urlsafe_b64encode(f'{epochms}:{linkid}'.encode()).decode()
+
+
+def _get_resume_token(params: Dict[str, Any]) -> Optional[Tuple[int, UUID]]:
+    token = params.get('resume_token')
+    if token is None:
+        return None
+    err = _IllegalParameterError(f'Invalid resume_token: {token}')
+    if type(token) != str:
+        raise err
+    try:
+        ms, linkid = _base64.urlsafe_b64decode(token.encode()).decode().split(':')
+        return int(ms), UUID(linkid)
+    except ValueError as _:  # noqa F841
+        raise err
+
 
 def validate_sample_id(id_, name=None):
     '''
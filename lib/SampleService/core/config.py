@@ -5,6 +5,7 @@ Configuration parsing and creation for the sample service.
 # Because creating the samples instance involves contacting arango and the auth service,
 # this code is mostly tested in the integration tests.
 
+import datetime
 import importlib
 from typing import Dict, Optional, List, Tuple
 from typing import cast as _cast
@@ -58,6 +59,13 @@ def build_samples(config: Dict[str, str]) -> Tuple[Samples, KBaseUserLookup, Lis
         'config param workspace-object-version-shadow-collection')
     col_schema = _check_string_req(config.get('schema-collection'),
                                    'config param schema-collection')
+    col_journal = _check_string_req(config.get('write-journal-collection'),
+                                    'config param write-journal-collection')
+    col_link_count = _check_string_req(config.get('data-link-count-collection'),
+                                       'config param data-link-count-collection')
+    col_node_body = _check_string(config.get('node-body-collection'),
+                                  'config param node-body-collection',
+                                  optional=True)
 
     auth_root_url = _check_string_req(config.get('auth-root-url'), 'config param auth-root-url')
     auth_token = _check_string_req(config.get('auth-token'), 'config param auth-token')
@@ -76,6 +84,23 @@ def build_samples(config: Dict[str, str]) -> Tuple[Samples, KBaseUserLookup, Lis
     if kafka_servers:  # have to start the server twice to test no kafka scenario
         kafka_topic = _check_string(config.get('kafka-topic'), 'config param kafka-topic')
 
+    reaper_update_delay = _get_int(config, 'reaper-update-delay-sec', 300)
+    reaper_deletion_delay = _get_int(config, 'reaper-deletion-delay-sec', 3600)
+    reaper_interval = _get_int(config, 'reaper-interval-sec', 60, minimum=1)
+    reaper_lease = _get_int(config, 'reaper-lease-sec', 180, minimum=1)
+    sample_cache_size = _get_int(config, 'sample-cache-size-mb', 32)
+    shared_cache_path = _check_string(config.get('shared-sample-cache-path'),
+                                      'config param shared-sample-cache-path',
+                                      optional=True)
+    shared_cache_size = _get_int(config, 'shared-sample-cache-size-mb', 256)
+    acl_cache_staleness = _get_int(config, 'acl-cache-staleness-sec', 0)
+    insert_chunk_size = _get_int(config, 'insert-chunk-size', 5000, minimum=1)
+    defer_edges = _check_string(config.get('defer-edges'), 'config param defer-edges',
+                                optional=True) == 'true'
+    shard_by_sample_id = _check_string(config.get('shard-by-sample-id'),
+                                       'config param shard-by-sample-id', optional=True) == 'true'
+    link_stream_batch_size = _get_int(config, 'link-stream-batch-size', 0)
+
     metaval_url = _check_string(config.get('metadata-validator-config-url'),
                                 'config param metadata-validator-config-url',
                                 optional=True)
@@ -96,6 +121,9 @@ def build_samples(config: Dict[str, str]) -> Tuple[Samples, KBaseUserLookup, Lis
             data-link-collection: {col_data_link}
             workspace-object-version-shadow-collection: {col_ws_obj_ver}
             schema-collection: {col_schema}
+            write-journal-collection: {col_journal}
+            data-link-count-collection: {col_link_count}
+            node-body-collection: {col_node_body}
             auth-root-url: {auth_root_url}
             auth-token: [REDACTED FOR YOUR CONVENIENCE AND ENJOYMENT]
             auth-full-admin-roles: {', '.join(full_roles)}
@@ -106,6 +134,18 @@ def build_samples(config: Dict[str, str]) -> Tuple[Samples, KBaseUserLookup, Lis
             kafka-bootstrap-servers: {kafka_servers}
             kafka-topic: {kafka_topic}
             metadata-validators-config-url: {metaval_url}
+            reaper-update-delay-sec: {reaper_update_delay}
+            reaper-deletion-delay-sec: {reaper_deletion_delay}
+            reaper-interval-sec: {reaper_interval}
+            reaper-lease-sec: {reaper_lease}
+            sample-cache-size-mb: {sample_cache_size}
+            shared-sample-cache-path: {shared_cache_path}
+            shared-sample-cache-size-mb: {shared_cache_size}
+            acl-cache-staleness-sec: {acl_cache_staleness}
+            insert-chunk-size: {insert_chunk_size}
+            defer-edges: {defer_edges}
+            shard-by-sample-id: {shard_by_sample_id}
+            link-stream-batch-size: {link_stream_batch_size}
     ''')
 
     # build the validators before trying to connect to arango
@@ -124,8 +164,21 @@ def build_samples(config: Dict[str, str]) -> Tuple[Samples, KBaseUserLookup, Lis
         col_ws_obj_ver,
         col_data_link,
         col_schema,
+        col_journal,
+        col_link_count,
+        reaper_update_delay=datetime.timedelta(seconds=reaper_update_delay),
+        reaper_deletion_delay=datetime.timedelta(seconds=reaper_deletion_delay),
+        sample_cache_max_bytes=sample_cache_size * 1024 * 1024,
+        shared_sample_cache_path=shared_cache_path,
+        shared_sample_cache_max_bytes=shared_cache_size * 1024 * 1024,
+        acl_cache_staleness=datetime.timedelta(seconds=acl_cache_staleness),
+        node_body_collection=col_node_body,
+        insert_chunk_size=insert_chunk_size,
+        defer_edges=defer_edges,
+        shard_by_sample_id=shard_by_sample_id,
+        link_stream_batch_size=link_stream_batch_size,
     )
-    storage.start_consistency_checker()
+    storage.start_consistency_checker(interval_sec=reaper_interval, lease_sec=reaper_lease)
     kafka = _KafkaNotifer(kafka_servers, _cast(str, kafka_topic)) if kafka_servers else None
     user_lookup = KBaseUserLookup(auth_root_url, auth_token, full_roles, read_roles)
     ws = _WS(_Workspace(ws_url, token=ws_token))
@@ -153,6 +206,19 @@ def _check_string_req(s: Optional[str], name: str) -> str:
     return _cast(str, _check_string(s, name))
 
 
+def _get_int(config: Dict[str, str], key: str, default: int, minimum: int = 0) -> int:
+    s = _check_string(config.get(key), 'config param ' + key, optional=True)
+    if not s:
+        return default
+    try:
+        i = int(s)
+    except ValueError as e:
+        raise ValueError(f'config param {key} must be an integer: {s}') from e
+    if i < minimum:
+        raise ValueError(f'config param {key} must be >= {minimum}')
+    return i
+
+
 # TODO may need a versioning scheme
 # If this structure is updated, please update the README file.
 _META_VAL_JSONSCHEMA = {
@@ -6,20 +6,23 @@ import datetime
 import uuid as _uuid  # lgtm [py/import-and-import-from]
 from uuid import UUID
 
-from typing import Optional, Callable, Tuple, List, Dict, Union, Any, cast as _cast
+from typing import Optional, Callable, Tuple, List, Dict, Union, Any, Iterable, cast as _cast
 
 from SampleService.core.arg_checkers import not_falsy as _not_falsy
+from SampleService.core.arg_checkers import not_falsy_in_iterable as _not_falsy_in_iterable
 from SampleService.core.arg_checkers import check_timestamp as _check_timestamp
 from SampleService.core.acls import SampleAccessType as _SampleAccessType
 from SampleService.core.acls import SampleACL, SampleACLOwnerless, SampleACLDelta
 from SampleService.core.core_types import PrimitiveType
 from SampleService.core.data_link import DataLink
 from SampleService.core.errors import (
+    SampleError,
     UnauthorizedError as _UnauthorizedError,
     IllegalParameterError as _IllegalParameterError,
     MetadataValidationError as _MetadataValidationError,
     NoSuchUserError as _NoSuchUserError,
-    NoSuchLinkError as _NoSuchLinkError
+    NoSuchLinkError as _NoSuchLinkError,
+    NoSuchSampleError as _NoSuchSampleError,
 )
 from SampleService.core.notification import KafkaNotifier
 from SampleService.core.sample import Sample, SavedSample, SampleAddress, SampleNodeAddress
@@ -76,7 +79,8 @@ class Samples:
             user: UserID,
             id_: UUID = None,
             prior_version: Optional[int] = None,
-            as_admin: bool = False) -> Tuple[UUID, int]:
+            as_admin: bool = False,
+            skip_if_unchanged: bool = False) -> Tuple[UUID, int]:
         '''
         Save a sample.
 
@@ -87,6 +91,10 @@ class Samples:
         :param prior_version: if id_ is included, specifying prior_version will ensure that the new
             sample is saved with version prior_version + 1 or not at all.
         :param as_admin: skip ACL checks for new versions.
+        :param skip_if_unchanged: if id_ is included and the sample name and nodes are the same
+            as the latest version of the sample, don't save a new version or send a
+            notification and return the latest version instead. If prior_version is also
+            included it must be the latest version or the save proceeds, and fails, as normal.
         :returns a tuple of the sample ID and version.
         :raises IllegalParameterError: if the prior version is < 1
         :raises UnauthorizedError: if the user does not have write permission to the sample when
@@ -104,6 +112,10 @@ class Samples:
                 raise _IllegalParameterError('Prior version must be > 0')
             self._check_perms(id_, user, _SampleAccessType.WRITE, as_admin=as_admin)
             swid = SavedSample(id_, user, list(sample.nodes), self._now(), sample.name)
+            if skip_if_unchanged:
+                latest = self._storage.get_version_if_unchanged(swid)
+                if latest and (not prior_version or latest == prior_version):
+                    return (id_, latest)
             ver = self._storage.save_sample_version(swid, prior_version)
         else:
             id_ = self._uuid_gen()
@@ -115,6 +127,79 @@ class Samples:
             self._kafka.notify_new_sample_version(id_, ver)
         return (id_, ver)
 
+    def save_samples(
+            self,
+            samples: List[Tuple[Sample, Optional[UUID], Optional[int]]],
+            user: UserID,
+            as_admin: bool = False
+            ) -> List[Tuple[UUID, Optional[int], Optional[SampleError]]]:
+        '''
+        Save many samples at once. All the samples are validated before any are saved.
+        Permissions are checked for all the samples with one call to the storage system and the
+        samples are then saved in bulk.
+
+        :param samples: a list of tuples of the sample to save, the ID of the sample if the sample
+            is a new version of an existing sample or None, and the prior version of the sample
+            or None. See save_sample for the semantics of the ID and prior version.
+        :param user: the username of the user saving the samples.
+        :param as_admin: skip ACL checks for new versions.
+        :returns: a list of tuples, one per input sample and in the same order, of the sample
+            ID, the sample version if the sample was saved or None, and the error that
+            prevented the sample from saving if any. The possible errors are an
+            UnauthorizedError if the user does not have write permission to the sample when
+            saving a new version, a NoSuchSampleError if the sample does not exist when saving a
+            new version, and a ConcurrencyError if the sample's version is not equal to the
+            prior version.
+        :raises IllegalParameterError: if a prior version is < 1 or a sample ID occurs more than
+            once in the input.
+        :raises MetadataValidationError: if any of the sample metadata is invalid.
+        :raises SampleStorageError: if the samples fail to save.
+        '''
+        _not_falsy(samples, 'samples')
+        _not_falsy(user, 'user')
+        ids = set()
+        for i, (sample, id_, prior_version) in enumerate(samples):
+            _not_falsy(sample, f'sample at index {i}')
+            try:
+                self._validate_metadata(sample)
+            except _MetadataValidationError as e:
+                raise _MetadataValidationError(
+                    f'Error for sample at index {i}: ' + _cast(str, e.message)) from e
+            if id_:
+                if prior_version is not None and prior_version < 1:
+                    raise _IllegalParameterError(
+                        f'Error for sample at index {i}: Prior version must be > 0')
+                if id_ in ids:
+                    raise _IllegalParameterError(
+                        f'Error for sample at index {i}: Sample ID {id_} occurs more than once')
+                ids.add(id_)
+        results: List[Tuple[UUID, Optional[int], Optional[SampleError]]] = [
+            (id_ if id_ else self._uuid_gen(), None, None) for _, id_, _ in samples]
+        versions = [(i, id_) for i, (_, id_, _) in enumerate(samples) if id_]
+        if versions and not as_admin:
+            acls = self._storage.get_sample_set_acls(
+                [id_ for _, id_ in versions], exception=False)
+            for (i, id_), acl in zip(versions, acls):
+                err = self._get_perm_error(id_, user, _SampleAccessType.WRITE, acl) if acl \
+                    else _NoSuchSampleError(str(id_))
+                results[i] = (id_, None, err)
+        now = self._now()
+        indexes = [i for i, r in enumerate(results) if not r[2]]
+        tosave = [(SavedSample(results[i][0], user, list(samples[i][0].nodes), now,
+                               samples[i][0].name),
+                   bool(samples[i][1]),
+                   samples[i][2] if samples[i][1] else None)
+                  for i in indexes]
+        if tosave:
+            for i, ret in zip(indexes, self._storage.save_samples(tosave)):
+                if isinstance(ret, Exception):
+                    results[i] = (results[i][0], None, _cast(SampleError, ret))
+                else:
+                    results[i] = (results[i][0], ret, None)
+                    if self._kafka:
+                        self._kafka.notify_new_sample_version(results[i][0], ret)
+        return results
+
     def _validate_metadata(self, sample: Sample, return_error_detail: bool=False):
         '''
         :params sample: sample to be validated
@@ -143,11 +228,20 @@ class Samples:
             return
         if not acls:
             acls = self._storage.get_sample_acls(id_)
-        level = self._get_access_level(acls, user)
-        if level < access:
+        err = self._get_perm_error(id_, user, access, acls)
+        if err:
+            raise err
+
+    def _get_perm_error(
+            self,
+            id_: UUID,
+            user: Optional[UserID],
+            access: _SampleAccessType,
+            acls: SampleACL) -> Optional[_UnauthorizedError]:
+        if self._get_access_level(acls, user) < access:
             uerr = f'User {user}' if user else 'Anonymous users'
-            errmsg = f'{uerr} {self._unauth_errmap[access]} sample {id_}'
-            raise _UnauthorizedError(errmsg)
+            return _UnauthorizedError(f'{uerr} {self._unauth_errmap[access]} sample {id_}')
+        return None
 
     _unauth_errmap = {_SampleAccessType.OWNER: 'does not own',
                       _SampleAccessType.ADMIN: 'cannot administrate',
@@ -164,7 +258,7 @@ class Samples:
             if as_admin:
                 return
             if not acls:
-                acls = self._storage.get_sample_set_acls(ids_)
+                acls = _cast(List[SampleACL], self._storage.get_sample_set_acls(ids_))
             levels = [self._get_access_level(acl, user) for acl in acls]
             for i, level in enumerate(levels):
                 if level < access:
@@ -213,9 +307,26 @@ class Samples:
         user: Optional[UserID],
         as_admin: bool = False) -> List[SavedSample]:
         '''
+        Get a set of samples. The ACLs for all the samples are fetched in bulk.
+        :param ids_: a list of dictionaries containing the sample "id" and the sample "version".
+            A None version retrieves the latest version of the sample.
+        :param user: the username of the user getting the samples, or None for an anonymous user.
+        :param as_admin: Skip ACL checks.
+        :returns: the samples, in the same order as the input.
+        :raises IllegalParameterError: if a version is supplied and is < 1
+        :raises UnauthorizedError: if the user does not have read permission for a sample.
+        :raises NoSuchSampleError: if a sample does not exist.
+        :raises NoSuchSampleVersionError: if a sample version does not exist.
+        :raises SampleStorageError: if the samples could not be retrieved.
         '''
         for id_ in ids_:
-            self._check_perms(_not_falsy(id_['id'], 'id_'), user, _SampleAccessType.READ, as_admin=as_admin)
+            if id_.get('version') is not None and id_['version'] < 1:
+                raise _IllegalParameterError('Version must be > 0')
+        self._check_batch_perms(
+            [_not_falsy(id_['id'], 'id_') for id_ in ids_],
+            user,
+            _SampleAccessType.READ,
+            as_admin=as_admin)
         return self._storage.get_samples(ids_)
 
     def get_sample_acls(
@@ -396,6 +507,56 @@ class Samples:
                 self._kafka.notify_expired_link(expired_id)
         return dl
 
+    def create_data_links(
+            self,
+            user: UserID,
+            links: List[Tuple[DataUnitID, SampleNodeAddress]],
+            update: bool = False,
+            as_admin: bool = False) -> List[Tuple[DataLink, Optional[UUID]]]:
+        '''
+        Create a batch of links from data units to samples. The permission checks and the
+        semantics for each link are the same as for create_data_link. The batch is atomic -
+        if any link cannot be created, no links are created.
+
+        :param user: the user creating the links.
+        :param links: the data units and the sample nodes to which they are to be linked.
+        :param update: True to expire any extant link if it does not link to the provided sample.
+            If False and a link from a data unit already exists, link creation will fail.
+        :param as_admin: allow link creation to proceed if user does not have
+            appropriate permissions.
+        :returns: for each input link, in the same order, the new link and the ID of the link
+            that was expired in the update process, if any.
+        :raises UnauthorizedError: if the user does not have acceptable permissions.
+        :raises NoSuchSampleError: if a sample does not exist.
+        :raises NoSuchSampleVersionError: if a sample version does not exist.
+        :raises NoSuchSampleNodeError: if a sample node does not exist.
+        :raises NoSuchWorkspaceDataError: if a workspace or UPA doesn't exist.
+        :raises DataLinkExistsError: if a link already exists from a data unit.
+        :raises TooManyDataLinksError: if there are too many links from a sample version or
+            a workspace object version.
+        :raises SampleStorageError: if the samples could not be retrieved.
+        '''
+        _not_falsy(user, 'user')
+        _not_falsy_in_iterable(links, 'links')
+        for duid, sna in links:
+            _not_falsy(duid, 'duid')
+            _not_falsy(sna, 'sna')
+        if not links:
+            return []
+        sids = list(dict.fromkeys(sna.sampleid for _, sna in links))
+        self._check_batch_perms(sids, user, _SampleAccessType.ADMIN, as_admin=as_admin)
+        wsperm = _WorkspaceAccessType.NONE if as_admin else _WorkspaceAccessType.WRITE
+        self._ws.has_permissions(user, wsperm, [duid.upa for duid, _ in links])
+        now = self._now()
+        dls = [DataLink(self._uuid_gen(), duid, sna, now, user) for duid, sna in links]
+        expired_ids = self._storage.create_data_links(dls, update=update)
+        if self._kafka:
+            for dl, expired_id in zip(dls, expired_ids):
+                self._kafka.notify_new_link(dl.id)
+                if expired_id:
+                    self._kafka.notify_expired_link(expired_id)
+        return list(zip(dls, expired_ids))
+
     def expire_data_link(self, user: UserID, duid: DataUnitID, as_admin: bool = False) -> None:
         '''
         Expire a data link, ensuring that it will not show up in link queries without an effective
@@ -436,7 +597,9 @@ class Samples:
             user: Optional[UserID],
             sample: SampleAddress,
             timestamp: datetime.datetime = None,
-            as_admin: bool = False) -> Tuple[List[DataLink], datetime.datetime]:
+            as_admin: bool = False,
+            limit: Optional[int] = None,
+            after: Optional[UUID] = None) -> Tuple[Iterable[DataLink], datetime.datetime]:
         '''
         Get a set of data links originating from a sample at a particular time.
 
@@ -446,7 +609,12 @@ class Samples:
             the current time.
         :param as_admin: allow link retrieval to proceed if user does not have
             appropriate permissions.
-        :returns: a tuple consisting of a list of links and the timestamp used to query the links.
+        :param limit: the maximum number of links to return, or None for no limit.
+        :param after: only return links with an ID greater than this ID. The links are sorted
+            by ID, so pass the ID of the last link of the prior page to get the next page.
+        :returns: a tuple consisting of the links and the timestamp used to query the links.
+            The links are a lazily evaluated iterator rather than a list if the storage system
+            streams link query results and no limit is provided.
         :raises UnauthorizedError: if the user does not have read permission for the sample.
         :raises NoSuchSampleError: if the sample does not exist.
         :raises NoSuchSampleVersionError: if the sample version does not exist.
@@ -457,14 +625,17 @@ class Samples:
         self._check_perms(sample.sampleid, user, _SampleAccessType.READ, as_admin=as_admin)
         wsids = None if as_admin else self._ws.get_user_workspaces(user)
         # TODO DATALINK what about deleted objects? Currently not handled
-        return self._storage.get_links_from_sample(sample, wsids, timestamp), timestamp
+        return self._storage.get_links_from_sample(
+            sample, wsids, timestamp, limit=limit, after=after), timestamp
 
     def get_batch_links_from_sample_set(
             self,
             user: Optional[UserID],
             samples: List[SampleAddress],
             timestamp: datetime.datetime = None,
-            as_admin: bool = False) -> Tuple[List[DataLink], datetime.datetime]:
+            as_admin: bool = False,
+            limit: Optional[int] = None,
+            after: Optional[UUID] = None) -> Tuple[Iterable[DataLink], datetime.datetime]:
         '''
         A batch version of get_links_from_sample. Gets a set of  data links originating
         from multiple samples in a given sampleset at a particular time.
@@ -475,7 +646,12 @@ class Samples:
             the current time.
         :param as_admin: allow link retrieval to proceed if user does not have
             appropriate permissions.
-        :returns: a tuple consisting of a list of links and the timestamp used to query the links.
+        :param limit: the maximum number of links to return, or None for no limit.
+        :param after: only return links with an ID greater than this ID. The links are sorted
+            by ID, so pass the ID of the last link of the prior page to get the next page.
+        :returns: a tuple consisting of the links and the timestamp used to query the links.
+            The links are a lazily evaluated iterator rather than a list if the storage system
+            streams link query results and no limit is provided.
         :raises UnauthorizedError: if the user does not have read permission for the sample.
         :raises NoSuchSampleError: if the sample does not exist.
         :raises NoSuchSampleVersionError: if the sample version does not exist.
@@ -487,7 +663,8 @@ class Samples:
         # checks for all sample acls in one query
         sampleids = [s.sampleid for s in samples]
         self._check_batch_perms(sampleids, user, _SampleAccessType.READ, as_admin=as_admin)
-        return_links = self._storage.get_batch_links_from_samples(samples, wsids, timestamp)
+        return_links = self._storage.get_batch_links_from_samples(
+            samples, wsids, timestamp, limit=limit, after=after)
         return return_links, timestamp
 
     def _resolve_timestamp(self, timestamp: datetime.datetime = None) -> datetime.datetime:
@@ -502,7 +679,9 @@ class Samples:
             user: Optional[UserID],
             upa: UPA,
             timestamp: datetime.datetime = None,
-            as_admin: bool = False) -> Tuple[List[DataLink], datetime.datetime]:
+            as_admin: bool = False,
+            limit: Optional[int] = None,
+            after: Optional[UUID] = None) -> Tuple[Iterable[DataLink], datetime.datetime]:
         '''
         Get a set of data links originating from a workspace object at a particular time.
 
@@ -512,7 +691,12 @@ class Samples:
             the current time.
         :param as_admin: allow link retrieval to proceed if user does not have
             appropriate permissions.
-        :returns: a tuple consisting of a list of links and the timestamp used to query the links.
+        :param limit: the maximum number of links to return, or None for no limit.
+        :param after: only return links with an ID greater than this ID. The links are sorted
+            by ID, so pass the ID of the last link of the prior page to get the next page.
+        :returns: a tuple consisting of the links and the timestamp used to query the links.
+            The links are a lazily evaluated iterator rather than a list if the storage system
+            streams link query results and no limit is provided.
         :raises UnauthorizedError: if the user does not have read permission for the data.
         :raises NoSuchWorkspaceDataError: if the data does not exist.
         '''
@@ -523,7 +707,59 @@ class Samples:
         # NONE still checks that WS/obj exists. If it's deleted this method should fail
         wsperm = _WorkspaceAccessType.NONE if as_admin else _WorkspaceAccessType.READ
         self._ws.has_permission(user, wsperm, upa=upa)
-        return self._storage.get_links_from_data(upa, timestamp), timestamp
+        return self._storage.get_links_from_data(
+            upa, timestamp, limit=limit, after=after), timestamp
+
+    def get_link_history(
+            self,
+            user: Optional[UserID],
+            sample: Optional[UUID],
+            upa: Optional[UPA],
+            dataid: Optional[str] = None,
+            as_admin: bool = False,
+            limit: Optional[int] = None,
+            after: Optional[Tuple[datetime.datetime, UUID]] = None) -> Iterable[DataLink]:
+        '''
+        Get all the links, expired or not, from a sample, a workspace object, or between a
+        sample and a workspace object.
+
+        If an UPA is provided the user must have read permission for the workspace object and
+        links to any sample are returned. Otherwise the user must have read permission for the
+        sample and only links from workspace objects the user can read are returned.
+
+        :param user: the user requesting the links, or None for an anonymous user.
+        :param sample: the ID of the sample from which the links originate, or None for any
+            sample.
+        :param upa: the data from which the links originate, or None for any data.
+        :param dataid: the ID of a data unit within the data. If provided only the links from
+            the data unit are returned. Requires an UPA.
+        :param as_admin: allow link retrieval to proceed if user does not have
+            appropriate permissions.
+        :param limit: the maximum number of links to return, or None for no limit.
+        :param after: only return links after this link creation time and link ID. The links
+            are sorted by creation time and then ID, so pass the creation time and ID of the
+            last link of the prior page to get the next page.
+        :returns: the links. The links are a lazily evaluated iterator rather than a list if
+            the storage system streams link query results and no limit is provided.
+        :raises UnauthorizedError: if the user does not have read permission for the data or
+            sample.
+        :raises NoSuchWorkspaceDataError: if the data does not exist.
+        :raises NoSuchSampleError: if the sample does not exist.
+        :raises NoSuchUserError: if the user does not exist.
+        '''
+        if not sample and not upa:
+            raise ValueError('At least one of sample or upa must be provided')
+        wsids = None
+        if upa:
+            # NONE still checks that WS/obj exists. If it's deleted this method should fail
+            wsperm = _WorkspaceAccessType.NONE if as_admin else _WorkspaceAccessType.READ
+            self._ws.has_permission(user, wsperm, upa=upa)
+        else:
+            self._check_perms(
+                _cast(UUID, sample), user, _SampleAccessType.READ, as_admin=as_admin)
+            wsids = None if as_admin else self._ws.get_user_workspaces(user)
+        return self._storage.get_link_history(
+            sample, upa, dataid, wsids, limit=limit, after=after)
 
     def get_sample_via_data(
             self,
@@ -570,6 +806,42 @@ class Samples:
         # if we expose this to users need to add ACL checking. Don't see a use case ATM.
         return self._storage.get_data_link(_not_falsy(link_id, 'link_id'))
 
+    def get_consistency_checker_status(self) -> Optional[Dict[str, Any]]:
+        '''
+        Get the status of the database consistency checker. See
+        ArangoSampleStorage.get_consistency_checker_status for the contents of the status.
+
+        :returns: the status, or None if the consistency checker has never run.
+        '''
+        return self._storage.get_consistency_checker_status()
+
+    def get_sample_cache_stats(self) -> Dict[str, int]:
+        '''
+        Get statistics for the sample version cache for this process. See
+        ArangoSampleStorage.get_sample_cache_stats for the contents of the statistics.
+
+        :returns: the statistics.
+        '''
+        return self._storage.get_sample_cache_stats()
+
+    def get_read_repair_stats(self) -> Dict[str, int]:
+        '''
+        Get statistics for the repair of sample versions found to be incomplete when read by this
+        process. See ArangoSampleStorage.get_read_repair_stats for the contents of the statistics.
+
+        :returns: the statistics.
+        '''
+        return self._storage.get_read_repair_stats()
+
+    def get_shared_sample_cache_stats(self) -> Dict[str, int]:
+        '''
+        Get statistics for the sample version cache shared between processes on this host. See
+        ArangoSampleStorage.get_shared_sample_cache_stats for the contents of the statistics.
+
+        :returns: the statistics.
+        '''
+        return self._storage.get_shared_sample_cache_stats()
+
     def validate_sample(self, sample: Sample):
         '''
         This method performs only the validation steps on a sample
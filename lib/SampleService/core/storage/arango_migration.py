@@ -0,0 +1,453 @@
+'''
+Online schema migrations for the ArangoDB based storage system for the Sample service.
+'''
+
+# A migration moves the database from one version of the schema to the next by running a series
+# of steps, each of which updates the documents in one collection in batches. While a migration
+# is running the schema document is marked as in update and records the target version of the
+# schema, so that servers at the target version can start and use the database. Servers at the
+# prior version can also start if the migration says they can read migrated documents.
+#
+# Progress is checkpointed in the schema collection after every round of batches. A migration
+# that is paused, or whose process dies, resumes from the last checkpoint when it is run again,
+# so the documents in the last round may be updated twice - steps must be idempotent.
+#
+# Steps that update an optional collection, such as the node body collection, are skipped if
+# the collection is not configured.
+#
+# Only one migrator may run against a database at once.
+
+import datetime
+from concurrent.futures import ThreadPoolExecutor as _ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import arango as _arango
+from arango.database import StandardDatabase
+
+from SampleService.core.arg_checkers import (
+    not_falsy as _not_falsy,
+    check_string as _check_string,
+)
+from SampleService.core.storage.arango_sample_storage import (
+    _FLD_ARANGO_KEY,
+    _FLD_NODE_CONTROLLED_METADATA,
+    _FLD_NODE_META_KEY,
+    _FLD_NODE_META_OUTER_KEY,
+    _FLD_NODE_META_SOURCE_KEY,
+    _FLD_NODE_META_VALUE,
+    _FLD_NODE_SAMPLE_ID,
+    _FLD_NODE_SOURCE_METADATA,
+    _FLD_NODE_UNCONTROLLED_METADATA,
+    _FLD_NODE_UUID_VER,
+    _FLD_NODE_VER,
+    _FLD_SCHEMA_PRIOR_COMPATIBLE,
+    _FLD_SCHEMA_TARGET,
+    _FLD_SCHEMA_UPDATE,
+    _FLD_SCHEMA_VERSION,
+    _FLD_VERSIONS,
+    _MIGRATION_CHECKPOINT_KEY,
+    _SCHEMA_VALUE,
+    _SCHEMA_VERSION,
+    _VAL_NO_VER,
+)
+from SampleService.core.storage.errors import SampleStorageError as _SampleStorageError
+from SampleService.core.storage.errors import StorageInitError as _StorageInitError
+
+# checkpoint document fields
+# the schema version the migration is migrating from.
+_FLD_CP_FROM = 'from'
+# the index of the step in progress.
+_FLD_CP_STEP = 'step'
+# the last document key processed by the step in progress.
+_FLD_CP_AFTER = 'after'
+# the number of documents updated by the migration so far.
+_FLD_CP_UPDATED = 'updated'
+# whether the migration has been asked to pause.
+_FLD_CP_PAUSED = 'paused'
+# the time of the last checkpoint in epoch milliseconds.
+_FLD_CP_TIME = 'time'
+
+# collection names available to migration steps
+COLLECTION_SAMPLE = 'sample'
+COLLECTION_VERSION = 'version'
+COLLECTION_NODE = 'node'
+COLLECTION_NODE_BODY = 'node_body'
+
+
+class MigrationStep:
+    '''
+    A step in a migration that updates documents in one collection.
+
+    The step is expressed as AQL operating on a document `d` in the collection, which is bound to
+    `@@col`. Other collections are bound as `@<name>_col`, e.g. `@sample_col`, if they are listed
+    in `collections`.
+    '''
+
+    def __init__(
+            self,
+            collection: str,
+            description: str,
+            filter_: str,
+            update: str,
+            collections: List[str] = None):
+        '''
+        Create the step.
+
+        :param collection: the collection to update, one of the COLLECTION_* values. If the
+            collection is optional and not configured the step is skipped.
+        :param description: a description of the step.
+        :param filter_: an AQL condition selecting the documents to update.
+        :param update: AQL statements, ending with an UPDATE, REPLACE or REMOVE of `d` in
+            `@@col`, applied to each selected document. The statements may filter out documents
+            that don't need updating.
+        :param collections: the other collections the AQL needs bound, if any.
+        '''
+        self.collection = _check_string(collection, 'collection')
+        self.description = _check_string(description, 'description')
+        self.filter = _not_falsy(filter_, 'filter_')
+        self.update = _not_falsy(update, 'update')
+        self.collections = collections or []
+
+
+class Migration:
+    '''
+    A migration from one version of the database schema to the next.
+    '''
+
+    def __init__(
+            self,
+            from_version: int,
+            description: str,
+            steps: List[MigrationStep],
+            prior_compatible: bool):
+        '''
+        Create the migration.
+
+        :param from_version: the version of the schema the migration starts from. The migration
+            leaves the database at the next version.
+        :param description: a description of the migration.
+        :param steps: the steps of the migration, run in order.
+        :param prior_compatible: True if servers at from_version can read documents written by
+            servers at the next version and by the migration, and so may keep running while the
+            migration is in progress.
+        '''
+        self.from_version = from_version
+        self.to_version = from_version + 1
+        self.description = _check_string(description, 'description')
+        self.steps = _not_falsy(steps, 'steps')
+        self.prior_compatible = prior_compatible
+
+
+def _meta_to_map(field: str) -> str:
+    # AQL converting a v2 list of {ok, k, v} metadata documents to a map of outer key to a map
+    # of inner key to value
+    return f'''ZIP(
+                (FOR m IN d.{field} || [] COLLECT ok = m.{_FLD_NODE_META_OUTER_KEY} RETURN ok),
+                (FOR m IN d.{field} || []
+                    COLLECT ok = m.{_FLD_NODE_META_OUTER_KEY} INTO g = m
+                    RETURN ZIP(g[*].{_FLD_NODE_META_KEY}, g[*].{_FLD_NODE_META_VALUE})))'''
+
+
+# converts the metadata in v2 node and node body documents to the v3 format
+_CONVERT_META_FILTER = f'IS_ARRAY(d.{_FLD_NODE_CONTROLLED_METADATA})'
+_CONVERT_META_UPDATE = f'''
+            UPDATE d WITH {{
+                {_FLD_NODE_CONTROLLED_METADATA}: {_meta_to_map(_FLD_NODE_CONTROLLED_METADATA)},
+                {_FLD_NODE_UNCONTROLLED_METADATA}: {_meta_to_map(_FLD_NODE_UNCONTROLLED_METADATA)},
+                {_FLD_NODE_SOURCE_METADATA}: (FOR m IN d.{_FLD_NODE_SOURCE_METADATA} || []
+                    RETURN [m.{_FLD_NODE_META_KEY},
+                            m.{_FLD_NODE_META_SOURCE_KEY},
+                            m.{_FLD_NODE_META_VALUE}])
+                }} IN @@col OPTIONS {{mergeObjects: false}}
+            '''
+
+_MIGRATIONS = {m.from_version: m for m in [
+    Migration(
+        1,
+        'Node documents are no longer updated with the integer version when a sample version '
+        + 'is saved',
+        [MigrationStep(
+            COLLECTION_NODE,
+            'Set the integer version of v1 nodes of completed saves that were not updated',
+            f'd.{_FLD_NODE_VER} == {_VAL_NO_VER}',
+            f'''
+            LET s = DOCUMENT(@sample_col, d.{_FLD_NODE_SAMPLE_ID})
+            FILTER s != null
+            LET ver = POSITION(s.{_FLD_VERSIONS}, d.{_FLD_NODE_UUID_VER}, true) + 1
+            FILTER ver > 0
+            UPDATE d WITH {{{_FLD_NODE_VER}: ver}} IN @@col
+            ''',
+            [COLLECTION_SAMPLE])],
+        # v1 servers fail on reading v2 node documents, which have no integer version
+        False),
+    Migration(
+        2,
+        'Node metadata is stored as maps rather than lists of key / value documents',
+        [MigrationStep(
+            COLLECTION_NODE,
+            'Convert the metadata in node documents to maps',
+            _CONVERT_META_FILTER,
+            _CONVERT_META_UPDATE),
+         MigrationStep(
+            COLLECTION_NODE_BODY,
+            'Convert the metadata in node body documents to maps',
+            _CONVERT_META_FILTER,
+            _CONVERT_META_UPDATE)],
+        # v2 servers fail on reading v3 metadata
+        False),
+]}
+
+
+class ArangoMigrator:
+    '''
+    Runs schema migrations against the database in batches.
+    '''
+
+    def __init__(
+            self,
+            db: StandardDatabase,
+            sample_collection: str,
+            version_collection: str,
+            node_collection: str,
+            schema_collection: str,
+            batch_size: int = 1000,
+            parallelism: int = 4,
+            node_body_collection: Optional[str] = None,
+            now: Callable[[], datetime.datetime] = lambda: datetime.datetime.now(
+                tz=datetime.timezone.utc)):
+        '''
+        Create the migrator.
+
+        :param db: the ArangoDB database containing the sample data.
+        :param sample_collection: the name of the collection containing sample documents.
+        :param version_collection: the name of the collection containing sample version
+            documents.
+        :param node_collection: the name of the collection containing sample node documents.
+        :param schema_collection: the name of the collection containing the schema document.
+        :param batch_size: the maximum number of documents updated by a single query.
+        :param parallelism: the number of batches run concurrently. Progress is checkpointed
+            after each round of concurrent batches.
+        :param node_body_collection: the name of the collection containing node body documents,
+            if the service is configured with one.
+        '''
+        # Don't publicize these params, for testing only
+        # :param now: A callable that returns the current time. Primarily used for testing.
+        # :param migrations: A mapping of schema version to the migration from that version.
+        self._db = _not_falsy(db, 'db')
+        self._cols = {
+            COLLECTION_SAMPLE: _check_string(sample_collection, 'sample_collection'),
+            COLLECTION_VERSION: _check_string(version_collection, 'version_collection'),
+            COLLECTION_NODE: _check_string(node_collection, 'node_collection'),
+        }
+        node_body_collection = _check_string(
+            node_body_collection, 'node_body_collection', optional=True)
+        if node_body_collection:
+            self._cols[COLLECTION_NODE_BODY] = node_body_collection
+        self._col_schema = db.collection(_check_string(schema_collection, 'schema_collection'))
+        if batch_size is None or batch_size < 1:
+            raise ValueError('batch_size must be > 0')
+        if parallelism is None or parallelism < 1:
+            raise ValueError('parallelism must be > 0')
+        self._batch_size = batch_size
+        self._parallelism = parallelism
+        self._now = _not_falsy(now, 'now')
+        self._migrations = _MIGRATIONS
+
+    def get_status(self) -> Optional[Dict[str, Any]]:
+        '''
+        Get the status of the database schema and any migration in progress.
+
+        :returns: None if the database has never been used, or a mapping with the keys:
+            schema_version - the version of the database schema.
+            server_schema_version - the version of the schema this code uses.
+            in_update - whether a migration is in progress.
+            target_version - the version of the schema the migration is migrating to, or None.
+            step - the index of the migration step in progress, or None.
+            step_description - the description of the step in progress, or None.
+            updated - the number of documents the migration has updated, or None.
+            paused - whether the migration has been paused.
+            last_checkpoint - the time of the last checkpoint as a datetime, or None.
+        '''
+        cfgdoc = self._get_doc(_SCHEMA_VALUE)
+        if not cfgdoc:
+            return None
+        cp = self._get_doc(_MIGRATION_CHECKPOINT_KEY)
+        mig = self._migrations.get(cfgdoc[_FLD_SCHEMA_VERSION])
+        step = cp[_FLD_CP_STEP] if cp else None
+        return {
+            'schema_version': cfgdoc[_FLD_SCHEMA_VERSION],
+            'server_schema_version': _SCHEMA_VERSION,
+            'in_update': cfgdoc[_FLD_SCHEMA_UPDATE],
+            'target_version': cfgdoc.get(_FLD_SCHEMA_TARGET),
+            'step': step,
+            'step_description': mig.steps[step].description
+            if mig and step is not None and step < len(mig.steps) else None,
+            'updated': cp[_FLD_CP_UPDATED] if cp else None,
+            'paused': bool(cp and cp[_FLD_CP_PAUSED]),
+            'last_checkpoint': datetime.datetime.fromtimestamp(
+                cp[_FLD_CP_TIME] / 1000, tz=datetime.timezone.utc) if cp else None,
+        }
+
+    def pause(self) -> bool:
+        '''
+        Ask a running migration to stop at its next checkpoint. The migration resumes from the
+        checkpoint when run() is called again.
+
+        :returns: True if a migration is in progress, False otherwise.
+        '''
+        try:
+            self._col_schema.update({_FLD_ARANGO_KEY: _MIGRATION_CHECKPOINT_KEY,
+                                     _FLD_CP_PAUSED: True})
+            return True
+        except _arango.exceptions.DocumentUpdateError as e:
+            if e.error_code == 1202:  # document not found
+                return False
+            # this is a real pain to test
+            raise _SampleStorageError('Connection to database failed: ' + str(e)) from e
+
+    def run(self) -> bool:
+        '''
+        Run migrations until the database is at the schema version this code uses, resuming any
+        migration in progress.
+
+        :returns: True if the database is at the current schema version, False if the
+            migration was paused.
+        :raises StorageInitError: if there is no migration from the database schema version.
+        :raises SampleStorageError: if the connection to the database fails.
+        '''
+        while True:
+            cfgdoc = self._get_doc(_SCHEMA_VALUE)
+            # the server creates the schema document for a new database
+            if not cfgdoc or (cfgdoc[_FLD_SCHEMA_VERSION] == _SCHEMA_VERSION
+                              and not cfgdoc[_FLD_SCHEMA_UPDATE]):
+                return True
+            mig = self._migrations.get(cfgdoc[_FLD_SCHEMA_VERSION])
+            if not mig or cfgdoc.get(_FLD_SCHEMA_TARGET, mig.to_version) != mig.to_version:
+                raise _StorageInitError(
+                    f'No migration from v{cfgdoc[_FLD_SCHEMA_VERSION]} of the database schema')
+            if not self._run_migration(mig):
+                return False
+
+    def _run_migration(self, mig: Migration) -> bool:
+        self._set_schema(mig.from_version, True, mig.to_version, mig.prior_compatible)
+        cp = self._get_doc(_MIGRATION_CHECKPOINT_KEY)
+        if not cp or cp[_FLD_CP_FROM] != mig.from_version:
+            cp = {_FLD_ARANGO_KEY: _MIGRATION_CHECKPOINT_KEY,
+                  _FLD_CP_FROM: mig.from_version,
+                  _FLD_CP_STEP: 0,
+                  _FLD_CP_AFTER: '',
+                  _FLD_CP_UPDATED: 0,
+                  }
+        # resuming clears any pause request. After this the runner never writes the pause flag,
+        # so a pause requested while a round is running isn't overwritten by the checkpoint
+        cp.pop(_FLD_CP_PAUSED, None)
+        self._resume(cp)
+        for i in range(cp[_FLD_CP_STEP], len(mig.steps)):
+            if not self._run_step(mig.steps[i], cp):
+                return False
+            cp[_FLD_CP_STEP] = i + 1
+            cp[_FLD_CP_AFTER] = ''
+            self._checkpoint(cp)
+        self._set_schema(mig.to_version, False, None, None)
+        self._delete_doc(_MIGRATION_CHECKPOINT_KEY)
+        return True
+
+    def _run_step(self, step: MigrationStep, cp: Dict[str, Any]) -> bool:
+        if step.collection not in self._cols:
+            return True  # optional collection that isn't configured
+        bind_vars = {f'{c}_col': self._cols[c] for c in step.collections}
+        bind_vars['@col'] = self._cols[step.collection]
+        keysaql = f'''
+            FOR d IN @@col
+                FILTER d.{_FLD_ARANGO_KEY} > @after
+                FILTER {step.filter}
+                SORT d.{_FLD_ARANGO_KEY}
+                LIMIT @limit
+                RETURN d.{_FLD_ARANGO_KEY}
+            '''
+        updateaql = f'''
+            LET updated = (
+                FOR d IN @@col
+                    FILTER d.{_FLD_ARANGO_KEY} IN @keys
+                    FILTER {step.filter}
+                    {step.update}
+                    RETURN 1
+            )
+            RETURN LENGTH(updated)
+            '''
+        limit = self._batch_size * self._parallelism
+        with _ThreadPoolExecutor(max_workers=self._parallelism) as pool:
+            while True:
+                # check for a pause request from another process before every round
+                current = self._get_doc(_MIGRATION_CHECKPOINT_KEY)
+                if current and current.get(_FLD_CP_PAUSED):
+                    return False
+                keys = self._find_via_aql(keysaql, dict(
+                    bind_vars, after=cp[_FLD_CP_AFTER], limit=limit))
+                if not keys:
+                    return True
+                batches = [keys[i:i + self._batch_size]
+                           for i in range(0, len(keys), self._batch_size)]
+                counts = pool.map(lambda b: self._find_via_aql(
+                    updateaql, dict(bind_vars, keys=b))[0], batches)
+                cp[_FLD_CP_UPDATED] += sum(counts)
+                cp[_FLD_CP_AFTER] = keys[-1]
+                self._checkpoint(cp)
+
+    def _resume(self, cp: Dict[str, Any]):
+        cp[_FLD_CP_TIME] = round(self._now().timestamp() * 1000)
+        try:
+            self._col_schema.insert(
+                dict(cp, **{_FLD_CP_PAUSED: False}), overwrite=True, silent=True)
+        except _arango.exceptions.DocumentInsertError as e:
+            # this is a real pain to test
+            raise _SampleStorageError('Connection to database failed: ' + str(e)) from e
+
+    def _checkpoint(self, cp: Dict[str, Any]):
+        cp[_FLD_CP_TIME] = round(self._now().timestamp() * 1000)
+        try:
+            # update rather than replace to keep any pause request made since the last check
+            self._col_schema.update(cp, check_rev=False, silent=True)
+        except _arango.exceptions.DocumentUpdateError as e:
+            # this is a real pain to test
+            raise _SampleStorageError('Connection to database failed: ' + str(e)) from e
+
+    def _set_schema(
+            self,
+            version: int,
+            inupdate: bool,
+            target: Optional[int],
+            prior_compatible: Optional[bool]):
+        try:
+            # keepNull false removes the target and compatibility fields after the update
+            self._col_schema.update({_FLD_ARANGO_KEY: _SCHEMA_VALUE,
+                                     _FLD_SCHEMA_VERSION: version,
+                                     _FLD_SCHEMA_UPDATE: inupdate,
+                                     _FLD_SCHEMA_TARGET: target,
+                                     _FLD_SCHEMA_PRIOR_COMPATIBLE: prior_compatible,
+                                     },
+                                    keep_none=False, silent=True)
+        except _arango.exceptions.DocumentUpdateError as e:
+            # this is a real pain to test
+            raise _SampleStorageError('Connection to database failed: ' + str(e)) from e
+
+    def _get_doc(self, key: str) -> Optional[dict]:
+        try:
+            return self._col_schema.get(key)
+        except _arango.exceptions.DocumentGetError as e:
+            # this is a real pain to test
+            raise _SampleStorageError('Connection to database failed: ' + str(e)) from e
+
+    def _delete_doc(self, key: str):
+        try:
+            self._col_schema.delete(key, ignore_missing=True, silent=True)
+        except _arango.exceptions.DocumentDeleteError as e:
+            # this is a real pain to test
+            raise _SampleStorageError('Connection to database failed: ' + str(e)) from e
+
+    def _find_via_aql(self, query: str, bind_vars: Dict[str, Any]) -> List[Any]:
+        try:
+            return list(self._db.aql.execute(query, bind_vars=bind_vars))
+        except _arango.exceptions.AQLQueryExecuteError as e:
+            # this is a real pain to test
+            raise _SampleStorageError('Connection to database failed: ' + str(e)) from e
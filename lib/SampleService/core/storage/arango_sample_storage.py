@@ -12,7 +12,7 @@ An ArangoDB based storage system for the Sample service.
 # ouside of this layer
 #
 # The process is:
-# 1) save all the node documents with the integer version = -1 and a UUID version.
+# 1) save all the node documents with the UUID version.
 # 2) save all the node edges.
 # 3) save the version document with the integer version = -1 and the same UUID version.
 # 4) save all the version edges.
@@ -20,33 +20,80 @@ An ArangoDB based storage system for the Sample service.
 #        save the sample document with the UUID version in the ordered version list.
 #    else:
 #        add the UUID version to the end of the sample document's version list.
-# 6) Update the integer version on the node documents.
-# 7) Update the integer version on the version document.
+# 6) Update the integer version on the version document.
 #
-# When accessing data, the data access methods should look for versions == -1 and correct the
-# database appropriately:
+# The version document is the commit marker for the version - node documents are never
+# modified after they are saved and have no integer version. A version's nodes exist as far as
+# the API is concerned if and only if the version document has an integer version or the UUID
+# version is in the sample document's version list.
+#
+# If a node body collection is configured, node metadata is stored in node body documents keyed
+# by the sample ID and a hash of the metadata, and the node documents refer to the body by its
+# key. Bodies are immutable, so a body is only saved if the sample has no identical body yet, and
+# versions that leave most nodes unchanged only save bodies for the changed nodes. Body
+# documents are never deleted since any number of versions may refer to them - bodies saved by
+# a save that is later reaped are simply orphaned.
+#
+# In v1 of the schema the node documents also had an integer version that was updated before
+# the version document. Node documents saved under v1 may still have the field, but it is
+# ignored other than by the database consistency checker, which deletes nodes with a -1 version
+# that were never committed.
+#
+# When accessing data, the data access methods should look for version documents with
+# versions == -1 and correct the database appropriately:
 #
 # * If the UUID version exists in the sample document version list,
-#   set the node and version documents for that UUID version to the index position + 1 of the UUID
+#   set the version document for that UUID version to the index position + 1 of the UUID
 #   version in the sample document version list.
 #
 # * If not or if the sample document does not exist at all *AND* an amount of time has
 #   passed such that it is reasonable that another process saving the sample has completed
-#   (hardcoded to 1h at the time of this writing), delete all the nodes and the version document
+#   (the reaper deletion delay, 1h by default), delete all the nodes and the version document
 #   with the corresponding UUID version.
 #
 # This process means that if a server or the database goes down in the middle of a write, it
 # is always possible to correct the database as long as one server is running.
 #
+# The edges are only needed for Relation Engine traversals. If edge creation is deferred, steps
+# 2 and 4 are skipped and the edges are instead created by the consistency checker from
+# committed version and node documents. The checker processes version documents in save order
+# and records the save time and key of the last version processed as a watermark in the
+# consistency checker lease document. The watermark never passes an uncommitted version, and
+# only versions saved before the reaper update delay are processed, so a save that is still in
+# progress is never skipped. Edge keys are the same as the version and node keys, so creating
+# edges that already exist does nothing.
+#
+# The version, node and edge collections may be sharded by the sample ID rather than _key, with
+# their shards distributed like the sample collection, so that all the documents for a sample
+# are on the same shard. ArangoDB rejects documents with a _key in collections with a custom
+# shard key (error 1466), so in this layout the version, node, and edge keys are generated by the
+# database, edge creation must be deferred, and version and node documents are found by their
+# sample ID and UUID version rather than by key. Queries for a single sample include the sample
+# ID so that the coordinator only sends them to one shard. Since the edge keys are not known in
+# advance, edges are only created for version and node documents that have no edges.
+#
+# Before step 1, an entry containing the sample ID and UUID version is written to the write
+# journal collection, and after step 6 the entry is removed. Any journal entry older than the
+# update delay therefore marks a save that may have been interrupted.
+#
 # The server runs correction code on startup and every minute if start_consistency_checker is
-# called with default arguments.
+# called with default arguments. At startup the version and node collections are scanned for
+# documents with a -1 version, which catches documents saved before the write journal existed.
+# The periodic checker only reads the write journal.
+#
+# Only one process at a time runs the periodic checker. Each process that starts the checker
+# competes for a lease document in the schema collection; the holder renews the lease every time
+# it runs, and if it dies another process takes over once the lease expires.
 #
-# There are two choices for how to deal with node and version documents with an integer version
+# There are two choices for how to deal with version documents with an integer version
 # of -1 in new code:
-# 1) Fix it. This is what get_sample() does - take a look at that code for an example.
-# 2) Ignore any documents (and their respective edges) with a -1 version. Effectively, they
-#    currently don't exist in the db. In time, they'll be removed or updated to the correct
-#    version but the current process doesn't care.
+# 1) Fix it. This is what get_sample() does - take a look at that code for an example. The fix
+#    is queued with _queue_read_repair(), which commits the version in the background at most
+#    once per UUID version per process. The integer version from the sample document is correct
+#    whether or not the version document has been fixed yet, so reads use it directly.
+# 2) Ignore any version documents with a -1 version, and their nodes and respective edges.
+#    Effectively, they currently don't exist in the db. In time, they'll be removed or updated to
+#    the correct version but the current process doesn't care.
 #
 #  DO NOT expose documents containing a -1 version outside the db API.
 #
@@ -68,14 +115,23 @@ An ArangoDB based storage system for the Sample service.
 import arango as _arango
 import datetime
 import hashlib as _hashlib
+import json as _json
+import logging as _logging
+import os as _os
+import random as _random
+import socket as _socket
+import threading as _threading
+import time as _time
 import uuid as _uuid  # lgtm [py/import-and-import-from]
 from uuid import UUID
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor as _ThreadPoolExecutor
 from typing import List, Tuple, Callable, cast as _cast, Optional, Sequence as _Sequence
-from typing import Dict as _Dict, Any as _Any
+from typing import Dict as _Dict, Any as _Any, Union, Iterable, Iterator
 
 from apscheduler.schedulers.background import BackgroundScheduler as _BackgroundScheduler
 from arango.database import StandardDatabase
+from cacheout.lru import LRUCache as _LRUCache  # type: ignore
 
 from SampleService.core.acls import SampleACL, SampleACLDelta
 from SampleService.core.core_types import PrimitiveType as _PrimitiveType
@@ -106,10 +162,15 @@ from SampleService.core.errors import (
 from SampleService.core.storage.errors import SampleStorageError as _SampleStorageError
 from SampleService.core.storage.errors import StorageInitError as _StorageInitError
 from SampleService.core.storage.errors import OwnerChangedError as _OwnerChangedError
+from SampleService.core.storage.sample_cache import SampleCache as _SampleCache
+from SampleService.core.storage.shared_sample_cache import (
+    SharedSampleCache as _SharedSampleCache
+)
 from SampleService.core.user import UserID
 from SampleService.core.workspace import DataUnitID, UPA
 
 _FLD_ARANGO_KEY = '_key'
+_FLD_ARANGO_REV = '_rev'
 _FLD_ARANGO_FROM = '_from'
 _FLD_ARANGO_TO = '_to'
 _FLD_ID = 'id'
@@ -120,17 +181,29 @@ _FLD_NAME = 'name'
 _FLD_USER = 'user'
 _FLD_SAVE_TIME = 'saved'
 _FLD_ACL_UPDATE_TIME = 'aclupdate'
+# a hash of the sample version's name and nodes, see _hash_sample
+_FLD_CONTENT_HASH = 'hash'
 
 _FLD_NODE_NAME = 'name'
 _FLD_NODE_TYPE = 'type'
 _FLD_NODE_PARENT = 'parent'
 _FLD_NODE_SAMPLE_ID = 'id'
+# only present in node documents saved under v1 of the schema, see the notes at the top of the file
 _FLD_NODE_VER = 'ver'
 _FLD_NODE_UUID_VER = 'uuidver'
 _FLD_NODE_INDEX = 'index'
 _FLD_NODE_CONTROLLED_METADATA = 'cmeta'
 _FLD_NODE_UNCONTROLLED_METADATA = 'ucmeta'
 _FLD_NODE_SOURCE_METADATA = 'smeta'
+# the key of the node body document containing the metadata, if the node is stored with a body
+_FLD_NODE_BODY = 'body'
+# the node document fields stored in the body document
+_NODE_BODY_FIELDS = [_FLD_NODE_CONTROLLED_METADATA,
+                     _FLD_NODE_UNCONTROLLED_METADATA,
+                     _FLD_NODE_SOURCE_METADATA]
+# In v3 of the schema controlled and user metadata are stored as maps of outer key to a map of
+# inner key to value, and source metadata as a list of [key, source key, source value] lists.
+# In v2 and earlier metadata was stored as lists of documents with the fields below.
 _FLD_NODE_META_OUTER_KEY = 'ok'
 _FLD_NODE_META_KEY = 'k'
 _FLD_NODE_META_SOURCE_KEY = 'sk'
@@ -163,18 +236,63 @@ _FLD_LINK_EXPIRED_BY = 'expireby'
 # see https://www.arangodb.com/2018/07/time-traveling-with-graph-databases/
 _ARANGO_MAX_INTEGER = 2**53 - 1
 
+# data link count constants. Each count document holds the number of extant links from a sample
+# version or a workspace object version, and the _key is the prefix followed by the UUID version
+# or the UPA with the parts separated by underscores.
+_FLD_LINK_COUNT = 'count'
+_LINK_COUNT_SAMPLE_VER_PREFIX = 'sver_'
+_LINK_COUNT_WS_OBJECT_PREFIX = 'obj_'
+
 _JOB_ID = 'consistencyjob'
 
 # schema version checking constants.
 
 # the current version of the database schema.
-_SCHEMA_VERSION = 1
+# v2: node documents are immutable and have no integer version, the version document is the
+#     commit marker. See the arango_migration module.
+# v3: node metadata is stored as maps rather than lists of key / value documents.
+_SCHEMA_VERSION = 3
+# the oldest schema version this code can read documents from, and so can run against while the
+# database is migrating to _SCHEMA_VERSION. v1 and v2 nodes are read as v3 nodes: the node
+# integer version is ignored and list metadata is converted on read.
+_MIN_READABLE_SCHEMA_VERSION = 1
 # the value for the schema key.
 _SCHEMA_VALUE = 'schema'
 # whether the schema is in the process of an update. Value is a boolean.
 _FLD_SCHEMA_UPDATE = 'inupdate'
 # the version of the schema. Value is _SCHEMA_VERSION.
 _FLD_SCHEMA_VERSION = 'schemaver'
+# the version of the schema an update is migrating the database to. Servers at this version of
+# the schema may start while the update is in progress. Value is an integer.
+_FLD_SCHEMA_TARGET = 'target'
+# whether servers at the version of the schema an update is migrating the database from can read
+# the database while the update is in progress. Value is a boolean.
+_FLD_SCHEMA_PRIOR_COMPATIBLE = 'priorcompat'
+# the value for the key of the migration checkpoint document in the schema collection.
+_MIGRATION_CHECKPOINT_KEY = 'migration'
+
+# consistency checker lease constants. The lease document is stored in the schema collection.
+
+# the value for the lease key.
+_REAPER_LEASE_KEY = 'reaperlease'
+# the ID of the process holding the lease.
+_FLD_LEASE_HOLDER = 'holder'
+# the time the lease expires in epoch milliseconds.
+_FLD_LEASE_EXPIRES = 'expires'
+# the time the last consistency check finished in epoch milliseconds.
+_FLD_LEASE_LAST_RUN = 'lastrun'
+# the duration of the last consistency check in milliseconds.
+_FLD_LEASE_LAST_RUN_DURATION = 'lastdur'
+# the number of journal entries repaired or deleted by the last consistency check.
+_FLD_LEASE_REPAIRED = 'repaired'
+# the save time in epoch milliseconds and the key of the last version document for which edges
+# were created when edge creation is deferred.
+_FLD_LEASE_EDGE_SAVE_TIME = 'edgesaved'
+_FLD_LEASE_EDGE_KEY = 'edgekey'
+
+# write journal constants. The journal document _key is the UUID version.
+_FLD_JOURNAL_SAMPLE_ID = 'id'
+_FLD_JOURNAL_SAVE_TIME = 'saved'
 
 
 class ArangoSampleStorage:
@@ -193,6 +311,20 @@ class ArangoSampleStorage:
             workspace_object_version_shadow_collection: str,
             data_link_collection: str,
             schema_collection: str,
+            write_journal_collection: str,
+            data_link_count_collection: str,
+            reaper_update_delay: datetime.timedelta = datetime.timedelta(minutes=5),
+            reaper_deletion_delay: datetime.timedelta = datetime.timedelta(hours=1),
+            sample_cache_max_bytes: int = 0,
+            shared_sample_cache_path: Optional[str] = None,
+            shared_sample_cache_max_bytes: int = 0,
+            acl_cache_staleness: datetime.timedelta = datetime.timedelta(),
+            acl_cache_max_size: int = 10000,
+            node_body_collection: Optional[str] = None,
+            insert_chunk_size: int = 5000,
+            defer_edges: bool = False,
+            shard_by_sample_id: bool = False,
+            link_stream_batch_size: int = 0,
             # See https://kbase.slack.com/archives/CNRT78G66/p1583967289053500 for justification
             max_links: int = 10000,
             now: Callable[[], datetime.datetime] = lambda: datetime.datetime.now(
@@ -218,6 +350,46 @@ class ArangoSampleStorage:
             object version to sample nodes will be stored, indicating data links.
         :schema_collection: the name of the collection in which information about the database
             schema will be stored.
+        :param write_journal_collection: the name of the collection in which in progress sample
+            saves are recorded so that interrupted saves can be found and corrected.
+        :param data_link_count_collection: the name of the collection in which the number of
+            extant data links from each sample version and workspace object version is stored.
+        :param reaper_update_delay: how long the consistency checker waits after a sample save
+            started before it considers the save to be interrupted and corrects the integer
+            versions of the save's documents.
+        :param reaper_deletion_delay: how long the consistency checker waits after a sample save
+            started before it deletes the documents of a save that was never recorded in the
+            sample document.
+        :param sample_cache_max_bytes: the maximum estimated in memory size of the cache of
+            sample versions in bytes. 0, the default, disables the cache.
+        :param shared_sample_cache_path: the path to a file on the local host in which to store
+            the cache of serialized sample versions shared between processes. None, the default,
+            disables the cache.
+        :param shared_sample_cache_max_bytes: the maximum size of the data in the shared cache
+            of sample versions in bytes. 0, the default, disables the cache.
+        :param acl_cache_staleness: how out of date sample ACLs served from the ACL cache may be.
+            The default, 0, checks the ACL update time in the database on every request, and so
+            only saves transferring the ACLs. Otherwise, the cache polls the database for
+            changed ACLs at most once per staleness period.
+        :param acl_cache_max_size: the maximum number of sample ACLs to cache.
+        :param node_body_collection: the name of the collection in which to store node metadata
+            keyed by a hash of its contents, so that nodes that are unchanged between versions
+            of a sample share the stored metadata. None, the default, stores the metadata in
+            every node document. Once nodes are saved with bodies the collection must remain
+            configured so they can be read.
+        :param insert_chunk_size: the maximum number of documents sent to the database in one
+            insert operation when saving samples.
+        :param defer_edges: True to skip saving the node and version edges when saving a sample
+            and instead create them in the background when the consistency checker runs. The
+            edges are only used by the Relation Engine.
+        :param shard_by_sample_id: True if the version, node, version edge, and node edge
+            collections are sharded by the sample ID field, `id`, rather than by `_key`. The
+            database generates the document keys in this layout, so defer_edges must be True.
+        :param link_stream_batch_size: the number of links fetched from the database at a time
+            when streaming the results of link queries. If > 0, queries for the links from a
+            sample, sample set or workspace object without a limit return an iterator over a
+            streaming database cursor rather than a list, so the links are never all held in
+            memory. 0, the default, disables streaming.
         '''
         # Don't publicize these params, for testing only
         # :param max_links: The maximum links any one sample version or workspace object version
@@ -227,6 +399,9 @@ class ArangoSampleStorage:
         self._db = _not_falsy(db, 'db')
         self._now = _not_falsy(now, 'now')
         self._max_links = max_links
+        # the number of data link transactions a single call may run when it conflicts with
+        # concurrent calls, see _create_data_links() and _update_links()
+        self._link_update_attempts = 100
 
         self._col_sample = _init_collection(
             db, sample_collection, 'sample collection', 'sample_collection')
@@ -248,11 +423,61 @@ class ArangoSampleStorage:
             db, data_link_collection, 'data link collection', 'data_link_collection', edge=True)
         self._col_schema = _init_collection(
             db, schema_collection, 'schema collection', 'schema_collection')
+        self._col_journal = _init_collection(
+            db, write_journal_collection, 'write journal collection', 'write_journal_collection')
+        self._col_link_count = _init_collection(
+            db,
+            data_link_count_collection,
+            'data link count collection',
+            'data_link_count_collection')
+        self._col_node_body = _init_collection(
+            db, node_body_collection, 'node body collection', 'node_body_collection'
+            ) if node_body_collection else None
+        if insert_chunk_size is None or insert_chunk_size < 1:
+            raise ValueError('insert_chunk_size must be > 0')
+        self._insert_chunk_size = insert_chunk_size
+        self._defer_edges = defer_edges
+        if shard_by_sample_id and not defer_edges:
+            raise ValueError('defer_edges must be True if shard_by_sample_id is True')
+        self._shard_by_sample_id = shard_by_sample_id
+        if link_stream_batch_size is None or link_stream_batch_size < 0:
+            raise ValueError('link_stream_batch_size must be >= 0')
+        self._link_stream_batch_size = link_stream_batch_size
+        self._reaper_update_delay = _check_delay(reaper_update_delay, 'reaper_update_delay')
+        self._reaper_deletion_delay = _check_delay(
+            reaper_deletion_delay, 'reaper_deletion_delay')
+        if self._reaper_deletion_delay < self._reaper_update_delay:
+            raise ValueError('reaper_deletion_delay must be >= reaper_update_delay')
+        self._sample_cache = _SampleCache(sample_cache_max_bytes)
+        self._shared_sample_cache = _SharedSampleCache(
+            shared_sample_cache_path, shared_sample_cache_max_bytes)
+        self._acl_cache_staleness = _check_delay(acl_cache_staleness, 'acl_cache_staleness')
+        if acl_cache_max_size is None or acl_cache_max_size < 1:
+            raise ValueError('acl_cache_max_size must be > 0')
+        # sample ID -> (ACLs, raw ACL update time)
+        self._acl_cache = _LRUCache(maxsize=acl_cache_max_size)
+        self._acl_cache_polled: Optional[datetime.datetime] = None
+        self._acl_cache_poll_lock = _threading.Lock()
+        # UUID versions queued for read repair by this process, see _queue_read_repair()
+        self._read_repairs = _LRUCache(maxsize=10000)
+        self._read_repair_lock = _threading.Lock()
+        self._read_repair_stats = {'queued': 0, 'repaired': 0, 'failed': 0}
+        # threads are only started when a repair is queued, so forked processes get their own
+        self._read_repair_executor = _ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='read-repair')
         self._ensure_indexes()
         self._check_schema()
-        self._reaper_deletion_delay = datetime.timedelta(hours=1)  # make configurable?
-        self._reaper_update_delay = datetime.timedelta(minutes=5)  # make configurable?
+        # the number of journal entries processed per query and the maximum time a single
+        # consistency check may run before yielding. The next check resumes where the last
+        # one stopped.
+        self._reaper_batch_size = 1000
+        self._reaper_pass_limit = datetime.timedelta(seconds=30)
+        self._journal_cursor = self._JOURNAL_START
+        # set when the consistency checker is started, see start_consistency_checker()
+        self._reaper_id: Optional[str] = None
+        self._reaper_lease = datetime.timedelta(minutes=3)
         self._check_db_updated()
+        self._check_journal()
         self._scheduler = self._build_scheduler()
 
     def _ensure_indexes(self):
@@ -262,20 +487,45 @@ class ArangoSampleStorage:
             self._col_version.add_persistent_index([_FLD_UUID_VER])
             self._col_version.add_persistent_index([_FLD_VER])  # partial index would be useful
             self._col_nodes.add_persistent_index([_FLD_UUID_VER])
-            self._col_nodes.add_persistent_index([_FLD_VER])  # partial index would be useful
+            # only v1 node documents have a version, see the notes at the top of the file
+            self._col_nodes.add_persistent_index([_FLD_NODE_VER])  # partial index would be useful
             # find links by ID
             self._col_data_link.add_persistent_index([_FLD_LINK_ID])
-            # find links from objects
+            # find links from objects, and the link history of objects in creation order
             self._col_data_link.add_persistent_index(
-                [_FLD_LINK_WORKSPACE_ID, _FLD_LINK_OBJECT_ID, _FLD_LINK_OBJECT_VERSION])
+                [_FLD_LINK_WORKSPACE_ID, _FLD_LINK_OBJECT_ID, _FLD_LINK_OBJECT_VERSION,
+                 _FLD_LINK_CREATED, _FLD_LINK_ID])
             # find links from sample versions
             self._col_data_link.add_persistent_index([_FLD_LINK_SAMPLE_UUID_VERSION])
-            # find links from samples
-            self._col_data_link.add_persistent_index([_FLD_LINK_SAMPLE_ID])
+            # find links from samples, and the link history between a sample and an object in
+            # creation order
+            self._col_data_link.add_persistent_index(
+                [_FLD_LINK_SAMPLE_ID, _FLD_LINK_WORKSPACE_ID, _FLD_LINK_OBJECT_ID,
+                 _FLD_LINK_OBJECT_VERSION, _FLD_LINK_CREATED, _FLD_LINK_ID])
+            # find the link history of samples in creation order
+            self._col_data_link.add_persistent_index(
+                [_FLD_LINK_SAMPLE_ID, _FLD_LINK_CREATED, _FLD_LINK_ID])
+            # find journal entries in save order
+            self._col_journal.add_persistent_index([_FLD_JOURNAL_SAVE_TIME])
+            # find samples with changed ACLs for the ACL cache
+            self._col_sample.add_persistent_index([_FLD_ACL_UPDATE_TIME])
+            if self._defer_edges:
+                # find versions in save order to create their edges
+                self._col_version.add_persistent_index([_FLD_SAVE_TIME])
+            if self._shard_by_sample_id:
+                # find nodes by name for data links, since the node keys are generated
+                self._col_nodes.add_persistent_index([_FLD_NODE_UUID_VER, _FLD_NODE_NAME])
         except _arango.exceptions.IndexCreateError as e:
             # this is a real pain to test.
             raise _SampleStorageError('Connection to database failed: ' + str(e)) from e
 
+    _COUNT_SCHEMA_DOCS_AQL = f'''
+        FOR d IN @@col
+            FILTER d.{_FLD_ARANGO_KEY} NOT IN @ignore
+            COLLECT WITH COUNT INTO count
+            RETURN count
+        '''
+
     def _check_schema(self):
         col = self._col_schema
         try:
@@ -289,27 +539,137 @@ class ArangoSampleStorage:
         # ok, the schema version document is already there, this isn't the first time this
         # database as been used. Now check the document is ok.
         try:
-            if col.count() != 1:
+            # the consistency checker lease and migration checkpoint documents are also stored in
+            # the schema collection
+            count = next(self._db.aql.execute(self._COUNT_SCHEMA_DOCS_AQL, bind_vars={
+                '@col': col.name, 'ignore': [_REAPER_LEASE_KEY, _MIGRATION_CHECKPOINT_KEY]}))
+            if count != 1:
                 raise _StorageInitError(
                     'Multiple config objects found in the database. ' +
                     'This should not happen, something is very wrong.')
             cfgdoc = col.get(_SCHEMA_VALUE)
-            if cfgdoc[_FLD_SCHEMA_VERSION] != _SCHEMA_VERSION:
+            if cfgdoc[_FLD_SCHEMA_UPDATE]:
+                # servers can always run during a migration towards their version from a
+                # version they can read, servers at the prior version only if the migration says
+                # they can read the migrated docs
+                migrating_to_current = (
+                    cfgdoc.get(_FLD_SCHEMA_TARGET, _SCHEMA_VERSION + 1) <= _SCHEMA_VERSION
+                    and cfgdoc[_FLD_SCHEMA_VERSION] >= _MIN_READABLE_SCHEMA_VERSION)
+                if not migrating_to_current and not (
+                        cfgdoc[_FLD_SCHEMA_VERSION] == _SCHEMA_VERSION and
+                        cfgdoc.get(_FLD_SCHEMA_PRIOR_COMPATIBLE)):
+                    raise _StorageInitError(
+                        'The database is in the middle of an update from ' +
+                        f'v{cfgdoc[_FLD_SCHEMA_VERSION]} of the schema. Aborting startup.')
+            elif cfgdoc[_FLD_SCHEMA_VERSION] != _SCHEMA_VERSION:
                 raise _StorageInitError(
                     f'Incompatible database schema. Server is v{_SCHEMA_VERSION}, ' +
                     f'DB is v{cfgdoc[_FLD_SCHEMA_VERSION]}')
-            if cfgdoc[_FLD_SCHEMA_UPDATE]:
-                raise _StorageInitError(
-                    'The database is in the middle of an update from ' +
-                    f'v{cfgdoc[_FLD_SCHEMA_VERSION]} of the schema. Aborting startup.')
         except _arango.exceptions.ArangoServerError as e:
             # this is a real pain to test
             raise _SampleStorageError('Connection to database failed: ' + str(e)) from e
 
     def _check_db_updated(self):
+        # Scans for all unupdated docs, including those saved before the write journal existed.
+        # Only run on startup - the consistency checker reads the journal instead.
+        # Only nodes saved under v1 of the schema can have a -1 version, and once the schema is
+        # migrated only uncommitted v1 nodes, which are deleted, have a -1 version.
         self._check_col_updated(self._col_version)
         self._check_col_updated(self._col_nodes)
 
+    # (save time, uuid version) of the last journal entry processed
+    _JOURNAL_START = (-1, '')
+
+    # Fetches a page of journal entries older than @cutoff, after the cursor, along with the
+    # integer version of the uuid version in the sample document. ver is 0 if the sample
+    # document doesn't exist or doesn't contain the uuid version.
+    _GET_JOURNAL_AQL = f'''
+        FOR j IN @@col
+            FILTER j.{_FLD_JOURNAL_SAVE_TIME} < @cutoff
+            FILTER j.{_FLD_JOURNAL_SAVE_TIME} > @saved OR
+                (j.{_FLD_JOURNAL_SAVE_TIME} == @saved AND j.{_FLD_ARANGO_KEY} > @key)
+            SORT j.{_FLD_JOURNAL_SAVE_TIME}, j.{_FLD_ARANGO_KEY}
+            LIMIT @limit
+            LET s = DOCUMENT(@sample_col, j.{_FLD_JOURNAL_SAMPLE_ID})
+            RETURN {{uuidver: j.{_FLD_ARANGO_KEY},
+                     id: j.{_FLD_JOURNAL_SAMPLE_ID},
+                     saved: j.{_FLD_JOURNAL_SAVE_TIME},
+                     ver: s == null ? 0 : POSITION(s.{_FLD_VERSIONS}, j.{_FLD_ARANGO_KEY}, true) + 1
+                     }}
+        '''
+
+    def _check_journal(self) -> int:
+        # Processes journal entries in batches, resuming from where the last run stopped if it
+        # ran out of time. Entries that can't be resolved yet - a missing version that is younger
+        # than the deletion delay - are skipped and picked up again on a later pass.
+        # Returns the number of entries resolved.
+        resolved = 0
+        start = self._now()
+        cutoff = self._timestamp_seconds_to_milliseconds(
+            (start - self._reaper_update_delay).timestamp())
+        while True:
+            saved, key = self._journal_cursor
+            entries = self._find_via_aql(self._GET_JOURNAL_AQL, {
+                '@col': self._col_journal.name,
+                'sample_col': self._col_sample.name,
+                'cutoff': cutoff,
+                'saved': saved,
+                'key': key,
+                'limit': self._reaper_batch_size,
+                })
+            resolved += self._resolve_journal_entries(entries)
+            if len(entries) < self._reaper_batch_size:
+                self._journal_cursor = self._JOURNAL_START
+                return resolved
+            self._journal_cursor = (entries[-1]['saved'], entries[-1]['uuidver'])
+            if self._now() - start > self._reaper_pass_limit:
+                return resolved
+
+    def _resolve_journal_entries(self, entries: List[dict]) -> int:
+        now = self._now()
+        update = {}
+        delete = []
+        for e in entries:
+            if e['ver']:
+                update[e['uuidver']] = e['ver']
+            else:
+                saved = self._timestamp_to_datetime(
+                    self._timestamp_milliseconds_to_seconds(e['saved']))
+                if now - saved > self._reaper_deletion_delay:
+                    delete.append(e['uuidver'])
+        if update:
+            self._find_via_aql(self._UPDATE_VERS_AQL,
+                               {'@col': self._col_version.name, 'vers': update})
+        if delete:
+            # delete edge docs first to ensure we don't orphan them
+            for col in [self._col_ver_edge, self._col_version, self._col_node_edge,
+                        self._col_nodes]:
+                self._find_via_aql(self._DELETE_VERS_AQL, {'@col': col.name, 'vers': delete})
+        self._delete_many(self._col_journal, list(update.keys()) + delete)
+        return len(update) + len(delete)
+
+    # @vers is a mapping of uuid version to integer version
+    _UPDATE_VERS_AQL = f'''
+        FOR d IN @@col
+            FILTER d.{_FLD_UUID_VER} IN ATTRIBUTES(@vers)
+            UPDATE d WITH {{{_FLD_VER}: @vers[d.{_FLD_UUID_VER}]}} IN @@col
+        '''
+
+    _DELETE_VERS_AQL = f'''
+        FOR d IN @@col
+            FILTER d.{_FLD_UUID_VER} IN @vers
+            REMOVE d IN @@col
+        '''
+
+    def _journal_saves(self, samples: List[Tuple[SavedSample, UUID]]):
+        # record saves in progress before any version or node documents are saved
+        self._insert_many(self._col_journal, [
+            {_FLD_ARANGO_KEY: str(versionid),
+             _FLD_JOURNAL_SAMPLE_ID: str(sample.id),
+             _FLD_JOURNAL_SAVE_TIME: self._timestamp_seconds_to_milliseconds(
+                 sample.savetime.timestamp()),
+             } for sample, versionid in samples])
+
     def _check_col_updated(self, col):
         # this should rarely find unupdated documents so don't worry too much about performance
         try:
@@ -318,8 +678,8 @@ class ArangoSampleStorage:
                 id_ = UUID(doc[_FLD_ID])
                 uver = UUID(doc[_FLD_UUID_VER])
                 ts = self._timestamp_to_datetime(self._timestamp_milliseconds_to_seconds(doc[_FLD_SAVE_TIME]))
-                sampledoc = self._get_sample_doc(id_, exception=False)
-                if not sampledoc:
+                version = self._get_version_position(id_, uver)
+                if version is None:
                     # the sample document was never saved for this version doc
                     self._delete_version_and_node_docs(uver, ts)
                 else:
@@ -327,20 +687,24 @@ class ArangoSampleStorage:
                     # this is to avoid writing to a document in the process of being created
                     if self._now() - ts < self._reaper_update_delay:
                         continue
-                    version = self._get_int_version_from_sample_doc(sampledoc, str(uver))
                     if version:
-                        self._update_version_and_node_docs_with_find(id_, uver, version)
+                        self._commit_version(id_, uver, version)
                     else:
                         self._delete_version_and_node_docs(uver, ts)
         except _arango.exceptions.DocumentGetError as e:
             # this is a real pain to test.
             raise _SampleStorageError('Connection to database failed: ' + str(e)) from e
 
-    def _get_int_version_from_sample_doc(self, sampledoc, uuidverstr):
-        for i, v in enumerate(sampledoc[_FLD_VERSIONS]):
-            if v == uuidverstr:
-                return i + 1
-        return None
+    # Returns null if the sample doesn't exist or the 1-based position of @uuidver in the
+    # sample's version list, 0 if it's not in the list.
+    _GET_VERSION_POSITION_AQL = f'''
+        LET s = DOCUMENT(@sample_col, @id)
+        RETURN s == null ? null : POSITION(s.{_FLD_VERSIONS}, @uuidver, true) + 1
+        '''
+
+    def _get_version_position(self, id_: UUID, uuidver: UUID) -> Optional[int]:
+        return self._find_via_aql(self._GET_VERSION_POSITION_AQL, {
+            'sample_col': self._col_sample.name, 'id': str(id_), 'uuidver': str(uuidver)})[0]
 
     def _delete_version_and_node_docs(self, uuidver, savedate):
         if self._now() - savedate > self._reaper_deletion_delay:
@@ -358,27 +722,316 @@ class ArangoSampleStorage:
 
     def _build_scheduler(self):
         schd = _BackgroundScheduler()
-        schd.add_job(self._check_db_updated, 'interval', seconds=1, id=_JOB_ID)
+        schd.add_job(self._run_consistency_checker, 'interval', seconds=1, id=_JOB_ID)
         schd.start(paused=True)
         return schd
 
-    def start_consistency_checker(self, interval_sec=60):
+    def _run_consistency_checker(self):
+        # only the lease holder checks the journal, so at most one process in the cluster
+        # runs the checker at any one time.
+        start = self._now()
+        if not self._acquire_reaper_lease(start):
+            return
+        resolved = self._check_journal()
+        if self._defer_edges:
+            self._create_deferred_edges()
+        end = self._now()
+        self._find_via_aql(self._RECORD_REAPER_RUN_AQL, {
+            '@col': self._col_schema.name,
+            'key': _REAPER_LEASE_KEY,
+            'holder': self._reaper_id,
+            'lastrun': self._timestamp_seconds_to_milliseconds(end.timestamp()),
+            'lastdur': round((end - start).total_seconds() * 1000),
+            'repaired': resolved,
+            })
+
+    # Creates the lease if it doesn't exist, renews it if it's held by @holder, or takes it
+    # over if it has expired. Returns whether @holder holds the lease.
+    _ACQUIRE_REAPER_LEASE_AQL = f'''
+        UPSERT {{{_FLD_ARANGO_KEY}: @key}}
+            INSERT {{{_FLD_ARANGO_KEY}: @key,
+                     {_FLD_LEASE_HOLDER}: @holder,
+                     {_FLD_LEASE_EXPIRES}: @expires
+                     }}
+            UPDATE OLD.{_FLD_LEASE_HOLDER} == @holder OR OLD.{_FLD_LEASE_EXPIRES} < @now ?
+                {{{_FLD_LEASE_HOLDER}: @holder, {_FLD_LEASE_EXPIRES}: @expires}} : {{}}
+            IN @@col
+            RETURN NEW.{_FLD_LEASE_HOLDER} == @holder
+        '''
+
+    def _acquire_reaper_lease(self, now: datetime.datetime) -> bool:
+        try:
+            return next(self._db.aql.execute(self._ACQUIRE_REAPER_LEASE_AQL, bind_vars={
+                '@col': self._col_schema.name,
+                'key': _REAPER_LEASE_KEY,
+                'holder': self._reaper_id,
+                'now': self._timestamp_seconds_to_milliseconds(now.timestamp()),
+                'expires': self._timestamp_seconds_to_milliseconds(
+                    (now + self._reaper_lease).timestamp()),
+                }))
+        except _arango.exceptions.AQLQueryExecuteError as e:
+            # another process created or updated the lease at the same time
+            if e.error_code in (1200, 1210):  # write-write conflict, unique constraint violation
+                return False
+            # this is a pain to test
+            raise _SampleStorageError('Connection to database failed: ' + str(e)) from e
+
+    _RECORD_REAPER_RUN_AQL = f'''
+        FOR d IN @@col
+            FILTER d.{_FLD_ARANGO_KEY} == @key
+            FILTER d.{_FLD_LEASE_HOLDER} == @holder
+            UPDATE d WITH {{{_FLD_LEASE_LAST_RUN}: @lastrun,
+                            {_FLD_LEASE_LAST_RUN_DURATION}: @lastdur,
+                            {_FLD_LEASE_REPAIRED}: @repaired
+                            }} IN @@col
+        '''
+
+    # Fetches a page of version documents saved before @cutoff and after the watermark, in save
+    # order, along with whether the sample document contains the version.
+    _GET_VERSIONS_AFTER_WATERMARK_AQL = f'''
+        FOR v IN @@col
+            FILTER v.{_FLD_SAVE_TIME} < @cutoff
+            FILTER v.{_FLD_SAVE_TIME} > @saved OR
+                (v.{_FLD_SAVE_TIME} == @saved AND v.{_FLD_ARANGO_KEY} > @key)
+            SORT v.{_FLD_SAVE_TIME}, v.{_FLD_ARANGO_KEY}
+            LIMIT @limit
+            LET s = DOCUMENT(@sample_col, v.{_FLD_ID})
+            RETURN MERGE(
+                KEEP(v, '{_FLD_ARANGO_KEY}', '{_FLD_ID}', '{_FLD_UUID_VER}', '{_FLD_VER}',
+                     '{_FLD_SAVE_TIME}'),
+                {{insample: s != null AND POSITION(s.{_FLD_VERSIONS}, v.{_FLD_UUID_VER})}})
+        '''
+
+    # Creates the version and node edges for the version documents in @vers, as built by
+    # _build_version_and_node_docs. Edges that already exist are ignored.
+    _CREATE_EDGES_AQL = f'''
+        LET veredges = (
+            FOR v IN @vers
+                INSERT {{{_FLD_ARANGO_KEY}: v.{_FLD_ARANGO_KEY},
+                         {_FLD_UUID_VER}: v.{_FLD_UUID_VER},
+                         {_FLD_ARANGO_FROM}: CONCAT(@ver_col_name, '/', v.{_FLD_ARANGO_KEY}),
+                         {_FLD_ARANGO_TO}: CONCAT(@sample_col_name, '/', v.{_FLD_ID})
+                         }} IN @@ver_edge_col OPTIONS {{ignoreErrors: true}}
+                RETURN 1
+        )
+        FOR v IN @vers
+            FOR n IN @@node_col
+                FILTER n.{_FLD_NODE_UUID_VER} == v.{_FLD_UUID_VER}
+                INSERT {{{_FLD_ARANGO_KEY}: n.{_FLD_ARANGO_KEY},
+                         {_FLD_UUID_VER}: n.{_FLD_NODE_UUID_VER},
+                         {_FLD_ARANGO_FROM}: CONCAT(@node_col_name, '/', n.{_FLD_ARANGO_KEY}),
+                         {_FLD_ARANGO_TO}: n.{_FLD_NODE_TYPE} == @biorep ?
+                            CONCAT(@ver_col_name, '/', v.{_FLD_ARANGO_KEY}) :
+                            CONCAT(@node_col_name, '/', v.{_FLD_ARANGO_KEY}, '_',
+                                   MD5(n.{_FLD_NODE_PARENT}))
+                         }} IN @@node_edge_col OPTIONS {{ignoreErrors: true}}
+        '''
+
+    # As _CREATE_EDGES_AQL, but for collections sharded by sample ID, where the keys are generated
+    # by the database. The existing edges are read before any are created, since AQL can't read
+    # a collection after modifying it, and only documents without edges get new edges.
+    _CREATE_EDGES_SHARDED_AQL = f'''
+        LET oldveredges = (
+            FOR v IN @vers
+                FOR e IN @@ver_edge_col
+                    FILTER e.{_FLD_UUID_VER} == v.{_FLD_UUID_VER}
+                    RETURN e.{_FLD_ARANGO_FROM}
+        )
+        LET oldnodeedges = (
+            FOR v IN @vers
+                FOR e IN @@node_edge_col
+                    FILTER e.{_FLD_UUID_VER} == v.{_FLD_UUID_VER}
+                    RETURN e.{_FLD_ARANGO_FROM}
+        )
+        LET veredges = (
+            FOR v IN @vers
+                LET from = CONCAT(@ver_col_name, '/', v.{_FLD_ARANGO_KEY})
+                FILTER from NOT IN oldveredges
+                INSERT {{{_FLD_ID}: v.{_FLD_ID},
+                         {_FLD_UUID_VER}: v.{_FLD_UUID_VER},
+                         {_FLD_ARANGO_FROM}: from,
+                         {_FLD_ARANGO_TO}: CONCAT(@sample_col_name, '/', v.{_FLD_ID})
+                         }} IN @@ver_edge_col
+                RETURN 1
+        )
+        FOR v IN @vers
+            LET nodes = (
+                FOR n IN @@node_col
+                    FILTER n.{_FLD_NODE_SAMPLE_ID} == v.{_FLD_ID}
+                    FILTER n.{_FLD_NODE_UUID_VER} == v.{_FLD_UUID_VER}
+                    RETURN KEEP(n, '{_FLD_ARANGO_KEY}', '{_FLD_NODE_NAME}', '{_FLD_NODE_TYPE}',
+                                '{_FLD_NODE_PARENT}')
+            )
+            LET keys = ZIP(nodes[*].{_FLD_NODE_NAME}, nodes[*].{_FLD_ARANGO_KEY})
+            FOR n IN nodes
+                LET from = CONCAT(@node_col_name, '/', n.{_FLD_ARANGO_KEY})
+                FILTER from NOT IN oldnodeedges
+                INSERT {{{_FLD_ID}: v.{_FLD_ID},
+                         {_FLD_UUID_VER}: v.{_FLD_UUID_VER},
+                         {_FLD_ARANGO_FROM}: from,
+                         {_FLD_ARANGO_TO}: n.{_FLD_NODE_TYPE} == @biorep ?
+                            CONCAT(@ver_col_name, '/', v.{_FLD_ARANGO_KEY}) :
+                            CONCAT(@node_col_name, '/', keys[n.{_FLD_NODE_PARENT}])
+                         }} IN @@node_edge_col
+        '''
+
+    _SET_EDGE_WATERMARK_AQL = f'''
+        FOR d IN @@col
+            FILTER d.{_FLD_ARANGO_KEY} == @key
+            FILTER d.{_FLD_LEASE_HOLDER} == @holder
+            UPDATE d WITH {{{_FLD_LEASE_EDGE_SAVE_TIME}: @saved,
+                            {_FLD_LEASE_EDGE_KEY}: @verkey
+                            }} IN @@col
+        '''
+
+    def _create_deferred_edges(self) -> int:
+        # Creates the edges for committed versions in batches, starting from the watermark,
+        # until it reaches an uncommitted version that will be committed, runs out of versions,
+        # or runs out of time. Returns the number of versions processed.
+        processed = 0
+        start = self._now()
+        # saves that started within the update delay may not have saved their version document
+        cutoff = self._timestamp_seconds_to_milliseconds(
+            (start - self._reaper_update_delay).timestamp())
+        doc = self._get_doc(self._col_schema, _REAPER_LEASE_KEY) or {}
+        saved = doc.get(_FLD_LEASE_EDGE_SAVE_TIME, -1)
+        key = doc.get(_FLD_LEASE_EDGE_KEY, '')
+        while True:
+            vers = self._find_via_aql(self._GET_VERSIONS_AFTER_WATERMARK_AQL, {
+                '@col': self._col_version.name,
+                'sample_col': self._col_sample.name,
+                'cutoff': cutoff,
+                'saved': saved,
+                'key': key,
+                'limit': self._reaper_batch_size,
+                })
+            # The consistency checker will commit uncommitted versions that are in the sample
+            # document, so wait for them. Versions older than the update delay that aren't in
+            # the sample document are from failed saves and will be deleted, so skip them
+            # rather than holding up the edges for every later version until they are.
+            committed = []
+            last = None
+            for v in vers:
+                if v[_FLD_VER] == _VAL_NO_VER and v['insample']:
+                    break
+                last = v
+                if v[_FLD_VER] != _VAL_NO_VER:
+                    committed.append(v)
+            if committed:
+                aql = (self._CREATE_EDGES_SHARDED_AQL if self._shard_by_sample_id
+                       else self._CREATE_EDGES_AQL)
+                self._find_via_aql(aql, {
+                    '@ver_edge_col': self._col_ver_edge.name,
+                    '@node_edge_col': self._col_node_edge.name,
+                    '@node_col': self._col_nodes.name,
+                    'ver_col_name': self._col_version.name,
+                    'node_col_name': self._col_nodes.name,
+                    'sample_col_name': self._col_sample.name,
+                    'biorep': _SubSampleType.BIOLOGICAL_REPLICATE.name,
+                    'vers': committed,
+                    })
+            if last:
+                saved = last[_FLD_SAVE_TIME]
+                key = last[_FLD_ARANGO_KEY]
+                self._find_via_aql(self._SET_EDGE_WATERMARK_AQL, {
+                    '@col': self._col_schema.name,
+                    'key': _REAPER_LEASE_KEY,
+                    'holder': self._reaper_id,
+                    'saved': saved,
+                    'verkey': key,
+                    })
+                processed += len(committed)
+            if len(vers) < self._reaper_batch_size or last is not vers[-1] or (
+                    self._now() - start > self._reaper_pass_limit):
+                return processed
+
+    def get_edge_watermark(self) -> Optional[datetime.datetime]:
+        '''
+        Get the save time of the last sample version for which edges were created in the
+        background when edge creation is deferred. Edges exist for all sample versions saved
+        before this time.
+
+        :returns: the save time or None if no edges have been created in the background.
+        '''
+        doc = self._get_doc(self._col_schema, _REAPER_LEASE_KEY)
+        if not doc or _FLD_LEASE_EDGE_SAVE_TIME not in doc:
+            return None
+        return self._timestamp_to_datetime(
+            self._timestamp_milliseconds_to_seconds(doc[_FLD_LEASE_EDGE_SAVE_TIME]))
+
+    _RELEASE_REAPER_LEASE_AQL = f'''
+        FOR d IN @@col
+            FILTER d.{_FLD_ARANGO_KEY} == @key
+            FILTER d.{_FLD_LEASE_HOLDER} == @holder
+            UPDATE d WITH {{{_FLD_LEASE_EXPIRES}: 0}} IN @@col
+        '''
+
+    def start_consistency_checker(self, interval_sec=60, lease_sec=180):
         '''
         Start the database consistency checker. In production use the consistency checker
         should always be on.
 
+        Every process that starts the consistency checker competes for a lease, and only the
+        process holding the lease runs the checker. The holder renews the lease each time the
+        checker runs. If the holder stops, another process takes over the lease within
+        lease_sec seconds of the last renewal plus interval_sec seconds.
+
         :param interval_ms: How frequently to run the scheduler in seconds. Defaults to one minute.
+        :param lease_sec: How long a process holds the lease after acquiring or renewing it in
+            seconds. Must be longer than interval_sec. Defaults to three minutes.
         '''
         if interval_sec < 1:
             raise ValueError('interval_sec must be > 0')
+        if lease_sec <= interval_sec:
+            raise ValueError('lease_sec must be > interval_sec')
+        if not self._reaper_id:
+            # set here rather than in the constructor so that forked processes get their own IDs
+            self._reaper_id = f'{_socket.gethostname()}:{_os.getpid()}:{_uuid.uuid4()}'
+        self._reaper_lease = datetime.timedelta(seconds=lease_sec)
         self._scheduler.reschedule_job(_JOB_ID, trigger='interval', seconds=interval_sec)
         self._scheduler.resume()
 
     def stop_consistency_checker(self):
         '''
-        Stop the consistency checker.
+        Stop the consistency checker. If this process holds the consistency checker lease, the
+        lease is released so another process can take over immediately.
         '''
         self._scheduler.pause()
+        if self._reaper_id:
+            self._find_via_aql(self._RELEASE_REAPER_LEASE_AQL, {
+                '@col': self._col_schema.name,
+                'key': _REAPER_LEASE_KEY,
+                'holder': self._reaper_id,
+                })
+
+    def get_consistency_checker_status(self) -> Optional[_Dict[str, _Any]]:
+        '''
+        Get the status of the consistency checker lease.
+
+        :returns: None if no process has ever held the lease, or a mapping with the keys:
+            holder - the ID of the process holding the lease.
+            lease_expires - the time the lease expires.
+            last_run - the time the last consistency check finished, or None.
+            last_run_duration - the duration of the last consistency check as a timedelta,
+                or None.
+            repaired - the number of interrupted saves repaired or deleted by the last
+                consistency check, or None.
+        '''
+        doc = self._get_doc(self._col_schema, _REAPER_LEASE_KEY)
+        if not doc:
+            return None
+        lastrun = doc.get(_FLD_LEASE_LAST_RUN)
+        lastdur = doc.get(_FLD_LEASE_LAST_RUN_DURATION)
+        return {
+            'holder': doc[_FLD_LEASE_HOLDER],
+            'lease_expires': self._timestamp_to_datetime(
+                self._timestamp_milliseconds_to_seconds(doc[_FLD_LEASE_EXPIRES])),
+            'last_run': None if lastrun is None else self._timestamp_to_datetime(
+                self._timestamp_milliseconds_to_seconds(lastrun)),
+            'last_run_duration': None if lastdur is None else datetime.timedelta(
+                milliseconds=lastdur),
+            'repaired': doc.get(_FLD_LEASE_REPAIRED),
+        }
 
     def save_sample(self, sample: SavedSample) -> bool:
         '''
@@ -393,31 +1046,16 @@ class ArangoSampleStorage:
         :raises SampleStorageError: if the sample fails to save.
         '''
         _not_falsy(sample, 'sample')
-        if self._get_sample_doc(sample.id, exception=False):
-            return False  # bail early
-        return self._save_sample_pt2(sample)
-
-    # this method is separated so we can test the race condition case where a sample with the
-    # same ID is saved after the check above.
-    def _save_sample_pt2(self, sample: SavedSample) -> bool:
-
+        # There's no check for an existing sample before saving since the caller normally
+        # generates a new ID. If the ID does exist the sample document insert fails and the
+        # reaper cleans up the other documents.
         versionid = _uuid.uuid4()
 
-        self._save_version_and_node_docs(sample, versionid)
+        self._journal_saves([(sample, versionid)])
+        self._save_version_and_node_docs([(sample, versionid)])
 
         # create sample document, adding uuid to version list
-        tosave = {_FLD_ARANGO_KEY: str(sample.id),
-                  # yes, this is redundant. It'll match the ver & node collectons though
-                  _FLD_ID: str(sample.id),  # TODO test this is saved
-                  _FLD_VERSIONS: [str(versionid)],
-                  _FLD_ACL_UPDATE_TIME: sample.savetime.timestamp(),
-                  _FLD_ACLS: {_FLD_OWNER: sample.user.id,
-                              _FLD_ADMIN: [],
-                              _FLD_WRITE: [],
-                              _FLD_READ: [],
-                              _FLD_PUBLIC_READ: False
-                              }
-                  }
+        tosave = self._build_sample_doc(sample, versionid)
         try:
             self._col_sample.insert(tosave)
         except _arango.exceptions.DocumentInsertError as e:
@@ -426,51 +1064,140 @@ class ArangoSampleStorage:
                 return False
             else:  # this is a real pain to test.
                 raise _SampleStorageError('Connection to database failed: ' + str(e)) from e
-        self._update_version_and_node_docs(sample, versionid, 1)
+        self._commit_version(sample.id, versionid, 1)
         return True
 
-    def _update_version_and_node_docs(self, sample: SavedSample, versionid: UUID, version: int):
-        nodeupdates: List[dict] = []
-        for n in sample.nodes:
-            ndoc = {_FLD_ARANGO_KEY: self._get_node_id(sample.id, versionid, n.name),
-                    _FLD_NODE_VER: version,
-                    }
-            nodeupdates.append(ndoc)
-        self._update_many(self._col_nodes, nodeupdates)
+    def _build_sample_doc(self, sample: SavedSample, versionid: UUID) -> dict:
+        return {_FLD_ARANGO_KEY: str(sample.id),
+                # yes, this is redundant. It'll match the ver & node collectons though
+                _FLD_ID: str(sample.id),  # TODO test this is saved
+                _FLD_VERSIONS: [str(versionid)],
+                _FLD_ACL_UPDATE_TIME: sample.savetime.timestamp(),
+                _FLD_ACLS: {_FLD_OWNER: sample.user.id,
+                            _FLD_ADMIN: [],
+                            _FLD_WRITE: [],
+                            _FLD_READ: [],
+                            _FLD_PUBLIC_READ: False
+                            }
+                }
+
+    # Sets the integer versions of the version documents and then removes the journal entries,
+    # in one round trip. @commits is a list of {key: version doc key, id, uuidver, ver}.
+    _COMMIT_VERSIONS_AQL = f'''
+        LET updated = (
+            FOR c IN @commits
+                UPDATE c.key WITH {{{_FLD_VER}: c.ver}} IN @@ver_col
+                RETURN 1
+        )
+        FOR c IN @commits
+            REMOVE c.uuidver IN @@journal_col OPTIONS {{ignoreErrors: true}}
+        '''
 
-        verdocid = self._get_version_id(sample.id, versionid)
-        self._update(self._col_version, {_FLD_ARANGO_KEY: verdocid, _FLD_VER: version})
+    # As _COMMIT_VERSIONS_AQL, but finds the version documents by sample ID and UUID version for
+    # collections sharded by sample ID, where the keys are generated by the database.
+    _COMMIT_VERSIONS_SHARDED_AQL = f'''
+        LET updated = (
+            FOR c IN @commits
+                FOR v IN @@ver_col
+                    FILTER v.{_FLD_ID} == c.id
+                    FILTER v.{_FLD_UUID_VER} == c.uuidver
+                    UPDATE v WITH {{{_FLD_VER}: c.ver}} IN @@ver_col
+                    RETURN 1
+        )
+        FOR c IN @commits
+            REMOVE c.uuidver IN @@journal_col OPTIONS {{ignoreErrors: true}}
+        '''
 
-    def _update_version_and_node_docs_with_find(self, id_: UUID, versionid: UUID, version: int):
+    def _commit_version(self, id_: UUID, versionid: UUID, version: int):
+        self._commit_versions([(id_, versionid, version)])
+
+    def _commit_versions(self, versions: List[Tuple[UUID, UUID, int]]):
+        # the node documents are immutable, so the version document is the only commit marker
+        if not versions:
+            return
+        aql = (self._COMMIT_VERSIONS_SHARDED_AQL if self._shard_by_sample_id
+               else self._COMMIT_VERSIONS_AQL)
+        self._find_via_aql(aql, {
+            '@ver_col': self._col_version.name,
+            '@journal_col': self._col_journal.name,
+            'commits': [{'key': self._get_version_id(id_, versionid),
+                         'id': str(id_),
+                         'uuidver': str(versionid),
+                         'ver': version,
+                         } for id_, versionid, version in versions]
+            })
+
+    def _save_version_and_node_docs(self, samples: List[Tuple[SavedSample, UUID]]):
+        # steps 1-4 of the save process
+        nodedocs: List[dict] = []
+        nodeedgedocs: List[dict] = []
+        verdocs: List[dict] = []
+        veredgedocs: List[dict] = []
+        bodydocs: _Dict[str, dict] = {}
+        for sample, versionid in samples:
+            nd, ned, vd, ved, bd = self._build_version_and_node_docs(sample, versionid)
+            nodedocs.extend(nd)
+            nodeedgedocs.extend(ned)
+            verdocs.append(vd)
+            veredgedocs.append(ved)
+            bodydocs.update(bd)
+        if self._shard_by_sample_id:
+            # the database generates the keys, see the notes on sharding at the top of the file
+            for d in nodedocs + verdocs:
+                del d[_FLD_ARANGO_KEY]
+        self._save_node_bodies(bodydocs)
+        # The steps are independent of each other, so send them all in one request. They just
+        # have to be complete before the sample document is updated.
+        inserts = [(self._col_nodes, nodedocs), (self._col_version, verdocs)]
+        if not self._defer_edges:
+            # TODO the edges actually aren't tested by anything since we're not doing traversals
+            # yet, but they will be
+            inserts += [(self._col_node_edge, nodeedgedocs), (self._col_ver_edge, veredgedocs)]
+        self._insert_many_batched(inserts)
+
+    def _insert_many_batched(self, inserts: List[Tuple[_Any, List[dict]]]):
+        # Inserts documents into multiple collections, in chunks, in a single batch request.
+        # The server executes the requests in the batch in order.
         try:
-            self._col_nodes.update_match({_FLD_UUID_VER: str(versionid)}, {_FLD_VER: version})
-        except _arango.exceptions.DocumentUpdateError as e:
-            # this is a real pain to test.
+            with self._db.begin_batch_execution(return_result=True) as bdb:
+                jobs = [bdb.collection(col.name).insert_many(
+                            docs[i:i + self._insert_chunk_size], silent=True)
+                        for col, docs in inserts
+                        for i in range(0, len(docs), self._insert_chunk_size)]
+            for j in jobs:
+                j.result()  # raises the error if the insert failed
+        except (_arango.exceptions.DocumentInsertError,
+                _arango.exceptions.BatchExecuteError,
+                _arango.exceptions.BatchStateError) as e:  # this is a real pain to test
             raise _SampleStorageError('Connection to database failed: ' + str(e)) from e
 
-        verdocid = self._get_version_id(id_, versionid)
-        self._update(self._col_version, {_FLD_ARANGO_KEY: verdocid, _FLD_VER: version})
-
-    def _save_version_and_node_docs(self, sample: SavedSample, versionid: UUID):
+    def _build_version_and_node_docs(
+            self,
+            sample: SavedSample,
+            versionid: UUID) -> Tuple[List[dict], List[dict], dict, dict, _Dict[str, dict]]:
         verdocid = self._get_version_id(sample.id, versionid)
 
         nodedocs: List[dict] = []
         nodeedgedocs: List[dict] = []
+        bodydocs: _Dict[str, dict] = {}
         for index, n in enumerate(sample.nodes):
             key = self._get_node_id(sample.id, versionid, n.name)
             ndoc = {_FLD_ARANGO_KEY: key,
                     _FLD_NODE_SAMPLE_ID: str(sample.id),
                     _FLD_NODE_UUID_VER: str(versionid),
-                    _FLD_NODE_VER: _VAL_NO_VER,
                     _FLD_SAVE_TIME: self._timestamp_seconds_to_milliseconds(sample.savetime.timestamp()),
                     _FLD_NODE_NAME: n.name,
                     _FLD_NODE_TYPE: n.type.name,
                     _FLD_NODE_PARENT: n.parent,
                     _FLD_NODE_INDEX: index,
-                    _FLD_NODE_CONTROLLED_METADATA: self._meta_to_list(n.controlled_metadata),
-                    _FLD_NODE_UNCONTROLLED_METADATA: self._meta_to_list(n.user_metadata),
-                    _FLD_NODE_SOURCE_METADATA: self._source_meta_to_list(n.source_metadata),
+                    _FLD_NODE_CONTROLLED_METADATA: self._meta_to_doc(n.controlled_metadata),
+                    _FLD_NODE_UNCONTROLLED_METADATA: self._meta_to_doc(n.user_metadata),
+                    _FLD_NODE_SOURCE_METADATA: self._source_meta_to_doc(n.source_metadata),
                     }
+            if self._col_node_body:
+                body = self._build_node_body(sample.id, ndoc)
+                bodydocs[body[_FLD_ARANGO_KEY]] = body
+                ndoc[_FLD_NODE_BODY] = body[_FLD_ARANGO_KEY]
             if n.type == _SubSampleType.BIOLOGICAL_REPLICATE:
                 to = f'{self._col_version.name}/{verdocid}'
             else:
@@ -483,66 +1210,226 @@ class ArangoSampleStorage:
                      }
             nodedocs.append(ndoc)
             nodeedgedocs.append(nedoc)
-        self._insert_many(self._col_nodes, nodedocs)
-        # TODO this actually isn't tested by anything since we're not doing traversals yet, but
-        # it will be
-        self._insert_many(self._col_node_edge, nodeedgedocs)
 
-        # save version document
+        # version document
         verdoc = {_FLD_ARANGO_KEY: verdocid,
                   _FLD_ID: str(sample.id),
                   _FLD_USER: sample.user.id,
                   _FLD_VER: _VAL_NO_VER,
                   _FLD_UUID_VER: str(versionid),
                   _FLD_SAVE_TIME: self._timestamp_seconds_to_milliseconds(sample.savetime.timestamp()),
-                  _FLD_NAME: sample.name
+                  _FLD_NAME: sample.name,
+                  _FLD_CONTENT_HASH: self._hash_sample(sample),
                   # TODO description
                   }
-        self._insert(self._col_version, verdoc)
-
-        # TODO this actually isn't tested by anything since we're not doing traversals yet, but
-        # it will be
         veredgedoc = {_FLD_ARANGO_KEY: verdocid,
                       _FLD_UUID_VER: str(versionid),
                       _FLD_ARANGO_FROM: f'{self._col_version.name}/{verdocid}',
                       _FLD_ARANGO_TO: f'{self._col_sample.name}/{sample.id}',
                       }
-        self._insert(self._col_ver_edge, veredgedoc)
+        return nodedocs, nodeedgedocs, verdoc, veredgedoc, bodydocs
+
+    def _hash_sample(self, sample: SavedSample) -> str:
+        # Hashes the parts of the sample a user provides - the name and the nodes. The hash is
+        # calculated from the sorted metadata so that it doesn't depend on the order of the
+        # metadata keys. Source metadata order is significant.
+        content = _json.dumps(
+            [sample.name, [[n.name,
+                            n.type.name,
+                            n.parent,
+                            self._sorted_meta(n.controlled_metadata),
+                            self._sorted_meta(n.user_metadata),
+                            [[sm.key, sm.sourcekey, sorted(sm.sourcevalue.items())]
+                             for sm in n.source_metadata]
+                            ] for n in sample.nodes]],
+            separators=(',', ':'))
+        return _hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def _sorted_meta(self, m) -> List[List[_Any]]:
+        return sorted([k, ik, m[k][ik]] for k in m for ik in m[k])
+
+    def _build_node_body(self, id_: UUID, nodedoc: dict) -> dict:
+        # moves the metadata from the node doc to a body doc keyed by a hash of the metadata.
+        # The hash is calculated with sorted map keys so that it doesn't depend on the order
+        # of the metadata keys. Source metadata order is significant.
+        body = {f: nodedoc.pop(f) for f in _NODE_BODY_FIELDS}
+        content = _json.dumps([body[f] for f in _NODE_BODY_FIELDS],
+                              sort_keys=True, separators=(',', ':'))
+        body[_FLD_ARANGO_KEY] = f'{id_}_{_hashlib.sha256(content.encode("utf-8")).hexdigest()}'
+        return body
+
+    _GET_EXISTING_KEYS_AQL = f'''
+        FOR d IN DOCUMENT(@col, @keys)
+            RETURN d.{_FLD_ARANGO_KEY}
+        '''
+
+    def _save_node_bodies(self, bodydocs: _Dict[str, dict]):
+        # only send the bodies that aren't already saved. Bodies are never modified, so if
+        # another save inserts the same body first that's fine.
+        if not bodydocs:
+            return
+        col = _cast(_Any, self._col_node_body)
+        for key in self._find_via_aql(self._GET_EXISTING_KEYS_AQL,
+                                      {'col': col.name, 'keys': list(bodydocs.keys())}):
+            del bodydocs[key]
+        if not bodydocs:
+            return
+        try:
+            res = col.insert_many(list(bodydocs.values()), silent=False)
+        except _arango.exceptions.DocumentInsertError as e:  # this is a real pain to test
+            raise _SampleStorageError('Connection to database failed: ' + str(e)) from e
+        for r in res:
+            # 1210 is a unique constraint violation, e.g. another save inserted the body
+            if isinstance(r, _arango.exceptions.DocumentInsertError) and r.error_code != 1210:
+                # this is a real pain to test.
+                raise _SampleStorageError('Connection to database failed: ' + str(r))
+
+    def save_samples(
+            self, samples: List[Tuple[SavedSample, bool, Optional[int]]]
+            ) -> List[Union[int, Exception]]:
+        '''
+        Save many new samples and / or new versions of samples with a small, fixed number of
+        calls to the database. The save protocol is the same as for save_sample and
+        save_sample_version, but each step is applied to all the samples at once.
+
+        The timestamps in the samples are expected to be accurate - the database may become
+        corrupted if this is not the case.
+
+        No permissions checking is performed.
+
+        :param samples: a list of tuples of the sample to save, whether the sample is a new
+            version of an existing sample rather than a new sample, and the prior version of
+            the sample if the sample is a new version, or None. See save_sample_version for
+            the semantics of the prior version.
+        :returns: a list with an entry for each input sample, in the same order as the input.
+            The entry is either the version of the saved sample or the exception describing why
+            the sample failed to save. The exception is a ConcurrencyError if a new sample's ID
+            already exists or the prior version does not match, or a NoSuchSampleError if the
+            sample does not exist when saving a new version.
+        :raises SampleStorageError: if the samples fail to save.
+        '''
+        _not_falsy_in_iterable(samples, 'samples')
+        seen = set()
+        for i, (sample, _, prior_version) in enumerate(samples):
+            _not_falsy(sample, f'sample at index {i}')
+            if sample.id in seen:
+                raise ValueError(f'Duplicate sample ID at index {i}: {sample.id}')
+            seen.add(sample.id)
+            if prior_version is not None and prior_version < 1:
+                raise ValueError(f'prior_version at index {i} must be > 0')
+        if not samples:
+            return []
+        results: List[Optional[Union[int, Exception]]] = [None] * len(samples)
+        # bail early on samples that can't be saved, as in save_sample & save_sample_version
+        counts = self._get_latest_versions([str(s.id) for s, _, _ in samples])
+        for i, (sample, is_version, prior_version) in enumerate(samples):
+            if not is_version:
+                if counts[i]:
+                    results[i] = _ConcurrencyError(f'Sample {sample.id} already exists')
+            elif not counts[i]:
+                results[i] = _NoSuchSampleError(str(sample.id))
+            elif prior_version and counts[i] != prior_version:
+                results[i] = _ConcurrencyError(
+                    f'Version required for sample {sample.id} is {prior_version}, but ' +
+                    f'current version is {counts[i]}')
+        tosave = {i: _uuid.uuid4() for i in range(len(samples)) if results[i] is None}
+        if not tosave:
+            return _cast(List[Union[int, Exception]], results)
+
+        self._journal_saves([(samples[i][0], versionid) for i, versionid in tosave.items()])
+        self._save_version_and_node_docs(
+            [(samples[i][0], versionid) for i, versionid in tosave.items()])
+
+        # step 5
+        new = [i for i in tosave if not samples[i][1]]
+        self._save_sample_docs(samples, tosave, new, results)
+        vers = [i for i in tosave if samples[i][1]]
+        self._push_sample_versions(samples, tosave, vers, results)
+
+        # step 6. Any samples that failed in step 5 are left for the reaper
+        self._commit_versions([(samples[i][0].id, versionid, _cast(int, results[i]))
+                               for i, versionid in tosave.items() if type(results[i]) == int])
+        return _cast(List[Union[int, Exception]], results)
+
+    def _save_sample_docs(self, samples, versionids, indexes, results):
+        if not indexes:
+            return
+        try:
+            res = self._col_sample.insert_many(
+                [self._build_sample_doc(samples[i][0], versionids[i]) for i in indexes],
+                silent=False)
+        except _arango.exceptions.DocumentInsertError as e:  # this is a real pain to test
+            raise _SampleStorageError('Connection to database failed: ' + str(e)) from e
+        for i, r in zip(indexes, res):
+            if not isinstance(r, _arango.exceptions.DocumentInsertError):
+                results[i] = 1
+            elif r.error_code == 1210:  # unique constraint violation code
+                # we'll let the reaper clean up any left over docs
+                results[i] = _ConcurrencyError(f'Sample {samples[i][0].id} already exists')
+            else:  # this is a real pain to test.
+                raise _SampleStorageError('Connection to database failed: ' + str(r))
+
+    _PUSH_VERSIONS_AQL = f'''
+        FOR s IN @@col
+            FILTER s.{_FLD_ARANGO_KEY} IN @ids
+            LET u = @updates[s.{_FLD_ARANGO_KEY}]
+            FILTER u.count == null OR LENGTH(s.{_FLD_VERSIONS}) == u.count
+            UPDATE s WITH {{{_FLD_VERSIONS}: PUSH(s.{_FLD_VERSIONS}, u.verid)}} IN @@col
+                RETURN {{id: NEW.{_FLD_ARANGO_KEY}, ver: LENGTH(NEW.{_FLD_VERSIONS})}}
+        '''
+
+    def _push_sample_versions(self, samples, versionids, indexes, results):
+        if not indexes:
+            return
+        updates = {str(samples[i][0].id): {'verid': str(versionids[i]), 'count': samples[i][2]}
+                   for i in indexes}
+        bind_vars = {'@col': self._col_sample.name,
+                     'ids': list(updates.keys()),
+                     'updates': updates,
+                     }
+        # let the reaper clean up any left over docs if this fails
+        saved = {d['id']: d['ver'] for d in self._find_via_aql(self._PUSH_VERSIONS_AQL, bind_vars)}
+        failed = [str(samples[i][0].id) for i in indexes if str(samples[i][0].id) not in saved]
+        # we checked that the docs existed above, so they must exist now, as in
+        # _save_sample_version_pt2
+        current = dict(zip(failed, self._get_latest_versions(failed))) if failed else {}
+        for i in indexes:
+            sample, _, prior_version = samples[i]
+            if str(sample.id) in saved:
+                results[i] = saved[str(sample.id)]
+            else:
+                results[i] = _ConcurrencyError(
+                    f'Version required for sample {sample.id} is {prior_version}, but ' +
+                    f'current version is {current.get(str(sample.id))}')
 
-    # TODO may need to make a meta collection. See below.
-    # Can only use equality comparisons on arrays:
+    # Storing metadata as maps allows adding persistent indexes on specific metadata values,
+    # e.g. cmeta.<outer key>.<inner key>, which support range queries. Indexes on the array
+    # values of the v2 list format only support equality comparisons:
     # https://www.arangodb.com/docs/stable/indexing-index-basics.html#indexing-array-values
-    # Maybe need a doc for each metadata value, which implies going through the whole
-    # save / version update routine the other docs go through
-    # But that means you can't query for metadata on traversals
-    def _meta_to_list(self, m: _Dict[str, _Dict[str, _PrimitiveType]]) -> List[_Dict[str, _Any]]:
-        ret = []
-        for k in m:
-            ret.extend([{_FLD_NODE_META_OUTER_KEY: k,
-                         _FLD_NODE_META_KEY: ik,
-                         _FLD_NODE_META_VALUE: m[k][ik]}
-                        for ik in m[k]]
-                       )
-        return ret
-
-    def _list_to_meta(
-            self, list_: List[_Dict[str, _Any]]) -> _Dict[str, _Dict[str, _PrimitiveType]]:
+    def _meta_to_doc(
+            self, m: _Dict[str, _Dict[str, _PrimitiveType]]
+            ) -> _Dict[str, _Dict[str, _PrimitiveType]]:
+        return {k: dict(m[k]) for k in m}
+
+    def _doc_to_meta(self, meta: _Any) -> _Dict[str, _Dict[str, _PrimitiveType]]:
+        if not isinstance(meta, list):
+            return meta
+        # v2 of the schema, nodes may not be migrated yet
         ret: _Dict[str, _Dict[str, _PrimitiveType]] = defaultdict(dict)
-        for m in list_:
+        for m in meta:
             ret[m[_FLD_NODE_META_OUTER_KEY]][m[_FLD_NODE_META_KEY]] = m[_FLD_NODE_META_VALUE]
         return dict(ret)  # some libs don't play nice with default dict, in particular maps
 
     # source metadata is informational only and is not expected to be queryable
-    def _source_meta_to_list(self, sm: _Sequence[_SourceMetadata]) -> List[_Dict[str, _Any]]:
-        return [{_FLD_NODE_META_KEY: m.key,
-                 _FLD_NODE_META_SOURCE_KEY: m.sourcekey,
-                 _FLD_NODE_META_VALUE: dict(m.sourcevalue)} for m in sm]
+    def _source_meta_to_doc(self, sm: _Sequence[_SourceMetadata]) -> List[List[_Any]]:
+        return [[m.key, m.sourcekey, dict(m.sourcevalue)] for m in sm]
 
-    def _list_to_source_meta(self, list_: List[_Dict[str, _Any]]) -> List[_SourceMetadata]:
+    def _doc_to_source_meta(self, list_: Optional[List[_Any]]) -> List[_SourceMetadata]:
         # allow for compatibility with old samples without a source meta field
         if not list_:
             return []
-        return [_SourceMetadata(
+        return [_SourceMetadata(*sm) if isinstance(sm, list) else _SourceMetadata(
+            # v2 of the schema, nodes may not be migrated yet
             sm[_FLD_NODE_META_KEY],
             sm[_FLD_NODE_META_SOURCE_KEY],
             sm[_FLD_NODE_META_VALUE]
@@ -554,22 +1441,20 @@ class ArangoSampleStorage:
         except _arango.exceptions.DocumentInsertError as e:  # this is a real pain to test
             raise _SampleStorageError('Connection to database failed: ' + str(e)) from e
 
-    def _insert_many(self, col, docs):
+    def _insert_many(self, col, docs, upsert=False):
         try:
-            col.insert_many(docs, silent=True)
+            for i in range(0, len(docs), self._insert_chunk_size):
+                col.insert_many(docs[i:i + self._insert_chunk_size], silent=True, overwrite=upsert)
         except _arango.exceptions.DocumentInsertError as e:  # this is a real pain to test
             raise _SampleStorageError('Connection to database failed: ' + str(e)) from e
 
-    def _update(self, col, doc):
-        try:
-            col.update(doc, silent=True, keep_none=True)
-        except _arango.exceptions.DocumentUpdateError as e:  # this is a real pain to test
-            raise _SampleStorageError('Connection to database failed: ' + str(e)) from e
-
-    def _update_many(self, col, docs):
+    def _delete_many(self, col, keys):
+        # missing documents are ignored
+        if not keys:
+            return
         try:
-            col.update_many(docs, silent=True)
-        except _arango.exceptions.DocumentUpdateError as e:  # this is a real pain to test
+            col.delete_many(keys, silent=True)
+        except _arango.exceptions.DocumentDeleteError as e:  # this is a real pain to test
             raise _SampleStorageError('Connection to database failed: ' + str(e)) from e
 
     def save_sample_version(self, sample: SavedSample, prior_version: int = None) -> int:
@@ -590,10 +1475,9 @@ class ArangoSampleStorage:
         _not_falsy(sample, 'sample')
         if prior_version is not None and prior_version < 1:
             raise ValueError('prior_version must be > 0')
-        sampledoc = self._get_sample_doc(sample.id, exception=False)
-        if not sampledoc:
+        version = self._get_version_count(sample.id)
+        if not version:
             raise _NoSuchSampleError(str(sample.id))  # bail early
-        version = len(sampledoc[_FLD_VERSIONS])
         if prior_version and version != prior_version:
             raise _ConcurrencyError(f'Version required for sample {sample.id} is ' +
                                     f'{prior_version}, but current version is {version}')
@@ -606,7 +1490,8 @@ class ArangoSampleStorage:
 
         versionid = _uuid.uuid4()
 
-        self._save_version_and_node_docs(sample, versionid)
+        self._journal_saves([(sample, versionid)])
+        self._save_version_and_node_docs([(sample, versionid)])
 
         aql = f'''
             FOR s IN @@col
@@ -632,8 +1517,7 @@ class ArangoSampleStorage:
             if not cur.empty():
                 version = len(cur.next()[_FLD_VERSIONS])
             else:
-                sampledoc = _cast(dict, self._get_sample_doc(sample.id))
-                version = len(sampledoc[_FLD_VERSIONS])
+                version = self._get_version_count(sample.id)
                 # so theoretically there could be a race condition within the race condition such
                 # that the aql doesn't find the doc, then the version gets incremented, and the
                 # version is ok here. That'll take millisecond timing though and the result is
@@ -645,9 +1529,101 @@ class ArangoSampleStorage:
             # this is a real pain to test.
             raise _SampleStorageError('Connection to database failed: ' + str(e)) from e
 
-        self._update_version_and_node_docs(sample, versionid, version)
+        self._commit_version(sample.id, versionid, version)
         return version
 
+    # Returns null if the sample doesn't exist.
+    _GET_LATEST_HASH_AQL = f'''
+        LET s = DOCUMENT(@sample_col, @id)
+        RETURN s == null ? null : {{
+            version: LENGTH(s.{_FLD_VERSIONS}),
+            hash: DOCUMENT(@ver_col, CONCAT(s.{_FLD_ARANGO_KEY}, "_", s.{_FLD_VERSIONS}[-1])
+                ).{_FLD_CONTENT_HASH}
+            }}
+        '''
+
+    # As _GET_LATEST_HASH_AQL, for collections sharded by sample ID.
+    _GET_LATEST_HASH_SHARDED_AQL = f'''
+        LET s = DOCUMENT(@sample_col, @id)
+        RETURN s == null ? null : {{
+            version: LENGTH(s.{_FLD_VERSIONS}),
+            hash: FIRST(
+                FOR v IN @@ver_col
+                    FILTER v.{_FLD_ID} == @id
+                    FILTER v.{_FLD_UUID_VER} == s.{_FLD_VERSIONS}[-1]
+                    RETURN v.{_FLD_CONTENT_HASH})
+            }}
+        '''
+
+    def get_version_if_unchanged(self, sample: SavedSample) -> Optional[int]:
+        '''
+        Check whether a sample is the same as the latest saved version of the sample with the
+        same ID. The sample name and nodes are compared - the user, save time, and any version
+        in the sample are ignored. Versions saved before content hashes were recorded never
+        match.
+
+        :param sample: the sample to check.
+        :returns: the latest version of the sample if it is the same as the sample, or None if
+            the sample is different or does not exist.
+        :raises SampleStorageError: if the connection to the database fails.
+        '''
+        _not_falsy(sample, 'sample')
+        aql = (self._GET_LATEST_HASH_SHARDED_AQL if self._shard_by_sample_id
+               else self._GET_LATEST_HASH_AQL)
+        res = self._find_via_aql(aql, {
+            'sample_col': self._col_sample.name,
+            **self._ver_col_bind_var(),
+            'id': str(sample.id),
+            })[0]
+        if not res or res['hash'] != self._hash_sample(sample):
+            return None
+        return res['version']
+
+    # Fetches the sample document, the requested version document, and the version's nodes,
+    # sorted by index, in a single query. If @version is null the latest version is returned.
+    # uuidver is null if the version doesn't exist.
+    _GET_SAMPLE_AQL = f'''
+        LET s = DOCUMENT(@sample_col, @id)
+        FILTER s != null
+        LET version = @version == null ? LENGTH(s.{_FLD_VERSIONS}) : @version
+        LET uuidver = version > LENGTH(s.{_FLD_VERSIONS}) ? null : s.{_FLD_VERSIONS}[version - 1]
+        LET verdoc = uuidver == null ? null : DOCUMENT(
+            @ver_col, CONCAT(s.{_FLD_ARANGO_KEY}, "_", uuidver))
+        LET nodes = (
+            FOR n IN @@node_col
+                FILTER n.{_FLD_NODE_UUID_VER} == uuidver
+                SORT n.{_FLD_NODE_INDEX}
+                RETURN n.{_FLD_NODE_BODY} == null ? n : MERGE(n, KEEP(
+                    DOCUMENT(@body_col, n.{_FLD_NODE_BODY}) || {{}},
+                    {_json.dumps(_NODE_BODY_FIELDS)}))
+        )
+        RETURN {{version: version, uuidver: uuidver, verdoc: verdoc, nodes: nodes}}
+        '''
+
+    # As _GET_SAMPLE_AQL, for collections sharded by sample ID. Every query of the version and
+    # node collections is on the sample ID so that it only goes to one shard.
+    _GET_SAMPLE_SHARDED_AQL = f'''
+        LET s = DOCUMENT(@sample_col, @id)
+        FILTER s != null
+        LET version = @version == null ? LENGTH(s.{_FLD_VERSIONS}) : @version
+        LET uuidver = version > LENGTH(s.{_FLD_VERSIONS}) ? null : s.{_FLD_VERSIONS}[version - 1]
+        LET verdoc = uuidver == null ? null : FIRST(
+            FOR v IN @@ver_col
+                FILTER v.{_FLD_ID} == @id
+                FILTER v.{_FLD_UUID_VER} == uuidver
+                RETURN v)
+        LET nodes = (
+            FOR n IN @@node_col
+                FILTER n.{_FLD_NODE_SAMPLE_ID} == @id
+                FILTER n.{_FLD_NODE_UUID_VER} == uuidver
+                SORT n.{_FLD_NODE_INDEX}
+                RETURN n.{_FLD_NODE_BODY} == null ? n : MERGE(n, KEEP(
+                    DOCUMENT(@body_col, n.{_FLD_NODE_BODY}) || {{}},
+                    {_json.dumps(_NODE_BODY_FIELDS)}))
+        )
+        RETURN {{version: version, uuidver: uuidver, verdoc: verdoc, nodes: nodes}}
+        '''
+
     def get_sample(self, id_: UUID, version: int = None) -> SavedSample:
         '''
         Get a sample from the database.
@@ -658,80 +1634,351 @@ class ArangoSampleStorage:
         :raises NoSuchSampleVersionError: if the sample version does not exist.
         :raises SampleStorageError: if the sample could not be retrieved.
         '''
-        doc, verdoc, version = self._get_sample_and_version_doc(id_, version)
+        _not_falsy(id_, 'id_')
+        if self._caching:
+            # sample versions never change, so only the latest version number needs to be
+            # looked up for a cache hit
+            version = version if version else self._get_latest_versions([str(id_)])[0]
+            # if the version is 0 the sample doesn't exist, and the query below throws the error
+            sample = self._get_cached_sample(id_, version) if version else None
+            if sample:
+                return sample
+        # resolve the sample doc, version doc, and nodes in one round trip to the DB.
+        bind_vars = {'sample_col': self._col_sample.name,
+                     **self._ver_col_bind_var(),
+                     '@node_col': self._col_nodes.name,
+                     'body_col': self._body_col_name,
+                     'id': str(id_),
+                     'version': version if version else None,
+                     }
+        aql = self._GET_SAMPLE_SHARDED_AQL if self._shard_by_sample_id else self._GET_SAMPLE_AQL
+        try:
+            cur = self._db.aql.execute(aql, bind_vars=bind_vars)
+            res = cur.next() if not cur.empty() else None
+        except _arango.exceptions.AQLQueryExecuteError as e:
+            # this is a real pain to test.
+            raise _SampleStorageError('Connection to database failed: ' + str(e)) from e
+        if not res:
+            raise _NoSuchSampleError(str(id_))
+        version = res['version']
+        if not res['uuidver']:
+            raise _NoSuchSampleVersionError(f'{id_} ver {version}')
+        uuidver = UUID(res['uuidver'])
+        verdoc = res['verdoc']
+        if not verdoc:
+            raise _SampleStorageError(f'Corrupt DB: Missing version {uuidver} for sample {id_}')
+        if not res['nodes']:
+            raise _SampleStorageError(
+                f'Corrupt DB: Missing nodes for version {uuidver} of sample {id_}')
+        if verdoc[_FLD_VER] == _VAL_NO_VER:
+            # since the version id came from the sample doc, the implication
+            # is that the db or server lost connection before the version could be updated
+            # and the reaper hasn't caught it yet, so we go ahead and fix it.
+            self._queue_read_repair(id_, uuidver, version)
+            # only cache versions that were complete when read
+            return self._docs_to_sample(verdoc, res['nodes'], version)
+        sample = self._docs_to_sample(verdoc, res['nodes'], version)
+        self._cache_sample(sample, verdoc, res['nodes'])
+        return sample
+
+    @property
+    def _body_col_name(self) -> str:
+        # if no body collection is configured there are no nodes with bodies to look up, but the
+        # read queries still need a collection name
+        return self._col_node_body.name if self._col_node_body else self._col_nodes.name
+
+    @property
+    def _caching(self) -> bool:
+        return self._sample_cache.enabled or self._shared_sample_cache.enabled
+
+    def _get_cached_sample(self, id_: UUID, version: int) -> Optional[SavedSample]:
+        # check the process cache first, and then the cache shared between processes
+        sample = self._sample_cache.get(id_, version)
+        if not sample:
+            data = self._shared_sample_cache.get(id_, version)
+            if data:
+                doc = _json.loads(data)
+                sample = self._docs_to_sample(doc['v'], doc['n'], version)
+                self._sample_cache.put(sample)
+        return sample
+
+    def _cache_sample(self, sample: SavedSample, verdoc: dict, nodedocs: List[dict]):
+        # callers must only cache versions that were complete when read
+        self._sample_cache.put(sample)
+        if self._shared_sample_cache.enabled:
+            # only store the fields _docs_to_sample needs
+            doc = {'v': {f: verdoc[f] for f in [_FLD_ID, _FLD_USER, _FLD_SAVE_TIME, _FLD_NAME]},
+                   'n': [{f: n.get(f) for f in [
+                        _FLD_NODE_NAME,
+                        _FLD_NODE_TYPE,
+                        _FLD_NODE_PARENT,
+                        _FLD_NODE_CONTROLLED_METADATA,
+                        _FLD_NODE_UNCONTROLLED_METADATA,
+                        _FLD_NODE_SOURCE_METADATA]}
+                         for n in nodedocs]
+                   }
+            self._shared_sample_cache.put(
+                sample.id, _cast(int, sample.version),
+                _json.dumps(doc, separators=(',', ':')).encode('utf-8'))
+
+    # Returns the number of versions of each sample ID in @ids, or 0 if the sample doesn't exist.
+    _GET_LATEST_VERSIONS_AQL = f'''
+        FOR id IN @ids
+            RETURN LENGTH(DOCUMENT(@sample_col, id).{_FLD_VERSIONS})
+        '''
 
-        nodes = self._get_nodes(id_, UUID(verdoc[_FLD_NODE_UUID_VER]), version)
-        dt = self._timestamp_to_datetime(self._timestamp_milliseconds_to_seconds(verdoc[_FLD_SAVE_TIME]))
+    def _get_latest_versions(self, ids_: List[str]) -> List[int]:
+        return self._find_via_aql(self._GET_LATEST_VERSIONS_AQL,
+                                  {'sample_col': self._col_sample.name, 'ids': ids_})
 
+    def _get_version_count(self, id_: UUID) -> int:
+        # samples always have at least one version, so 0 means the sample doesn't exist
+        return self._get_latest_versions([str(_not_falsy(id_, 'id_'))])[0]
+
+    def _docs_to_sample(self, verdoc: dict, nodedocs: List[dict], version: int) -> SavedSample:
+        # expects the node docs to be sorted by index
+        dt = self._timestamp_to_datetime(
+            self._timestamp_milliseconds_to_seconds(verdoc[_FLD_SAVE_TIME]))
         return SavedSample(
-            UUID(doc[_FLD_ID]), UserID(verdoc[_FLD_USER]), nodes, dt, verdoc[_FLD_NAME], version)
+            UUID(verdoc[_FLD_ID]),
+            UserID(verdoc[_FLD_USER]),
+            [self._doc_to_node(n) for n in nodedocs],
+            dt,
+            verdoc[_FLD_NAME],
+            version)
+
+    # Fetches the version documents for a list of {id, version} requests in a single query.
+    # A null version means the latest version. uuidver is null if the version doesn't exist.
+    _GET_SAMPLES_AQL = f'''
+        FOR r IN @reqs
+            LET s = DOCUMENT(@sample_col, r.id)
+            LET version = s == null ? null : (
+                r.version == null ? LENGTH(s.{_FLD_VERSIONS}) : r.version)
+            LET uuidver = s == null OR version > LENGTH(s.{_FLD_VERSIONS}) ?
+                null : s.{_FLD_VERSIONS}[version - 1]
+            LET verdoc = uuidver == null ? null : DOCUMENT(
+                @ver_col, CONCAT(s.{_FLD_ARANGO_KEY}, "_", uuidver))
+            RETURN {{exists: s != null, version: version, uuidver: uuidver, verdoc: verdoc}}
+        '''
+
+    # As _GET_SAMPLES_AQL, for collections sharded by sample ID.
+    _GET_SAMPLES_SHARDED_AQL = f'''
+        FOR r IN @reqs
+            LET s = DOCUMENT(@sample_col, r.id)
+            LET version = s == null ? null : (
+                r.version == null ? LENGTH(s.{_FLD_VERSIONS}) : r.version)
+            LET uuidver = s == null OR version > LENGTH(s.{_FLD_VERSIONS}) ?
+                null : s.{_FLD_VERSIONS}[version - 1]
+            LET verdoc = uuidver == null ? null : FIRST(
+                FOR v IN @@ver_col
+                    FILTER v.{_FLD_ID} == r.id
+                    FILTER v.{_FLD_UUID_VER} == uuidver
+                    RETURN v)
+            RETURN {{exists: s != null, version: version, uuidver: uuidver, verdoc: verdoc}}
+        '''
+
+    _GET_NODES_AQL = f'''
+        FOR n IN @@node_col
+            FILTER n.{_FLD_NODE_UUID_VER} IN @vers
+            SORT n.{_FLD_NODE_INDEX}
+            RETURN n.{_FLD_NODE_BODY} == null ? n : MERGE(n, KEEP(
+                DOCUMENT(@body_col, n.{_FLD_NODE_BODY}) || {{}},
+                {_json.dumps(_NODE_BODY_FIELDS)}))
+        '''
+
+    # As _GET_NODES_AQL, for collections sharded by sample ID. The filter on the sample IDs
+    # limits the query to the shards holding the samples.
+    _GET_NODES_SHARDED_AQL = f'''
+        FOR n IN @@node_col
+            FILTER n.{_FLD_NODE_SAMPLE_ID} IN @ids
+            FILTER n.{_FLD_NODE_UUID_VER} IN @vers
+            SORT n.{_FLD_NODE_INDEX}
+            RETURN n.{_FLD_NODE_BODY} == null ? n : MERGE(n, KEEP(
+                DOCUMENT(@body_col, n.{_FLD_NODE_BODY}) || {{}},
+                {_json.dumps(_NODE_BODY_FIELDS)}))
+        '''
 
     def get_samples(self, ids_: List[_Dict[str, _Any]]) -> List[SavedSample]:
         '''
-        ids_: list of dictionaries containing "id" and "version" field.
+        Get a set of samples from the database. The number of queries made to the database is
+        independent of the number of samples.
+
+        :param ids_: a list of dictionaries containing the sample "id" and, optionally, the
+            sample "version". A missing or None version retrieves the latest version.
+        :returns: the samples, in the same order as the input.
+        :raises NoSuchSampleError: if one of the samples does not exist.
+        :raises NoSuchSampleVersionError: if one of the sample versions does not exist.
+        :raises SampleStorageError: if the samples could not be retrieved.
         '''
-        docs, verdocs, versions = self._get_many_sample_and_version_doc(ids_)
+        reqs = [{'id': str(_not_falsy(id_.get('id'), 'id_')),
+                 'version': id_.get('version') if id_.get('version') else None}
+                for id_ in _cast(List[_Dict[str, _Any]], _not_falsy_in_iterable(ids_, 'ids_'))]
+        if not reqs:
+            return []
+        if not self._caching:
+            return self._get_samples_from_db(reqs)
+        latest = [r for r in reqs if not r['version']]
+        if latest:
+            # if the version is 0 the sample doesn't exist, and the query below throws the error
+            for r, ver in zip(latest, self._get_latest_versions([r['id'] for r in latest])):
+                r['version'] = ver if ver else None
+        samples = [self._get_cached_sample(UUID(r['id']), r['version']) if r['version'] else None
+                   for r in reqs]
+        misses = [i for i, s in enumerate(samples) if not s]
+        if misses:
+            for i, s in zip(misses, self._get_samples_from_db([reqs[i] for i in misses])):
+                samples[i] = s
+        return _cast(List[SavedSample], samples)
+
+    def _get_samples_from_db(self, reqs: List[_Dict[str, _Any]]) -> List[SavedSample]:
+        res = self._get_version_docs(reqs)
+        # this class controls the version ID, and since it's a UUID we can assume it's unique
+        # across all versions of all samples
+        uuidver_to_nodes: _Dict[str, List[dict]] = defaultdict(list)
+        bind_vars = {'@node_col': self._col_nodes.name,
+                     'body_col': self._body_col_name,
+                     'vers': list({r['uuidver'] for r in res})}
+        aql = self._GET_NODES_AQL
+        if self._shard_by_sample_id:
+            aql = self._GET_NODES_SHARDED_AQL
+            bind_vars['ids'] = list({r['id'] for r in reqs})
+        for n in self._find_via_aql(aql, bind_vars):
+            uuidver_to_nodes[n[_FLD_NODE_UUID_VER]].append(n)
+
         samples = []
-        for id_tup in ids_:
-            id_ = str(id_tup['id'])
-            verdoc = verdocs[id_]
-            nodes = self._get_nodes(UUID(id_), UUID(verdoc[_FLD_NODE_UUID_VER]), versions[id_])
-            doc = docs[id_]
-            version = versions[id_]
-            dt = self._timestamp_to_datetime(
-                self._timestamp_milliseconds_to_seconds(verdoc[_FLD_SAVE_TIME])
-            )
-            samples.append(SavedSample(
-                UUID(doc[_FLD_ID]),
-                UserID(verdoc[_FLD_USER]),
-                nodes, dt, verdoc[_FLD_NAME], version
-            ))
+        for r, req in zip(res, reqs):
+            uuidver = r['uuidver']
+            nodes = uuidver_to_nodes[uuidver]
+            if not nodes:
+                raise _SampleStorageError(
+                    f'Corrupt DB: Missing nodes for version {uuidver} of sample {req["id"]}')
+            sample = self._docs_to_sample(r['verdoc'], nodes, r['version'])
+            if r['verdoc'][_FLD_VER] == _VAL_NO_VER:
+                # see the comments in get_sample()
+                self._queue_read_repair(UUID(req['id']), UUID(uuidver), r['version'])
+            else:
+                # only cache versions that were complete when read
+                self._cache_sample(sample, r['verdoc'], nodes)
+            samples.append(sample)
         return samples
 
-    def _get_sample_and_version_doc(
-            self, id_: UUID, version: Optional[int] = None) -> Tuple[dict, dict, int]:
-        doc, uuidversion, version = self._get_sample_doc_and_versions(id_, version)
+    def _queue_read_repair(self, id_: UUID, uuidver: UUID, version: int):
+        # commits a version found uncommitted on read in the background, at most once per
+        # process. If the commit fails the next read queues it again.
+        with self._read_repair_lock:
+            if self._read_repairs.get(uuidver):
+                return
+            self._read_repairs.set(uuidver, True)
+            self._read_repair_stats['queued'] += 1
+        self._read_repair_executor.submit(self._read_repair, id_, uuidver, version)
+
+    def _read_repair(self, id_: UUID, uuidver: UUID, version: int):
+        try:
+            self._commit_version(id_, uuidver, version)
+            stat = 'repaired'
+        except Exception as e:  # don't kill the repair thread
+            _logging.getLogger(__name__).warning(
+                'Read repair of version %s of sample %s failed: %s', uuidver, id_, e)
+            self._read_repairs.delete(uuidver)
+            stat = 'failed'
+        with self._read_repair_lock:
+            self._read_repair_stats[stat] += 1
+
+    def get_read_repair_stats(self) -> _Dict[str, int]:
+        '''
+        Get statistics for the repair of sample versions found to be uncommitted when read by
+        this process. Each version is repaired at most once per process, in the background.
+
+        :returns: a mapping with the keys:
+            queued - the number of versions queued for repair.
+            repaired - the number of versions repaired.
+            failed - the number of repairs that failed. The version is queued again when it is
+                next read.
+        '''
+        with self._read_repair_lock:
+            return dict(self._read_repair_stats)
+
+    def get_sample_cache_stats(self) -> _Dict[str, int]:
+        '''
+        Get statistics for the sample version cache for this process.
+
+        :returns: a mapping with the keys hits, misses, entries, bytes, and max_bytes. See
+            SampleCache.get_stats.
+        '''
+        return self._sample_cache.get_stats()
+
+    def get_shared_sample_cache_stats(self) -> _Dict[str, int]:
+        '''
+        Get statistics for the sample version cache shared between processes on this host.
+
+        :returns: a mapping with the keys hits, misses, entries, bytes, and max_bytes. See
+            SharedSampleCache.get_stats.
+        '''
+        return self._shared_sample_cache.get_stats()
+
+    def _get_version_docs(self, reqs: List[_Dict[str, _Any]]) -> List[dict]:
+        # reqs is a list of {'id': str, 'version': Optional[int]}
+        bind_vars = {'sample_col': self._col_sample.name,
+                     **self._ver_col_bind_var(),
+                     'reqs': reqs,
+                     }
+        aql = self._GET_SAMPLES_SHARDED_AQL if self._shard_by_sample_id else self._GET_SAMPLES_AQL
+        res = self._find_via_aql(aql, bind_vars)
+        for r, req in zip(res, reqs):
+            if not r['exists']:
+                raise _NoSuchSampleError(req['id'])
+            if not r['uuidver']:
+                raise _NoSuchSampleVersionError(f'{req["id"]} ver {r["version"]}')
+            if not r['verdoc']:
+                raise _SampleStorageError(
+                    f'Corrupt DB: Missing version {r["uuidver"]} for sample {req["id"]}')
+        return res
+
+    def _ver_col_bind_var(self) -> _Dict[str, str]:
+        # the sharded queries search the version collection rather than getting documents by key
+        if self._shard_by_sample_id:
+            return {'@ver_col': self._col_version.name}
+        return {'ver_col': self._col_version.name}
+
+    def _find_via_aql(self, query, bind_vars) -> List[_Any]:
+        try:
+            return list(self._db.aql.execute(query, bind_vars=bind_vars))
+        except _arango.exceptions.AQLQueryExecuteError as e:  # this is a pain to test
+            raise _SampleStorageError('Connection to database failed: ' + str(e)) from e
+
+    def _get_sample_version_doc(
+            self, id_: UUID, version: Optional[int] = None) -> Tuple[dict, int]:
+        uuidversion, version = self._get_uuid_version(id_, version)
         verdoc = self._get_version_doc(id_, uuidversion)
         if verdoc[_FLD_VER] == _VAL_NO_VER:
             # since the version id came from the sample doc, the implication
             # is that the db or server lost connection before the version could be updated
             # and the reaper hasn't caught it yet, so we go ahead and fix it.
-            self._update_version_and_node_docs_with_find(id_, verdoc[_FLD_UUID_VER], version)
-        return (doc, verdoc, version)
-
-    def _get_sample_doc_and_versions(
-            self, id_: UUID, version: Optional[int] = None) -> Tuple[dict, UUID, int]:
-        doc = _cast(dict, self._get_sample_doc(id_))
-        maxver = len(doc[_FLD_VERSIONS])
-        version = version if version else maxver
-        if version > maxver:
+            self._queue_read_repair(id_, UUID(verdoc[_FLD_UUID_VER]), version)
+        return (verdoc, version)
+
+    # Returns null if the sample doesn't exist. Negative indexes count from the end of the list.
+    _GET_UUID_VERSION_AQL = f'''
+        LET s = DOCUMENT(@sample_col, @id)
+        RETURN s == null ? null : {{
+            count: LENGTH(s.{_FLD_VERSIONS}),
+            uuidver: s.{_FLD_VERSIONS}[@index]
+            }}
+        '''
+
+    def _get_uuid_version(
+            self, id_: UUID, version: Optional[int] = None) -> Tuple[UUID, int]:
+        res = self._find_via_aql(self._GET_UUID_VERSION_AQL, {
+            'sample_col': self._col_sample.name,
+            'id': str(_not_falsy(id_, 'id_')),
+            'index': version - 1 if version else -1
+            })[0]
+        if not res:
+            raise _NoSuchSampleError(str(id_))
+        version = version if version else res['count']
+        if version > res['count']:
             raise _NoSuchSampleVersionError(f'{id_} ver {version}')
-        return doc, UUID(doc[_FLD_VERSIONS][version - 1]), version
-
-    def _get_many_sample_and_version_doc(self, ids_: List[_Dict[str, _Any]]) -> Tuple[_Dict[str, dict], _Dict[str, dict], _Dict[str, int]]:
-        docs, versions = self._get_many_sample_doc_and_versions(ids_)
-        verdocs = self._get_many_version_docs([(id_, UUID(doc[_FLD_VERSIONS][versions[id_] - 1])) for id_, doc in docs.items()])  # sends id and version id
-        return (docs, verdocs, versions)
-
-    def _get_many_sample_doc_and_versions(self, ids_: List[_Dict[str, _Any]]) -> Tuple[_Dict[str, dict], _Dict[str, int]]:
-        docs = [_cast(dict, doc) for doc in self._get_many_sample_doc(ids_)]
-        ret_docs = {}
-        ret_versions = {}
-        for id_ver in ids_:
-            id_ = id_ver['id']
-            version = id_ver['version']
-            # match to document
-
-        for doc in docs:
-            # get doc id
-            id_ = doc['id']
-            maxver = len(doc[_FLD_VERSIONS])
-            version = version if version else maxver
-            if version > maxver:
-                raise _NoSuchSampleError(f"{id_} ver {version}")
-            ret_versions[id_] = version
-            ret_docs[id_] = doc
-        return ret_docs, ret_versions
+        return UUID(res['uuidver']), version
 
     def _timestamp_to_datetime(self, ts: float) -> datetime.datetime:
         return datetime.datetime.fromtimestamp(ts, tz=datetime.timezone.utc)
@@ -757,70 +2004,31 @@ class ArangoSampleStorage:
     # assumes args are not None, and ver came from the sample doc in the db.
     def _get_version_doc(self, id_: UUID, ver: UUID) -> dict:
         try:
-            doc = self._col_version.get(self._get_version_id(id_, ver))
+            if self._shard_by_sample_id:
+                doc = next(self._col_version.find(
+                    {_FLD_ID: str(id_), _FLD_UUID_VER: str(ver)}, limit=1), None)
+            else:
+                doc = self._col_version.get(self._get_version_id(id_, ver))
         except _arango.exceptions.DocumentGetError as e:  # this is a pain to test
             raise _SampleStorageError('Connection to database failed: ' + str(e)) from e
         if not doc:
             raise _SampleStorageError(f'Corrupt DB: Missing version {ver} for sample {id_}')
         return doc
 
-    def _get_many_version_docs(self, ids_, exception: bool=True) -> _Dict[str, dict]:
-        version_ids = [self._get_version_id(id_, ver) for id_, ver in ids_]
-        ver_docs = self._get_many_docs(self._col_version, version_ids)
-        if not ver_docs:
-            if exception:
-                raise _NoSuchSampleError(f"Could not complete search for samples: {[str(id_['id']) for id_ in ids_]}")
-            # return None
-        return {ver_doc['id']: ver_doc for ver_doc in ver_docs}
-
-    # assumes ver came from the sample doc in the db.
-    def _get_nodes(self, id_: UUID, ver: UUID, version: int) -> List[_SampleNode]:
-        # this class controls the version ID, and since it's a UUID we can assume it's unique
-        # across all versions of all samples
-        try:
-            nodedocs = self._col_nodes.find({_FLD_NODE_UUID_VER: str(ver)})
-            if not nodedocs:
-                raise _SampleStorageError(
-                    f'Corrupt DB: Missing nodes for version {ver} of sample {id_}')
-            index_to_node = {}
-            for n in nodedocs:
-                if n[_FLD_VER] == _VAL_NO_VER:
-                    # since it's assumed the version id came from the sample doc, the implication
-                    # is that the db or server lost connection before the version could be updated
-                    # and the reaper hasn't caught it yet, so we go ahead and fix it.
-                    self._update_version_and_node_docs_with_find(id_, ver, version)
-                index_to_node[n[_FLD_NODE_INDEX]] = _SampleNode(
-                    n[_FLD_NODE_NAME],
-                    _SubSampleType[n[_FLD_NODE_TYPE]],
-                    n[_FLD_NODE_PARENT],
-                    self._list_to_meta(n[_FLD_NODE_CONTROLLED_METADATA]),
-                    self._list_to_meta(n[_FLD_NODE_UNCONTROLLED_METADATA]),
-                    # allow for compatatibility with old samples without a source meta field
-                    self._list_to_source_meta(n.get(_FLD_NODE_SOURCE_METADATA)),
-                    )
-        except _arango.exceptions.DocumentGetError as e:  # this is a pain to test
-            raise _SampleStorageError('Connection to database failed: ' + str(e)) from e
-        # could check for keyerror here if nodes were deleted, but db is corrupt either way
-        # so YAGNI.
-        # Could add a node count to the version... but how about we just assume the db works
-        nodes = [index_to_node[i] for i in range(len(index_to_node))]
-        return nodes
-
-    def _get_sample_doc(self, id_: UUID, exception: bool = True) -> Optional[dict]:
-        doc = self._get_doc(self._col_sample, str(_not_falsy(id_, 'id_')))
-        if not doc:
-            if exception:
-                raise _NoSuchSampleError(str(id_))
-            return None
-        return doc
-
-    def _get_many_sample_doc(self, ids_: List[_Dict[str, _Any]], exception: bool=True) -> List[dict]:
-        docs = self._get_many_docs(self._col_sample, [str(_not_falsy(id_['id'], 'id_')) for id_ in ids_])
-        if not docs:
-            if exception:
-                raise _NoSuchSampleError(f"Could not complete search for samples: {[str(id_['id']) for id_ in ids_]}")
-            # return [{}]
-        return docs
+    def _doc_to_node(self, n: dict) -> _SampleNode:
+        if _FLD_NODE_CONTROLLED_METADATA not in n:
+            raise _SampleStorageError(
+                f'Corrupt DB: Missing body {n.get(_FLD_NODE_BODY)} for node {n[_FLD_NODE_NAME]} '
+                + f'of version {n[_FLD_NODE_UUID_VER]} of sample {n[_FLD_NODE_SAMPLE_ID]}')
+        return _SampleNode(
+            n[_FLD_NODE_NAME],
+            _SubSampleType[n[_FLD_NODE_TYPE]],
+            n[_FLD_NODE_PARENT],
+            self._doc_to_meta(n[_FLD_NODE_CONTROLLED_METADATA]),
+            self._doc_to_meta(n[_FLD_NODE_UNCONTROLLED_METADATA]),
+            # allow for compatatibility with old samples without a source meta field
+            self._doc_to_source_meta(n.get(_FLD_NODE_SOURCE_METADATA)),
+            )
 
     def _get_doc(self, col, id_: str) -> Optional[dict]:
         try:
@@ -836,14 +2044,115 @@ class ArangoSampleStorage:
 
     def get_sample_acls(self, id_: UUID) -> SampleACL:
         '''
-        Get a sample's acls from the database.
+        Get a sample's acls from the database. The acls may be served from the ACL cache, and
+        so may be out of date by up to the ACL cache staleness period.
         :param id_: the ID of the sample.
         :returns: the sample acls.
         :raises NoSuchSampleError: if the sample does not exist.
         :raises SampleStorageError: if the sample could not be retrieved.
         '''
         # return no class for now, might need later
-        doc = _cast(dict, self._get_sample_doc(id_))
+        id_str = str(_not_falsy(id_, 'id_'))
+        acls = self._get_acls_via_cache([id_str])[id_str]
+        if not acls:
+            raise _NoSuchSampleError(id_str)
+        return acls
+
+    def get_sample_set_acls(
+            self, ids_: List[UUID], exception: bool = True) -> List[Optional[SampleACL]]:
+        '''
+        Get the acls for a set of samples from the database in a single query.
+        :param ids_: the IDs of the samples.
+        :param exception: if False, return None for samples that do not exist rather than
+            throwing an exception.
+        :returns: the sample acls, in the same order as the input IDs.
+        :raises NoSuchSampleError: if one of the samples does not exist.
+        :raises SampleStorageError: if the samples could not be retrieved.
+        '''
+        str_ids = [str(id_) for id_ in _not_falsy_in_iterable(ids_, 'ids_')]
+        if not str_ids:
+            return []
+        acls = self._get_acls_via_cache(list(dict.fromkeys(str_ids)))
+        sample_acls: List[Optional[SampleACL]] = []
+        for id_ in str_ids:
+            if acls[id_]:
+                sample_acls.append(acls[id_])
+            elif exception:
+                raise _NoSuchSampleError(id_)
+            else:
+                sample_acls.append(None)
+        return sample_acls
+
+    # For each {id, ts} in @reqs, returns null if the sample doesn't exist, just the ACL update
+    # time if it matches ts, or the ACLs and update time otherwise. This avoids fetching the
+    # sample document's version list.
+    _GET_ACLS_AQL = f'''
+        FOR r IN @reqs
+            LET s = DOCUMENT(@sample_col, r.id)
+            RETURN s == null ? null : (
+                s.{_FLD_ACL_UPDATE_TIME} == r.ts ?
+                    {{{_FLD_ACL_UPDATE_TIME}: s.{_FLD_ACL_UPDATE_TIME}}} :
+                    KEEP(s, "{_FLD_ACLS}", "{_FLD_ACL_UPDATE_TIME}"))
+        '''
+
+    def _get_acls_via_cache(self, ids_: List[str]) -> _Dict[str, Optional[SampleACL]]:
+        # expects ids_ to be unique. Returns None for samples that don't exist.
+        if self._acl_cache_staleness:
+            self._poll_acl_changes()
+        cached = {id_: self._acl_cache.get(id_) for id_ in ids_}
+        # in strict mode check every ACL update time, otherwise just fetch the cache misses
+        check = [id_ for id_ in ids_ if not self._acl_cache_staleness or not cached[id_]]
+        if check:
+            res = self._find_via_aql(self._GET_ACLS_AQL, {
+                'sample_col': self._col_sample.name,
+                'reqs': [{'id': id_, 'ts': cached[id_][1] if cached[id_] else None}
+                         for id_ in check]
+                })
+            for id_, doc in zip(check, res):
+                if not doc:
+                    cached[id_] = None
+                elif _FLD_ACLS in doc:
+                    cached[id_] = (self._doc_to_acls(doc), doc[_FLD_ACL_UPDATE_TIME])
+                    self._acl_cache.set(id_, cached[id_])
+        return {id_: cached[id_][0] if cached[id_] else None for id_ in ids_}
+
+    _GET_CHANGED_ACLS_AQL = f'''
+        FOR s IN @@col
+            FILTER s.{_FLD_ACL_UPDATE_TIME} >= @since
+            RETURN s.{_FLD_ARANGO_KEY}
+        '''
+
+    def _poll_acl_changes(self):
+        # Drops cache entries for samples with ACLs that have changed since the last poll,
+        # polling at most once per staleness period. This process invalidates its own cache
+        # entries when it changes ACLs, the poll catches changes made by other processes.
+        now = self._now()
+        with self._acl_cache_poll_lock:
+            if self._acl_cache_polled and now - self._acl_cache_polled < self._acl_cache_staleness:
+                return
+            if self._acl_cache_polled:
+                # ACL update times are set by the clock of the server making the change, so
+                # overlap the previous poll by the staleness period to allow for clock skew.
+                since = self._acl_cache_polled - self._acl_cache_staleness
+                for id_ in self._find_via_aql(self._GET_CHANGED_ACLS_AQL, {
+                        '@col': self._col_sample.name, 'since': since.timestamp()}):
+                    self._acl_cache.delete(id_)
+            # if this is the first poll, nothing can be in the cache yet
+            self._acl_cache_polled = now
+
+    _GET_SAMPLE_ACLS_AQL = f'''
+        LET s = DOCUMENT(@sample_col, @id)
+        RETURN s == null ? null : KEEP(s, "{_FLD_ACLS}", "{_FLD_ACL_UPDATE_TIME}")
+        '''
+
+    def _get_sample_acls_doc(self, id_: UUID) -> dict:
+        doc = self._find_via_aql(self._GET_SAMPLE_ACLS_AQL, {
+            'sample_col': self._col_sample.name, 'id': str(_not_falsy(id_, 'id_'))})[0]
+        if not doc:
+            raise _NoSuchSampleError(str(id_))
+        return doc
+
+    def _doc_to_acls(self, doc: dict) -> SampleACL:
         acls = doc[_FLD_ACLS]
         return SampleACL(
             UserID(acls[_FLD_OWNER]),
@@ -854,29 +2163,6 @@ class ArangoSampleStorage:
             # allow None for backwards compability with DB entries missing the key
             acls.get(_FLD_PUBLIC_READ))
 
-    def get_sample_set_acls(self, ids_: List[UUID]) -> List[SampleACL]:
-        # function to ensure docs are sorted correctly
-        str_ids = [str(id_) for id_ in ids_]
-        def _keyfunc(doc):
-            return str_ids.index(doc[_FLD_ARANGO_KEY])
-        # have to cast this way for compatibility with _get_many_sample_doc
-        docs = self._get_many_sample_doc([{'id': str_id} for str_id in str_ids])
-        # sort docs (ensure that the right id is raised for errors)
-        sorted_docs = sorted(docs, key=_keyfunc)
-        sample_acls = []
-        for doc in docs:
-            acls = doc[_FLD_ACLS]
-            sample_acls.append(SampleACL(
-                UserID(acls[_FLD_OWNER]),
-                self._timestamp_to_datetime(doc[_FLD_ACL_UPDATE_TIME]),
-                [UserID(u) for u in acls[_FLD_ADMIN]],
-                [UserID(u) for u in acls[_FLD_WRITE]],
-                [UserID(u) for u in acls[_FLD_READ]],
-                acls.get(_FLD_PUBLIC_READ)
-            ))
-
-        return sample_acls
-
     def replace_sample_acls(self, id_: UUID, acls: SampleACL):
         '''
         Completely replace a sample's ACLs.
@@ -922,10 +2208,13 @@ class ArangoSampleStorage:
             cur = self._db.aql.execute(aql, bind_vars=bind_vars, count=True)
             if not cur.count():
                 # assume cur.count() is never > 1 as we're filtering on _key
-                self._get_sample_doc(id_)  # will raise exception if document does not exist
+                if not self._get_version_count(id_):
+                    raise _NoSuchSampleError(str(id_))
                 raise _OwnerChangedError()
         except _arango.exceptions.AQLQueryExecuteError as e:  # this is a real pain to test
             raise _SampleStorageError('Connection to database failed: ' + str(e)) from e
+        finally:
+            self._acl_cache.delete(str(id_))
 
     def update_sample_acls(
             self, id_: UUID, update: SampleACLDelta, update_time: datetime.datetime) -> None:
@@ -943,7 +2232,8 @@ class ArangoSampleStorage:
         # could make an option to just ignore the update to the owner? YAGNI for now.
         _not_falsy(update, 'update')
         _check_timestamp(update_time, 'update_time')
-        s = self.get_sample_acls(id_)
+        # don't use the ACL cache, the ACLs must be up to date to detect a noop
+        s = self._doc_to_acls(self._get_sample_acls_doc(id_))
         if not s.is_update(update):
             # noop. Theoretically the values in the DB may have changed since we pulled the ACLs,
             # but now we're talking about millisecond ordering differences, so don't worry
@@ -1046,6 +2336,8 @@ class ArangoSampleStorage:
                     'If this error occurs frequently, code changes may be necessary.')
         except _arango.exceptions.AQLQueryExecuteError as e:  # this is a real pain to test
             raise _SampleStorageError('Connection to database failed: ' + str(e)) from e
+        finally:
+            self._acl_cache.delete(str(id_))
 
     def create_data_link(self, link: DataLink, update: bool = False) -> Optional[UUID]:
         '''
@@ -1075,15 +2367,14 @@ class ArangoSampleStorage:
         :raises DataLinkExistsError: if a link already exists from the data unit.
         :raises TooManyDataLinksError: if there are too many links from the sample version or
             the workspace object version.
+        :raises ConcurrencyError: if the link could not be saved due to concurrent changes to
+            links from the same data unit, sample version, or workspace object version.
         '''
         # may want to link non-ws data at some point, would need a data source ID? YAGNI for now
 
-        # Using the REST streaming api for the transaction. Might be faster with javascript
-        # server side implementation, but this is easier to read, easier to understand, and easier
-        # to implement. Switch to js if performance becomes an issue.
-
-        # Might want a bulk method for peformance improvement, should take measurements at some
-        # point.
+        # The changes are computed from the current links and then applied by a server side
+        # javascript transaction, so the collection locks are only held for the duration of a
+        # single request. See _update_links.
 
         # For the current link from the DUID, the _key is the DUID. This ensures there's only 1
         # extant link per DUID. For expired links, the expiration time is added to the _key.
@@ -1091,78 +2382,303 @@ class ArangoSampleStorage:
         # Since _keys have a maxium length of 254 chars and the dataid of the DUID may be up to
         # 256 characters and may contain illegal characters, it is MD5'd. See
         # https://www.arangodb.com/docs/stable/data-modeling-naming-conventions-document-keys.html
-
-        # TODO CODE this method is too long, try to split up
         _not_falsy(link, 'link')
         if link.expired:
             raise ValueError('link cannot be expired')
         sna = link.sample_node_address
         # need to get the version doc to ensure the documents have been updated appropriately
         # as well as getting the uuid version, see comments at beginning of file
-        _, versiondoc, _ = self._get_sample_and_version_doc(sna.sampleid, sna.version)
+        versiondoc, _ = self._get_sample_version_doc(sna.sampleid, sna.version)
         samplever = UUID(versiondoc[_FLD_UUID_VER])
-        nodeid = self._get_node_id(sna.sampleid, samplever, sna.node)
-        if not self._get_doc(self._col_nodes, nodeid):
-            raise _NoSuchSampleNodeError(f'{sna.sampleid} ver {sna.version} {sna.node}')
+        nodekey = self._check_nodes_exist([link], [samplever])[0]
+        return self._create_data_links([link], [samplever], [nodekey], update)[0]
 
-        # makes a db specifically for this transaction
-        tdb = self._db.begin_transaction(
-            read=self._col_data_link.name,
-            # Need exclusive as we're counting docs and making decisions based on that number
-            # Write only checks for write collisions on specific docs, so count could change
-            # during transaction
-            exclusive=self._col_data_link.name)
+    def create_data_links(
+            self, links: List[DataLink], update: bool = False) -> List[Optional[UUID]]:
+        '''
+        Link a batch of data units in the workspace to samples. The batch is saved in a single
+        transaction and the number of queries made to the database is independent of the number
+        of links.
 
-        try:
-            # makes a collection specifically for this transaction
-            tdlc = tdb.collection(self._col_data_link.name)
-            oldlinkdoc = self._get_doc(tdlc, self._create_link_key(link))
-            if oldlinkdoc:
-                if not update:  # maybe want to move this after the noop check? or add noop option
-                    raise _DataLinkExistsError(str(link.duid))
-                oldlink = self._doc_to_link(oldlinkdoc)
-                if link.is_equivalent(oldlink):
-                    self._abort_transaction(tdb)
-                    return None  # I don't like having a return in the middle of the method, but
-                    # the alternative seems to be worse
-
-                # See the notes in the expire method, many are relevant here.
-                # However, since this is an exclusive lock and at this point we know the old
-                # linkdoc exists, there's no need to check for key collisions on insert.
-                # The entire transaction may fail, but not the individual inserts.
-                oldlinkdoc[_FLD_LINK_EXPIRED_BY] = link.created_by.id
-                # I'm not a fan of this, but a millisecond gap seems safe and most systems
-                # should have millisecond resolution.
-                # Consider rounding to millisecond resolution for consistency? Make a class?
-                oldlinkdoc[_FLD_LINK_EXPIRED] = self._timestamp_seconds_to_milliseconds(link.created.timestamp() - 0.001)
-                oldlinkdoc[_FLD_ARANGO_KEY] = self._create_link_key_from_link_doc(oldlinkdoc)
-
-                # since we're replacing a link we don't need to worry about counting links from
-                # ws object. Not true for the sample, which could be different.
-                oldsna = oldlink.sample_node_address
-                if sna.sampleid != oldsna.sampleid or sna.version != oldsna.version:
-                    # it doesn't matter if only the node is different since the traversal from
-                    # sample -> workspace objects starts at a version, so the count/version
-                    # of extant links won't change
-                    # Could support starting at a node later
-                    self._check_link_count_from_sample_ver(tdb, samplever, link)
-                self._insert(tdlc, oldlinkdoc)
-            else:
-                # might be able to get rid of these limits if it turns out the link queries
-                # can be done without a traversal, which means the links can be looked up with
-                # an index
-                # but then paging is needed, so need to implement that
-                self._check_link_count_from_ws_object(tdb, link)
-                self._check_link_count_from_sample_ver(tdb, samplever, link)
-
-            ldoc = self._create_link_doc(link, samplever)
-            self._insert(tdlc, ldoc, upsert=bool(oldlinkdoc))
-            # since transaction is exclusive write, conflicts can't happen
-            # presumably any failures are unrecoverable...? conn / db down, etc
-            self._commit_transaction(tdb)
-        finally:
-            self._abort_transaction(tdb)
-        return UUID(oldlinkdoc[_FLD_LINK_ID]) if oldlinkdoc else None
+        The semantics for each link are the same as for create_data_link. The batch is atomic -
+        if any link cannot be saved, no links are saved.
+
+        :param links: the links to save, none of which can be expired. Each data unit may only
+            appear once in the batch.
+        :param update: if a link from a data unit already exists and is linked to a different
+            sample, update the link. If it is linked to the same sample take no action.
+        :returns: For each input link, in the same order, the ID of the link that is expired as
+            part of the update process, if any.
+
+        :raises NoSuchSampleError: if a sample does not exist.
+        :raises NoSuchSampleVersionError: if a sample version does not exist.
+        :raises NoSuchSampleNodeError: if a sample node does not exist.
+        :raises DataLinkExistsError: if a link already exists from a data unit.
+        :raises TooManyDataLinksError: if there are too many links from a sample version or
+            a workspace object version.
+        :raises ConcurrencyError: if the links could not be saved due to concurrent changes to
+            links from the same data units, sample versions, or workspace object versions.
+        '''
+        _not_falsy_in_iterable(links, 'links')
+        duids = set()
+        for i, link in enumerate(links):
+            if link.expired:
+                raise ValueError(f'link at index {i} cannot be expired')
+            if link.duid in duids:
+                raise ValueError(f'Duplicate data unit ID at index {i}: {link.duid}')
+            duids.add(link.duid)
+        if not links:
+            return []
+        samplevers = self._get_sample_uuid_versions(links)
+        nodekeys = self._check_nodes_exist(links, samplevers)
+        return self._create_data_links(links, samplevers, nodekeys, update)
+
+    def _create_data_links(
+            self,
+            links: List[DataLink],
+            samplevers: List[UUID],
+            nodekeys: List[str],
+            update: bool
+            ) -> List[Optional[UUID]]:
+        # see the notes in create_data_link
+        keys = [self._create_link_key(link) for link in links]
+        # a conflict means another call changed one of the links after it was read, so try
+        # again with the current state. Each conflict means another call succeeded.
+        # Every retry runs another transaction, which takes an attempt from the attempts shared
+        # with _update_links, so the total number of transactions is bounded and _update_links
+        # raises a ConcurrencyError when the attempts run out.
+        attempts = iter(range(self._link_update_attempts))
+        while True:
+            olddocs = {d[_FLD_ARANGO_KEY]: d for d in self._get_many_docs(
+                self._col_data_link, keys)}
+            expired_ids: List[Optional[UUID]] = []
+            expected: _Dict[str, Optional[str]] = {}
+            newdocs = []
+            expireddocs = []
+            sample_counts: _Dict[UUID, List[DataLink]] = defaultdict(list)
+            ws_counts: _Dict[UPA, List[DataLink]] = defaultdict(list)
+            incs: _Dict[str, int] = defaultdict(int)
+            for link, key, samplever, nodekey in zip(links, keys, samplevers, nodekeys):
+                oldlinkdoc = olddocs.get(key)
+                if oldlinkdoc:
+                    # maybe want to move this after the noop check? or add noop option
+                    if not update:
+                        raise _DataLinkExistsError(str(link.duid))
+                    oldlink = self._doc_to_link(oldlinkdoc)
+                    if link.is_equivalent(oldlink):
+                        expired_ids.append(None)
+                        continue
+                    expected[key] = oldlinkdoc[_FLD_ARANGO_REV]
+                    # See the notes in the expire method, many are relevant here.
+                    oldlinkdoc[_FLD_LINK_EXPIRED_BY] = link.created_by.id
+                    # I'm not a fan of this, but a millisecond gap seems safe and most systems
+                    # should have millisecond resolution.
+                    # Consider rounding to millisecond resolution for consistency? Make a class?
+                    oldlinkdoc[_FLD_LINK_EXPIRED] = self._timestamp_seconds_to_milliseconds(
+                        link.created.timestamp() - 0.001)
+                    oldlinkdoc[_FLD_ARANGO_KEY] = self._create_link_key_from_link_doc(oldlinkdoc)
+                    expireddocs.append(oldlinkdoc)
+                    expired_ids.append(UUID(oldlinkdoc[_FLD_LINK_ID]))
+                    # since we're replacing a link we don't need to worry about counting links
+                    # from the ws object. Not true for the sample, which could be different.
+                    sna = link.sample_node_address
+                    oldsna = oldlink.sample_node_address
+                    if sna.sampleid != oldsna.sampleid or sna.version != oldsna.version:
+                        # it doesn't matter if only the node is different since the traversal
+                        # from sample -> workspace objects starts at a version, so the
+                        # count/version of extant links won't change
+                        # Could support starting at a node later
+                        sample_counts[samplever].append(link)
+                        incs[self._sample_ver_link_count_key(
+                            UUID(oldlinkdoc[_FLD_LINK_SAMPLE_UUID_VERSION]))] -= 1
+                        incs[self._sample_ver_link_count_key(samplever)] += 1
+                else:
+                    expected[key] = None
+                    expired_ids.append(None)
+                    # might be able to get rid of these limits if it turns out the link queries
+                    # can be done without a traversal, which means the links can be looked up
+                    # with an index
+                    # but then paging is needed, so need to implement that
+                    ws_counts[link.duid.upa].append(link)
+                    sample_counts[samplever].append(link)
+                    incs[self._ws_object_link_count_key(link.duid.upa)] += 1
+                    incs[self._sample_ver_link_count_key(samplever)] += 1
+                newdocs.append(self._create_link_doc(link, samplever, nodekey))
+            if not newdocs:
+                return expired_ids
+            checks = [(self._ws_object_link_count_key(upa), len(lnks),
+                       f'More than {self._max_links} links from workspace object {upa}')
+                      for upa, lnks in ws_counts.items()]
+            for sv, lnks in sample_counts.items():
+                sna = lnks[0].sample_node_address
+                checks.append((self._sample_ver_link_count_key(sv), len(lnks),
+                               f'More than {self._max_links} links from sample {sna.sampleid} '
+                               + f'version {sna.version}'))
+            if not self._update_links(
+                    expected, [], expireddocs, newdocs, checks, incs, attempts):
+                return expired_ids
+
+    # Applies a set of changes to the data links and link counts in a single transaction.
+    # Params:
+    #   linkcol, countcol: the data link and link count collection names.
+    #   max: the maximum number of links from a sample version or workspace object version.
+    #   expected: a map of link key to the expected _rev of the link, or null if the link is
+    #       expected not to exist. If any link differs nothing is changed.
+    #   checks: a list of {key, add} - the count with the key must not exceed max after add is
+    #       added to it. If any check fails nothing is changed.
+    #   remove: the keys of links to remove.
+    #   insert: new links.
+    #   replace: links that replace any existing link with the same key.
+    #   incs: a map of link count key to the amount to add to the count.
+    # Returns {conflict: key} or {toomany: index of the check} on failure, otherwise {}.
+    _UPDATE_LINKS_JS = '''
+        function (params) {
+            const db = require('@arangodb').db;
+            const links = db._collection(params.linkcol);
+            const counts = db._collection(params.countcol);
+            const count = function (key) {
+                return counts.exists(key) ? counts.document(key).count : 0;
+            };
+            for (const key of Object.keys(params.expected)) {
+                const cur = links.exists(key);
+                if ((cur ? cur._rev : null) !== params.expected[key]) {
+                    return {conflict: key};
+                }
+            }
+            for (let i = 0; i < params.checks.length; i++) {
+                if (count(params.checks[i].key) + params.checks[i].add > params.max) {
+                    return {toomany: i};
+                }
+            }
+            params.remove.forEach(key => links.remove(key));
+            params.insert.forEach(doc => links.insert(doc, {silent: true}));
+            params.replace.forEach(doc => links.insert(doc, {silent: true, overwrite: true}));
+            for (const key of Object.keys(params.incs)) {
+                if (counts.exists(key)) {
+                    counts.update(key, {count: count(key) + params.incs[key]});
+                } else {
+                    counts.insert({_key: key, count: params.incs[key]});
+                }
+            }
+            return {};
+        }
+        '''
+
+    def _update_links(
+            self,
+            expected: _Dict[str, Optional[str]],
+            remove: List[str],
+            insert: List[dict],
+            replace: List[dict],
+            checks: List[Tuple[str, int, str]],
+            incs: _Dict[str, int],
+            attempts: Optional[Iterator[int]] = None
+            ) -> Optional[str]:
+        # Applies the changes with _UPDATE_LINKS_JS. checks is a list of (count key, number of
+        # links added, error message). attempts limits the number of transactions, and may be
+        # shared with the caller's retries. Returns the key of the link that differs from the
+        # expected state if the changes could not be applied.
+        params = {
+            'linkcol': self._col_data_link.name,
+            'countcol': self._col_link_count.name,
+            'max': self._max_links,
+            'expected': expected,
+            'checks': [{'key': k, 'add': a} for k, a, _ in checks],
+            'remove': remove,
+            'insert': insert,
+            'replace': replace,
+            # always write the counts in the same order so that concurrent transactions are
+            # less likely to conflict on each other's counts
+            'incs': {k: incs[k] for k in sorted(incs) if incs[k]},
+        }
+        # Only write locks are taken on the collections, which are shared, so transactions that
+        # change unrelated links run concurrently. ArangoDB fails a transaction that writes a
+        # document written by another transaction since it started. Every transaction writes the
+        # links it changes, and every transaction that increases a link count writes that
+        # count's document, so concurrent transactions that change the same links or could
+        # together exceed a link limit conflict. Counts with no net change aren't written, but
+        # those transactions can't increase the count.
+        if attempts is None:
+            attempts = iter(range(self._link_update_attempts))
+        retry = False
+        for _ in attempts:
+            if retry:
+                # back off so the conflicting transactions don't conflict again
+                _time.sleep(_random.uniform(0, 0.01))
+            retry = True
+            try:
+                res = self._db.execute_transaction(
+                    self._UPDATE_LINKS_JS,
+                    params=params,
+                    write=[self._col_data_link.name, self._col_link_count.name])
+            except _arango.exceptions.TransactionExecuteError as e:
+                # write-write conflict or a new count document saved by another transaction
+                if e.error_code in (1200, 1210):
+                    continue
+                # this is a real pain to test
+                raise _SampleStorageError('Connection to database failed: ' + str(e)) from e
+            if 'toomany' in res:
+                raise _TooManyDataLinksError(checks[res['toomany']][2])
+            return res.get('conflict')
+        raise _ConcurrencyError('Too many concurrent data link changes, please try again')
+
+    def _get_sample_uuid_versions(self, links: List[DataLink]) -> List[UUID]:
+        # returns the uuid version of the sample version for each link
+        sids = list(dict.fromkeys(
+            (link.sample_node_address.sampleid, link.sample_node_address.version)
+            for link in links))
+        res = self._get_version_docs([{'id': str(s), 'version': v} for s, v in sids])
+        sid_to_ver = {}
+        for (sid, ver), r in zip(sids, res):
+            verdoc = r['verdoc']
+            if verdoc[_FLD_VER] == _VAL_NO_VER:
+                # see the comments in _get_sample_version_doc
+                self._queue_read_repair(sid, UUID(verdoc[_FLD_UUID_VER]), r['version'])
+            sid_to_ver[(sid, ver)] = UUID(verdoc[_FLD_UUID_VER])
+        return [sid_to_ver[(link.sample_node_address.sampleid,
+                            link.sample_node_address.version)] for link in links]
+
+    # Finds the keys of nodes by sample ID, UUID version, and name for collections sharded by
+    # sample ID, where the keys are generated by the database. @nodes is a list of
+    # {id, uuidver, name}. The key is null if the node doesn't exist.
+    _GET_NODE_KEYS_SHARDED_AQL = f'''
+        FOR r IN @nodes
+            RETURN FIRST(
+                FOR n IN @@col
+                    FILTER n.{_FLD_NODE_SAMPLE_ID} == r.id
+                    FILTER n.{_FLD_NODE_UUID_VER} == r.uuidver
+                    FILTER n.{_FLD_NODE_NAME} == r.name
+                    RETURN n.{_FLD_ARANGO_KEY})
+        '''
+
+    def _check_nodes_exist(self, links: List[DataLink], samplevers: List[UUID]) -> List[str]:
+        # returns the node key for each link
+        if self._shard_by_sample_id:
+            nodekeys = self._find_via_aql(self._GET_NODE_KEYS_SHARDED_AQL, {
+                '@col': self._col_nodes.name,
+                'nodes': [{'id': str(link.sample_node_address.sampleid),
+                           'uuidver': str(sv),
+                           'name': link.sample_node_address.node,
+                           } for link, sv in zip(links, samplevers)]
+                })
+        else:
+            nodekeys = [self._get_node_id(link.sample_node_address.sampleid, sv,
+                                          link.sample_node_address.node)
+                        for link, sv in zip(links, samplevers)]
+            found = {d[_FLD_ARANGO_KEY] for d in self._get_many_docs(
+                self._col_nodes, list(set(nodekeys)))}
+            nodekeys = [k if k in found else None for k in nodekeys]
+        for link, nodekey in zip(links, nodekeys):
+            if not nodekey:
+                sna = link.sample_node_address
+                raise _NoSuchSampleNodeError(f'{sna.sampleid} ver {sna.version} {sna.node}')
+        return nodekeys
+
+    def _sample_ver_link_count_key(self, samplever: UUID) -> str:
+        return f'{_LINK_COUNT_SAMPLE_VER_PREFIX}{samplever}'
+
+    def _ws_object_link_count_key(self, upa: UPA) -> str:
+        return f'{_LINK_COUNT_WS_OBJECT_PREFIX}{upa.wsid}_{upa.objid}_{upa.version}'
 
     def _commit_transaction(self, transaction_db):
         try:
@@ -1180,76 +2696,6 @@ class ArangoSampleStorage:
                 # connection is hosed
                 raise _SampleStorageError('Connection to database failed: ' + str(e)) from e
 
-    def _check_link_count_from_ws_object(self, db, link: DataLink):
-        if self._count_links_from_ws_object(
-                db, link.duid.upa, link.created, link.expired) >= self._max_links:
-            raise _TooManyDataLinksError(
-                f'More than {self._max_links} links from workspace object {link.duid.upa}')
-
-    def _count_links_from_ws_object(
-            self,
-            db,
-            upa: UPA,
-            created: datetime.datetime,
-            expired: Optional[datetime.datetime]):
-        wsc = self._count_links(
-            db,
-            f'''
-                    FILTER d.{_FLD_LINK_WORKSPACE_ID} == @wsid
-                    FILTER d.{_FLD_LINK_OBJECT_ID} == @objid
-                    FILTER d.{_FLD_LINK_OBJECT_VERSION} == @ver''',
-            {'wsid': upa.wsid, 'objid': upa.objid, 'ver': upa.version},
-            created,
-            expired)
-        return wsc
-
-    def _check_link_count_from_sample_ver(self, db, samplever: UUID, link: DataLink):
-        if self._count_links_from_sample_ver(
-                db, samplever, link.created, link.expired) >= self._max_links:
-            sna = link.sample_node_address
-            raise _TooManyDataLinksError(
-                f'More than {self._max_links} links from sample {sna.sampleid} ' +
-                f'version {sna.version}')
-
-    def _count_links_from_sample_ver(
-            self,
-            db,
-            version: UUID,
-            created: datetime.datetime,
-            expired: Optional[datetime.datetime]):
-        sv = self._count_links(
-            db,
-            f'''
-                    FILTER d.{_FLD_LINK_SAMPLE_UUID_VERSION} == @sver''',
-            {'sver': str(version)},
-            created,
-            expired)
-        return sv
-
-    def _count_links(self, db, filters: str, bind_vars, created, expired):
-        bind_vars['@col'] = self._col_data_link.name
-        bind_vars['created'] = self._timestamp_seconds_to_milliseconds(created.timestamp())
-        bind_vars['expired'] = self._timestamp_seconds_to_milliseconds(expired.timestamp()) if expired else _ARANGO_MAX_INTEGER
-        # might need to include created / expired in compound indexes if we get a ton of expired
-        # links. Might not work in a NOT though. Alternate formulation is
-        # (d.creatd >= @created AND d.created <= @expired) OR
-        # (d.expired >= @created AND d.expired <= @expired)
-        q = ('''
-                FOR d in @@col
-             ''' +
-             filters +
-             f'''
-                    FILTER NOT (d.{_FLD_LINK_EXPIRED} < @created OR
-                        d.{_FLD_LINK_CREATED} > @expired)
-                    COLLECT WITH COUNT INTO linkcount
-                    RETURN linkcount
-             ''')
-        try:
-            cur = db.aql.execute(q, bind_vars=bind_vars)
-            return cur.next()
-        except _arango.exceptions.AQLQueryExecuteError as e:  # this is a pain to test
-            raise _SampleStorageError('Connection to database failed: ' + str(e)) from e
-
     def _create_link_key(self, link: DataLink):
         cr = f'_{link.created.timestamp()}' if link.expired else ''
         upa = link.duid.upa
@@ -1274,16 +2720,15 @@ class ArangoSampleStorage:
         version = link[_FLD_LINK_OBJECT_VERSION]
         return f'{wsid}_{objid}_{version}{dataid}{cr}'
 
-    def _create_link_doc(self, link: DataLink, samplever: UUID):
+    def _create_link_doc(self, link: DataLink, samplever: UUID, nodekey: str):
         sna = link.sample_node_address
         upa = link.duid.upa
-        nodeid = self._get_node_id(sna.sampleid, samplever, sna.node)
         # see https://github.com/kbase/relation_engine_spec/blob/4a9dc6df2088763a9df88f0b018fa5c64f2935aa/schemas/ws/ws_object_version.yaml#L17  # noqa
         from_ = f'{self._col_ws.name}/{upa.wsid}:{upa.objid}:{upa.version}'
         return {
             _FLD_ARANGO_KEY: self._create_link_key(link),
             _FLD_ARANGO_FROM: from_,
-            _FLD_ARANGO_TO: f'{self._col_nodes.name}/{nodeid}',
+            _FLD_ARANGO_TO: f'{self._col_nodes.name}/{nodekey}',
             _FLD_LINK_CREATED: self._timestamp_seconds_to_milliseconds(link.created.timestamp()),
             _FLD_LINK_CREATED_BY: link.created_by.id,
             _FLD_LINK_EXPIRED: self._timestamp_seconds_to_milliseconds(link.expired.timestamp()) if link.expired else _ARANGO_MAX_INTEGER,
@@ -1339,6 +2784,8 @@ class ArangoSampleStorage:
         :param duid: the data unit ID from which the link originates.
         :returns: the updated link.
         :raises NoSuchLinkError: if the link does not exist or is already expired.
+        :raises ConcurrencyError: if the link could not be expired due to concurrent changes to
+            links from the same sample version or workspace object version.
         '''
         # See notes for creating links re the transaction approach.
         _check_timestamp(expired, 'expired')
@@ -1364,54 +2811,93 @@ class ArangoSampleStorage:
     def _expire_data_link_pt2(self, linkdoc, expired, expired_by, txtid) -> DataLink:
 
         oldkey = self._create_link_key_from_link_doc(linkdoc)
+        oldrev = linkdoc[_FLD_ARANGO_REV]
 
         linkdoc[_FLD_LINK_EXPIRED] = self._timestamp_seconds_to_milliseconds(expired.timestamp())
         linkdoc[_FLD_LINK_EXPIRED_BY] = expired_by.id
         linkdoc[_FLD_ARANGO_KEY] = self._create_link_key_from_link_doc(linkdoc)
+        link = self._doc_to_link(linkdoc)
 
         # There appears to be no way to transactionally update a document's _key.
         # Even using a transaction, as we do here, isn't guaranteed since in a cluster parts
         # of a transaction may fail, and so the DB may be left in an inconsistent state.
         # TODO DATALINK do we want to add failure checking / recovery code for this transaction?
+        if self._update_links(
+                {oldkey: oldrev},
+                [oldkey],
+                [linkdoc],
+                [],
+                [],
+                {self._ws_object_link_count_key(link.duid.upa): -1,
+                 self._sample_ver_link_count_key(
+                     UUID(linkdoc[_FLD_LINK_SAMPLE_UUID_VERSION])): -1}):
+            # ok, a race condition occurred and another thread expired the link after it was
+            # read. If an interleaving call made a new link after expiring the old one, we
+            # should *NOT* expire that.
+            raise _NoSuchLinkError(txtid)
+        return link
+
+    # Counts the extant links from each sample version and workspace object version, returning
+    # count documents.
+    _COUNT_LINKS_AQL = f'''
+        LET svers = (
+            FOR d IN @@col
+                FILTER d.{_FLD_LINK_EXPIRED} == @expired
+                COLLECT sver = d.{_FLD_LINK_SAMPLE_UUID_VERSION} WITH COUNT INTO linkcount
+                RETURN {{{_FLD_ARANGO_KEY}: CONCAT(@sverprefix, sver),
+                        {_FLD_LINK_COUNT}: linkcount}}
+            )
+        LET objs = (
+            FOR d IN @@col
+                FILTER d.{_FLD_LINK_EXPIRED} == @expired
+                COLLECT wsid = d.{_FLD_LINK_WORKSPACE_ID},
+                        objid = d.{_FLD_LINK_OBJECT_ID},
+                        ver = d.{_FLD_LINK_OBJECT_VERSION}
+                    WITH COUNT INTO linkcount
+                RETURN {{{_FLD_ARANGO_KEY}: CONCAT(@objprefix, wsid, '_', objid, '_', ver),
+                        {_FLD_LINK_COUNT}: linkcount}}
+            )
+        FOR c IN APPEND(svers, objs)
+            RETURN c
+        '''
+
+    _REMOVE_LINK_COUNTS_AQL = '''
+        FOR c IN @@col
+            REMOVE c IN @@col
+        '''
 
-        # makes a db specifically for this transaction
+    def rebuild_data_link_counts(self) -> int:
+        '''
+        Recalculate the number of extant data links from each sample version and workspace
+        object version from the links themselves and replace the stored counts, which are used
+        to enforce the link limits. The counts are maintained as links are created and expired,
+        so this is only necessary when upgrading from a version of the service that did not
+        store the counts or if the counts are suspected to be incorrect.
+
+        Links cannot be created or expired while the counts are rebuilt.
+
+        :returns: the number of count documents saved.
+        '''
         tdb = self._db.begin_transaction(
             read=self._col_data_link.name,
-            write=self._col_data_link.name)
-
-        # TODO DATALINK Transactions in arango can allow some ops to succeed and others to fail.
-        # What do?
+            exclusive=[self._col_data_link.name, self._col_link_count.name])
         try:
-            # makes a collection specifically for this transaction
-            tdlc = tdb.collection(self._col_data_link.name)
             try:
-                tdlc.insert(linkdoc, silent=True)
-            except _arango.exceptions.DocumentInsertError as e:
-                if e.error_code == 1210:  # unique constraint violation code
-                    # ok, a race condition occurred and another thread expired the link.
-                    # If an interleaving call made a new link after expiring the old one, we
-                    # should *NOT* expire that.
-                    raise _NoSuchLinkError(txtid)
-                else:  # this is a real pain to test.
-                    raise _SampleStorageError('Connection to database failed: ' + str(e)) from e
-            try:
-                tdlc.delete(oldkey, silent=True)
-            except _arango.exceptions.DocumentDeleteError as e:
-                # In the context of the transaction, since the insert above succeeded the link
-                # can't have been deleted yet, because the link hasn't been expired yet.
-                # If the overall transaction fails at this point, it means either another call
-                # expired and deleted the link, so we're done, or another call expired the link and
-                # created a new link and the transaction collided. We should probably *NOT*
-                # expire the brand new link - that was not the user's intent. Both of these
-                # cases take millisecond timing and will be extremely rare, so just throw an
-                # error and document potential failure modes for expire transaction
-
-                # this is really hard to test - maybe impossible?
+                counts = list(tdb.aql.execute(self._COUNT_LINKS_AQL, bind_vars={
+                    '@col': self._col_data_link.name,
+                    'expired': _ARANGO_MAX_INTEGER,
+                    'sverprefix': _LINK_COUNT_SAMPLE_VER_PREFIX,
+                    'objprefix': _LINK_COUNT_WS_OBJECT_PREFIX,
+                    }))
+                tdb.aql.execute(self._REMOVE_LINK_COUNTS_AQL,
+                                bind_vars={'@col': self._col_link_count.name})
+            except _arango.exceptions.AQLQueryExecuteError as e:  # this is a pain to test
                 raise _SampleStorageError('Connection to database failed: ' + str(e)) from e
+            self._insert_many(tdb.collection(self._col_link_count.name), counts)
             self._commit_transaction(tdb)
-            return self._doc_to_link(linkdoc)
         finally:
             self._abort_transaction(tdb)
+        return len(counts)
 
     def get_data_link(self, id_: UUID = None, duid: DataUnitID = None) -> DataLink:
         '''
@@ -1457,7 +2943,9 @@ class ArangoSampleStorage:
             self,
             sample: SampleAddress,
             readable_wsids: Optional[List[int]],
-            timestamp: datetime.datetime) -> List[DataLink]:
+            timestamp: datetime.datetime,
+            limit: Optional[int] = None,
+            after: Optional[UUID] = None) -> Iterable[DataLink]:
         '''
         Get the links from a sample at a particular time.
 
@@ -1465,7 +2953,12 @@ class ArangoSampleStorage:
         :param readable_wsids: IDs of workspaces for which the user has read permissions.
             Pass None to return links to objects in all workspaces.
         :param timestamp: the time to use to determine which links are active.
-        :returns: a list of links.
+        :param limit: the maximum number of links to return, or None for no limit.
+        :param after: only return links with an ID greater than this ID. Pass the ID of the last
+            link of the prior page to get the next page.
+        :returns: the links, sorted by the link ID. If link streaming is enabled and no limit is
+            provided, an iterator that fetches the links from the database as it is consumed,
+            otherwise a list.
         :raises NoSuchSampleError: if the sample does not exist.
         :raises NoSuchSampleVersionError: if the sample version does not exist.
         '''
@@ -1473,13 +2966,14 @@ class ArangoSampleStorage:
         _not_falsy(sample, 'sample')
         _check_timestamp(timestamp, 'timestamp')
         _not_falsy_in_iterable(readable_wsids, 'readable_wsids', allow_none=True)
+        _check_limit(limit)
         if readable_wsids is not None and not readable_wsids:
             return []
         # need to get the version doc to ensure the documents have been updated appropriately
         # as well as getting the uuid version, see comments at beginning of file
         # note that testing version updating has been done for at least 2 other methods
         # the tests are not repeated here
-        _, versiondoc, _ = self._get_sample_and_version_doc(sample.sampleid, sample.version)
+        versiondoc, _ = self._get_sample_version_doc(sample.sampleid, sample.version)
         bind_vars = {'@col': self._col_data_link.name,
                      'samplever': versiondoc[_FLD_UUID_VER],
                      'ts': self._timestamp_seconds_to_milliseconds(timestamp.timestamp())}
@@ -1493,13 +2987,38 @@ class ArangoSampleStorage:
                 {wsidfilter}
                 FILTER d.{_FLD_LINK_CREATED} <= @ts
                 FILTER d.{_FLD_LINK_EXPIRED} >= @ts
+                {_link_page_aql(bind_vars, limit, after)}
                 RETURN d
             '''
         # may need an index on version + created and expired? Assume for now links aren't
         # expired very often.
         # may also want a sample ver / wsid index? Max 10k items per version though, and
         # probably much less. YAGNI for now.
-        return self._find_links_via_aql(q, bind_vars)
+        return self._get_links_via_aql(q, bind_vars, limit)
+
+    def _get_links_via_aql(self, query, bind_vars, limit) -> Iterable[DataLink]:
+        if limit is None and self._link_stream_batch_size:
+            return self._stream_links_via_aql(query, bind_vars)
+        return self._find_links_via_aql(query, bind_vars)
+
+    def _stream_links_via_aql(self, query, bind_vars) -> Iterator[DataLink]:
+        # execute the query now so errors are thrown before the caller starts consuming the links
+        try:
+            cursor = self._db.aql.execute(query, bind_vars=bind_vars, stream=True,
+                                          batch_size=self._link_stream_batch_size)
+        except _arango.exceptions.AQLQueryExecuteError as e:  # this is a pain to test
+            raise _SampleStorageError('Connection to database failed: ' + str(e)) from e
+        return self._iter_link_cursor(cursor)
+
+    def _iter_link_cursor(self, cursor) -> Iterator[DataLink]:
+        try:
+            for doc in cursor:
+                yield self._doc_to_link(doc)
+        except _arango.exceptions.CursorNextError as e:  # this is a pain to test
+            raise _SampleStorageError('Connection to database failed: ' + str(e)) from e
+        finally:
+            # frees the cursor on the server if the caller stops before consuming every link
+            cursor.close(ignore_missing=True)
 
     def _find_links_via_aql(self, query, bind_vars):
         duids = []
@@ -1513,7 +3032,9 @@ class ArangoSampleStorage:
     def get_batch_links_from_samples(self,
                                      samples: List[SampleAddress],
                                      readable_wsids: Optional[List[int]],
-                                     timestamp: datetime.datetime) -> List[DataLink]:
+                                     timestamp: datetime.datetime,
+                                     limit: Optional[int] = None,
+                                     after: Optional[UUID] = None) -> Iterable[DataLink]:
         '''
         Get the links from a bulk list of samples at a particular time.
 
@@ -1521,12 +3042,18 @@ class ArangoSampleStorage:
         :param readable_wsids: IDs of workspaces for which the user has read permissions.
             Pass None to return links to objects in all workspaces.
         :param timestamp: the time to use to determine which links are active.
-        :returns: a list of links.
+        :param limit: the maximum number of links to return, or None for no limit.
+        :param after: only return links with an ID greater than this ID. Pass the ID of the last
+            link of the prior page to get the next page.
+        :returns: the links, sorted by the link ID. If link streaming is enabled and no limit is
+            provided, an iterator that fetches the links from the database as it is consumed,
+            otherwise a list.
         :raises SampleStorageError: if a conection to the database fails.
         '''
 
         _not_falsy(samples, 'samples')
         _check_timestamp(timestamp, 'timestamp')
+        _check_limit(limit)
 
         aql_bind = {
             '@sample_col': self._col_sample.name,
@@ -1551,38 +3078,45 @@ class ArangoSampleStorage:
                 }}
             )
 
-            LET data_links = (FOR version_id IN version_ids
+            FOR version_id IN version_ids
                 FOR d in @@link_col
                     FILTER d.{_FLD_LINK_SAMPLE_UUID_VERSION} == version_id.version_id
                     {wsidfilter}
                     FILTER d.{_FLD_LINK_CREATED} <= @ts
                     FILTER d.{_FLD_LINK_EXPIRED} >= @ts
+                    {_link_page_aql(aql_bind, limit, after)}
                     RETURN d
-            )
-            RETURN data_links
         '''
+        # the sort and limit apply to the links from all the samples, so a page may span samples
+        return self._get_links_via_aql(q, aql_bind, limit)
 
-        duids = []
-        try:
-            # have to unwrap query result twice because its a nested array
-            for link_set in self._db.aql.execute(q, bind_vars=aql_bind):
-                for link in link_set:
-                    duids.append(self._doc_to_link(link))
-        except _arango.exceptions.AQLQueryExecuteError as e:
-            raise _SampleStorageError('Connection to database failed: ' + str(e)) from e
-        return duids
-
-    def get_links_from_data(self, upa: UPA, timestamp: datetime.datetime) -> List[DataLink]:
+    def get_links_from_data(
+            self,
+            upa: UPA,
+            timestamp: datetime.datetime,
+            limit: Optional[int] = None,
+            after: Optional[UUID] = None) -> Iterable[DataLink]:
         '''
         Get links originating from a data object. The data object is not checked for existence.
 
         :param upa: the address of the data object.
         :param timestamp: the time to use to determine which links are active.
-        :returns: a list of links.
+        :param limit: the maximum number of links to return, or None for no limit.
+        :param after: only return links with an ID greater than this ID. Pass the ID of the last
+            link of the prior page to get the next page.
+        :returns: the links, sorted by the link ID. If link streaming is enabled and no limit is
+            provided, an iterator that fetches the links from the database as it is consumed,
+            otherwise a list.
         '''
         # the UPA makes it workspace specific, may need to make it generic later. YAGNI for now.
         _not_falsy(upa, 'upa')
         _check_timestamp(timestamp, 'timestamp')
+        _check_limit(limit)
+        bind_vars = {'@col': self._col_data_link.name,
+                     'wsid': upa.wsid,
+                     'objid': upa.objid,
+                     'ver': upa.version,
+                     'ts': self._timestamp_seconds_to_milliseconds(timestamp.timestamp())}
         q = f'''
             FOR d in @@col
                 FILTER d.{_FLD_LINK_WORKSPACE_ID} == @wsid
@@ -1590,16 +3124,88 @@ class ArangoSampleStorage:
                 FILTER d.{_FLD_LINK_OBJECT_VERSION} == @ver
                 FILTER d.{_FLD_LINK_CREATED} <= @ts
                 FILTER d.{_FLD_LINK_EXPIRED} >= @ts
+                {_link_page_aql(bind_vars, limit, after)}
                 RETURN d
             '''
-        bind_vars = {'@col': self._col_data_link.name,
-                     'wsid': upa.wsid,
-                     'objid': upa.objid,
-                     'ver': upa.version,
-                     'ts': self._timestamp_seconds_to_milliseconds(timestamp.timestamp())}
         # may need an index on upa + created and expired? Assume for now links aren't
         # expired very often.
-        return self._find_links_via_aql(q, bind_vars)
+        return self._get_links_via_aql(q, bind_vars, limit)
+
+    def get_link_history(
+            self,
+            sample: Optional[UUID],
+            upa: Optional[UPA],
+            dataid: Optional[str],
+            readable_wsids: Optional[List[int]],
+            limit: Optional[int] = None,
+            after: Optional[Tuple[datetime.datetime, UUID]] = None) -> Iterable[DataLink]:
+        '''
+        Get all the links, expired or not, from a sample, a data object, or between a sample
+        and a data object. Neither the sample nor the data object is checked for existence.
+
+        :param sample: the ID of the sample, or None to get links to any sample.
+        :param upa: the address of the data object, or None to get links from any object.
+        :param dataid: the ID of a data unit within the data object. If provided only the
+            links from the data unit are returned. Requires an UPA.
+        :param readable_wsids: IDs of workspaces for which the user has read permissions.
+            Pass None to return links to objects in all workspaces.
+        :param limit: the maximum number of links to return, or None for no limit.
+        :param after: only return links after this link creation time and link ID. Pass the
+            creation time and ID of the last link of the prior page to get the next page.
+        :returns: the links, sorted by creation time and then by link ID. If link streaming is
+            enabled and no limit is provided, an iterator that fetches the links from the
+            database as it is consumed, otherwise a list.
+        '''
+        if not sample and not upa:
+            raise ValueError('At least one of sample or upa must be provided')
+        if dataid and not upa:
+            raise ValueError('dataid requires an upa')
+        _not_falsy_in_iterable(readable_wsids, 'readable_wsids', allow_none=True)
+        _check_limit(limit)
+        if readable_wsids is not None and not readable_wsids:
+            return []
+        bind_vars: _Dict[str, _Any] = {'@col': self._col_data_link.name}
+        filters = []
+        if sample:
+            bind_vars['sampleid'] = str(sample)
+            filters.append(f'FILTER d.{_FLD_LINK_SAMPLE_ID} == @sampleid')
+        if upa:
+            bind_vars.update({'wsid': upa.wsid, 'objid': upa.objid, 'ver': upa.version})
+            filters.append(f'''
+                FILTER d.{_FLD_LINK_WORKSPACE_ID} == @wsid
+                FILTER d.{_FLD_LINK_OBJECT_ID} == @objid
+                FILTER d.{_FLD_LINK_OBJECT_VERSION} == @ver''')
+        if dataid:
+            bind_vars['dataid'] = dataid
+            filters.append(f'FILTER d.{_FLD_LINK_OBJECT_DATA_UNIT} == @dataid')
+        if readable_wsids:
+            bind_vars['wsids'] = readable_wsids
+            filters.append(f'FILTER d.{_FLD_LINK_WORKSPACE_ID} IN @wsids')
+        if after:
+            bind_vars['after_created'] = self._timestamp_seconds_to_milliseconds(
+                _check_timestamp(after[0], 'after time').timestamp())
+            bind_vars['after'] = str(_not_falsy(after[1], 'after ID'))
+            # the range filter lets the database seek to the page in the index
+            filters.append(f'''
+                FILTER d.{_FLD_LINK_CREATED} >= @after_created
+                FILTER d.{_FLD_LINK_CREATED} > @after_created OR d.{_FLD_LINK_ID} > @after''')
+        limitq = ''
+        if limit:
+            bind_vars['limit'] = limit
+            limitq = 'LIMIT @limit'
+        filterq = '\n'.join(filters)
+        q = f'''
+            FOR d in @@col
+                {filterq}
+                SORT d.{_FLD_LINK_CREATED}, d.{_FLD_LINK_ID}
+                {limitq}
+                RETURN d
+            '''
+        # The creation time isn't unique, since links created in the same call share the time,
+        # so the link ID breaks ties. The indexes on the sample and / or object fields followed by
+        # the creation time and ID serve the filter and the sort, so a page is read from the
+        # index without scanning or sorting the rest of the history.
+        return self._get_links_via_aql(q, bind_vars, limit)
 
     def has_data_link(self, upa: UPA, sample: UUID) -> bool:
         '''
@@ -1643,3 +3249,30 @@ def _init_collection(database, collection, collection_name, collection_variable_
         ctype = 'an edge' if edge else 'a vertex'
         raise _StorageInitError(f'{collection_name} {collection} is not {ctype} collection')
     return c
+
+
+def _check_limit(limit: Optional[int]):
+    if limit is not None and limit < 1:
+        raise ValueError('limit must be > 0')
+
+
+# Link queries are sorted by the link ID, which is unique, so that a page of links can be
+# continued from the last link ID of the prior page without skipping or repeating links.
+def _link_page_aql(bind_vars: _Dict[str, _Any], limit: Optional[int], after: Optional[UUID]):
+    q = ''
+    if after:
+        bind_vars['after'] = str(after)
+        q = f'FILTER d.{_FLD_LINK_ID} > @after\n'
+    q += f'SORT d.{_FLD_LINK_ID}'
+    if limit:
+        bind_vars['limit'] = limit
+        q += '\nLIMIT @limit'
+    return q
+
+
+def _check_delay(delay: datetime.timedelta, name: str) -> datetime.timedelta:
+    if delay is None:
+        raise ValueError(f'{name} cannot be None')
+    if delay < datetime.timedelta():
+        raise ValueError(f'{name} must be >= 0')
+    return delay
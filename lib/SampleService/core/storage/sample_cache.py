@@ -0,0 +1,135 @@
+'''
+An in memory cache for saved sample versions.
+'''
+
+# Once a sample version has been saved and its integer version set, the version never changes,
+# and samples cannot be deleted. Hence cached sample versions never need to be invalidated.
+# ACLs are not part of a sample version and are never cached here.
+
+import sys
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping as _Mapping
+from typing import Any, Dict, Optional, Tuple
+from uuid import UUID
+
+from SampleService.core.sample import SavedSample, SampleNode
+
+
+class SampleCache:
+    '''
+    A least recently used cache of sample versions, bounded by the estimated in memory size of
+    the cached samples. Thread safe.
+    '''
+
+    def __init__(self, max_bytes: int):
+        '''
+        Create the cache.
+
+        :param max_bytes: the maximum estimated size of the cached samples in bytes. Samples
+            larger than this size are never cached. 0 disables the cache.
+        '''
+        if max_bytes is None or max_bytes < 0:
+            raise ValueError('max_bytes must be >= 0')
+        self._max_bytes = max_bytes
+        self._cache: 'OrderedDict[Tuple[UUID, int], Tuple[SavedSample, int]]' = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        '''
+        True if the cache is enabled, i.e. max_bytes > 0.
+        '''
+        return self._max_bytes > 0
+
+    def get(self, id_: UUID, version: int) -> Optional[SavedSample]:
+        '''
+        Get a sample version from the cache.
+
+        :param id_: the ID of the sample.
+        :param version: the version of the sample.
+        :returns: the sample or None if the sample version is not in the cache.
+        '''
+        with self._lock:
+            entry = self._cache.get((id_, version))
+            if not entry:
+                self._misses += 1
+                return None
+            self._cache.move_to_end((id_, version))
+            self._hits += 1
+            return entry[0]
+
+    def put(self, sample: SavedSample):
+        '''
+        Add a sample version to the cache, evicting the least recently used sample versions
+        as necessary to keep the cache within its size bound.
+
+        The sample version must be complete - i.e. its integer version must have been set in
+        the database - as it will be served from the cache indefinitely.
+
+        :param sample: the sample version.
+        '''
+        if not self._max_bytes:
+            return
+        key = (sample.id, sample.version)
+        size = estimate_size(sample)
+        if size > self._max_bytes:
+            return
+        with self._lock:
+            old = self._cache.pop(key, None)
+            if old:
+                self._bytes -= old[1]
+            while self._bytes + size > self._max_bytes:
+                _, (_, evicted) = self._cache.popitem(last=False)
+                self._bytes -= evicted
+            self._cache[key] = (sample, size)
+            self._bytes += size
+
+    def get_stats(self) -> Dict[str, int]:
+        '''
+        Get statistics about the cache.
+
+        :returns: a mapping with the keys:
+            hits - the number of requests for a sample version served from the cache.
+            misses - the number of requests for a sample version not in the cache.
+            entries - the number of cached sample versions.
+            bytes - the estimated size of the cached sample versions.
+            max_bytes - the maximum estimated size of the cached sample versions.
+        '''
+        with self._lock:
+            return {'hits': self._hits,
+                    'misses': self._misses,
+                    'entries': len(self._cache),
+                    'bytes': self._bytes,
+                    'max_bytes': self._max_bytes,
+                    }
+
+
+def estimate_size(sample: SavedSample) -> int:
+    '''
+    Estimate the in memory size of a sample.
+
+    :param sample: the sample.
+    :returns: the estimated size in bytes.
+    '''
+    return (sys.getsizeof(sample) + _size(sample.name) + _size(sample.user.id) +
+            sum(_node_size(n) for n in sample.nodes))
+
+
+def _node_size(node: SampleNode) -> int:
+    return (sys.getsizeof(node) + _size(node.name) + _size(node.parent) +
+            _size(node.controlled_metadata) + _size(node.user_metadata) +
+            sum(_size(sm.key) + _size(sm.sourcekey) + _size(sm.sourcevalue)
+                for sm in node.source_metadata))
+
+
+def _size(obj: Any) -> int:
+    # shared objects like enums, small ints and None are over counted, which is fine for an
+    # estimate
+    size = sys.getsizeof(obj)
+    if isinstance(obj, _Mapping):
+        size += sum(_size(k) + _size(v) for k, v in obj.items())
+    return size
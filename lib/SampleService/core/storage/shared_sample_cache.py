@@ -0,0 +1,248 @@
+'''
+A cache for serialized sample versions that is shared between the server processes on a host.
+'''
+
+# The cache is a SQLite database in a file on the local host. SQLite reads the file via mmap,
+# so processes read cached data directly from the OS page cache rather than via a broker
+# process, and the cache outlives any individual server process. Like SampleCache, the cache
+# never needs to be invalidated since saved sample versions never change.
+#
+# Eviction is least recently used, approximately - the last used time of an entry is only
+# updated when it is more than _TOUCH_INTERVAL_SEC old to avoid a write on every read.
+#
+# The cache must never hold up a request. SQLite waits for a lock held by another process by
+# sleeping in C code, which blocks every greenlet in a gevent worker, so the busy timeout is
+# short and a locked cache is treated as a miss or the write is skipped. Reads never write -
+# last used times are recorded in memory and written by the next put - and each put evicts a
+# bounded number of entries so the write lock is only held briefly.
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple, cast as _cast
+from uuid import UUID
+
+_TOUCH_INTERVAL_SEC = 60
+# the maximum number of last used times recorded in memory between puts.
+_MAX_PENDING_TOUCHES = 1000
+# the maximum number of entries evicted by a single put.
+_MAX_EVICTIONS = 100
+# how long to wait for a lock held by another process when using the cache.
+_BUSY_TIMEOUT_SEC = 0.02
+# how long to wait for a lock when creating the cache, which is done once per cache file.
+_INIT_TIMEOUT_SEC = 30
+# the fraction of the cache size freed when the cache is full, so that eviction doesn't run on
+# every insert into a full cache.
+_EVICT_FRACTION = 0.1
+
+
+class SharedSampleCache:
+    '''
+    A least recently used cache of serialized sample versions, bounded by size, and stored in a
+    file shared between processes. Thread and process safe.
+    '''
+
+    def __init__(
+            self,
+            path: Optional[str],
+            max_bytes: int,
+            timer: Callable[[], float] = time.time):
+        '''
+        Create the cache. The cache file is created if it doesn't already exist.
+
+        :param path: the path to the cache file. The file must be on a local file system. None
+            disables the cache.
+        :param max_bytes: the maximum size of the cached data in bytes. Serialized samples
+            larger than this size are never cached. 0 disables the cache.
+        '''
+        # Don't publicize this param, for testing only
+        # :param timer: A callable that returns the current time in epoch seconds.
+        if max_bytes is None or max_bytes < 0:
+            raise ValueError('max_bytes must be >= 0')
+        self._path = path if max_bytes else None
+        self._max_bytes = max_bytes
+        self._timer = timer
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+        self._touches: Dict[Tuple[str, int], float] = {}
+        self._pid: Optional[int] = None
+        self._con: Optional[sqlite3.Connection] = None
+        if self._path:
+            self._init_db()  # fail early if the file can't be opened
+
+    @property
+    def enabled(self) -> bool:
+        '''
+        True if the cache is enabled, i.e. a path is set and max_bytes > 0.
+        '''
+        return bool(self._path)
+
+    def _init_db(self):
+        # creates the tables if needed. This is the only place the cache waits for locks, and
+        # it's run when the server starts rather than on a request.
+        con = sqlite3.connect(
+            _cast(str, self._path), timeout=_INIT_TIMEOUT_SEC, isolation_level=None)
+        try:
+            # WAL mode is stored in the file, and lets reads proceed during writes
+            con.execute('PRAGMA journal_mode=WAL')
+            con.execute('''
+                CREATE TABLE IF NOT EXISTS samples (
+                    id TEXT NOT NULL,
+                    ver INTEGER NOT NULL,
+                    data BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    used REAL NOT NULL,
+                    PRIMARY KEY (id, ver))
+                ''')
+            con.execute('CREATE INDEX IF NOT EXISTS samples_used ON samples (used)')
+            con.execute('''
+                CREATE TABLE IF NOT EXISTS total (
+                    k INTEGER PRIMARY KEY CHECK (k = 0),
+                    bytes INTEGER NOT NULL)
+                ''')
+            con.execute('INSERT OR IGNORE INTO total VALUES (0, 0)')
+        finally:
+            con.close()
+
+    def _get_connection(self) -> sqlite3.Connection:
+        # SQLite connections must not be used across a fork, so check if we're in a new process
+        if self._pid != os.getpid():
+            con = sqlite3.connect(
+                _cast(str, self._path), timeout=_BUSY_TIMEOUT_SEC, isolation_level=None,
+                check_same_thread=False)
+            # it's a cache, durability doesn't matter
+            con.execute('PRAGMA synchronous=OFF')
+            con.execute(f'PRAGMA mmap_size={2 * self._max_bytes}')
+            self._con = con
+            self._pid = os.getpid()
+        return _cast(sqlite3.Connection, self._con)
+
+    def get(self, id_: UUID, version: int) -> Optional[bytes]:
+        '''
+        Get a serialized sample version from the cache.
+
+        :param id_: the ID of the sample.
+        :param version: the version of the sample.
+        :returns: the serialized sample or None if the sample version is not in the cache.
+        '''
+        if not self._path:
+            return None
+        key = (str(id_), version)
+        with self._lock:
+            try:
+                con = self._get_connection()
+                row = con.execute(
+                    'SELECT data, used FROM samples WHERE id = ? AND ver = ?', key).fetchone()
+                if row:
+                    now = self._timer()
+                    if now - row[1] > _TOUCH_INTERVAL_SEC and (
+                            len(self._touches) < _MAX_PENDING_TOUCHES):
+                        self._touches[key] = now
+            except sqlite3.Error as e:
+                # the cache is an optimization, don't fail the read
+                if not _is_busy(e):
+                    logging.getLogger(__name__).warning('Shared sample cache read failed: %s', e)
+                row = None
+            if not row:
+                self._misses += 1
+                return None
+            self._hits += 1
+            return row[0]
+
+    def put(self, id_: UUID, version: int, data: bytes):
+        '''
+        Add a serialized sample version to the cache, evicting the least recently used sample
+        versions as necessary to keep the cache within its size bound.
+
+        The sample version must be complete - i.e. its integer version must have been set in
+        the database - as it will be served from the cache indefinitely.
+
+        :param id_: the ID of the sample.
+        :param version: the version of the sample.
+        :param data: the serialized sample.
+        '''
+        size = len(data)
+        if not self._path or size > self._max_bytes:
+            return
+        with self._lock:
+            try:
+                con = self._get_connection()
+                con.execute('BEGIN IMMEDIATE')
+                try:
+                    con.executemany('UPDATE samples SET used = ? WHERE id = ? AND ver = ?',
+                                    [(t,) + k for k, t in self._touches.items()])
+                    cur = con.execute('INSERT OR IGNORE INTO samples VALUES (?, ?, ?, ?, ?)',
+                                      (str(id_), version, data, size, self._timer()))
+                    if cur.rowcount:
+                        con.execute('UPDATE total SET bytes = bytes + ?', (size,))
+                        self._evict(con)
+                    con.execute('COMMIT')
+                except BaseException:
+                    con.execute('ROLLBACK')
+                    raise
+                self._touches.clear()
+            except sqlite3.Error as e:
+                # if another process holds the lock skip the write rather than waiting
+                if not _is_busy(e):
+                    logging.getLogger(__name__).warning(
+                        'Shared sample cache write failed: %s', e)
+
+    def _evict(self, con: sqlite3.Connection):
+        # Evicts at most _MAX_EVICTIONS entries, so the cache may briefly exceed its size bound
+        # if many small entries have to be evicted to make room. Later puts evict the rest.
+        total = con.execute('SELECT bytes FROM total').fetchone()[0]
+        if total <= self._max_bytes:
+            return
+        target = total - self._max_bytes + _EVICT_FRACTION * self._max_bytes
+        freed = 0
+        evict = []
+        cur = con.execute(
+            'SELECT id, ver, size FROM samples ORDER BY used LIMIT ?', (_MAX_EVICTIONS,))
+        for id_, ver, size in cur:
+            evict.append((id_, ver))
+            freed += size
+            if freed >= target:
+                break
+        cur.close()
+        con.executemany('DELETE FROM samples WHERE id = ? AND ver = ?', evict)
+        con.execute('UPDATE total SET bytes = bytes - ?', (freed,))
+
+    def get_stats(self) -> Dict[str, int]:
+        '''
+        Get statistics about the cache.
+
+        :returns: a mapping with the keys:
+            hits - the number of requests for a sample version served from the cache by this
+                process.
+            misses - the number of requests for a sample version not in the cache made by this
+                process.
+            entries - the number of cached sample versions.
+            bytes - the size of the cached sample versions.
+            max_bytes - the maximum size of the cached sample versions.
+        '''
+        entries, size = 0, 0
+        with self._lock:
+            if self._path:
+                try:
+                    con = self._get_connection()
+                    entries = con.execute('SELECT COUNT(*) FROM samples').fetchone()[0]
+                    size = con.execute('SELECT bytes FROM total').fetchone()[0]
+                except sqlite3.Error as e:
+                    if not _is_busy(e):
+                        logging.getLogger(__name__).warning(
+                            'Shared sample cache read failed: %s', e)
+            return {'hits': self._hits,
+                    'misses': self._misses,
+                    'entries': entries,
+                    'bytes': size,
+                    'max_bytes': self._max_bytes,
+                    }
+
+
+def _is_busy(e: sqlite3.Error) -> bool:
+    # another process holds a lock on the cache. The sqlite3 module doesn't expose the error
+    # code in the supported Python versions, so check the message for SQLITE_BUSY.
+    return isinstance(e, sqlite3.OperationalError) and str(e) == 'database is locked'
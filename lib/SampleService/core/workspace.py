@@ -8,6 +8,7 @@ from typing import List, Optional, Dict as _Dict, Set as _Set
 from installed_clients.WorkspaceClient import Workspace
 from installed_clients.baseclient import ServerError as _ServerError
 from SampleService.core.arg_checkers import not_falsy as _not_falsy
+from SampleService.core.arg_checkers import not_falsy_in_iterable as _not_falsy_in_iterable
 from SampleService.core.arg_checkers import check_string as _check_string
 from SampleService.core.errors import IllegalParameterError as _IllegalParameterError
 from SampleService.core.errors import UnauthorizedError as _UnauthorizedError
@@ -200,33 +201,74 @@ class WS:
         if wsid < 1:
             raise _IllegalParameterError(f'{wsid} is not a valid workspace ID')
 
+        p = self._get_perms([wsid])[0]
+        self._check_perm(p, user, perm, name, target)
+        if upa:
+            self._check_objects_exist([upa])
+
+    def has_permissions(
+            self,
+            user: Optional[UserID],
+            perm: WorkspaceAccessType,
+            upas: List[UPA]):
+        '''
+        Check if a user can access a set of workspace objects. The check is performed with a
+        fixed number of calls to the workspace service, regardless of the number of objects.
+
+        See has_permission for details.
+
+        :param user: The user's user name, or None for an anonymous user.
+        :param perm: The requested permission
+        :param upas: the workspace service UPAs of the objects.
+        :raises UnauthorizedError: if the user doesn't have the requested permission for any of
+            the objects.
+        :raises NoSuchWorkspaceDataError: if any of the workspaces or UPAs don't exist.
+        '''
+        _not_falsy(perm, 'perm')
+        _not_falsy_in_iterable(upas, 'upas')
+        if not upas:
+            return
+        upas = list(dict.fromkeys(upas))  # dedup, preserving order
+        wsid_to_upa = {}
+        for upa in upas:
+            wsid_to_upa.setdefault(upa.wsid, upa)
+        perms = self._get_perms(list(wsid_to_upa.keys()))
+        for p, upa in zip(perms, wsid_to_upa.values()):
+            self._check_perm(p, user, perm, 'upa', str(upa))
+        self._check_objects_exist(upas)
+
+    def _get_perms(self, wsids: List[int]) -> List[_Dict[str, str]]:
         try:
-            p = self._ws.administer({'command': 'getPermissionsMass',
-                                     'params': {'workspaces': [{'id': wsid}]}
-                                     }
-                                    )['perms'][0]
+            return self._ws.administer({'command': 'getPermissionsMass',
+                                        'params': {'workspaces': [{'id': i} for i in wsids]}
+                                        }
+                                       )['perms']
         except _ServerError as se:
             # this is pretty ugly, need error codes
             if 'No workspace' in se.args[0] or 'is deleted' in se.args[0]:
                 raise _NoSuchWorkspaceDataError(se.args[0]) from se
             else:
                 raise
+
+    def _check_perm(self, p, user, perm, name, target):
         publicaccess = p.get('*') == 'r' and perm == WorkspaceAccessType.READ
         hasaccess = p.get(user.id) in _PERM_TO_PERM_SET[perm] if user else False
         # could optimize a bit if NONE and upa but not worth the code complication most likely
         if (perm != WorkspaceAccessType.NONE and not hasaccess and not publicaccess):
             u = f'User {user}' if user else 'Anonymous users'
             raise _UnauthorizedError(f'{u} cannot {_PERM_TO_PERM_TEXT[perm]} {name} {target}')
-        if upa:
-            # Allow any server errors to percolate upwards
-            # theoretically the workspace could've been deleted between the last call and this
-            # one, but that'll just result in a different error and is extremely unlikely to
-            # happen, so don't worry about it
-            ret = self._ws.administer({'command': 'getObjectInfo',
-                                       'params': {'objects': [{'ref': str(upa)}],
-                                                  'ignoreErrors': 1}
-                                       })
-            if not ret['infos'][0]:
+
+    def _check_objects_exist(self, upas: List[UPA]):
+        # Allow any server errors to percolate upwards
+        # theoretically the workspace could've been deleted between the last call and this
+        # one, but that'll just result in a different error and is extremely unlikely to
+        # happen, so don't worry about it
+        ret = self._ws.administer({'command': 'getObjectInfo',
+                                   'params': {'objects': [{'ref': str(u)} for u in upas],
+                                              'ignoreErrors': 1}
+                                   })
+        for upa, info in zip(upas, ret['infos']):
+            if not info:
                 raise _NoSuchWorkspaceDataError(f'Object {upa} does not exist')
 
     def get_user_workspaces(self, user: Optional[UserID]) -> List[int]:
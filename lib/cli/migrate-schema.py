@@ -0,0 +1,79 @@
+'''
+Migrates the Sample Service database to the schema version used by this version of the service.
+
+The migration runs in batches against a live database and checkpoints its progress, so it can
+be paused with the pause command and resumed by running it again.
+
+Usage:
+    migrate-schema.py --config deploy.cfg status
+    migrate-schema.py --config deploy.cfg run [--batch-size N] [--parallelism N]
+    migrate-schema.py --config deploy.cfg pause
+'''
+
+import argparse
+import configparser
+import json
+import sys
+
+import arango
+
+from SampleService.core.storage.arango_migration import ArangoMigrator
+
+CONFIG_SECTION = 'SampleService'
+
+
+def get_config(path):
+    cfg = configparser.ConfigParser()
+    with open(path) as f:
+        cfg.read_file(f)
+    return dict(cfg.items(CONFIG_SECTION))
+
+
+def build_migrator(config, batch_size, parallelism):
+    client = arango.ArangoClient(hosts=config['arango-url'])
+    db = client.db(config['arango-db'], username=config['arango-user'],
+                   password=config['arango-pwd'], verify=True)
+    return ArangoMigrator(
+        db,
+        config['sample-collection'],
+        config['version-collection'],
+        config['node-collection'],
+        config['schema-collection'],
+        batch_size=batch_size,
+        parallelism=parallelism,
+        node_body_collection=config.get('node-body-collection') or None)
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description='Migrate the Sample Service database schema.')
+    parser.add_argument('--config', required=True,
+                        help='the Sample Service deploy.cfg file containing the ArangoDB '
+                        + 'connection parameters and collection names')
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help='the maximum number of documents updated by one query')
+    parser.add_argument('--parallelism', type=int, default=4,
+                        help='the number of batches run concurrently')
+    parser.add_argument('command', choices=['status', 'run', 'pause'])
+    return parser.parse_args(args)
+
+
+def main(args):
+    a = parse_args(args)
+    migrator = build_migrator(get_config(a.config), a.batch_size, a.parallelism)
+    if a.command == 'run':
+        if migrator.run():
+            print('[migrate-schema] Database schema is up to date')
+        else:
+            print('[migrate-schema] Migration paused, run again to resume')
+    elif a.command == 'pause':
+        if migrator.pause():
+            print('[migrate-schema] Requested migration pause')
+        else:
+            print('[migrate-schema] No migration in progress')
+    else:
+        print(json.dumps(migrator.get_status(), indent=4, default=str))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -1,4 +1,5 @@
 import datetime
+import os
 import time
 
 import arango
@@ -13,21 +14,37 @@ TEST_COL_NODE_EDGE = "samples_nodes_edge"
 TEST_COL_WS_OBJ_VER = "ws_object_version"
 TEST_COL_DATA_LINK = "samples_data_link"
 TEST_COL_SCHEMA = "samples_schema"
+TEST_COL_WRITE_JOURNAL = "samples_write_journal"
+TEST_COL_DATA_LINK_COUNT = "samples_data_link_count"
+TEST_COL_NODE_BODY = "samples_node_body"
 TEST_USER = "test"
 TEST_PWD = "test123"
 
+# Must match shard-by-sample-id in deploy.cfg
+SHARD_BY_SAMPLE_ID = os.environ.get("shard_by_sample_id") == "true"
+SAMPLE_ID_FIELD = "id"
+
 TIMEOUT = 60
 
 
-def create_collections(db):
+def create_collections(db, shard_by_sample_id=False):
     db.create_collection(TEST_COL_SAMPLE)
-    db.create_collection(TEST_COL_VERSION)
-    db.create_collection(TEST_COL_VER_EDGE, edge=True)
-    db.create_collection(TEST_COL_NODES)
-    db.create_collection(TEST_COL_NODE_EDGE, edge=True)
+    if shard_by_sample_id:
+        # Store all the documents for a sample on the same shard as the sample document. The
+        # sample collection is sharded by _key, which is the sample ID.
+        sharding = {"shard_fields": [SAMPLE_ID_FIELD], "shard_like": TEST_COL_SAMPLE}
+    else:
+        sharding = {}
+    db.create_collection(TEST_COL_VERSION, **sharding)
+    db.create_collection(TEST_COL_VER_EDGE, edge=True, **sharding)
+    db.create_collection(TEST_COL_NODES, **sharding)
+    db.create_collection(TEST_COL_NODE_EDGE, edge=True, **sharding)
     db.create_collection(TEST_COL_WS_OBJ_VER)
     db.create_collection(TEST_COL_DATA_LINK, edge=True)
     db.create_collection(TEST_COL_SCHEMA)
+    db.create_collection(TEST_COL_WRITE_JOURNAL)
+    db.create_collection(TEST_COL_DATA_LINK_COUNT)
+    db.create_collection(TEST_COL_NODE_BODY)
 
 
 def create_test_db(arango_host, test_db_name, test_user, test_user_password):
@@ -63,7 +80,7 @@ def main():
     db = try_wait(create_db, 60)
 
     try:
-        create_collections(db)
+        create_collections(db, SHARD_BY_SAMPLE_ID)
     except Exception as ex:
         print("[prepare-arango] collections: I guess not :(", ex)
 
@@ -0,0 +1,76 @@
+'''
+Rebuilds the counts of extant data links from each sample version and workspace object version
+from the data links.
+
+The counts are used to enforce the link limits and are maintained as links are created and
+expired. Links cannot be created or expired while the counts are rebuilt.
+
+The database schema is checked as it is when a server starts, so when upgrading from a version
+of the service that did not store the counts, run this after the schema migration starts and
+before starting the new servers:
+    1. Stop all servers.
+    2. Start the migration with migrate-schema.py --config deploy.cfg run.
+    3. Run this tool. If it fails with an incompatible schema error it ran between the v1 to v2
+       and v2 to v3 migrations - run it again.
+    4. Start the new servers.
+
+Usage:
+    rebuild-link-counts.py --config deploy.cfg
+'''
+
+import argparse
+import configparser
+import sys
+
+import arango
+
+from SampleService.core.storage.arango_sample_storage import ArangoSampleStorage
+
+CONFIG_SECTION = 'SampleService'
+
+
+def get_config(path):
+    cfg = configparser.ConfigParser()
+    with open(path) as f:
+        cfg.read_file(f)
+    return dict(cfg.items(CONFIG_SECTION))
+
+
+def build_storage(config):
+    client = arango.ArangoClient(hosts=config['arango-url'])
+    db = client.db(config['arango-db'], username=config['arango-user'],
+                   password=config['arango-pwd'], verify=True)
+    return ArangoSampleStorage(
+        db,
+        config['sample-collection'],
+        config['version-collection'],
+        config['version-edge-collection'],
+        config['node-collection'],
+        config['node-edge-collection'],
+        config['workspace-object-version-shadow-collection'],
+        config['data-link-collection'],
+        config['schema-collection'],
+        config['write-journal-collection'],
+        config['data-link-count-collection'],
+        node_body_collection=config.get('node-body-collection') or None,
+        defer_edges=config.get('defer-edges') == 'true',
+        shard_by_sample_id=config.get('shard-by-sample-id') == 'true')
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description='Rebuild the Sample Service data link counts.')
+    parser.add_argument('--config', required=True,
+                        help='the Sample Service deploy.cfg file containing the ArangoDB '
+                        + 'connection parameters and collection names')
+    return parser.parse_args(args)
+
+
+def main(args):
+    a = parse_args(args)
+    count = build_storage(get_config(a.config)).rebuild_data_link_counts()
+    print(f'[rebuild-link-counts] Saved {count} data link counts')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -62,6 +62,8 @@ TEST_COL_NODE_EDGE = 'node_edges'
 TEST_COL_DATA_LINK = 'data_link'
 TEST_COL_WS_OBJ_VER = 'ws_obj_ver_shadow'
 TEST_COL_SCHEMA = 'schema'
+TEST_COL_WRITE_JOURNAL = 'write_journal'
+TEST_COL_DATA_LINK_COUNT = 'data_link_count'
 TEST_USER = 'user1'
 TEST_PWD = 'password1'
 
@@ -126,6 +128,10 @@ def create_deploy_cfg(auth_port, arango_port, workspace_port, kafka_port):
     cfg[ss]['data-link-collection'] = TEST_COL_DATA_LINK
     cfg[ss]['workspace-object-version-shadow-collection'] = TEST_COL_WS_OBJ_VER
     cfg[ss]['schema-collection'] = TEST_COL_SCHEMA
+    cfg[ss]['write-journal-collection'] = TEST_COL_WRITE_JOURNAL
+    cfg[ss]['data-link-count-collection'] = TEST_COL_DATA_LINK_COUNT
+    # stream link query results in small batches so the link tests span several batches
+    cfg[ss]['link-stream-batch-size'] = '2'
 
     metacfg = {
         'validators': {
@@ -328,6 +334,8 @@ def clear_db_and_recreate(arango):
     db.create_collection(TEST_COL_DATA_LINK, edge=True)
     db.create_collection(TEST_COL_WS_OBJ_VER)
     db.create_collection(TEST_COL_SCHEMA)
+    db.create_collection(TEST_COL_WRITE_JOURNAL)
+    db.create_collection(TEST_COL_DATA_LINK_COUNT)
     return db
 
 
@@ -404,6 +412,10 @@ def test_init_fail():
     cfg['workspace-object-version-shadow-collection'] = 'crap'
     init_fail(cfg, MissingParameterError('config param schema-collection'))
     cfg['schema-collection'] = 'crap'
+    init_fail(cfg, MissingParameterError('config param write-journal-collection'))
+    cfg['write-journal-collection'] = 'crap'
+    init_fail(cfg, MissingParameterError('config param data-link-count-collection'))
+    cfg['data-link-count-collection'] = 'crap'
     init_fail(cfg, MissingParameterError('config param auth-root-url'))
     cfg['auth-root-url'] = 'crap'
     init_fail(cfg, MissingParameterError('config param auth-token'))
@@ -415,6 +427,20 @@ def test_init_fail():
     cfg['kafka-bootstrap-servers'] = 'crap'
     init_fail(cfg, MissingParameterError('config param kafka-topic'))
     cfg['kafka-topic'] = 'crap'
+    cfg['reaper-update-delay-sec'] = 'foo'
+    init_fail(cfg, ValueError('config param reaper-update-delay-sec must be an integer: foo'))
+    cfg['reaper-update-delay-sec'] = '-1'
+    init_fail(cfg, ValueError('config param reaper-update-delay-sec must be >= 0'))
+    cfg['reaper-update-delay-sec'] = '300'
+    cfg['reaper-lease-sec'] = '0'
+    init_fail(cfg, ValueError('config param reaper-lease-sec must be >= 1'))
+    cfg['reaper-lease-sec'] = '180'
+    cfg['sample-cache-size-mb'] = '-1'
+    init_fail(cfg, ValueError('config param sample-cache-size-mb must be >= 0'))
+    cfg['sample-cache-size-mb'] = '32'
+    cfg['acl-cache-staleness-sec'] = '-1'
+    init_fail(cfg, ValueError('config param acl-cache-staleness-sec must be >= 0'))
+    cfg['acl-cache-staleness-sec'] = '0'
     # get_validators is tested elsewhere, just make sure it'll error out
     cfg['metadata-validator-config-url'] = 'https://kbase.us/services'
     init_fail(cfg, ValueError(
@@ -442,6 +468,11 @@ def test_status(sample_port):
     assert s['result'][0]['state'] == 'OK'
     assert s['result'][0]['message'] == ""
     assert s['result'][0]['version'] == VER
+    # the checker may or may not have run yet, depending on test order
+    assert 'consistency_checker' in s['result'][0]
+    assert s['result'][0]['sample_cache']['max_bytes'] == 32 * 1024 * 1024
+    assert s['result'][0]['shared_sample_cache']['entries'] == 0  # disabled
+    assert s['result'][0]['read_repair'] == {'queued': 0, 'repaired': 0, 'failed': 0}
     # ignore git url and hash, can change
 
 
@@ -614,6 +645,46 @@ def test_create_and_get_sample_with_version(sample_port, kafka):
         ])
 
 
+def test_create_sample_version_skip_if_unchanged(sample_port, kafka):
+    _clear_kafka_messages(kafka)
+    url = f'http://localhost:{sample_port}'
+
+    def create(id_, name, skip):
+        sample = {'name': name,
+                  'node_tree': [{'id': 'root',
+                                 'type': 'BioReplicate',
+                                 'meta_controlled': {'foo': {'bar': 'baz'}},
+                                 'meta_user': {'a': {'b': 'c'}}
+                                 }
+                                ]
+                  }
+        if id_:
+            sample['id'] = id_
+        ret = requests.post(url, headers=get_authorized_headers(TOKEN1), json={
+            'method': 'SampleService.create_sample',
+            'version': '1.1',
+            'id': '67',
+            'params': [{'sample': sample, 'skip_if_unchanged': skip}]
+        })
+        # print(ret.text)
+        assert ret.ok is True
+        return ret.json()['result'][0]
+
+    id_ = create(None, 'mysample', 1)['id']
+    assert create(id_, 'mysample', 1) == {'id': id_, 'version': 1}
+    assert create(id_, 'mysample', 0) == {'id': id_, 'version': 2}
+    assert create(id_, 'mysample2', 1) == {'id': id_, 'version': 3}
+    assert create(id_, 'mysample2', 1) == {'id': id_, 'version': 3}
+
+    _check_kafka_messages(
+        kafka,
+        [
+            {'event_type': 'NEW_SAMPLE', 'sample_id': id_, 'sample_ver': 1},
+            {'event_type': 'NEW_SAMPLE', 'sample_id': id_, 'sample_ver': 2},
+            {'event_type': 'NEW_SAMPLE', 'sample_id': id_, 'sample_ver': 3}
+        ])
+
+
 def test_create_and_get_samples(sample_port, kafka):
     _clear_kafka_messages(kafka)
     url = f'http://localhost:{sample_port}'
@@ -731,6 +802,73 @@ def test_create_and_get_samples(sample_port, kafka):
         ])
 
 
+def test_create_samples(sample_port, kafka):
+    _clear_kafka_messages(kafka)
+    url = f'http://localhost:{sample_port}'
+
+    id1 = _create_generic_sample(url, TOKEN1)
+
+    ret = requests.post(url, headers=get_authorized_headers(TOKEN1), json={
+        'method': 'SampleService.create_samples',
+        'version': '1.1',
+        'id': '67',
+        'params': [{'samples': [
+            {'sample': {'name': 'new',
+                        'node_tree': [{'id': 'root', 'type': 'BioReplicate',
+                                       'meta_controlled': {'foo': {'bar': 'baz'}}}]}},
+            {'sample': {'id': id1,
+                        'name': 'newver',
+                        'node_tree': [{'id': 'root', 'type': 'BioReplicate'}]},
+             'prior_version': 1},
+            {'sample': {'id': '706fe9e1-70ef-4feb-bbd9-32295104a119',
+                        'node_tree': [{'id': 'root', 'type': 'BioReplicate'}]}},
+        ]}]
+    })
+    # print(ret.text)
+    assert ret.ok is True
+    res = ret.json()['result'][0]['results']
+    assert len(res) == 3
+    assert res[0]['version'] == 1
+    assert res[0]['error'] is None
+    assert res[1] == {'id': id1, 'version': 2, 'error': None}
+    assert res[2] == {
+        'id': '706fe9e1-70ef-4feb-bbd9-32295104a119',
+        'version': None,
+        'error': 'Sample service error code 50010 No such sample: ' +
+                 '706fe9e1-70ef-4feb-bbd9-32295104a119'}
+
+    ret = requests.post(url, headers=get_authorized_headers(TOKEN1), json={
+        'method': 'SampleService.get_samples',
+        'version': '1.1',
+        'id': '42',
+        'params': [{'samples': [{'id': res[0]['id']}, {'id': id1}]}]
+    })
+    assert ret.ok is True
+    j = ret.json()['result'][0]
+    assert [(s['name'], s['version']) for s in j] == [('new', 1), ('newver', 2)]
+
+    _check_kafka_messages(
+        kafka,
+        [
+            {'event_type': 'NEW_SAMPLE', 'sample_id': id1, 'sample_ver': 1},
+            {'event_type': 'NEW_SAMPLE', 'sample_id': res[0]['id'], 'sample_ver': 1},
+            {'event_type': 'NEW_SAMPLE', 'sample_id': id1, 'sample_ver': 2},
+        ])
+
+
+def test_create_samples_fail_bad_metadata(sample_port):
+    _request_fail(
+        sample_port, 'create_samples', TOKEN1, {'samples': [
+            {'sample': {'node_tree': [{'id': 'root', 'type': 'BioReplicate'}]}},
+            {'sample': {'node_tree': [{'id': 'root', 'type': 'BioReplicate',
+                                       'meta_controlled': {'stringlentest': {'foooo': 'barrrr'}}
+                                       }]}}
+            ]},
+        'Sample service error code 30010 Metadata validation failed: Error for sample at ' +
+        'index 1: Node at index 0: Key stringlentest: Metadata value at key foooo is longer ' +
+        'than max length of 5')
+
+
 def test_create_sample_as_admin(sample_port):
     _create_sample_as_admin(sample_port, None, TOKEN2, USER2)
 
@@ -3239,6 +3377,81 @@ def _create_link_fail(sample_port, token, params, expected):
     assert ret.json()['error']['message'] == expected
 
 
+def test_create_data_links(sample_port, workspace):
+    url = f'http://localhost:{sample_port}'
+    wsurl = f'http://localhost:{workspace.port}'
+    wscli = Workspace(wsurl, token=TOKEN3)
+
+    wscli.create_workspace({'workspace': 'foo'})
+    wscli.save_objects({'id': 1, 'objects': [
+        {'name': 'bar', 'data': {}, 'type': 'Trivial.Object-1.0'},
+        {'name': 'baz', 'data': {}, 'type': 'Trivial.Object-1.0'},
+        ]})
+
+    id_ = _create_generic_sample(url, TOKEN3)
+
+    lid1 = _create_link(url, TOKEN3, USER3,
+                        {'id': id_, 'version': 1, 'node': 'foo', 'upa': '1/1/1'})
+
+    ret = requests.post(url, headers=get_authorized_headers(TOKEN3), json={
+        'method': 'SampleService.create_data_links',
+        'version': '1.1',
+        'id': '42',
+        'params': [{'links': [
+            {'id': id_, 'version': 1, 'node': 'root', 'upa': '1/1/1'},
+            {'id': id_, 'version': 1, 'node': 'foo', 'upa': '1/2/1', 'dataid': 'yay'},
+            ],
+            'update': 1}]
+    })
+    # print(ret.text)
+    assert ret.ok is True
+    res = ret.json()['result'][0]['results']
+    assert len(res) == 2
+    assert res[0]['expired_link_id'] == lid1
+    assert res[1]['expired_link_id'] is None
+    for r in res:
+        uuid.UUID(r['new_link']['linkid'])
+        assert_ms_epoch_close_to_now(r['new_link']['created'])
+        del r['new_link']['linkid']
+        del r['new_link']['created']
+    assert [r['new_link'] for r in res] == [
+        {'id': id_, 'version': 1, 'node': 'root', 'upa': '1/1/1', 'dataid': None,
+         'createdby': USER3, 'expiredby': None, 'expired': None},
+        {'id': id_, 'version': 1, 'node': 'foo', 'upa': '1/2/1', 'dataid': 'yay',
+         'createdby': USER3, 'expiredby': None, 'expired': None},
+    ]
+
+
+def test_create_data_links_fail_link_exists(sample_port, workspace):
+    url = f'http://localhost:{sample_port}'
+    wsurl = f'http://localhost:{workspace.port}'
+    wscli = Workspace(wsurl, token=TOKEN3)
+
+    wscli.create_workspace({'workspace': 'foo'})
+    wscli.save_objects({'id': 1, 'objects': [
+        {'name': 'bar', 'data': {}, 'type': 'Trivial.Object-1.0'},
+        ]})
+
+    id_ = _create_generic_sample(url, TOKEN3)
+
+    _create_link(url, TOKEN3, USER3,
+                 {'id': id_, 'version': 1, 'node': 'foo', 'upa': '1/1/1', 'dataid': 'yay'})
+
+    ret = requests.post(url, headers=get_authorized_headers(TOKEN3), json={
+        'method': 'SampleService.create_data_links',
+        'version': '1.1',
+        'id': '42',
+        'params': [{'links': [
+            {'id': id_, 'version': 1, 'node': 'root', 'upa': '1/1/1'},
+            {'id': id_, 'version': 1, 'node': 'root', 'upa': '1/1/1', 'dataid': 'yay'},
+            ]}]
+    })
+
+    assert ret.status_code == 500
+    assert ret.json()['error']['message'] == (
+        'Sample service error code 60000 Data link exists for data ID: 1/1/1:yay')
+
+
 def test_get_links_from_sample_fail(sample_port):
     url = f'http://localhost:{sample_port}'
     id_ = _create_generic_sample(url, TOKEN3)
@@ -3810,6 +4023,116 @@ def _get_links_from_data(url, token, params, print_resp=False):
     return ret.json()['result'][0]
 
 
+def test_get_links_paged(sample_port, workspace):
+    url = f'http://localhost:{sample_port}'
+    wsurl = f'http://localhost:{workspace.port}'
+    wscli = Workspace(wsurl, token=TOKEN3)
+
+    wscli.create_workspace({'workspace': 'foo'})
+    wscli.save_objects({'id': 1, 'objects': [
+        {'name': 'bar', 'data': {}, 'type': 'Trivial.Object-1.0'},
+        ]})
+
+    id_ = _create_generic_sample(url, TOKEN3)
+    lids = sorted([
+        _create_link(url, TOKEN3, USER3,
+                     {'id': id_, 'version': 1, 'node': 'root', 'upa': '1/1/1', 'dataid': d})
+        for d in ['a', 'b', 'c']])
+
+    methods = [
+        ('get_data_links_from_sample', {'id': id_, 'version': 1}),
+        ('get_data_links_from_data', {'upa': '1/1/1'}),
+        ('get_data_links_from_sample_set', {
+            'sample_ids': [{'id': id_, 'version': 1}],
+            'effective_time': _get_current_epochmillis()}),
+    ]
+    first_pages = []
+    for method, params in methods:
+        ret = _get_links_page(url, method, dict(params, limit=2))
+        assert [link['linkid'] for link in ret['links']] == lids[:2]
+        assert ret['resume_token'] is not None
+        first_pages.append(ret)
+
+    # links created after the first page are not in later pages
+    _create_link(url, TOKEN3, USER3,
+                 {'id': id_, 'version': 1, 'node': 'root', 'upa': '1/1/1', 'dataid': 'd'})
+
+    for (method, params), first in zip(methods, first_pages):
+        token = first['resume_token']
+        ret = _get_links_page(url, method, dict(params, limit=2, resume_token=token))
+        assert [link['linkid'] for link in ret['links']] == lids[2:]
+        assert ret['resume_token'] is None
+        assert ret['effective_time'] == first['effective_time']
+
+        _request_fail(
+            sample_port, method, TOKEN3,
+            dict(params, effective_time=first['effective_time'] + 1, resume_token=token),
+            'Sample service error code 30001 Illegal input parameter: effective_time does not ' +
+            'match the resume_token')
+
+
+def _get_links_page(url, method, params):
+    ret = requests.post(url, headers=get_authorized_headers(TOKEN3), json={
+        'method': 'SampleService.' + method,
+        'version': '1.1',
+        'id': '42',
+        'params': [params]
+    })
+    assert ret.ok is True
+    return ret.json()['result'][0]
+
+
+def test_get_link_history(sample_port, workspace):
+    url = f'http://localhost:{sample_port}'
+    wsurl = f'http://localhost:{workspace.port}'
+    wscli = Workspace(wsurl, token=TOKEN3)
+
+    wscli.create_workspace({'workspace': 'foo'})
+    wscli.save_objects({'id': 1, 'objects': [
+        {'name': 'bar', 'data': {}, 'type': 'Trivial.Object-1.0'},
+        ]})
+
+    id_ = _create_generic_sample(url, TOKEN3)
+    lids = [_create_link(url, TOKEN3, USER3,
+                         {'id': id_, 'version': 1, 'node': 'root', 'upa': '1/1/1', 'dataid': d})
+            for d in ['a', 'b']]
+
+    ret = requests.post(url, headers=get_authorized_headers(TOKEN3), json={
+        'method': 'SampleService.expire_data_link',
+        'version': '1.1',
+        'id': '42',
+        'params': [{'upa': '1/1/1', 'dataid': 'a'}]
+    })
+    assert ret.ok is True
+    # a new link from the same data unit
+    lids.append(_create_link(url, TOKEN3, USER3,
+                             {'id': id_, 'version': 1, 'node': 'root', 'upa': '1/1/1',
+                              'dataid': 'a'}))
+
+    for params, expected in [({'id': id_}, lids),
+                             ({'upa': '1/1/1'}, lids),
+                             ({'id': id_, 'upa': '1/1/1', 'dataid': 'a'}, [lids[0], lids[2]])]:
+        ret = _get_links_page(url, 'get_data_link_history', params)
+        assert [link['linkid'] for link in ret['links']] == expected
+        assert ret['links'][0]['expiredby'] == USER3  # the expired link is included
+        assert 'resume_token' not in ret
+
+        ret = _get_links_page(url, 'get_data_link_history', dict(params, limit=2))
+        assert [link['linkid'] for link in ret['links']] == expected[:2]
+        assert ret['resume_token'] is not None
+        ret = _get_links_page(url, 'get_data_link_history', dict(
+            params, limit=2, resume_token=ret['resume_token']))
+        assert [link['linkid'] for link in ret['links']] == expected[2:]
+        assert ret['resume_token'] is None
+
+    _request_fail(
+        sample_port, 'get_data_link_history', TOKEN3, {'dataid': 'a'},
+        'Sample service error code 30000 Missing input parameter: id or upa')
+    _request_fail(
+        sample_port, 'get_data_link_history', TOKEN4, {'upa': '1/1/1'},
+        'Sample service error code 20000 Unauthorized: User user4 cannot read upa 1/1/1')
+
+
 def test_get_links_from_data_expired(sample_port, workspace):
     url = f'http://localhost:{sample_port}'
     wsurl = f'http://localhost:{workspace.port}'
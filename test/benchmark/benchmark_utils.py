@@ -0,0 +1,112 @@
+'''
+Utilities for the storage benchmarks. The benchmarks use the same test configuration file as
+the tests to find the ArangoDB executable. Run a benchmark from the repo root with
+PYTHONPATH=lib:test python test/benchmark/<benchmark>.py
+'''
+
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+from arango import ArangoClient
+
+from core import test_utils
+from arango_controller import ArangoController
+from SampleService.core.storage.arango_sample_storage import ArangoSampleStorage
+
+DB_NAME = 'benchmark'
+COL_SAMPLE = 'samples'
+COL_VERSION = 'versions'
+COL_VER_EDGE = 'ver_to_sample'
+COL_NODES = 'nodes'
+COL_NODE_EDGE = 'node_edges'
+COL_WS_OBJ_VER = 'ws_obj_ver'
+COL_DATA_LINK = 'data_link'
+COL_SCHEMA = 'schema'
+COL_WRITE_JOURNAL = 'write_journal'
+COL_DATA_LINK_COUNT = 'data_link_count'
+COL_NODE_BODY = 'node_body'
+
+# the collections that are sharded by sample ID if the storage shard_by_sample_id argument is true
+SAMPLE_ID_SHARDED = [COL_VERSION, COL_VER_EDGE, COL_NODES, COL_NODE_EDGE]
+
+
+@contextmanager
+def arango():
+    '''
+    Start an ArangoDB server for the duration of the context.
+    '''
+    a = ArangoController(
+        test_utils.get_arango_exe(), test_utils.get_arango_js(), test_utils.get_temp_dir())
+    try:
+        yield a
+    finally:
+        a.destroy(test_utils.get_delete_temp_files())
+
+
+@contextmanager
+def cluster(url: str):
+    '''
+    Connect to an ArangoDB cluster that is already running, for example one started with
+    `arangodb --starter.local`, for the duration of the context. The context value can be used
+    in place of an ArangoDB controller.
+
+    :param url: the URL of a coordinator.
+    '''
+    yield SimpleNamespace(client=ArangoClient(hosts=url))
+
+
+def build_storage(arango, shards: int = None, **kwargs) -> ArangoSampleStorage:
+    '''
+    Recreate the benchmark database with empty collections and return a storage instance.
+
+    :param arango: the ArangoDB controller.
+    :param shards: the number of shards for each collection in a cluster. If the
+        shard_by_sample_id storage argument is true, the version, node, and edge collections are
+        instead sharded by sample ID and distributed like the sample collection.
+    :param kwargs: any keyword arguments for the storage constructor.
+    '''
+    sysdb = arango.client.db(verify=True)
+    if DB_NAME in sysdb.databases():
+        sysdb.delete_database(DB_NAME)
+    sysdb.create_database(DB_NAME)
+    db = arango.client.db(DB_NAME)
+    for col, edge in [(COL_SAMPLE, False), (COL_VERSION, False), (COL_VER_EDGE, True),
+                      (COL_NODES, False), (COL_NODE_EDGE, True), (COL_WS_OBJ_VER, False),
+                      (COL_DATA_LINK, True), (COL_SCHEMA, False), (COL_WRITE_JOURNAL, False),
+                      (COL_DATA_LINK_COUNT, False), (COL_NODE_BODY, False)]:
+        if kwargs.get('shard_by_sample_id') and col in SAMPLE_ID_SHARDED:
+            db.create_collection(col, edge=edge, shard_fields=['id'], shard_like=COL_SAMPLE)
+        else:
+            db.create_collection(col, edge=edge, shard_count=shards)
+    return ArangoSampleStorage(
+        db,
+        COL_SAMPLE,
+        COL_VERSION,
+        COL_VER_EDGE,
+        COL_NODES,
+        COL_NODE_EDGE,
+        COL_WS_OBJ_VER,
+        COL_DATA_LINK,
+        COL_SCHEMA,
+        COL_WRITE_JOURNAL,
+        COL_DATA_LINK_COUNT,
+        **kwargs)
+
+
+def collection_bytes(storage: ArangoSampleStorage, col: str) -> int:
+    '''
+    Get the total size of the documents in a collection, serialized as JSON.
+    '''
+    return next(storage._db.aql.execute(
+        'RETURN SUM(FOR d IN @@col RETURN LENGTH(TO_STRING(d)))', bind_vars={'@col': col}))
+
+
+@contextmanager
+def timer(results: list):
+    '''
+    Append the wall clock time of the context in seconds to a list.
+    '''
+    start = time.perf_counter()
+    yield
+    results.append(time.perf_counter() - start)
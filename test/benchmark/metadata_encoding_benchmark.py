@@ -0,0 +1,76 @@
+'''
+Compares the size of the node documents and the time taken to read and decode a large sample
+with the node metadata stored in the v2 schema list format and in the v3 schema map format.
+'''
+
+import datetime
+import statistics
+import time
+import uuid
+
+from benchmark_utils import arango, build_storage, collection_bytes, timer, COL_NODES
+from SampleService.core.sample import SavedSample, SampleNode, SubSampleType, SourceMetadata
+from SampleService.core.user import UserID
+
+NODES = 10000
+META_KEYS = 30
+READS = 5
+
+
+def _nodes():
+    nodes = [SampleNode('root')]
+    for i in range(NODES - 1):
+        nodes.append(SampleNode(
+            f'node{i}', SubSampleType.TECHNICAL_REPLICATE, 'root',
+            {f'controlled_key_{k}': {'value': f'value {k} {i}', 'units': 'cm'}
+             for k in range(META_KEYS)},
+            {'notes': {'value': f'user value for node {i}'}},
+            [SourceMetadata('controlled_key_0', 'source_key_0', {'value': f'source value {i}'})]))
+    return nodes
+
+
+def _to_v2(doc):
+    return {
+        '_key': doc['_key'],
+        'cmeta': [{'ok': ok, 'k': k, 'v': v}
+                  for ok in doc['cmeta'] for k, v in doc['cmeta'][ok].items()],
+        'ucmeta': [{'ok': ok, 'k': k, 'v': v}
+                   for ok in doc['ucmeta'] for k, v in doc['ucmeta'][ok].items()],
+        'smeta': [{'k': k, 'sk': sk, 'v': v} for k, sk, v in doc['smeta']],
+    }
+
+
+def _measure(storage, id_, name):
+    reads = []
+    # the sample cache is disabled by default
+    for _ in range(READS):
+        with timer(reads):
+            storage.get_sample(id_)
+    docs = list(storage._col_nodes.all())
+    decodes = []
+    for _ in range(READS):
+        start = time.perf_counter()
+        for d in docs:
+            storage._doc_to_node(d)
+        decodes.append(time.perf_counter() - start)
+    print(f'{name}:')
+    print(f'    node storage: {collection_bytes(storage, COL_NODES) / 1024 / 1024:.1f} MB')
+    print(f'    median read: {statistics.median(reads):.3f}s')
+    print(f'    median decode: {statistics.median(decodes):.3f}s')
+
+
+def main():
+    print(f'A sample with {NODES} nodes and {META_KEYS} controlled metadata keys per node')
+    with arango() as a:
+        storage = build_storage(a)
+        id_ = uuid.uuid4()
+        now = datetime.datetime.now(tz=datetime.timezone.utc)
+        storage.save_sample(SavedSample(id_, UserID('u'), _nodes(), now, 'foo'))
+        _measure(storage, id_, 'v3 map format')
+        storage._col_nodes.update_many(
+            [_to_v2(d) for d in storage._col_nodes.all()], merge=False, silent=True)
+        _measure(storage, id_, 'v2 list format')
+
+
+if __name__ == '__main__':
+    main()
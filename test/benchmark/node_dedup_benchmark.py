@@ -0,0 +1,73 @@
+'''
+Compares the storage used and the time taken to save new versions of a large sample where only
+a few nodes change, with and without the node body collection.
+'''
+
+import datetime
+import statistics
+import uuid
+
+from benchmark_utils import (
+    arango,
+    build_storage,
+    collection_bytes,
+    timer,
+    COL_NODES,
+    COL_NODE_BODY,
+)
+from SampleService.core.sample import SavedSample, SampleNode, SubSampleType
+from SampleService.core.user import UserID
+
+NODES = 2000
+VERSIONS = 10
+CHANGED_NODES = 5
+META_KEYS = 20
+
+
+def _nodes(version):
+    nodes = [SampleNode('root')]
+    for i in range(NODES - 1):
+        # change the metadata of the first few nodes in each version
+        v = version if i < CHANGED_NODES else 0
+        nodes.append(SampleNode(
+            f'node{i}', SubSampleType.TECHNICAL_REPLICATE, 'root',
+            {f'key{k}': {'value': f'controlled value {k} {v}', 'units': 'cm'}
+             for k in range(META_KEYS)},
+            {'notes': {'value': f'user value for node {i} {v}'}}))
+    return nodes
+
+
+def _run(arango, name, **kwargs):
+    storage = build_storage(arango, **kwargs)
+    id_ = uuid.uuid4()
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    times = []
+    with timer(times):
+        storage.save_sample(SavedSample(id_, UserID('u'), _nodes(0), now, 'foo'))
+    for v in range(1, VERSIONS):
+        with timer(times):
+            storage.save_sample_version(SavedSample(id_, UserID('u'), _nodes(v), now, 'foo'))
+    reads = []
+    for v in range(1, VERSIONS + 1):
+        with timer(reads):
+            storage.get_sample(id_, v)
+    size = collection_bytes(storage, COL_NODES)
+    if kwargs:
+        size += collection_bytes(storage, COL_NODE_BODY)
+    print(f'{name}:')
+    print(f'    node storage: {size / 1024 / 1024:.1f} MB')
+    print(f'    first save: {times[0]:.3f}s')
+    print(f'    median new version save: {statistics.median(times[1:]):.3f}s')
+    print(f'    median read: {statistics.median(reads):.3f}s')
+
+
+def main():
+    print(f'{VERSIONS} versions of a sample with {NODES} nodes, {CHANGED_NODES} nodes '
+          + 'changed per version')
+    with arango() as a:
+        _run(a, 'Metadata in node documents')
+        _run(a, 'Metadata in node body documents', node_body_collection=COL_NODE_BODY)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+'''
+Measures the time taken to save new samples and new versions of samples of various sizes, with
+the default and a small insert chunk size, and with deferred edge creation.
+'''
+
+import datetime
+import statistics
+import uuid
+
+from benchmark_utils import arango, build_storage, timer
+from SampleService.core.sample import SavedSample, SampleNode, SubSampleType
+from SampleService.core.user import UserID
+
+NODE_COUNTS = [1, 100, 10000]
+RUNS = 5
+META_KEYS = 10
+
+
+def _nodes(count):
+    nodes = [SampleNode('root', controlled_metadata={'key': {'value': 'root'}})]
+    for i in range(count - 1):
+        nodes.append(SampleNode(
+            f'node{i}', SubSampleType.TECHNICAL_REPLICATE, 'root',
+            {f'key{k}': {'value': f'controlled value {k}', 'units': 'cm'}
+             for k in range(META_KEYS)}))
+    return nodes
+
+
+def _run(arango, name, **kwargs):
+    print(f'{name}:')
+    for count in NODE_COUNTS:
+        storage = build_storage(arango, **kwargs)
+        nodes = _nodes(count)
+        now = datetime.datetime.now(tz=datetime.timezone.utc)
+        saves = []
+        versions = []
+        for _ in range(RUNS):
+            id_ = uuid.uuid4()
+            with timer(saves):
+                storage.save_sample(SavedSample(id_, UserID('u'), nodes, now, 'foo'))
+            with timer(versions):
+                storage.save_sample_version(SavedSample(id_, UserID('u'), nodes, now, 'foo'))
+        print(f'    {count} nodes: median new sample save: {statistics.median(saves):.3f}s, '
+              + f'median new version save: {statistics.median(versions):.3f}s')
+
+
+def main():
+    print(f'Median of {RUNS} saves')
+    with arango() as a:
+        _run(a, 'Default insert chunk size')
+        _run(a, 'Insert chunk size 500', insert_chunk_size=500)
+        _run(a, 'Deferred edges', defer_edges=True)
+
+
+if __name__ == '__main__':
+    main()
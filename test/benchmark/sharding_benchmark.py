@@ -0,0 +1,69 @@
+'''
+Compares the time taken to save and read samples in an ArangoDB cluster with the version, node,
+and edge collections sharded by _key and sharded by sample ID.
+
+Unlike the other benchmarks this needs a running cluster, for example one started with
+`arangodb --starter.local` as in dev/docker-compose.yml. The coordinator URL may be passed as
+the first argument and defaults to http://localhost:8529.
+'''
+
+import datetime
+import statistics
+import sys
+import uuid
+
+from benchmark_utils import build_storage, cluster, timer
+from SampleService.core.sample import SavedSample, SampleNode, SubSampleType
+from SampleService.core.user import UserID
+
+SHARDS = 3
+SAMPLES = 100
+NODES = 100
+READS = 5
+
+
+def _nodes():
+    nodes = [SampleNode('root')]
+    for i in range(NODES - 1):
+        nodes.append(SampleNode(
+            f'node{i}', SubSampleType.TECHNICAL_REPLICATE, 'root',
+            {'key': {'value': f'controlled value {i}', 'units': 'cm'}}))
+    return nodes
+
+
+def _run(arango, name, **kwargs):
+    # edge creation must be deferred when sharding by sample ID, so defer it for both layouts
+    storage = build_storage(arango, shards=SHARDS, defer_edges=True, **kwargs)
+    nodes = _nodes()
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    ids = [uuid.uuid4() for _ in range(SAMPLES)]
+    saves = []
+    for id_ in ids:
+        with timer(saves):
+            storage.save_sample(SavedSample(id_, UserID('u'), nodes, now, 'foo'))
+    # the sample cache is disabled by default
+    reads = []
+    for _ in range(READS):
+        for id_ in ids:
+            with timer(reads):
+                storage.get_sample(id_)
+    bulk = []
+    for _ in range(READS):
+        with timer(bulk):
+            storage.get_samples([{'id': id_} for id_ in ids])
+    print(f'{name}:')
+    print(f'    median save: {statistics.median(saves):.3f}s')
+    print(f'    median get_sample: {statistics.median(reads):.3f}s')
+    print(f'    median get_samples for all samples: {statistics.median(bulk):.3f}s')
+
+
+def main():
+    url = sys.argv[1] if len(sys.argv) > 1 else 'http://localhost:8529'
+    print(f'{SAMPLES} samples with {NODES} nodes, {SHARDS} shards per collection')
+    with cluster(url) as a:
+        _run(a, 'Sharded by _key')
+        _run(a, 'Sharded by sample ID', shard_by_sample_id=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -13,13 +13,23 @@ from SampleService.core.api_translation import (
     check_admin,
     get_static_key_metadata_params,
     create_data_link_params,
+    create_data_links_params,
+    create_data_links_results_to_dicts,
+    consistency_checker_status_to_dict,
     get_datetime_from_epochmilliseconds_in_object,
     links_to_dicts,
+    stream_links_to_dicts,
+    get_link_page_params,
+    link_resume_token,
+    get_link_history_params,
+    link_history_resume_token,
     get_upa_from_object,
     get_data_unit_id_from_object,
     get_user_from_object,
     get_admin_request_from_object,
-    acl_delta_from_dict
+    acl_delta_from_dict,
+    create_samples_params,
+    create_samples_results_to_dicts,
 )
 from SampleService.core.data_link import DataLink
 from SampleService.core.sample import (
@@ -36,7 +46,8 @@ from SampleService.core.errors import (
     IllegalParameterError,
     MissingParameterError,
     UnauthorizedError,
-    NoSuchUserError
+    NoSuchUserError,
+    NoSuchSampleError,
 )
 from SampleService.core.acls import AdminPermission
 from SampleService.core.user_lookup import KBaseUserLookup
@@ -424,6 +435,66 @@ def create_sample_params_fail(params, expected):
     assert_exception_correct(got.value, expected)
 
 
+def test_create_samples_params():
+    params = {'samples': [
+        {'sample': {'node_tree': [{'id': 'foo', 'type': 'BioReplicate'}]}},
+        {'sample': {'id': '706fe9e1-70ef-4feb-bbd9-32295104a119',
+                    'name': 'myname',
+                    'node_tree': [{'id': 'bar', 'type': 'BioReplicate'}]},
+         'prior_version': 3}
+        ],
+        'as_admin': 1}
+
+    assert create_samples_params(params) == [
+        (Sample([SampleNode('foo')]), None, None),
+        (Sample([SampleNode('bar')], 'myname'), UUID('706fe9e1-70ef-4feb-bbd9-32295104a119'), 3)
+    ]
+
+
+def test_create_samples_params_fail_bad_input():
+    _create_samples_params_fail(None, ValueError('params cannot be None'))
+    _create_samples_params_fail(
+        {}, IllegalParameterError('params must contain a non-empty list of samples'))
+    _create_samples_params_fail(
+        {'samples': []}, IllegalParameterError('params must contain a non-empty list of samples'))
+    _create_samples_params_fail(
+        {'samples': {'sample': {}}},
+        IllegalParameterError('params must contain a non-empty list of samples'))
+    _create_samples_params_fail(
+        {'samples': [{'sample': {'node_tree': [{'id': 'foo', 'type': 'BioReplicate'}]}}, 'x']},
+        IllegalParameterError('Sample at index 1 is not a structure'))
+    _create_samples_params_fail(
+        {'samples': [{'sample': {'node_tree': [{'id': 'foo', 'type': 'BioReplicate'}]}},
+                     {'sample': {'node_tree': [{'id': 'foo', 'type': 'BioReplicate'}]},
+                      'prior_version': '1'}]},
+        IllegalParameterError(
+            'Error for sample at index 1: prior_version must be an integer if supplied'))
+    _create_samples_params_fail(
+        {'samples': [{'sample': {'node_tree': [{'id': 'foo', 'type': 'BioReplicate'}, 'foo']}}]},
+        IllegalParameterError('Error for sample at index 0: Node at index 1 is not a structure'))
+
+
+def _create_samples_params_fail(params, expected):
+    with raises(Exception) as got:
+        create_samples_params(params)
+    assert_exception_correct(got.value, expected)
+
+
+def test_create_samples_results_to_dicts():
+    assert create_samples_results_to_dicts([]) == []
+    assert create_samples_results_to_dicts([
+        (UUID('706fe9e1-70ef-4feb-bbd9-32295104a119'), 2, None),
+        (UUID('706fe9e1-70ef-4feb-bbd9-32295104a118'), None, NoSuchSampleError(
+            '706fe9e1-70ef-4feb-bbd9-32295104a118'))
+        ]) == [
+            {'id': '706fe9e1-70ef-4feb-bbd9-32295104a119', 'version': 2, 'error': None},
+            {'id': '706fe9e1-70ef-4feb-bbd9-32295104a118',
+             'version': None,
+             'error': 'Sample service error code 50010 No such sample: ' +
+                      '706fe9e1-70ef-4feb-bbd9-32295104a118'}
+        ]
+
+
 def test_get_version_from_object():
     assert get_version_from_object({}) is None
     assert get_version_from_object({'version': None}) is None
@@ -955,6 +1026,138 @@ def _create_data_link_params_fail(params, expected):
     assert_exception_correct(got.value, expected)
 
 
+def test_create_data_links_params():
+    assert create_data_links_params({
+        'links': [
+            {'id': '706fe9e1-70ef-4feb-bbd9-32295104a119',
+             'version': 78,
+             'node': 'mynode',
+             'upa': '6/7/29',
+             'dataid': 'mydata',
+             'update': 1  # ignored
+             },
+            {'id': '706fe9e1-70ef-4feb-bbd9-32295104a118',
+             'version': 1,
+             'node': 'n',
+             'upa': '6/7/29'}
+        ]
+    }) == (
+        [(DataUnitID(UPA('6/7/29'), 'mydata'),
+          SampleNodeAddress(
+            SampleAddress(UUID('706fe9e1-70ef-4feb-bbd9-32295104a119'), 78), 'mynode')),
+         (DataUnitID(UPA('6/7/29')),
+          SampleNodeAddress(
+            SampleAddress(UUID('706fe9e1-70ef-4feb-bbd9-32295104a118'), 1), 'n'))],
+        False)
+
+    link = {'id': '706fe9e1-70ef-4feb-bbd9-32295104a119', 'version': 1, 'node': 'n',
+            'upa': '1/1/1'}
+    assert create_data_links_params({'links': [link], 'update': 1}) == (
+        [(DataUnitID(UPA('1/1/1')),
+          SampleNodeAddress(SampleAddress(UUID('706fe9e1-70ef-4feb-bbd9-32295104a119'), 1), 'n'))],
+        True)
+
+
+def test_create_data_links_params_fail_bad_args():
+    link = {'id': '706fe9e1-70ef-4feb-bbd9-32295104a119', 'version': 1, 'node': 'n',
+            'upa': '1/1/1'}
+    err = 'params must contain a non-empty list of links'
+    _create_data_links_params_fail(None, ValueError('params cannot be None'))
+    _create_data_links_params_fail({}, IllegalParameterError(err))
+    _create_data_links_params_fail({'links': []}, IllegalParameterError(err))
+    _create_data_links_params_fail({'links': {'a': 'b'}}, IllegalParameterError(err))
+    _create_data_links_params_fail({'links': [link, 'foo']}, IllegalParameterError(
+        'Link at index 1 is not a structure'))
+    _create_data_links_params_fail({'links': [link, {'id': link['id']}]}, MissingParameterError(
+        'Error for link at index 1: version'))
+    _create_data_links_params_fail(
+        {'links': [dict(link, upa='1/0/1')]},
+        IllegalParameterError('Error for link at index 0: 1/0/1 is not a valid UPA'))
+
+
+def _create_data_links_params_fail(params, expected):
+    with raises(Exception) as got:
+        create_data_links_params(params)
+    assert_exception_correct(got.value, expected)
+
+
+def test_create_data_links_results_to_dicts():
+    assert create_data_links_results_to_dicts([]) == []
+    assert create_data_links_results_to_dicts([
+        (DataLink(
+            UUID('706fe9e1-70ef-4feb-bbd9-32295104a119'),
+            DataUnitID(UPA('1/2/3'), 'foo'),
+            SampleNodeAddress(
+                SampleAddress(UUID('706fe9e1-70ef-4feb-bbd9-32295104a118'), 4), 'n'),
+            dt(5),
+            UserID('userA')),
+         UUID('706fe9e1-70ef-4feb-bbd9-32295104a117')),
+        (DataLink(
+            UUID('706fe9e1-70ef-4feb-bbd9-32295104a116'),
+            DataUnitID(UPA('1/2/4')),
+            SampleNodeAddress(
+                SampleAddress(UUID('706fe9e1-70ef-4feb-bbd9-32295104a118'), 4), 'n'),
+            dt(5),
+            UserID('userA')),
+         None)
+    ]) == [
+        {'new_link': {
+            'linkid': '706fe9e1-70ef-4feb-bbd9-32295104a119',
+            'upa': '1/2/3',
+            'dataid': 'foo',
+            'id': '706fe9e1-70ef-4feb-bbd9-32295104a118',
+            'version': 4,
+            'node': 'n',
+            'createdby': 'userA',
+            'created': 5000,
+            'expiredby': None,
+            'expired': None},
+         'expired_link_id': '706fe9e1-70ef-4feb-bbd9-32295104a117'},
+        {'new_link': {
+            'linkid': '706fe9e1-70ef-4feb-bbd9-32295104a116',
+            'upa': '1/2/4',
+            'dataid': None,
+            'id': '706fe9e1-70ef-4feb-bbd9-32295104a118',
+            'version': 4,
+            'node': 'n',
+            'createdby': 'userA',
+            'created': 5000,
+            'expiredby': None,
+            'expired': None},
+         'expired_link_id': None}
+    ]
+
+
+def test_consistency_checker_status_to_dict():
+    assert consistency_checker_status_to_dict(None) is None
+    assert consistency_checker_status_to_dict({
+        'holder': 'host:42:foo',
+        'lease_expires': dt(180),
+        'last_run': None,
+        'last_run_duration': None,
+        'repaired': None
+    }) == {
+        'holder': 'host:42:foo',
+        'lease_expires': 180000,
+        'last_run': None,
+        'last_run_duration_ms': None,
+        'repaired': None
+    }
+    assert consistency_checker_status_to_dict({
+        'holder': 'host:42:foo',
+        'lease_expires': dt(180),
+        'last_run': dt(2),
+        'last_run_duration': datetime.timedelta(milliseconds=1500),
+        'repaired': 0
+    }) == {
+        'holder': 'host:42:foo',
+        'lease_expires': 180000,
+        'last_run': 2000,
+        'last_run_duration_ms': 1500,
+        'repaired': 0
+    }
+
+
 def test_get_data_unit_id_from_object():
     assert get_data_unit_id_from_object({'upa': '1/1/1'}) == DataUnitID(UPA('1/1/1'))
     assert get_data_unit_id_from_object({'upa': '8/3/2'}) == DataUnitID(UPA('8/3/2'))
@@ -1098,3 +1301,151 @@ def _links_to_dicts_fail(links, expected):
     with raises(Exception) as got:
         links_to_dicts(links)
     assert_exception_correct(got.value, expected)
+
+
+def test_stream_links_to_dicts():
+    l1 = _link('f5bd78c3-823e-40b2-9f93-20e78680e41a')
+    l2 = _link('f5bd78c3-823e-40b2-9f93-20e78680e41e')
+
+    assert stream_links_to_dicts([l1, l2]) == links_to_dicts([l1, l2])
+    assert stream_links_to_dicts([]) == []
+
+    def gen():
+        yield l1
+        raise ValueError('consumed too far')
+
+    got = stream_links_to_dicts(gen())
+    assert not isinstance(got, list)
+    assert next(got) == links_to_dicts([l1])[0]
+    with raises(Exception) as e:
+        next(got)
+    assert_exception_correct(e.value, ValueError('consumed too far'))
+
+    assert list(stream_links_to_dicts(iter([l1, l2]))) == links_to_dicts([l1, l2])
+
+
+def test_stream_links_to_dicts_fail_bad_args():
+    with raises(Exception) as got:
+        stream_links_to_dicts(None)
+    assert_exception_correct(got.value, ValueError('links cannot be None'))
+
+    with raises(Exception) as got:
+        list(stream_links_to_dicts(iter([_link('f5bd78c3-823e-40b2-9f93-20e78680e41a'), None])))
+    assert_exception_correct(got.value, ValueError(
+        'link cannot be a value that evaluates to false'))
+
+
+def _link(id_):
+    return DataLink(
+        UUID(id_),
+        DataUnitID(UPA('1/2/3'), 'foo'),
+        SampleNodeAddress(SampleAddress(UUID('f5bd78c3-823e-40b2-9f93-20e78680e41f'), 6), 'foo'),
+        dt(1),
+        UserID('usera'))
+
+
+def test_link_resume_token():
+    links = [_link('f5bd78c3-823e-40b2-9f93-20e78680e41a'),
+             _link('f5bd78c3-823e-40b2-9f93-20e78680e41e')]
+
+    assert link_resume_token(links, dt(1234877807.185), None) is None
+    assert link_resume_token(links, dt(1234877807.185), 3) is None
+    assert link_resume_token([], dt(1234877807.185), 3) is None
+
+    token = link_resume_token(links, dt(1234877807.185), 2)
+    assert get_link_page_params({'resume_token': token, 'limit': 2}) == (
+        dt(1234877807.185), 2, UUID('f5bd78c3-823e-40b2-9f93-20e78680e41e'))
+    assert get_link_page_params({'resume_token': token, 'effective_time': 1234877807185}) == (
+        dt(1234877807.185), None, UUID('f5bd78c3-823e-40b2-9f93-20e78680e41e'))
+
+
+def test_link_resume_token_fail_bad_args():
+    with raises(Exception) as got:
+        link_resume_token([], None, 1)
+    assert_exception_correct(got.value, ValueError(
+        'effective_time cannot be a value that evaluates to false'))
+
+
+def test_get_link_page_params():
+    assert get_link_page_params({}) == (None, None, None)
+    assert get_link_page_params({'effective_time': 1234877807185, 'limit': 1}) == (
+        dt(1234877807.185), 1, None)
+    assert get_link_page_params({'limit': None, 'resume_token': None}) == (None, None, None)
+
+
+def test_get_link_page_params_fail_bad_args():
+    token = link_resume_token([_link('f5bd78c3-823e-40b2-9f93-20e78680e41e')], dt(1), 1)
+    gp = _get_link_page_params_fail
+
+    gp(None, ValueError('params cannot be None'))
+    gp({'effective_time': 'a'}, IllegalParameterError(
+        "key 'effective_time' value of 'a' is not a valid epoch millisecond timestamp"))
+    for limit in [0, -1, 1.5, '1', True]:
+        gp({'limit': limit}, IllegalParameterError('limit must be an integer > 0'))
+    # not a string, not base64, no separator, bad link ID, bad time
+    for t in [1, 'a', 'Zm9v', 'MTIzOmZvbw==',
+              'Zm9vOmY1YmQ3OGMzLTgyM2UtNDBiMi05ZjkzLTIwZTc4NjgwZTQxZQ==']:
+        gp({'resume_token': t}, IllegalParameterError(f'Invalid resume_token: {t}'))
+    gp({'resume_token': token, 'effective_time': 1001}, IllegalParameterError(
+        'effective_time does not match the resume_token'))
+
+
+def _get_link_page_params_fail(params, expected):
+    with raises(Exception) as got:
+        get_link_page_params(params)
+    assert_exception_correct(got.value, expected)
+
+
+def test_get_link_history_params():
+    sid = 'f5bd78c3-823e-40b2-9f93-20e78680e41e'
+    assert get_link_history_params({'id': sid}) == (UUID(sid), None, None, None, None)
+    assert get_link_history_params({'upa': '1/2/3', 'dataid': 'foo', 'limit': 4}) == (
+        None, UPA('1/2/3'), 'foo', 4, None)
+    assert get_link_history_params(
+        {'id': sid, 'upa': '1/2/3', 'limit': None, 'resume_token': None}) == (
+            UUID(sid), UPA('1/2/3'), None, None, None)
+
+
+def test_link_history_resume_token():
+    links = [_link('f5bd78c3-823e-40b2-9f93-20e78680e41a'),
+             DataLink(
+                 UUID('f5bd78c3-823e-40b2-9f93-20e78680e41e'),
+                 DataUnitID(UPA('1/2/3')),
+                 SampleNodeAddress(
+                     SampleAddress(UUID('f5bd78c3-823e-40b2-9f93-20e78680e41f'), 6), 'foo'),
+                 dt(1234877807.185),
+                 UserID('usera'))]
+
+    assert link_history_resume_token(links, None) is None
+    assert link_history_resume_token(links, 3) is None
+    assert link_history_resume_token([], 3) is None
+
+    token = link_history_resume_token(links, 2)
+    assert get_link_history_params({'upa': '1/2/3', 'resume_token': token, 'limit': 2}) == (
+        None, UPA('1/2/3'), None, 2,
+        (dt(1234877807.185), UUID('f5bd78c3-823e-40b2-9f93-20e78680e41e')))
+
+
+def test_get_link_history_params_fail_bad_args():
+    sid = 'f5bd78c3-823e-40b2-9f93-20e78680e41e'
+    gp = _get_link_history_params_fail
+
+    gp(None, ValueError('params cannot be None'))
+    gp({}, MissingParameterError('id or upa'))
+    gp({'id': None, 'upa': None}, MissingParameterError('id or upa'))
+    gp({'id': 'foo'}, IllegalParameterError('id foo must be a UUID string'))
+    gp({'upa': 1}, IllegalParameterError('upa key is not a string as required'))
+    gp({'upa': '1/2'}, IllegalParameterError('1/2 is not a valid UPA'))
+    gp({'upa': '1/2/3', 'dataid': 1}, IllegalParameterError(
+        'dataid key is not a string as required'))
+    gp({'id': sid, 'dataid': 'foo'}, IllegalParameterError('dataid requires an upa'))
+    for limit in [0, -1, 1.5, '1', True]:
+        gp({'id': sid, 'limit': limit}, IllegalParameterError('limit must be an integer > 0'))
+    for t in [1, 'a', 'Zm9v', 'MTIzOmZvbw==']:
+        gp({'id': sid, 'resume_token': t}, IllegalParameterError(f'Invalid resume_token: {t}'))
+
+
+def _get_link_history_params_fail(params, expected):
+    with raises(Exception) as got:
+        get_link_history_params(params)
+    assert_exception_correct(got.value, expected)
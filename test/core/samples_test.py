@@ -9,11 +9,13 @@ from SampleService.core.storage.arango_sample_storage import ArangoSampleStorage
 from SampleService.core.acls import SampleACL, SampleACLOwnerless, SampleACLDelta
 from SampleService.core.data_link import DataLink
 from SampleService.core.errors import (
+    ConcurrencyError,
     IllegalParameterError,
     UnauthorizedError,
     NoSuchUserError,
     MetadataValidationError,
-    NoSuchLinkError
+    NoSuchLinkError,
+    NoSuchSampleError,
 )
 from SampleService.core.notification import KafkaNotifier
 from SampleService.core.sample import Sample, SampleNode, SavedSample, SampleAddress
@@ -205,6 +207,47 @@ def _save_sample_version_per_user(user: UserID, name, prior_version):
         UUID('1234567890abcdef1234567890abcdea'), 3)
 
 
+def test_save_sample_version_skip_if_unchanged():
+    _save_sample_version_skip_if_unchanged(3, None, 3, False)
+    _save_sample_version_skip_if_unchanged(3, 3, 3, False)
+    # the sample changed
+    _save_sample_version_skip_if_unchanged(None, None, 4, True)
+    # the prior version doesn't match, so the save proceeds and the storage system throws the
+    # concurrency error, but the mock doesn't
+    _save_sample_version_skip_if_unchanged(3, 2, 4, True)
+
+
+def _save_sample_version_skip_if_unchanged(latest, prior_version, expected, saved):
+    storage = create_autospec(ArangoSampleStorage, spec_set=True, instance=True)
+    lu = create_autospec(KBaseUserLookup, spec_set=True, instance=True)
+    meta = create_autospec(MetadataValidatorSet, spec_set=True, instance=True)
+    ws = create_autospec(WS, spec_set=True, instance=True)
+    kafka = create_autospec(KafkaNotifier, spec_set=True, instance=True)
+    s = Samples(storage, lu, meta, ws, kafka, now=nw,
+                uuid_gen=lambda: UUID('1234567890abcdef1234567890abcdef'))
+
+    storage.get_sample_acls.return_value = SampleACL(u('someuser'), dt(1))
+    storage.get_version_if_unchanged.return_value = latest
+    storage.save_sample_version.return_value = 4
+
+    id_ = UUID('1234567890abcdef1234567890abcdea')
+    assert s.save_sample(
+        Sample([SampleNode('foo')], 'bar'),
+        UserID('someuser'),
+        id_,
+        prior_version,
+        skip_if_unchanged=True) == (id_, expected)
+
+    sample = SavedSample(id_, UserID('someuser'), [SampleNode('foo')], dt(6), 'bar')
+    storage.get_version_if_unchanged.assert_called_once_with(sample)
+    if saved:
+        storage.save_sample_version.assert_called_once_with(sample, prior_version)
+        kafka.notify_new_sample_version.assert_called_once_with(id_, 4)
+    else:
+        assert storage.save_sample_version.call_args_list == []
+        assert kafka.notify_new_sample_version.call_args_list == []
+
+
 def test_save_sample_version_as_admin():
     '''
     Also test that not providing a notifier causes no issues.
@@ -349,6 +392,135 @@ def _save_sample_fail(samples, sample, user, id_, prior_version, expected):
     assert_exception_correct(got.value, expected)
 
 
+def test_save_samples():
+    storage = create_autospec(ArangoSampleStorage, spec_set=True, instance=True)
+    lu = create_autospec(KBaseUserLookup, spec_set=True, instance=True)
+    meta = create_autospec(MetadataValidatorSet, spec_set=True, instance=True)
+    ws = create_autospec(WS, spec_set=True, instance=True)
+    kafka = create_autospec(KafkaNotifier, spec_set=True, instance=True)
+    ids = iter([UUID('1234567890abcdef1234567890abcde1'),
+                UUID('1234567890abcdef1234567890abcde2')])
+    s = Samples(storage, lu, meta, ws, kafka, now=nw, uuid_gen=lambda: next(ids))
+
+    id3 = UUID('1234567890abcdef1234567890abcde3')
+    id4 = UUID('1234567890abcdef1234567890abcde4')
+    id5 = UUID('1234567890abcdef1234567890abcde5')
+    id6 = UUID('1234567890abcdef1234567890abcde6')
+
+    storage.get_sample_set_acls.return_value = [
+        SampleACL(u('someuser'), dt(1), write=[u('auser')]),
+        SampleACL(u('someuser'), dt(1), read=[u('auser')]),
+        None,
+        SampleACL(u('auser'), dt(1))]
+    storage.save_samples.return_value = [
+        1, 4, ConcurrencyError('Sample 12345678-90ab-cdef-1234-567890abcde2 already exists'), 2]
+
+    _check_save_samples_results(s.save_samples([
+        (Sample([SampleNode('foo')], 'a'), None, None),
+        (Sample([SampleNode('bar')], 'b'), id3, 3),
+        (Sample([SampleNode('baz')], 'c'), id4, None),
+        (Sample([SampleNode('bat')], 'd'), None, None),
+        (Sample([SampleNode('bag')], 'e'), id5, None),
+        (Sample([SampleNode('bal')], 'f'), id6, 2),
+        ],
+        UserID('auser')), [
+            (UUID('1234567890abcdef1234567890abcde1'), 1, None),
+            (id3, 4, None),
+            (id4, None, UnauthorizedError(
+                'User auser cannot write to sample 12345678-90ab-cdef-1234-567890abcde4')),
+            (UUID('1234567890abcdef1234567890abcde2'), None, ConcurrencyError(
+                'Sample 12345678-90ab-cdef-1234-567890abcde2 already exists')),
+            (id5, None, NoSuchSampleError('12345678-90ab-cdef-1234-567890abcde5')),
+            (id6, 2, None),
+        ])
+
+    assert storage.get_sample_set_acls.call_args_list == [
+        (([id3, id4, id5, id6],), {'exception': False})]
+    assert storage.save_samples.call_args_list == [((
+        [(SavedSample(UUID('1234567890abcdef1234567890abcde1'), UserID('auser'),
+                      [SampleNode('foo')], nw(), 'a'), False, None),
+         (SavedSample(id3, UserID('auser'), [SampleNode('bar')], nw(), 'b'), True, 3),
+         (SavedSample(UUID('1234567890abcdef1234567890abcde2'), UserID('auser'),
+                      [SampleNode('bat')], nw(), 'd'), False, None),
+         (SavedSample(id6, UserID('auser'), [SampleNode('bal')], nw(), 'f'), True, 2),
+         ],), {})]
+    assert kafka.notify_new_sample_version.call_args_list == [
+        ((UUID('1234567890abcdef1234567890abcde1'), 1), {}),
+        ((id3, 4), {}),
+        ((id6, 2), {}),
+    ]
+
+
+def test_save_samples_as_admin():
+    storage = create_autospec(ArangoSampleStorage, spec_set=True, instance=True)
+    lu = create_autospec(KBaseUserLookup, spec_set=True, instance=True)
+    meta = create_autospec(MetadataValidatorSet, spec_set=True, instance=True)
+    ws = create_autospec(WS, spec_set=True, instance=True)
+    s = Samples(storage, lu, meta, ws, now=nw)
+
+    id_ = UUID('1234567890abcdef1234567890abcde3')
+    storage.save_samples.return_value = [NoSuchSampleError(str(id_))]
+
+    _check_save_samples_results(
+        s.save_samples([(Sample([SampleNode('foo')]), id_, None)], UserID('auser'), True),
+        [(id_, None, NoSuchSampleError('12345678-90ab-cdef-1234-567890abcde3'))])
+
+    assert storage.get_sample_set_acls.call_args_list == []
+    assert storage.save_samples.call_args_list == [((
+        [(SavedSample(id_, UserID('auser'), [SampleNode('foo')], nw()), True, None)],), {})]
+
+
+def _check_save_samples_results(got, expected):
+    assert len(got) == len(expected)
+    for (gid, gver, gerr), (eid, ever, eerr) in zip(got, expected):
+        assert (gid, gver) == (eid, ever)
+        if eerr:
+            assert_exception_correct(gerr, eerr)
+        else:
+            assert gerr is None
+
+
+def test_save_samples_fail_bad_args():
+    storage = create_autospec(ArangoSampleStorage, spec_set=True, instance=True)
+    lu = create_autospec(KBaseUserLookup, spec_set=True, instance=True)
+    meta = create_autospec(MetadataValidatorSet, spec_set=True, instance=True)
+    ws = create_autospec(WS, spec_set=True, instance=True)
+    samples = Samples(storage, lu, meta, ws, now=nw)
+
+    s = Sample([SampleNode('foo')])
+    id_ = UUID('1234567890abcdef1234567890abcdef')
+    u = UserID('u')
+
+    _save_samples_fail(
+        samples, None, u, ValueError('samples cannot be a value that evaluates to false'))
+    _save_samples_fail(
+        samples, [(s, None, None)], None,
+        ValueError('user cannot be a value that evaluates to false'))
+    _save_samples_fail(
+        samples, [(s, None, None), (None, None, None)], u,
+        ValueError('sample at index 1 cannot be a value that evaluates to false'))
+    _save_samples_fail(
+        samples, [(s, None, None), (s, id_, 0)], u,
+        IllegalParameterError('Error for sample at index 1: Prior version must be > 0'))
+    _save_samples_fail(
+        samples, [(s, id_, None), (s, None, None), (s, id_, 1)], u,
+        IllegalParameterError('Error for sample at index 2: Sample ID ' +
+                              '12345678-90ab-cdef-1234-567890abcdef occurs more than once'))
+
+    meta.validate_metadata.side_effect = [None, MetadataValidationError('key2: u suk lol')]
+    _save_samples_fail(
+        samples, [(s, None, None), (s, None, None)], u,
+        MetadataValidationError('Error for sample at index 1: Node at index 0: key2: u suk lol'))
+
+    assert storage.save_samples.call_args_list == []
+
+
+def _save_samples_fail(samples, samples_to_save, user, expected):
+    with raises(Exception) as got:
+        samples.save_samples(samples_to_save, user)
+    assert_exception_correct(got.value, expected)
+
+
 def test_get_sample():
     # sample versions other than 4 don't really make sense but the mock doesn't care
     _get_sample(UserID('someuser'), None, False)
@@ -421,13 +593,13 @@ def _get_samples(user, version, as_admin, public_read=False):
     samples = Samples(
         storage, lu, meta, ws, uuid_gen=lambda: UUID('1234567890abcdef1234567890fbcdef'))
 
-    storage.get_sample_acls.return_value = SampleACL(
+    storage.get_sample_set_acls.return_value = [SampleACL(
         u('someuser'),
         dt(1),
         [u('otheruser')],
         [u('anotheruser'), u('ur mum')],
         [u('Fungus J. Pustule Jr.'), u('x')],
-        public_read=public_read)
+        public_read=public_read)] * 2
 
     storage.get_samples.return_value = [
         SavedSample(
@@ -464,12 +636,13 @@ def _get_samples(user, version, as_admin, public_read=False):
             'baz', 4)
     ]
     if not as_admin:
-        assert storage.get_sample_acls.call_args_list == [
-            call(UUID('12345678-90ab-cdef-1234-567890fbcdef')),
-            call(UUID('12345678-90ab-cdef-1234-567890fbcdeb'))
+        assert storage.get_sample_set_acls.call_args_list == [
+            call([UUID('12345678-90ab-cdef-1234-567890fbcdef'),
+                  UUID('12345678-90ab-cdef-1234-567890fbcdeb')])
         ]
     else:
-        assert storage.get_sample_acls.call_args_list == []
+        assert storage.get_sample_set_acls.call_args_list == []
+    assert storage.get_sample_acls.call_args_list == []
 
     # print('-'*80)
     # print(storage.get_samples.call_args_list)
@@ -530,6 +703,45 @@ def _get_sample_fail_unauthorized(user, expected):
         ((UUID('1234567890abcdef1234567890abcdef'),), {})]
 
 
+def test_get_samples_fail_unauthorized():
+    storage = create_autospec(ArangoSampleStorage, spec_set=True, instance=True)
+    lu = create_autospec(KBaseUserLookup, spec_set=True, instance=True)
+    meta = create_autospec(MetadataValidatorSet, spec_set=True, instance=True)
+    ws = create_autospec(WS, spec_set=True, instance=True)
+    samples = Samples(
+        storage, lu, meta, ws, now=nw, uuid_gen=lambda: UUID('1234567890abcdef1234567890abcdef'))
+
+    storage.get_sample_set_acls.return_value = [
+        SampleACL(u('someuser'), dt(1), read=[u('y')]),
+        SampleACL(u('someuser'), dt(1), read=[u('x')])]
+
+    with raises(Exception) as got:
+        samples.get_samples([
+            {'id': UUID('1234567890abcdef1234567890abcdef'), 'version': 1},
+            {'id': UUID('1234567890abcdef1234567890abcdea'), 'version': None}],
+            UserID('y'))
+    assert_exception_correct(got.value, UnauthorizedError(
+        'User y cannot read sample 12345678-90ab-cdef-1234-567890abcdea'))
+
+    assert storage.get_sample_set_acls.call_args_list == [
+        call([UUID('1234567890abcdef1234567890abcdef'),
+              UUID('1234567890abcdef1234567890abcdea')])]
+    assert storage.get_samples.call_args_list == []
+
+
+def test_get_samples_fail_bad_version():
+    storage = create_autospec(ArangoSampleStorage, spec_set=True, instance=True)
+    lu = create_autospec(KBaseUserLookup, spec_set=True, instance=True)
+    meta = create_autospec(MetadataValidatorSet, spec_set=True, instance=True)
+    ws = create_autospec(WS, spec_set=True, instance=True)
+    samples = Samples(storage, lu, meta, ws, now=nw)
+
+    with raises(Exception) as got:
+        samples.get_samples(
+            [{'id': UUID('1234567890abcdef1234567890abcdef'), 'version': 0}], UserID('y'))
+    assert_exception_correct(got.value, IllegalParameterError('Version must be > 0'))
+
+
 def _get_sample_fail(samples, id_, user, version, expected):
     with raises(Exception) as got:
         samples.get_sample(id_, user, version)
@@ -1481,6 +1693,143 @@ def _create_data_link_fail(samples, user, duid, sna, expected):
     assert_exception_correct(got.value, expected)
 
 
+def test_create_data_links():
+    storage = create_autospec(ArangoSampleStorage, spec_set=True, instance=True)
+    lu = create_autospec(KBaseUserLookup, spec_set=True, instance=True)
+    meta = create_autospec(MetadataValidatorSet, spec_set=True, instance=True)
+    ws = create_autospec(WS, spec_set=True, instance=True)
+    kafka = create_autospec(KafkaNotifier, spec_set=True, instance=True)
+    ids = iter([UUID('1234567890abcdef1234567890abcde1'), UUID('1234567890abcdef1234567890abcde2'),
+                UUID('1234567890abcdef1234567890abcde3')])
+    s = Samples(storage, lu, meta, ws, kafka, now=nw, uuid_gen=lambda: next(ids))
+
+    sid1 = UUID('1234567890abcdef1234567890abcdee')
+    sid2 = UUID('1234567890abcdef1234567890abcded')
+    storage.get_sample_set_acls.return_value = [
+        SampleACL(u('someuser'), dt(1)),
+        SampleACL(u('otheruser'), dt(1), [u('someuser')])]
+    storage.create_data_links.return_value = [
+        None, UUID('1234567890abcdef1234567890abcdea'), None]
+
+    sna1 = SampleNodeAddress(SampleAddress(sid1, 3), 'mynode')
+    sna2 = SampleNodeAddress(SampleAddress(sid2, 1), 'n')
+    sna3 = SampleNodeAddress(SampleAddress(sid1, 1), 'n2')
+    duid1 = DataUnitID(UPA('1/1/1'))
+    duid2 = DataUnitID(UPA('1/1/1'), 'foo')
+    duid3 = DataUnitID(UPA('2/1/1'))
+
+    dl1 = DataLink(UUID('1234567890abcdef1234567890abcde1'), duid1, sna1, dt(6), u('someuser'))
+    dl2 = DataLink(UUID('1234567890abcdef1234567890abcde2'), duid2, sna2, dt(6), u('someuser'))
+    dl3 = DataLink(UUID('1234567890abcdef1234567890abcde3'), duid3, sna3, dt(6), u('someuser'))
+
+    assert s.create_data_links(
+        UserID('someuser'), [(duid1, sna1), (duid2, sna2), (duid3, sna3)], update=True) == [
+            (dl1, None), (dl2, UUID('1234567890abcdef1234567890abcdea')), (dl3, None)]
+
+    storage.get_sample_set_acls.assert_called_once_with([sid1, sid2])
+
+    ws.has_permissions.assert_called_once_with(
+        UserID('someuser'), WorkspaceAccessType.WRITE, [UPA('1/1/1'), UPA('1/1/1'), UPA('2/1/1')])
+
+    storage.create_data_links.assert_called_once_with([dl1, dl2, dl3], update=True)
+
+    assert kafka.notify_new_link.call_args_list == [
+        ((UUID('1234567890abcdef1234567890abcde1'),), {}),
+        ((UUID('1234567890abcdef1234567890abcde2'),), {}),
+        ((UUID('1234567890abcdef1234567890abcde3'),), {})]
+    kafka.notify_expired_link.assert_called_once_with(UUID('1234567890abcdef1234567890abcdea'))
+
+
+def test_create_data_links_as_admin():
+    storage = create_autospec(ArangoSampleStorage, spec_set=True, instance=True)
+    lu = create_autospec(KBaseUserLookup, spec_set=True, instance=True)
+    meta = create_autospec(MetadataValidatorSet, spec_set=True, instance=True)
+    ws = create_autospec(WS, spec_set=True, instance=True)
+    s = Samples(storage, lu, meta, ws, now=nw,
+                uuid_gen=lambda: UUID('1234567890abcdef1234567890abcdef'))
+
+    storage.create_data_links.return_value = [None]
+
+    sna = SampleNodeAddress(SampleAddress(UUID('1234567890abcdef1234567890abcdee'), 3), 'n')
+    dl = DataLink(
+        UUID('1234567890abcdef1234567890abcdef'), DataUnitID(UPA('1/1/1')), sna, dt(6), u('x'))
+
+    assert s.create_data_links(
+        UserID('x'), [(DataUnitID(UPA('1/1/1')), sna)], as_admin=True) == [(dl, None)]
+
+    assert storage.get_sample_set_acls.call_count == 0
+
+    ws.has_permissions.assert_called_once_with(
+        UserID('x'), WorkspaceAccessType.NONE, [UPA('1/1/1')])
+
+    storage.create_data_links.assert_called_once_with([dl], update=False)
+
+
+def test_create_data_links_empty():
+    storage = create_autospec(ArangoSampleStorage, spec_set=True, instance=True)
+    lu = create_autospec(KBaseUserLookup, spec_set=True, instance=True)
+    meta = create_autospec(MetadataValidatorSet, spec_set=True, instance=True)
+    ws = create_autospec(WS, spec_set=True, instance=True)
+    s = Samples(storage, lu, meta, ws, now=nw)
+
+    assert s.create_data_links(UserID('x'), []) == []
+
+    assert storage.create_data_links.call_count == 0
+
+
+def test_create_data_links_fail_bad_args():
+    storage = create_autospec(ArangoSampleStorage, spec_set=True, instance=True)
+    lu = create_autospec(KBaseUserLookup, spec_set=True, instance=True)
+    meta = create_autospec(MetadataValidatorSet, spec_set=True, instance=True)
+    ws = create_autospec(WS, spec_set=True, instance=True)
+    s = Samples(storage, lu, meta, ws, now=nw)
+
+    u_ = UserID('u')
+    d = DataUnitID(UPA('1/1/1'))
+    sna = SampleNodeAddress(SampleAddress(UUID('1234567890abcdef1234567890abcdee'), 3), 'node')
+
+    _create_data_links_fail(s, None, [(d, sna)], ValueError(
+        'user cannot be a value that evaluates to false'))
+    _create_data_links_fail(s, u_, None, ValueError('links cannot be None'))
+    _create_data_links_fail(s, u_, [(d, sna), None], ValueError(
+        'Index 1 of iterable links cannot be a value that evaluates to false'))
+    _create_data_links_fail(s, u_, [(None, sna)], ValueError(
+        'duid cannot be a value that evaluates to false'))
+    _create_data_links_fail(s, u_, [(d, None)], ValueError(
+        'sna cannot be a value that evaluates to false'))
+
+
+def test_create_data_links_fail_no_sample_access():
+    storage = create_autospec(ArangoSampleStorage, spec_set=True, instance=True)
+    lu = create_autospec(KBaseUserLookup, spec_set=True, instance=True)
+    meta = create_autospec(MetadataValidatorSet, spec_set=True, instance=True)
+    ws = create_autospec(WS, spec_set=True, instance=True)
+    s = Samples(storage, lu, meta, ws, now=nw)
+
+    storage.get_sample_set_acls.return_value = [
+        SampleACL(u('someuser'), dt(1)),
+        SampleACL(u('otheruser'), dt(1), write=[u('someuser')])]
+
+    _create_data_links_fail(
+        s,
+        UserID('someuser'),
+        [(DataUnitID(UPA('1/1/1')), SampleNodeAddress(
+            SampleAddress(UUID('1234567890abcdef1234567890abcdee'), 3), 'mynode')),
+         (DataUnitID(UPA('1/1/2')), SampleNodeAddress(
+            SampleAddress(UUID('1234567890abcdef1234567890abcded'), 3), 'mynode'))],
+        UnauthorizedError(
+            'User someuser cannot administrate sample 12345678-90ab-cdef-1234-567890abcded'))
+
+    assert ws.has_permissions.call_count == 0
+    assert storage.create_data_links.call_count == 0
+
+
+def _create_data_links_fail(samples, user, links, expected):
+    with raises(Exception) as got:
+        samples.create_data_links(user, links)
+    assert_exception_correct(got.value, expected)
+
+
 def test_get_links_from_sample():
     _get_links_from_sample(UserID('someuser'))
     _get_links_from_sample(UserID('otheruser'))
@@ -1535,7 +1884,9 @@ def _get_links_from_sample(user, public_read=False):
     storage.get_links_from_sample.assert_called_once_with(
         SampleAddress(UUID('1234567890abcdef1234567890abcdee'), 3),
         [7, 90, 106],
-        dt(6)
+        dt(6),
+        limit=None,
+        after=None
     )
 
 
@@ -1572,7 +1923,9 @@ def test_get_links_from_sample_as_admin():
     storage.get_links_from_sample.assert_called_once_with(
         SampleAddress(UUID('1234567890abcdef1234567890abcdee'), 3),
         None,
-        dt(6)
+        dt(6),
+        limit=None,
+        after=None
     )
 
 
@@ -1600,7 +1953,9 @@ def test_get_links_from_sample_with_timestamp():
     assert s.get_links_from_sample(
         UserID('someuser'),
         SampleAddress(UUID('1234567890abcdef1234567890abcdee'), 3),
-        dt(40)) == ([dl1], dt(40))
+        dt(40),
+        limit=1,
+        after=UUID('1234567890abcdef1234567890abcded')) == ([dl1], dt(40))
 
     storage.get_sample_acls.assert_called_once_with(UUID('1234567890abcdef1234567890abcdee'))
 
@@ -1609,7 +1964,9 @@ def test_get_links_from_sample_with_timestamp():
     storage.get_links_from_sample.assert_called_once_with(
         SampleAddress(UUID('1234567890abcdef1234567890abcdee'), 3),
         [3],
-        dt(40)
+        dt(40),
+        limit=1,
+        after=UUID('1234567890abcdef1234567890abcded')
     )
 
 
@@ -1697,7 +2054,8 @@ def test_get_links_from_data():
     ws.has_permission.assert_called_once_with(
         UserID('u1'), WorkspaceAccessType.READ, upa=UPA('2/4/6'))
 
-    storage.get_links_from_data.assert_called_once_with(UPA('2/4/6'), dt(6))
+    storage.get_links_from_data.assert_called_once_with(
+        UPA('2/4/6'), dt(6), limit=None, after=None)
 
 
 def test_get_links_from_data_with_timestamp_and_anon_user():
@@ -1717,12 +2075,15 @@ def test_get_links_from_data_with_timestamp_and_anon_user():
 
     storage.get_links_from_data.return_value = [dl1]
 
-    assert s.get_links_from_data(None, UPA('2/4/6'), timestamp=dt(700)) == ([dl1], dt(700))
+    assert s.get_links_from_data(
+        None, UPA('2/4/6'), timestamp=dt(700), limit=5,
+        after=UUID('1234567890abcdef1234567890abcded')) == ([dl1], dt(700))
 
     ws.has_permission.assert_called_once_with(
         None, WorkspaceAccessType.READ, upa=UPA('2/4/6'))
 
-    storage.get_links_from_data.assert_called_once_with(UPA('2/4/6'), dt(700))
+    storage.get_links_from_data.assert_called_once_with(
+        UPA('2/4/6'), dt(700), limit=5, after=UUID('1234567890abcdef1234567890abcded'))
 
 
 def test_get_links_from_data_as_admin():
@@ -1755,7 +2116,8 @@ def test_get_links_from_data_as_admin():
     ws.has_permission.assert_called_once_with(
         UserID('u1'), WorkspaceAccessType.NONE, upa=UPA('2/4/6'))
 
-    storage.get_links_from_data.assert_called_once_with(UPA('2/4/6'), dt(6))
+    storage.get_links_from_data.assert_called_once_with(
+        UPA('2/4/6'), dt(6), limit=None, after=None)
 
 
 def test_get_links_from_data_fail_bad_args():
@@ -1802,6 +2164,102 @@ def _get_links_from_from_data_fail(samples, user, upa, ts, expected):
     assert_exception_correct(got.value, expected)
 
 
+def _link_history_samples():
+    storage = create_autospec(ArangoSampleStorage, spec_set=True, instance=True)
+    lu = create_autospec(KBaseUserLookup, spec_set=True, instance=True)
+    meta = create_autospec(MetadataValidatorSet, spec_set=True, instance=True)
+    ws = create_autospec(WS, spec_set=True, instance=True)
+    return Samples(storage, lu, meta, ws, now=nw), storage, ws
+
+
+def _history_link():
+    return DataLink(
+        UUID('1234567890abcdef1234567890abcdee'),
+        DataUnitID(UPA('2/4/6'), 'foo'),
+        SampleNodeAddress(SampleAddress(UUID('1234567890abcdef1234567890abcdea'), 3), 'mynode'),
+        dt(5),
+        UserID('userb'),
+        dt(7),
+        UserID('userc'))
+
+
+def test_get_link_history_from_data():
+    for user, admin, perm in [(UserID('u1'), False, WorkspaceAccessType.READ),
+                              (None, False, WorkspaceAccessType.READ),
+                              (UserID('u1'), True, WorkspaceAccessType.NONE)]:
+        s, storage, ws = _link_history_samples()
+        dl = _history_link()
+        storage.get_link_history.return_value = [dl]
+        sid = UUID('1234567890abcdef1234567890abcdea')
+        after = (dt(4), UUID('1234567890abcdef1234567890abcded'))
+
+        assert s.get_link_history(
+            user, sid, UPA('2/4/6'), 'foo', as_admin=admin, limit=3, after=after) == [dl]
+
+        ws.has_permission.assert_called_once_with(user, perm, upa=UPA('2/4/6'))
+        assert storage.get_sample_acls.call_args_list == []
+        assert ws.get_user_workspaces.call_args_list == []
+        storage.get_link_history.assert_called_once_with(
+            sid, UPA('2/4/6'), 'foo', None, limit=3, after=after)
+
+
+def test_get_link_history_from_sample():
+    s, storage, ws = _link_history_samples()
+    dl = _history_link()
+    storage.get_sample_acls.return_value = SampleACL(u('someuser'), dt(1), read=[u('x')])
+    ws.get_user_workspaces.return_value = [2, 7]
+    storage.get_link_history.return_value = [dl]
+    sid = UUID('1234567890abcdef1234567890abcdea')
+
+    assert s.get_link_history(UserID('x'), sid, None) == [dl]
+
+    storage.get_sample_acls.assert_called_once_with(sid)
+    ws.get_user_workspaces.assert_called_once_with(UserID('x'))
+    storage.get_link_history.assert_called_once_with(
+        sid, None, None, [2, 7], limit=None, after=None)
+
+
+def test_get_link_history_from_sample_as_admin():
+    s, storage, ws = _link_history_samples()
+    dl = _history_link()
+    storage.get_link_history.return_value = [dl]
+    sid = UUID('1234567890abcdef1234567890abcdea')
+
+    assert s.get_link_history(UserID('whateva'), sid, None, as_admin=True, limit=1) == [dl]
+
+    assert storage.get_sample_acls.call_args_list == []
+    assert ws.get_user_workspaces.call_args_list == []
+    storage.get_link_history.assert_called_once_with(
+        sid, None, None, None, limit=1, after=None)
+
+
+def test_get_link_history_fail_bad_args():
+    s, _, _ = _link_history_samples()
+    _get_link_history_fail(s, UserID('u'), None, None, ValueError(
+        'At least one of sample or upa must be provided'))
+
+
+def test_get_link_history_fail_unauthorized():
+    s, storage, ws = _link_history_samples()
+    storage.get_sample_acls.return_value = SampleACL(u('someuser'), dt(1))
+    sid = UUID('1234567890abcdef1234567890abcdee')
+
+    _get_link_history_fail(s, None, sid, None, UnauthorizedError(
+        'Anonymous users cannot read sample 12345678-90ab-cdef-1234-567890abcdee'))
+
+    s, storage, ws = _link_history_samples()
+    ws.has_permission.side_effect = UnauthorizedError('oh honey')
+
+    _get_link_history_fail(s, UserID('u'), sid, UPA('1/1/1'), UnauthorizedError('oh honey'))
+    assert storage.get_sample_acls.call_args_list == []
+
+
+def _get_link_history_fail(samples, user, sample, upa, expected):
+    with raises(Exception) as got:
+        samples.get_link_history(user, sample, upa)
+    assert_exception_correct(got.value, expected)
+
+
 def test_get_sample_via_data():
     _get_sample_via_data(None)
     _get_sample_via_data(UserID('someguy'))
@@ -2152,3 +2610,73 @@ def _get_data_link_fail(samples, linkid, expected):
     with raises(Exception) as got:
         samples.get_data_link_admin(linkid)
     assert_exception_correct(got.value, expected)
+
+
+def test_get_consistency_checker_status():
+    storage = create_autospec(ArangoSampleStorage, spec_set=True, instance=True)
+    lu = create_autospec(KBaseUserLookup, spec_set=True, instance=True)
+    meta = create_autospec(MetadataValidatorSet, spec_set=True, instance=True)
+    ws = create_autospec(WS, spec_set=True, instance=True)
+    s = Samples(storage, lu, meta, ws, now=nw)
+
+    storage.get_consistency_checker_status.return_value = {
+        'holder': 'host:42:foo',
+        'lease_expires': dt(180),
+        'last_run': dt(2),
+        'last_run_duration': datetime.timedelta(seconds=1),
+        'repaired': 3}
+
+    assert s.get_consistency_checker_status() == {
+        'holder': 'host:42:foo',
+        'lease_expires': dt(180),
+        'last_run': dt(2),
+        'last_run_duration': datetime.timedelta(seconds=1),
+        'repaired': 3}
+
+    storage.get_consistency_checker_status.assert_called_once_with()
+
+
+def test_get_sample_cache_stats():
+    storage = create_autospec(ArangoSampleStorage, spec_set=True, instance=True)
+    lu = create_autospec(KBaseUserLookup, spec_set=True, instance=True)
+    meta = create_autospec(MetadataValidatorSet, spec_set=True, instance=True)
+    ws = create_autospec(WS, spec_set=True, instance=True)
+    s = Samples(storage, lu, meta, ws, now=nw)
+
+    storage.get_sample_cache_stats.return_value = {
+        'hits': 1, 'misses': 2, 'entries': 1, 'bytes': 400, 'max_bytes': 1000}
+
+    assert s.get_sample_cache_stats() == {
+        'hits': 1, 'misses': 2, 'entries': 1, 'bytes': 400, 'max_bytes': 1000}
+
+    storage.get_sample_cache_stats.assert_called_once_with()
+
+
+def test_get_read_repair_stats():
+    storage = create_autospec(ArangoSampleStorage, spec_set=True, instance=True)
+    lu = create_autospec(KBaseUserLookup, spec_set=True, instance=True)
+    meta = create_autospec(MetadataValidatorSet, spec_set=True, instance=True)
+    ws = create_autospec(WS, spec_set=True, instance=True)
+    s = Samples(storage, lu, meta, ws, now=nw)
+
+    storage.get_read_repair_stats.return_value = {'queued': 3, 'repaired': 2, 'failed': 1}
+
+    assert s.get_read_repair_stats() == {'queued': 3, 'repaired': 2, 'failed': 1}
+
+    storage.get_read_repair_stats.assert_called_once_with()
+
+
+def test_get_shared_sample_cache_stats():
+    storage = create_autospec(ArangoSampleStorage, spec_set=True, instance=True)
+    lu = create_autospec(KBaseUserLookup, spec_set=True, instance=True)
+    meta = create_autospec(MetadataValidatorSet, spec_set=True, instance=True)
+    ws = create_autospec(WS, spec_set=True, instance=True)
+    s = Samples(storage, lu, meta, ws, now=nw)
+
+    storage.get_shared_sample_cache_stats.return_value = {
+        'hits': 1, 'misses': 2, 'entries': 6, 'bytes': 400, 'max_bytes': 1000}
+
+    assert s.get_shared_sample_cache_stats() == {
+        'hits': 1, 'misses': 2, 'entries': 6, 'bytes': 400, 'max_bytes': 1000}
+
+    storage.get_shared_sample_cache_stats.assert_called_once_with()
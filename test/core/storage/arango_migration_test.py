@@ -0,0 +1,432 @@
+import datetime
+import uuid
+
+from pytest import raises, fixture
+from core import test_utils
+from core.test_utils import assert_exception_correct
+from arango_controller import ArangoController
+from SampleService.core.errors import MissingParameterError
+from SampleService.core.sample import SavedSample, SampleNode, SubSampleType, SourceMetadata
+from SampleService.core.storage.arango_migration import (
+    ArangoMigrator,
+    Migration,
+    MigrationStep,
+)
+from SampleService.core.storage.arango_sample_storage import ArangoSampleStorage
+from SampleService.core.storage.errors import StorageInitError
+from SampleService.core.user import UserID
+
+TEST_DB_NAME = 'test_sample_service'
+TEST_COL_SAMPLE = 'samples'
+TEST_COL_VERSION = 'versions'
+TEST_COL_VER_EDGE = 'ver_to_sample'
+TEST_COL_NODES = 'nodes'
+TEST_COL_NODE_EDGE = 'node_edges'
+TEST_COL_WS_OBJ_VER = 'ws_obj_ver'
+TEST_COL_DATA_LINK = 'data_link'
+TEST_COL_SCHEMA = 'schema'
+TEST_COL_WRITE_JOURNAL = 'write_journal'
+TEST_COL_DATA_LINK_COUNT = 'data_link_count'
+TEST_COL_NODE_BODY = 'node_body'
+TEST_USER = 'user1'
+TEST_PWD = 'password1'
+
+
+@fixture(scope='module')
+def arango():
+    arangoexe = test_utils.get_arango_exe()
+    arangojs = test_utils.get_arango_js()
+    tempdir = test_utils.get_temp_dir()
+    arango = ArangoController(arangoexe, arangojs, tempdir)
+    create_test_db(arango)
+    print('running arango on port {} in dir {}'.format(arango.port, arango.temp_dir))
+    yield arango
+    del_temp = test_utils.get_delete_temp_files()
+    print('shutting down arango, delete_temp_files={}'.format(del_temp))
+    arango.destroy(del_temp)
+
+
+def create_test_db(arango):
+    systemdb = arango.client.db(verify=True)  # default access to _system db
+    systemdb.create_database(TEST_DB_NAME, [{'username': TEST_USER, 'password': TEST_PWD}])
+    return arango.client.db(TEST_DB_NAME, TEST_USER, TEST_PWD)
+
+
+@fixture
+def samplestorage(arango):
+    return samplestorage_method(arango)
+
+
+def clear_db_and_recreate(arango):
+    arango.clear_database(TEST_DB_NAME, drop_indexes=True)
+    db = create_test_db(arango)
+    db.create_collection(TEST_COL_SAMPLE)
+    db.create_collection(TEST_COL_VERSION)
+    db.create_collection(TEST_COL_VER_EDGE, edge=True)
+    db.create_collection(TEST_COL_NODES)
+    db.create_collection(TEST_COL_NODE_EDGE, edge=True)
+    db.create_collection(TEST_COL_WS_OBJ_VER)
+    db.create_collection(TEST_COL_DATA_LINK, edge=True)
+    db.create_collection(TEST_COL_SCHEMA)
+    db.create_collection(TEST_COL_WRITE_JOURNAL)
+    db.create_collection(TEST_COL_DATA_LINK_COUNT)
+    return db
+
+
+def samplestorage_method(arango):
+    clear_db_and_recreate(arango)
+    return _build_storage(arango.client.db(TEST_DB_NAME, TEST_USER, TEST_PWD))
+
+
+def _build_storage(db, **kwargs):
+    return ArangoSampleStorage(
+        db,
+        TEST_COL_SAMPLE,
+        TEST_COL_VERSION,
+        TEST_COL_VER_EDGE,
+        TEST_COL_NODES,
+        TEST_COL_NODE_EDGE,
+        TEST_COL_WS_OBJ_VER,
+        TEST_COL_DATA_LINK,
+        TEST_COL_SCHEMA,
+        TEST_COL_WRITE_JOURNAL,
+        TEST_COL_DATA_LINK_COUNT,
+        **kwargs)
+
+
+def _migrator(db, batch_size=1000, parallelism=4, now=lambda: dt(5), **kwargs):
+    return ArangoMigrator(
+        db,
+        TEST_COL_SAMPLE,
+        TEST_COL_VERSION,
+        TEST_COL_NODES,
+        TEST_COL_SCHEMA,
+        batch_size=batch_size,
+        parallelism=parallelism,
+        now=now,
+        **kwargs)
+
+
+def dt(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc)
+
+
+def _make_v1_db(samplestorage):
+    # simulates a v1 database with a committed version, a version where the sample doc was
+    # updated but the node versions weren't, and an uncommitted version
+    id_ = uuid.UUID('1234567890abcdef1234567890abcdef')
+    nodes = [SampleNode('root'), SampleNode('kid1', SubSampleType.TECHNICAL_REPLICATE, 'root')]
+    assert samplestorage.save_sample(SavedSample(id_, UserID('u'), nodes, dt(1), 'foo')) is True
+    assert samplestorage.save_sample_version(
+        SavedSample(id_, UserID('u'), nodes, dt(1), 'foo')) == 2
+    assert samplestorage.save_sample_version(
+        SavedSample(id_, UserID('u'), nodes, dt(1), 'foo')) == 3
+
+    # this is very naughty
+    uuidver1, uuidver2, uuidver3 = samplestorage._col_sample.get(str(id_))['vers']
+    samplestorage._col_sample.update_match({}, {'vers': [uuidver1, uuidver2]})
+    samplestorage._col_nodes.update_match({'uuidver': uuidver1}, {'ver': 1})
+    for uv in [uuidver2, uuidver3]:
+        samplestorage._col_version.update_match({'uuidver': uv}, {'ver': -1})
+        samplestorage._col_nodes.update_match({'uuidver': uv}, {'ver': -1})
+    samplestorage._col_schema.update_match({'_key': 'schema'}, {'schemaver': 1})
+    return uuidver1, uuidver2, uuidver3
+
+
+def test_migrate_v1_to_v2(samplestorage):
+    uuidver1, uuidver2, uuidver3 = _make_v1_db(samplestorage)
+    db = samplestorage._db
+    m = _migrator(db, batch_size=1, parallelism=2)
+
+    assert m.get_status() == {
+        'schema_version': 1,
+        'server_schema_version': 3,
+        'in_update': False,
+        'target_version': None,
+        'step': None,
+        'step_description': None,
+        'updated': None,
+        'paused': False,
+        'last_checkpoint': None,
+    }
+
+    assert m.run() is True
+
+    # this is very naughty
+    cfgdoc = samplestorage._col_schema.get('schema')
+    assert cfgdoc['schemaver'] == 3
+    assert cfgdoc['inupdate'] is False
+    assert 'target' not in cfgdoc
+    assert 'priorcompat' not in cfgdoc
+    assert samplestorage._col_schema.get('migration') is None
+    for n in samplestorage._col_nodes.all():
+        assert n['ver'] == {uuidver1: 1, uuidver2: 2, uuidver3: -1}[n['uuidver']]
+    assert m.get_status()['schema_version'] == 3
+
+    # running the migration again does nothing
+    assert m.run() is True
+
+    # the server starts, commits the version doc, and deletes the uncommitted version
+    _build_storage(db, now=lambda: dt(3602))
+    assert samplestorage._col_version.count() == 2
+    assert samplestorage._col_nodes.count() == 4
+    assert len(list(samplestorage._col_nodes.find({'uuidver': uuidver3}))) == 0
+    assert samplestorage._col_version.find({'uuidver': uuidver2}).next()['ver'] == 2
+
+
+def _to_v2_meta(doc):
+    return {
+        'cmeta': [{'ok': ok, 'k': k, 'v': v}
+                  for ok in doc['cmeta'] for k, v in doc['cmeta'][ok].items()],
+        'ucmeta': [{'ok': ok, 'k': k, 'v': v}
+                   for ok in doc['ucmeta'] for k, v in doc['ucmeta'][ok].items()],
+        'smeta': [{'k': k, 'sk': sk, 'v': v} for k, sk, v in doc['smeta']],
+    }
+
+
+def _make_v2_db(samplestorage, ss):
+    # simulates a v2 database with metadata in the node documents and in node body documents
+    n1 = SampleNode('root', controlled_metadata={'a': {'b': 'c', 'd': 1}, 'e': {'f': True}},
+                    source_metadata=[SourceMetadata('a', 'sk', {'x': 'y'}),
+                                     SourceMetadata('e', 'sk2', {'z': 1.5})])
+    n2 = SampleNode('kid1', SubSampleType.TECHNICAL_REPLICATE, 'root',
+                    user_metadata={'g': {'h': 'i'}})
+    n3 = SampleNode('kid2', SubSampleType.SUB_SAMPLE, 'kid1')
+    id1 = uuid.UUID('1234567890abcdef1234567890abcdef')
+    id2 = uuid.UUID('1234567890abcdef1234567890abcdee')
+    s1 = SavedSample(id1, UserID('u'), [n1, n2, n3], dt(1), 'foo', 1)
+    s2 = SavedSample(id2, UserID('u'), [n1, n2], dt(2), 'bar', 1)
+    assert samplestorage.save_sample(s1) is True
+    assert ss.save_sample(s2) is True
+
+    # this is very naughty
+    expected = {}
+    for col in [samplestorage._col_nodes, ss._col_node_body]:
+        for d in col.all():
+            if 'cmeta' in d:
+                expected[d['_key']] = {k: d[k] for k in ['cmeta', 'ucmeta', 'smeta']}
+                col.update(dict(_to_v2_meta(d), _key=d['_key']), merge=False)
+    samplestorage._col_schema.update_match({'_key': 'schema'}, {'schemaver': 2})
+    return s1, s2, expected
+
+
+def test_migrate_v2_to_v3(samplestorage):
+    db = samplestorage._db
+    db.create_collection(TEST_COL_NODE_BODY)
+    ss = _build_storage(db, node_body_collection=TEST_COL_NODE_BODY)
+    s1, s2, expected = _make_v2_db(samplestorage, ss)
+    m = _migrator(db, batch_size=1, parallelism=2, node_body_collection=TEST_COL_NODE_BODY)
+    assert m.get_status()['schema_version'] == 2
+
+    assert m.run() is True
+
+    assert m.get_status()['schema_version'] == 3
+    assert m.get_status()['in_update'] is False
+    # this is very naughty
+    got = {}
+    for col in [samplestorage._col_nodes, ss._col_node_body]:
+        for d in col.all():
+            if 'cmeta' in d:
+                got[d['_key']] = {k: d[k] for k in ['cmeta', 'ucmeta', 'smeta']}
+    assert got == expected
+    assert len(got) == 5
+    assert ss.get_sample(s1.id) == s1
+    assert ss.get_sample(s2.id) == s2
+
+
+def test_migrate_v2_to_v3_without_node_body_collection(samplestorage):
+    db = samplestorage._db
+    db.create_collection(TEST_COL_NODE_BODY)
+    ss = _build_storage(db, node_body_collection=TEST_COL_NODE_BODY)
+    s1, s2, _ = _make_v2_db(samplestorage, ss)
+
+    assert _migrator(db).run() is True
+
+    # the node body documents aren't migrated, but can still be read
+    for d in ss._col_node_body.all():
+        assert type(d['cmeta']) == list
+    for d in samplestorage._col_nodes.find({'id': str(s1.id)}):
+        assert type(d['cmeta']) == dict
+    assert ss.get_sample(s1.id) == s1
+    assert ss.get_sample(s2.id) == s2
+
+
+def test_migrate_resume_from_checkpoint(samplestorage):
+    uuidver1, uuidver2, uuidver3 = _make_v1_db(samplestorage)
+    db = samplestorage._db
+    # this is very naughty
+    nodekeys = sorted(n['_key'] for n in samplestorage._col_nodes.find({'uuidver': uuidver2}))
+    # simulates a migration that died after updating the first node of the second version
+    samplestorage._col_schema.update_match(
+        {'_key': 'schema'}, {'inupdate': True, 'target': 2, 'priorcompat': False})
+    samplestorage._col_schema.insert({'_key': 'migration', 'from': 1, 'step': 0,
+                                      'after': nodekeys[0], 'updated': 1, 'paused': False,
+                                      'time': 2000})
+    samplestorage._col_nodes.update({'_key': nodekeys[0], 'ver': 2})
+
+    m = _migrator(db)
+    status = m.get_status()
+    assert status == {
+        'schema_version': 1,
+        'server_schema_version': 3,
+        'in_update': True,
+        'target_version': 2,
+        'step': 0,
+        'step_description': status['step_description'],
+        'updated': 1,
+        'paused': False,
+        'last_checkpoint': dt(2),
+    }
+    assert status['step_description'].startswith('Set the integer version of v1 nodes')
+
+    assert m.run() is True
+
+    assert samplestorage._col_schema.get('schema')['schemaver'] == 3
+    assert samplestorage._col_schema.get('migration') is None
+    for n in samplestorage._col_nodes.all():
+        assert n['ver'] == {uuidver1: 1, uuidver2: 2, uuidver3: -1}[n['uuidver']]
+
+
+def test_migrate_pause(samplestorage):
+    _make_v1_db(samplestorage)
+    db = samplestorage._db
+    m = _migrator(db, batch_size=1, parallelism=1)
+
+    assert m.pause() is False  # nothing to pause
+
+    # pauses the migration when the first round is checkpointed
+    orig_checkpoint = m._checkpoint
+    calls = []
+
+    def checkpoint(cp):
+        orig_checkpoint(cp)
+        calls.append(cp['after'])
+        if len(calls) == 2:
+            assert m.pause() is True
+
+    m._checkpoint = checkpoint
+    assert m.run() is False
+
+    status = m.get_status()
+    assert status['schema_version'] == 1
+    assert status['in_update'] is True
+    assert status['target_version'] == 2
+    assert status['step'] == 0
+    assert status['updated'] in [0, 1]  # depends on the order of the random node keys
+    assert status['paused'] is True
+
+    # the v3 server can run while the database is migrating from v1, and reads the v1 nodes
+    ss = _build_storage(db, now=lambda: dt(2))
+    assert ss.get_sample(uuid.UUID('1234567890abcdef1234567890abcdef'), 1).nodes == [
+        SampleNode('root'), SampleNode('kid1', SubSampleType.TECHNICAL_REPLICATE, 'root')]
+
+    m._checkpoint = orig_checkpoint
+    assert m.run() is True
+    assert m.get_status()['schema_version'] == 3
+    assert m.get_status()['in_update'] is False
+    for n in samplestorage._col_nodes.find({'ver': -1}):
+        # only the nodes of the uncommitted version remain
+        assert n['uuidver'] not in samplestorage._col_sample.all().next()['vers']
+
+
+def test_migrate_pause_during_round(samplestorage):
+    _make_v1_db(samplestorage)
+    m = _migrator(samplestorage._db, batch_size=1, parallelism=1)
+
+    # pauses the migration while the first batch is updated, before the round is checkpointed
+    orig_find = m._find_via_aql
+
+    def find(query, bind_vars):
+        if 'keys' in bind_vars and not m.get_status()['paused']:
+            assert m.pause() is True
+        return orig_find(query, bind_vars)
+
+    m._find_via_aql = find
+    assert m.run() is False
+
+    status = m.get_status()
+    assert status['schema_version'] == 1
+    assert status['step'] == 0
+    assert status['updated'] in [0, 1]  # depends on the order of the random node keys
+    assert status['paused'] is True
+
+    m._find_via_aql = orig_find
+    assert m.run() is True
+    assert m.get_status()['schema_version'] == 3
+
+
+def test_migrate_new_db(arango):
+    db = clear_db_and_recreate(arango)
+
+    m = _migrator(db)
+    assert m.get_status() is None
+    assert m.run() is True
+    assert m.pause() is False
+    assert db.collection(TEST_COL_SCHEMA).count() == 0
+
+
+def test_migrate_multiple_steps(samplestorage):
+    db = samplestorage._db
+    for i in range(5):
+        samplestorage._col_nodes.insert({'_key': f'n{i}', 'x': i})
+    samplestorage._col_schema.update_match({'_key': 'schema'}, {'schemaver': 2})
+
+    m = _migrator(db, batch_size=2, parallelism=2)
+    # this is very naughty
+    m._migrations = {2: Migration(2, 'test', [
+        MigrationStep('node', 'add y', 'd.y == null', 'UPDATE d WITH {y: d.x * 2} IN @@col'),
+        MigrationStep('node', 'add z', 'd.z == null',
+                      'LET s = DOCUMENT(@sample_col, "fake") '
+                      + 'UPDATE d WITH {z: s == null ? d.y : -1} IN @@col',
+                      ['sample']),
+    ], True)}
+    assert m.run() is True
+
+    assert sorted((n['x'], n['y'], n['z']) for n in samplestorage._col_nodes.all()) == [
+        (i, i * 2, i * 2) for i in range(5)]
+    assert samplestorage._col_schema.get('schema')['schemaver'] == 3
+
+
+def test_init_fail(samplestorage):
+    db = samplestorage._db
+    s = TEST_COL_SAMPLE
+    v = TEST_COL_VERSION
+    n = TEST_COL_NODES
+    sc = TEST_COL_SCHEMA
+
+    _init_fail(None, s, v, n, sc, 1, 1, ValueError(
+        'db cannot be a value that evaluates to false'))
+    _init_fail(db, '', v, n, sc, 1, 1, MissingParameterError('sample_collection'))
+    _init_fail(db, s, None, n, sc, 1, 1, MissingParameterError('version_collection'))
+    _init_fail(db, s, v, '  ', sc, 1, 1, MissingParameterError('node_collection'))
+    _init_fail(db, s, v, n, '', 1, 1, MissingParameterError('schema_collection'))
+    _init_fail(db, s, v, n, sc, 0, 1, ValueError('batch_size must be > 0'))
+    _init_fail(db, s, v, n, sc, 1, None, ValueError('parallelism must be > 0'))
+
+
+def _init_fail(db, sample_col, version_col, node_col, schema_col, batch_size, parallelism,
+               expected):
+    with raises(Exception) as got:
+        ArangoMigrator(db, sample_col, version_col, node_col, schema_col, batch_size,
+                       parallelism)
+    assert_exception_correct(got.value, expected)
+
+
+def test_run_fail_no_migration(samplestorage):
+    db = samplestorage._db
+
+    # this is very naughty
+    samplestorage._col_schema.update_match({'_key': 'schema'}, {'schemaver': 4})
+    _run_fail(db, StorageInitError('No migration from v4 of the database schema'))
+
+    samplestorage._col_schema.update_match({'_key': 'schema'}, {'schemaver': 3, 'inupdate': True})
+    _run_fail(db, StorageInitError('No migration from v3 of the database schema'))
+
+    samplestorage._col_schema.update_match({'_key': 'schema'}, {'schemaver': 2, 'target': 4})
+    _run_fail(db, StorageInitError('No migration from v2 of the database schema'))
+
+
+def _run_fail(db, expected):
+    with raises(Exception) as got:
+        _migrator(db).run()
+    assert_exception_correct(got.value, expected)
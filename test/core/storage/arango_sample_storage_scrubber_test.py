@@ -38,6 +38,8 @@ TEST_COL_NODE_EDGE = 'node_edges'
 TEST_COL_WS_OBJ_VER = 'ws_obj_ver'
 TEST_COL_DATA_LINK = 'samples_data_link'
 TEST_COL_SCHEMA = 'schema'
+TEST_COL_WRITE_JOURNAL = 'write_journal'
+TEST_COL_DATA_LINK_COUNT = 'data_link_count'
 TEST_USER = 'user1'
 TEST_PWD = 'password1'
 
@@ -78,6 +80,8 @@ def clear_db_and_recreate(arango):
     db.create_collection(TEST_COL_WS_OBJ_VER)
     db.create_collection(TEST_COL_DATA_LINK, edge=True)
     db.create_collection(TEST_COL_SCHEMA)
+    db.create_collection(TEST_COL_WRITE_JOURNAL)
+    db.create_collection(TEST_COL_DATA_LINK_COUNT)
     return db
 
 
@@ -92,7 +96,9 @@ def samplestorage_method(arango):
         TEST_COL_NODE_EDGE,
         TEST_COL_WS_OBJ_VER,
         TEST_COL_DATA_LINK,
-        TEST_COL_SCHEMA)
+        TEST_COL_SCHEMA,
+        TEST_COL_WRITE_JOURNAL,
+        TEST_COL_DATA_LINK_COUNT)
 
 def dt(timestamp):
     return datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc)
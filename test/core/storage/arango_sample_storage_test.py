@@ -1,4 +1,5 @@
 import datetime
+import threading
 import uuid
 import time
 
@@ -38,6 +39,8 @@ TEST_COL_NODE_EDGE = 'node_edges'
 TEST_COL_WS_OBJ_VER = 'ws_obj_ver'
 TEST_COL_DATA_LINK = 'data_link'
 TEST_COL_SCHEMA = 'schema'
+TEST_COL_WRITE_JOURNAL = 'write_journal'
+TEST_COL_DATA_LINK_COUNT = 'data_link_count'
 TEST_USER = 'user1'
 TEST_PWD = 'password1'
 
@@ -78,6 +81,8 @@ def clear_db_and_recreate(arango):
     db.create_collection(TEST_COL_WS_OBJ_VER)
     db.create_collection(TEST_COL_DATA_LINK, edge=True)
     db.create_collection(TEST_COL_SCHEMA)
+    db.create_collection(TEST_COL_WRITE_JOURNAL)
+    db.create_collection(TEST_COL_DATA_LINK_COUNT)
     return db
 
 
@@ -92,7 +97,9 @@ def samplestorage_method(arango):
         TEST_COL_NODE_EDGE,
         TEST_COL_WS_OBJ_VER,
         TEST_COL_DATA_LINK,
-        TEST_COL_SCHEMA)
+        TEST_COL_SCHEMA,
+        TEST_COL_WRITE_JOURNAL,
+        TEST_COL_DATA_LINK_COUNT)
 
 
 def nw():
@@ -104,7 +111,7 @@ def test_startup_and_check_config_doc(samplestorage):
     assert samplestorage._col_schema.count() == 1
     cfgdoc = samplestorage._col_schema.find({}).next()
     assert cfgdoc['_key'] == 'schema'
-    assert cfgdoc['schemaver'] == 1
+    assert cfgdoc['schemaver'] == 3
     assert cfgdoc['inupdate'] is False
 
     # check startup works with cfg object in place
@@ -118,7 +125,10 @@ def test_startup_and_check_config_doc(samplestorage):
         samplestorage._col_node_edge.name,
         samplestorage._col_ws.name,
         samplestorage._col_data_link.name,
-        samplestorage._col_schema.name)
+        samplestorage._col_schema.name,
+        samplestorage._col_journal.name,
+        samplestorage._col_link_count.name,
+        samplestorage._col_link_count.name)
 
     id_ = uuid.UUID('1234567890abcdef1234567890abcdef')
     n = SampleNode('rootyroot')
@@ -162,13 +172,13 @@ def test_startup_with_bad_schema_version(arango):
     sc = TEST_COL_SCHEMA
 
     _fail_startup(db, s, v, ve, n, ne, ws, dl, sc, nw, StorageInitError(
-        'Incompatible database schema. Server is v1, DB is v4'))
+        'Incompatible database schema. Server is v3, DB is v4'))
 
 
 def test_startup_in_update(arango):
     db = clear_db_and_recreate(arango)
     col = db.collection(TEST_COL_SCHEMA)
-    col.insert({'_key': 'schema', 'schemaver': 1, 'inupdate': True})
+    col.insert({'_key': 'schema', 'schemaver': 2, 'inupdate': True})
 
     s = TEST_COL_SAMPLE
     v = TEST_COL_VERSION
@@ -180,12 +190,104 @@ def test_startup_in_update(arango):
     sc = TEST_COL_SCHEMA
 
     _fail_startup(db, s, v, ve, n, ne, ws, dl, sc, nw, StorageInitError(
-        'The database is in the middle of an update from v1 of the schema. Aborting startup.'))
+        'The database is in the middle of an update from v2 of the schema. Aborting startup.'))
 
 
-def test_startup_with_unupdated_version_and_node_docs(samplestorage):
-    # this test simulates a server coming up after a dirty shutdown, where version and
-    # node doc integer versions have not been updated
+def test_startup_with_v1_schema(arango):
+    db = clear_db_and_recreate(arango)
+    col = db.collection(TEST_COL_SCHEMA)
+    col.insert({'_key': 'schema', 'schemaver': 1, 'inupdate': False})
+
+    s = TEST_COL_SAMPLE
+    v = TEST_COL_VERSION
+    ve = TEST_COL_VER_EDGE
+    n = TEST_COL_NODES
+    ne = TEST_COL_NODE_EDGE
+    ws = TEST_COL_WS_OBJ_VER
+    dl = TEST_COL_DATA_LINK
+    sc = TEST_COL_SCHEMA
+
+    _fail_startup(db, s, v, ve, n, ne, ws, dl, sc, nw, StorageInitError(
+        'Incompatible database schema. Server is v3, DB is v1'))
+
+
+def test_startup_during_migration(arango):
+    # servers at the target version of a migration in progress can start
+    db = clear_db_and_recreate(arango)
+    col = db.collection(TEST_COL_SCHEMA)
+    col.insert({'_key': 'schema', 'schemaver': 2, 'inupdate': True, 'target': 3,
+                'priorcompat': False})
+    col.insert({'_key': 'migration', 'from': 2, 'step': 0, 'after': '', 'updated': 0})
+
+    ss = samplestorage_method_no_clear(arango)
+    id_ = uuid.UUID('1234567890abcdef1234567890abcdef')
+    assert ss.save_sample(SavedSample(id_, UserID('u'), [TEST_NODE], dt(1), 'foo')) is True
+    assert col.get('schema')['schemaver'] == 2
+
+
+def test_startup_during_earlier_migration(arango):
+    # servers can start while the database is migrating towards their version from an older
+    # version they can read
+    db = clear_db_and_recreate(arango)
+    col = db.collection(TEST_COL_SCHEMA)
+    col.insert({'_key': 'schema', 'schemaver': 1, 'inupdate': True, 'target': 2,
+                'priorcompat': False})
+
+    ss = samplestorage_method_no_clear(arango)
+    id_ = uuid.UUID('1234567890abcdef1234567890abcdef')
+    assert ss.save_sample(SavedSample(id_, UserID('u'), [TEST_NODE], dt(1), 'foo')) is True
+    assert ss.get_sample(id_).nodes == [TEST_NODE]
+    assert col.get('schema')['schemaver'] == 1
+
+
+def test_startup_during_prior_compatible_migration(arango):
+    # servers at the prior version of a prior compatible migration can start
+    db = clear_db_and_recreate(arango)
+    col = db.collection(TEST_COL_SCHEMA)
+    col.insert({'_key': 'schema', 'schemaver': 3, 'inupdate': True, 'target': 4,
+                'priorcompat': True})
+
+    samplestorage_method_no_clear(arango)
+    assert col.get('schema')['inupdate'] is True
+
+
+def test_startup_during_incompatible_migration(arango):
+    db = clear_db_and_recreate(arango)
+    col = db.collection(TEST_COL_SCHEMA)
+    col.insert({'_key': 'schema', 'schemaver': 3, 'inupdate': True, 'target': 4,
+                'priorcompat': False})
+
+    s = TEST_COL_SAMPLE
+    v = TEST_COL_VERSION
+    ve = TEST_COL_VER_EDGE
+    n = TEST_COL_NODES
+    ne = TEST_COL_NODE_EDGE
+    ws = TEST_COL_WS_OBJ_VER
+    dl = TEST_COL_DATA_LINK
+    sc = TEST_COL_SCHEMA
+
+    _fail_startup(db, s, v, ve, n, ne, ws, dl, sc, nw, StorageInitError(
+        'The database is in the middle of an update from v3 of the schema. Aborting startup.'))
+
+
+def samplestorage_method_no_clear(arango):
+    return ArangoSampleStorage(
+        arango.client.db(TEST_DB_NAME, TEST_USER, TEST_PWD),
+        TEST_COL_SAMPLE,
+        TEST_COL_VERSION,
+        TEST_COL_VER_EDGE,
+        TEST_COL_NODES,
+        TEST_COL_NODE_EDGE,
+        TEST_COL_WS_OBJ_VER,
+        TEST_COL_DATA_LINK,
+        TEST_COL_SCHEMA,
+        TEST_COL_WRITE_JOURNAL,
+        TEST_COL_DATA_LINK_COUNT)
+
+
+def test_startup_with_unupdated_version_docs(samplestorage):
+    # this test simulates a server coming up after a dirty shutdown, where the version
+    # doc integer version has not been updated
     n1 = SampleNode('root')
     n2 = SampleNode('kid1', SubSampleType.TECHNICAL_REPLICATE, 'root')
     n3 = SampleNode('kid2', SubSampleType.SUB_SAMPLE, 'kid1')
@@ -199,7 +301,6 @@ def test_startup_with_unupdated_version_and_node_docs(samplestorage):
     # this is very naughty
     # checked that these modifications actually work by viewing the db contents
     samplestorage._col_version.update_match({}, {'ver': -1})
-    samplestorage._col_nodes.update_match({'name': 'kid2'}, {'ver': -1})
 
     # this is also very naughty
     ArangoSampleStorage(
@@ -211,7 +312,10 @@ def test_startup_with_unupdated_version_and_node_docs(samplestorage):
         samplestorage._col_node_edge.name,
         samplestorage._col_ws.name,
         samplestorage._col_data_link.name,
-        samplestorage._col_schema.name)
+        samplestorage._col_schema.name,
+        samplestorage._col_journal.name,
+        samplestorage._col_link_count.name,
+        samplestorage._col_link_count.name)
 
     assert samplestorage._col_version.count() == 1
     assert samplestorage._col_ver_edge.count() == 1
@@ -222,56 +326,52 @@ def test_startup_with_unupdated_version_and_node_docs(samplestorage):
         assert v['ver'] == 1
 
     for v in samplestorage._col_nodes.all():
-        assert v['ver'] == 1
+        assert 'ver' not in v
 
 
-def test_startup_with_unupdated_node_docs(samplestorage):
-    # this test simulates a server coming up after a dirty shutdown, where
-    # node doc integer versions have not been updated
-    # version doc cannot be modified such that ver = -1 or the version check will also correct the
-    # node docs, negating the point of this test
+def test_startup_with_uncommitted_v1_node_docs(samplestorage):
+    # this test simulates a server coming up after a v1 server had a dirty shutdown before the
+    # version doc was saved, and so only the node docs, with a -1 version, exist.
     n1 = SampleNode('root')
     n2 = SampleNode('kid1', SubSampleType.TECHNICAL_REPLICATE, 'root')
-    n3 = SampleNode('kid2', SubSampleType.SUB_SAMPLE, 'kid1')
-    n4 = SampleNode('kid3', SubSampleType.TECHNICAL_REPLICATE, 'root')
 
     id_ = uuid.UUID('1234567890abcdef1234567890abcdef')
 
     assert samplestorage.save_sample(
-        SavedSample(id_, UserID('u'), [n1, n2, n3, n4], dt(1), 'foo')) is True
+        SavedSample(id_, UserID('u'), [n1, n2], dt(1), 'foo')) is True
 
     assert samplestorage.save_sample_version(
-        SavedSample(id_, UserID('u'), [n1, n2, n3, n4], dt(1), 'bar')) == 2
+        SavedSample(id_, UserID('u'), [n1, n2], dt(1), 'bar')) == 2
 
     # this is very naughty
     sample = samplestorage._col_sample.find({}).next()
-    uuidver2 = sample['vers'][1]
+    uuidver1, uuidver2 = sample['vers']
 
-    # checked that these modifications actually work by viewing the db contents
-    samplestorage._col_nodes.update_match({'uuidver': uuidver2, 'name': 'kid2'}, {'ver': -1})
+    samplestorage._col_sample.update_match({}, {'vers': [uuidver1]})
+    samplestorage._col_ver_edge.delete_match({'uuidver': uuidver2})
+    samplestorage._col_version.delete_match({'uuidver': uuidver2})
+    samplestorage._col_nodes.update_match({'uuidver': uuidver2}, {'ver': -1})
+    # committed v1 nodes are ignored
+    samplestorage._col_nodes.update_match({'uuidver': uuidver1}, {'ver': 1})
 
     # this is also very naughty
-    ArangoSampleStorage(
-        samplestorage._db,
-        samplestorage._col_sample.name,
-        samplestorage._col_version.name,
-        samplestorage._col_ver_edge.name,
-        samplestorage._col_nodes.name,
-        samplestorage._col_node_edge.name,
-        samplestorage._col_ws.name,
-        samplestorage._col_data_link.name,
-        samplestorage._col_schema.name)
+    _build_storage(samplestorage, now=lambda: dt(3601))
 
-    assert samplestorage._col_version.count() == 2
-    assert samplestorage._col_ver_edge.count() == 2
-    assert samplestorage._col_nodes.count() == 8
-    assert samplestorage._col_node_edge.count() == 8
+    assert samplestorage._col_version.count() == 1
+    assert samplestorage._col_nodes.count() == 4
+    assert samplestorage._col_node_edge.count() == 4
 
-    for v in samplestorage._col_version.all():
-        assert v['ver'] == 2 if v['uuidver'] == uuidver2 else 1
+    # now test that bringing up the server after the deletion delay deletes the docs:
+    _build_storage(samplestorage, now=lambda: dt(3602))
+
+    assert samplestorage._col_version.count() == 1
+    assert samplestorage._col_ver_edge.count() == 1
+    assert samplestorage._col_nodes.count() == 2
+    assert samplestorage._col_node_edge.count() == 2
 
     for v in samplestorage._col_nodes.all():
-        assert v['ver'] == 2 if v['uuidver'] == uuidver2 else 1
+        assert v['uuidver'] == uuidver1
+        assert v['ver'] == 1
 
 
 def test_startup_with_no_sample_doc(samplestorage):
@@ -299,10 +399,9 @@ def test_startup_with_no_sample_doc(samplestorage):
     assert samplestorage._col_node_edge.count() == 8
 
     samplestorage._col_sample.delete({'_key': str(id2)})
-    # if the sample document hasn't been saved, then none of the integer versions for the
-    # sample can have been updated to 1
+    # if the sample document hasn't been saved, then the integer version for the
+    # sample can't have been updated to 1
     samplestorage._col_version.update_match({'id': str(id2)}, {'ver': -1})
-    samplestorage._col_nodes.update_match({'id': str(id2)}, {'ver': -1})
 
     # first test that bringing up the server before the 1hr deletion time limit doesn't change the
     # db:
@@ -317,6 +416,8 @@ def test_startup_with_no_sample_doc(samplestorage):
         samplestorage._col_ws.name,
         samplestorage._col_data_link.name,
         samplestorage._col_schema.name,
+        samplestorage._col_journal.name,
+        samplestorage._col_link_count.name,
         now=lambda: datetime.datetime.fromtimestamp(4600, tz=datetime.timezone.utc))
 
     assert samplestorage._col_version.count() == 2
@@ -335,6 +436,8 @@ def test_startup_with_no_sample_doc(samplestorage):
         samplestorage._col_ws.name,
         samplestorage._col_data_link.name,
         samplestorage._col_schema.name,
+        samplestorage._col_journal.name,
+        samplestorage._col_link_count.name,
         now=lambda: datetime.datetime.fromtimestamp(4601, tz=datetime.timezone.utc))
 
     assert samplestorage._col_sample.count() == 1
@@ -381,10 +484,9 @@ def test_startup_with_no_version_in_sample_doc(samplestorage):
     samplestorage._col_sample.update_match({}, {'vers': sample['vers'][:1]})
     uuidver2 = sample['vers'][1]
 
-    # if the sample document hasn't been updated, then none of the integer versions for the
-    # sample can have been updated to 1
+    # if the sample document hasn't been updated, then the integer version for the
+    # sample can't have been updated to 2
     samplestorage._col_version.update_match({'uuidver': uuidver2}, {'ver': -1})
-    samplestorage._col_nodes.update_match({'uuidver': uuidver2}, {'ver': -1})
 
     # first test that bringing up the server before the 1hr deletion time limit doesn't change the
     # db:
@@ -399,6 +501,8 @@ def test_startup_with_no_version_in_sample_doc(samplestorage):
         samplestorage._col_ws.name,
         samplestorage._col_data_link.name,
         samplestorage._col_schema.name,
+        samplestorage._col_journal.name,
+        samplestorage._col_link_count.name,
         now=lambda: datetime.datetime.fromtimestamp(5600, tz=datetime.timezone.utc))
 
     assert samplestorage._col_version.count() == 2
@@ -417,6 +521,8 @@ def test_startup_with_no_version_in_sample_doc(samplestorage):
         samplestorage._col_ws.name,
         samplestorage._col_data_link.name,
         samplestorage._col_schema.name,
+        samplestorage._col_journal.name,
+        samplestorage._col_link_count.name,
         now=lambda: datetime.datetime.fromtimestamp(5601, tz=datetime.timezone.utc))
 
     assert samplestorage._col_version.count() == 1
@@ -463,6 +569,10 @@ def test_fail_startup_bad_args(arango):
     _fail_startup(db, s, v, ve, n, ne, ws, '', sc, nw, MissingParameterError(
         'data_link_collection'))
     _fail_startup(db, s, v, ve, n, ne, ws, dl, '', nw, MissingParameterError('schema_collection'))
+    _fail_startup(db, s, v, ve, n, ne, ws, dl, sc, nw, MissingParameterError(
+        'write_journal_collection'), coljournal='')
+    _fail_startup(db, s, v, ve, n, ne, ws, dl, sc, nw, MissingParameterError(
+        'data_link_count_collection'), colcount='')
     _fail_startup(db, s, v, ve, n, ne, ws, dl, sc, None,
                   ValueError('now cannot be a value that evaluates to false'))
 
@@ -500,6 +610,10 @@ def test_fail_startup_incorrect_collection_type(arango):
         'data link collection ws_obj_ver is not an edge collection'))
     _fail_startup(db, s, v, ve, n, ne, ws, dl, ne, nw, StorageInitError(
         'schema collection node_edges is not a vertex collection'))
+    _fail_startup(db, s, v, ve, n, ne, ws, dl, sc, nw, StorageInitError(
+        'write journal collection node_edges is not a vertex collection'), coljournal=ne)
+    _fail_startup(db, s, v, ve, n, ne, ws, dl, sc, nw, StorageInitError(
+        'data link count collection node_edges is not a vertex collection'), colcount=ne)
 
 
 def _fail_startup(
@@ -513,7 +627,9 @@ def _fail_startup(
         coldatalink,
         colschema,
         now,
-        expected):
+        expected,
+        coljournal=TEST_COL_WRITE_JOURNAL,
+        colcount=TEST_COL_DATA_LINK_COUNT):
 
     with raises(Exception) as got:
         ArangoSampleStorage(
@@ -526,6 +642,8 @@ def _fail_startup(
             colws,
             coldatalink,
             colschema,
+            coljournal,
+            colcount,
             now=now)
     assert_exception_correct(got.value, expected)
 
@@ -538,17 +656,20 @@ def test_indexes_created(samplestorage):
                    if not x['name'].startswith('_')])
     assert cols == [
         'data_link',
+        'data_link_count',
         'node_edges',
         'nodes',
         'samples',
         'schema',
         'ver_to_sample',
         'versions',
+        'write_journal',
         'ws_obj_ver']
 
     indexes = samplestorage._col_sample.indexes()
-    assert len(indexes) == 1
+    assert len(indexes) == 2
     assert indexes[0]['fields'] == ['_key']
+    _check_index(indexes[1], ['aclupdate'])
 
     indexes = samplestorage._col_nodes.indexes()
     assert len(indexes) == 3
@@ -581,18 +702,28 @@ def test_indexes_created(samplestorage):
     assert indexes[0]['fields'] == ['_key']
 
     indexes = samplestorage._col_data_link.indexes()
-    assert len(indexes) == 6
+    assert len(indexes) == 7
     assert indexes[0]['fields'] == ['_key']
     assert indexes[1]['fields'] == ['_from', '_to']
     _check_index(indexes[2], ['id'])
-    _check_index(indexes[3], ['wsid', 'objid', 'objver'])
+    _check_index(indexes[3], ['wsid', 'objid', 'objver', 'created', 'id'])
     _check_index(indexes[4], ['samuuidver'])
-    _check_index(indexes[5], ['sampleid'])
+    _check_index(indexes[5], ['sampleid', 'wsid', 'objid', 'objver', 'created', 'id'])
+    _check_index(indexes[6], ['sampleid', 'created', 'id'])
 
     indexes = samplestorage._col_schema.indexes()
     assert len(indexes) == 1
     assert indexes[0]['fields'] == ['_key']
 
+    indexes = samplestorage._col_journal.indexes()
+    assert len(indexes) == 2
+    assert indexes[0]['fields'] == ['_key']
+    _check_index(indexes[1], ['saved'])
+
+    indexes = samplestorage._col_link_count.indexes()
+    assert len(indexes) == 1
+    assert indexes[0]['fields'] == ['_key']
+
 
 def _check_index(index, fields):
     assert index['fields'] == fields
@@ -607,6 +738,56 @@ def test_start_consistency_checker_fail_bad_args(samplestorage):
         samplestorage.start_consistency_checker(interval_sec=0)
     assert_exception_correct(got.value, ValueError('interval_sec must be > 0'))
 
+    with raises(Exception) as got:
+        samplestorage.start_consistency_checker(interval_sec=60, lease_sec=60)
+    assert_exception_correct(got.value, ValueError('lease_sec must be > interval_sec'))
+
+
+def test_startup_fail_bad_reaper_delays(samplestorage):
+    _fail_startup_delays(samplestorage, None, datetime.timedelta(),
+                         ValueError('reaper_update_delay cannot be None'))
+    _fail_startup_delays(samplestorage, datetime.timedelta(), None,
+                         ValueError('reaper_deletion_delay cannot be None'))
+    _fail_startup_delays(samplestorage, datetime.timedelta(seconds=-1), datetime.timedelta(),
+                         ValueError('reaper_update_delay must be >= 0'))
+    _fail_startup_delays(samplestorage, datetime.timedelta(), datetime.timedelta(seconds=-1),
+                         ValueError('reaper_deletion_delay must be >= 0'))
+    _fail_startup_delays(
+        samplestorage, datetime.timedelta(seconds=2), datetime.timedelta(seconds=1),
+        ValueError('reaper_deletion_delay must be >= reaper_update_delay'))
+
+
+def _fail_startup_delays(samplestorage, update_delay, deletion_delay, expected):
+    with raises(Exception) as got:
+        _build_storage(samplestorage, update_delay, deletion_delay)
+    assert_exception_correct(got.value, expected)
+
+
+def _build_storage(samplestorage, update_delay=datetime.timedelta(minutes=5),
+                   deletion_delay=datetime.timedelta(hours=1), **kwargs):
+    # this is very naughty
+    return ArangoSampleStorage(
+        samplestorage._db,
+        samplestorage._col_sample.name,
+        samplestorage._col_version.name,
+        samplestorage._col_ver_edge.name,
+        samplestorage._col_nodes.name,
+        samplestorage._col_node_edge.name,
+        samplestorage._col_ws.name,
+        samplestorage._col_data_link.name,
+        samplestorage._col_schema.name,
+        samplestorage._col_journal.name,
+        samplestorage._col_link_count.name,
+        reaper_update_delay=update_delay,
+        reaper_deletion_delay=deletion_delay,
+        **kwargs)
+
+
+def _wait_for_read_repairs(ss):
+    # this is very naughty. The repair executor has a single thread, so this waits for all the
+    # repairs queued so far to finish
+    ss._read_repair_executor.submit(lambda: None).result()
+
 
 def test_consistency_checker_run(samplestorage):
     # here we just test that stopping and starting the checker will clean up the db.
@@ -618,120 +799,1086 @@ def test_consistency_checker_run(samplestorage):
     n3 = SampleNode('kid2', SubSampleType.SUB_SAMPLE, 'kid1')
     n4 = SampleNode('kid3', SubSampleType.TECHNICAL_REPLICATE, 'root')
 
-    id_ = uuid.UUID('1234567890abcdef1234567890abcdef')
+    id_ = uuid.UUID('1234567890abcdef1234567890abcdef')
+
+    assert samplestorage.save_sample(
+        SavedSample(id_, UserID('u'), [n1, n2, n3, n4], dt(1), 'foo')) is True
+
+    assert samplestorage.save_sample_version(
+        SavedSample(id_, UserID('u'), [n1, n2, n3, n4], dt(1), 'bar')) == 2
+
+    # this is very naughty
+    sample = samplestorage._col_sample.find({}).next()
+    uuidver2 = sample['vers'][1]
+
+    samplestorage._col_version.update_match({'uuidver': uuidver2}, {'ver': -1})
+    # the checker only looks at versions in the write journal
+    samplestorage._col_journal.insert({'_key': uuidver2, 'id': str(id_), 'saved': 1000})
+
+    samplestorage.start_consistency_checker(interval_sec=1)
+    samplestorage.start_consistency_checker(interval_sec=1)  # test that running twice does nothing
+
+    time.sleep(0.5)
+
+    assert samplestorage._col_version.find({'uuidver': uuidver2}).next()['ver'] == -1
+
+    time.sleep(1)
+
+    assert samplestorage._col_version.count() == 2
+    assert samplestorage._col_ver_edge.count() == 2
+    assert samplestorage._col_nodes.count() == 8
+    assert samplestorage._col_node_edge.count() == 8
+
+    for v in samplestorage._col_version.all():
+        assert v['ver'] == 2 if v['uuidver'] == uuidver2 else 1
+
+    # test that pausing stops updating
+    samplestorage.stop_consistency_checker()
+    samplestorage.stop_consistency_checker()  # test that running twice in a row does nothing
+
+    samplestorage._col_version.update_match({'uuidver': uuidver2}, {'ver': -1})
+    samplestorage._col_journal.insert({'_key': uuidver2, 'id': str(id_), 'saved': 1000})
+
+    time.sleep(1.5)
+    assert samplestorage._col_version.find({'uuidver': uuidver2}).next()['ver'] == -1
+
+    samplestorage.start_consistency_checker(1)
+
+    time.sleep(1.5)
+
+    assert samplestorage._col_version.find({'uuidver': uuidver2}).next()['ver'] == 2
+    assert samplestorage._col_journal.count() == 0
+
+    # leaving the checker running can occasionally interfere with other tests, deleting documents
+    # that are in the middle of the save process. Stop the checker and wait until the job must've
+    # run.
+    samplestorage.stop_consistency_checker()
+    time.sleep(1)
+
+
+def test_write_journal_cleared_on_save(samplestorage):
+    id1 = uuid.UUID('1234567890abcdef1234567890abcdef')
+    id2 = uuid.UUID('1234567890abcdef1234567890abcdee')
+
+    assert samplestorage.save_sample(
+        SavedSample(id1, UserID('u'), [SampleNode('root')], dt(1), 'foo')) is True
+    assert samplestorage.save_sample_version(
+        SavedSample(id1, UserID('u'), [SampleNode('root')], dt(2), 'foo')) == 2
+    assert samplestorage.save_samples([
+        (SavedSample(id1, UserID('u'), [SampleNode('root')], dt(3), 'foo'), True, None),
+        (SavedSample(id2, UserID('u'), [SampleNode('root')], dt(3), 'foo'), False, None)
+    ]) == [3, 1]
+
+    assert samplestorage._col_journal.count() == 0
+
+
+def _interrupted_save(samplestorage):
+    # simulates two saves interrupted before the integer versions were updated, one of which
+    # didn't get as far as pushing the version to the sample document, and a third
+    # interrupted save of a new sample that never saved the sample document
+    n1 = SampleNode('root')
+    n2 = SampleNode('kid1', SubSampleType.TECHNICAL_REPLICATE, 'root')
+    id1 = uuid.UUID('1234567890abcdef1234567890abcdef')
+    id2 = uuid.UUID('1234567890abcdef1234567890abcdee')
+
+    assert samplestorage.save_sample(
+        SavedSample(id1, UserID('u'), [n1, n2], dt(1), 'foo')) is True
+    assert samplestorage.save_sample_version(
+        SavedSample(id1, UserID('u'), [n1, n2], dt(2), 'foo')) == 2
+    assert samplestorage.save_sample_version(
+        SavedSample(id1, UserID('u'), [n1, n2], dt(3), 'foo')) == 3
+    assert samplestorage.save_sample(
+        SavedSample(id2, UserID('u'), [n1, n2], dt(4), 'foo')) is True
+
+    # this is very naughty
+    sample = samplestorage._col_sample.get(str(id1))
+    uuidver2, uuidver3 = sample['vers'][1:]
+    uuidver4 = samplestorage._col_sample.get(str(id2))['vers'][0]
+    samplestorage._col_sample.update_match({'_key': str(id1)}, {'vers': sample['vers'][:2]})
+    samplestorage._col_sample.delete(str(id2))
+    for uv in [uuidver2, uuidver3, uuidver4]:
+        samplestorage._col_version.update_match({'uuidver': uv}, {'ver': -1})
+    samplestorage._col_journal.insert_many([
+        {'_key': uuidver2, 'id': str(id1), 'saved': 2000},
+        {'_key': uuidver3, 'id': str(id1), 'saved': 3000},
+        {'_key': uuidver4, 'id': str(id2), 'saved': 4000}])
+    return uuidver2, uuidver3, uuidver4
+
+
+def test_check_journal(samplestorage):
+    uuidver2, uuidver3, uuidver4 = _interrupted_save(samplestorage)
+
+    # nothing is older than the update delay
+    samplestorage._now = lambda: dt(300)
+    samplestorage._check_journal()
+    assert samplestorage._col_journal.count() == 3
+    assert samplestorage._col_version.find({'uuidver': uuidver2}).next()['ver'] == -1
+
+    # the version in the sample doc is repaired, the other versions are too young to delete
+    samplestorage._now = lambda: dt(3000)
+    samplestorage._check_journal()
+    assert sorted([j['_key'] for j in samplestorage._col_journal.all()]) == sorted(
+        [uuidver3, uuidver4])
+    assert samplestorage._col_version.find({'uuidver': uuidver2}).next()['ver'] == 2
+    assert samplestorage._col_version.count() == 4
+    assert samplestorage._col_nodes.count() == 8
+
+    # the orphaned versions are deleted
+    samplestorage._now = lambda: dt(7605)
+    samplestorage._check_journal()
+    assert samplestorage._col_journal.count() == 0
+    assert samplestorage._col_version.count() == 2
+    assert samplestorage._col_ver_edge.count() == 2
+    assert samplestorage._col_nodes.count() == 4
+    assert samplestorage._col_node_edge.count() == 4
+    for uv in [uuidver3, uuidver4]:
+        assert len(list(samplestorage._col_version.find({'uuidver': uv}))) == 0
+        assert len(list(samplestorage._col_nodes.find({'uuidver': uv}))) == 0
+
+    assert samplestorage.get_sample(uuid.UUID('1234567890abcdef1234567890abcdef')) == SavedSample(
+        uuid.UUID('1234567890abcdef1234567890abcdef'), UserID('u'),
+        [SampleNode('root'), SampleNode('kid1', SubSampleType.TECHNICAL_REPLICATE, 'root')],
+        dt(2), 'foo', 2)
+
+
+def test_check_journal_resumes_after_time_limit(samplestorage):
+    uuidver2, uuidver3, uuidver4 = _interrupted_save(samplestorage)
+
+    # start time, time when resolving the batch, time when checking the time limit
+    times = iter([dt(7605), dt(7605), dt(7640)])
+    samplestorage._now = lambda: next(times)
+    samplestorage._reaper_batch_size = 1
+    samplestorage._reaper_pass_limit = datetime.timedelta(seconds=30)
+
+    # first pass processes one batch and then runs out of time
+    samplestorage._check_journal()
+    assert sorted([j['_key'] for j in samplestorage._col_journal.all()]) == sorted(
+        [uuidver3, uuidver4])
+    assert samplestorage._journal_cursor == (2000, uuidver2)
+
+    # second pass resumes from the cursor and finishes
+    samplestorage._now = lambda: dt(7640)
+    samplestorage._check_journal()
+    assert samplestorage._col_journal.count() == 0
+    assert samplestorage._journal_cursor == (-1, '')
+    assert samplestorage._col_version.count() == 2
+
+
+def test_check_journal_with_configured_delays(samplestorage):
+    ss = _build_storage(samplestorage, datetime.timedelta(seconds=10),
+                        datetime.timedelta(seconds=20))
+    uuidver2, uuidver3, uuidver4 = _interrupted_save(ss)
+
+    ss._now = lambda: dt(11)
+    assert ss._check_journal() == 1
+    assert sorted([j['_key'] for j in ss._col_journal.all()]) == sorted([uuidver3, uuidver4])
+    assert ss._col_version.find({'uuidver': uuidver2}).next()['ver'] == 2
+    assert ss._col_version.count() == 4
+
+    ss._now = lambda: dt(25)
+    assert ss._check_journal() == 2
+    assert ss._col_journal.count() == 0
+    assert ss._col_version.count() == 2
+    assert ss._col_nodes.count() == 4
+
+
+def _edge_docs(col):
+    return sorted([{k: d[k] for k in ['_key', 'uuidver', '_from', '_to']} for d in col.all()],
+                  key=lambda d: d['_key'])
+
+
+def _expected_edge_docs(ss, samples):
+    # this is very naughty
+    nodeedges = []
+    veredges = []
+    for s in samples:
+        uuidver = uuid.UUID(ss._col_sample.get(str(s.id))['vers'][s.version - 1])
+        _, ne, _, ve, _ = ss._build_version_and_node_docs(s, uuidver)
+        nodeedges.extend(ne)
+        veredges.append(ve)
+    return (sorted(nodeedges, key=lambda d: d['_key']),
+            sorted(veredges, key=lambda d: d['_key']))
+
+
+def test_deferred_edges(samplestorage):
+    ss = _build_storage(samplestorage, defer_edges=True)
+    n1 = SampleNode('root')
+    n2 = SampleNode('kid1', SubSampleType.TECHNICAL_REPLICATE, 'root')
+    n3 = SampleNode('kid2', SubSampleType.SUB_SAMPLE, 'kid1')
+    n4 = SampleNode('root2', SubSampleType.BIOLOGICAL_REPLICATE)
+    id1 = uuid.UUID('1234567890abcdef1234567890abcdef')
+    id2 = uuid.UUID('1234567890abcdef1234567890abcdee')
+    s1 = SavedSample(id1, UserID('u'), [n1, n2, n3], dt(1), 'foo', 1)
+    s2 = SavedSample(id1, UserID('u'), [n1, n2, n3, n4], dt(2), 'foo', 2)
+    s3 = SavedSample(id2, UserID('u'), [n4], dt(3), 'bar', 1)
+    assert ss.save_sample(s1) is True
+    assert ss.save_sample_version(s2) == 2
+    assert ss.save_samples([(s3, False, None)]) == [1]
+
+    assert ss._col_node_edge.count() == 0
+    assert ss._col_ver_edge.count() == 0
+    assert ss.get_edge_watermark() is None
+    assert ss.get_sample(id1) == s2
+
+    # this is very naughty
+    ss._reaper_id = 'ss'
+    # the versions are too young to process
+    ss._now = lambda: dt(300)
+    ss._run_consistency_checker()
+    assert ss._col_node_edge.count() == 0
+    assert ss.get_edge_watermark() is None
+
+    ss._now = lambda: dt(304)
+    ss._run_consistency_checker()
+    assert ss.get_edge_watermark() == dt(3)
+    nodeedges, veredges = _expected_edge_docs(ss, [s1, s2, s3])
+    assert _edge_docs(ss._col_node_edge) == nodeedges
+    assert _edge_docs(ss._col_ver_edge) == veredges
+
+    # running again does nothing
+    ss._run_consistency_checker()
+    assert _edge_docs(ss._col_node_edge) == nodeedges
+    assert _edge_docs(ss._col_ver_edge) == veredges
+
+
+def test_deferred_edges_stop_at_uncommitted_version(samplestorage):
+    ss = _build_storage(samplestorage, defer_edges=True)
+    ss._reaper_id = 'ss'
+    ss._reaper_batch_size = 1
+    id_ = uuid.UUID('1234567890abcdef1234567890abcdef')
+    assert ss.save_sample(SavedSample(id_, UserID('u'), [TEST_NODE], dt(1), 'foo')) is True
+    assert ss.save_sample_version(SavedSample(id_, UserID('u'), [TEST_NODE], dt(2), 'foo')) == 2
+    assert ss.save_sample_version(SavedSample(id_, UserID('u'), [TEST_NODE], dt(3), 'foo')) == 3
+    # this is very naughty
+    ss._col_version.update_match({'ver': 2}, {'ver': -1})
+
+    ss._now = lambda: dt(1000)
+    ss._run_consistency_checker()
+    assert ss.get_edge_watermark() == dt(1)
+    assert ss._col_ver_edge.count() == 1
+    assert ss._col_node_edge.count() == 1
+
+    ss._col_version.update_match({'ver': -1}, {'ver': 2})
+    ss._run_consistency_checker()
+    assert ss.get_edge_watermark() == dt(3)
+    assert ss._col_ver_edge.count() == 3
+    assert ss._col_node_edge.count() == 3
+
+
+def test_deferred_edges_skip_failed_save(samplestorage):
+    ss = _build_storage(samplestorage, defer_edges=True)
+    ss._reaper_id = 'ss'
+    ss._reaper_batch_size = 1
+    id_ = uuid.UUID('1234567890abcdef1234567890abcdef')
+    assert ss.save_sample(SavedSample(id_, UserID('u'), [TEST_NODE], dt(1), 'foo')) is True
+    assert ss.save_sample_version(SavedSample(id_, UserID('u'), [TEST_NODE], dt(2), 'foo')) == 2
+    assert ss.save_sample_version(SavedSample(id_, UserID('u'), [TEST_NODE], dt(3), 'foo')) == 3
+    # this is very naughty. Simulates a save that failed before updating the sample document,
+    # which the consistency checker won't delete until the deletion delay has passed
+    ss._col_version.update_match({'ver': 2}, {'ver': -1, 'uuidver': str(uuid.uuid4())})
+
+    ss._now = lambda: dt(1000)
+    ss._run_consistency_checker()
+    assert ss.get_edge_watermark() == dt(3)
+    assert ss._col_ver_edge.count() == 2
+    assert ss._col_node_edge.count() == 2
+
+
+def test_shard_by_sample_id_fail_without_deferred_edges(samplestorage):
+    with raises(Exception) as got:
+        _build_storage(samplestorage, shard_by_sample_id=True)
+    assert_exception_correct(got.value, ValueError(
+        'defer_edges must be True if shard_by_sample_id is True'))
+
+
+# The test collections are not sharded, but the storage system behaves as if they were.
+
+def test_shard_by_sample_id_save_and_get(samplestorage):
+    ss = _build_storage(samplestorage, defer_edges=True, shard_by_sample_id=True)
+    n1 = SampleNode('root')
+    n2 = SampleNode('kid1', SubSampleType.TECHNICAL_REPLICATE, 'root')
+    n3 = SampleNode('root2', SubSampleType.BIOLOGICAL_REPLICATE)
+    id1 = uuid.UUID('1234567890abcdef1234567890abcdef')
+    id2 = uuid.UUID('1234567890abcdef1234567890abcdee')
+    s1 = SavedSample(id1, UserID('u'), [n1, n2], dt(1), 'foo', 1)
+    s2 = SavedSample(id1, UserID('u'), [n1, n2, n3], dt(2), 'foo', 2)
+    s3 = SavedSample(id2, UserID('u'), [n3], dt(3), 'bar', 1)
+    assert ss.save_sample(s1) is True
+    assert ss.save_sample_version(s2) == 2
+    assert ss.save_samples([(s3, False, None)]) == [1]
+
+    # the keys were generated by the database
+    for d in list(ss._col_version.all()) + list(ss._col_nodes.all()):
+        assert not d['_key'].startswith(d['id'])
+    assert sorted((v['id'], v['ver']) for v in ss._col_version.all()) == [
+        (str(id2), 1), (str(id1), 1), (str(id1), 2)]
+    assert ss._col_journal.count() == 0
+
+    assert ss.get_sample(id1) == s2
+    assert ss.get_sample(id1, 1) == s1
+    assert ss.get_samples([{'id': id1, 'version': 1}, {'id': id2}]) == [s1, s3]
+    assert ss.get_version_if_unchanged(
+        SavedSample(id1, UserID('u2'), [n1, n2, n3], dt(5), 'foo')) == 2
+
+    # this is very naughty
+    ss._col_version.update_match({}, {'ver': -1})
+    assert ss.get_sample(id1) == s2
+    assert ss.get_samples([{'id': id1, 'version': 1}, {'id': id2}]) == [s1, s3]
+    _wait_for_read_repairs(ss)
+    assert sorted((v['id'], v['ver']) for v in ss._col_version.all()) == [
+        (str(id2), 1), (str(id1), 1), (str(id1), 2)]
+
+
+def _sharded_edge_docs(col):
+    return sorted([{k: d[k] for k in ['id', 'uuidver', '_from', '_to']} for d in col.all()],
+                  key=lambda d: d['_from'])
+
+
+def _expected_sharded_edge_docs(ss):
+    # this is very naughty
+    vers = {v['uuidver']: v for v in ss._col_version.all()}
+    nodekeys = {(n['uuidver'], n['name']): n['_key'] for n in ss._col_nodes.all()}
+    veredges = [{'id': v['id'],
+                 'uuidver': v['uuidver'],
+                 '_from': f'{ss._col_version.name}/{v["_key"]}',
+                 '_to': f'{ss._col_sample.name}/{v["id"]}'}
+                for v in vers.values()]
+    nodeedges = []
+    for n in ss._col_nodes.all():
+        if n['type'] == 'BIOLOGICAL_REPLICATE':
+            to = f'{ss._col_version.name}/{vers[n["uuidver"]]["_key"]}'
+        else:
+            to = f'{ss._col_nodes.name}/{nodekeys[(n["uuidver"], n["parent"])]}'
+        nodeedges.append({'id': n['id'],
+                          'uuidver': n['uuidver'],
+                          '_from': f'{ss._col_nodes.name}/{n["_key"]}',
+                          '_to': to})
+    return (sorted(nodeedges, key=lambda d: d['_from']),
+            sorted(veredges, key=lambda d: d['_from']))
+
+
+def test_shard_by_sample_id_deferred_edges(samplestorage):
+    ss = _build_storage(samplestorage, defer_edges=True, shard_by_sample_id=True)
+    n1 = SampleNode('root')
+    n2 = SampleNode('kid1', SubSampleType.TECHNICAL_REPLICATE, 'root')
+    n3 = SampleNode('kid2', SubSampleType.SUB_SAMPLE, 'kid1')
+    n4 = SampleNode('root2', SubSampleType.BIOLOGICAL_REPLICATE)
+    id1 = uuid.UUID('1234567890abcdef1234567890abcdef')
+    id2 = uuid.UUID('1234567890abcdef1234567890abcdee')
+    assert ss.save_sample(SavedSample(id1, UserID('u'), [n1, n2, n3], dt(1), 'foo')) is True
+    assert ss.save_sample_version(SavedSample(id1, UserID('u'), [n1, n2, n3, n4], dt(2), 'foo')
+                                  ) == 2
+    assert ss.save_sample(SavedSample(id2, UserID('u'), [n4], dt(3), 'bar')) is True
+
+    # this is very naughty
+    ss._reaper_id = 'ss'
+    ss._now = lambda: dt(304)
+    ss._run_consistency_checker()
+    assert ss.get_edge_watermark() == dt(3)
+    nodeedges, veredges = _expected_sharded_edge_docs(ss)
+    assert len(nodeedges) == 8
+    assert len(veredges) == 3
+    assert _sharded_edge_docs(ss._col_node_edge) == nodeedges
+    assert _sharded_edge_docs(ss._col_ver_edge) == veredges
+
+    # reprocessing the versions only creates missing edges
+    ss._col_node_edge.delete_match({'_from': nodeedges[0]['_from']})
+    ss._col_ver_edge.delete_match({'_from': veredges[0]['_from']})
+    ss._col_schema.update({'_key': 'reaperlease', 'edgesaved': -1, 'edgekey': ''})
+    ss._run_consistency_checker()
+    assert ss.get_edge_watermark() == dt(3)
+    assert _sharded_edge_docs(ss._col_node_edge) == nodeedges
+    assert _sharded_edge_docs(ss._col_ver_edge) == veredges
+
+
+def test_shard_by_sample_id_data_links(samplestorage):
+    ss = _build_storage(samplestorage, defer_edges=True, shard_by_sample_id=True)
+    id1 = uuid.UUID('1234567890abcdef1234567890abcdef')
+    assert ss.save_sample(SavedSample(
+        id1, UserID('user'), [SampleNode('mynode'), SampleNode('mynode1')], dt(1), 'foo')) is True
+    l1 = DataLink(
+        uuid.UUID('1234567890abcdef1234567890abcde1'),
+        DataUnitID(UPA('5/89/32')),
+        SampleNodeAddress(SampleAddress(id1, 1), 'mynode'),
+        dt(500),
+        UserID('usera'))
+    l2 = DataLink(
+        uuid.UUID('1234567890abcdef1234567890abcde2'),
+        DataUnitID(UPA('5/89/33')),
+        SampleNodeAddress(SampleAddress(id1, 1), 'mynode1'),
+        dt(500),
+        UserID('usera'))
+    assert ss.create_data_link(l1) is None
+    assert ss.create_data_links([l2]) == [None]
+
+    assert ss.get_data_link(l1.id) == l1
+    assert ss.get_data_link(l2.id) == l2
+    # this is very naughty
+    nodekeys = {n['name']: n['_key'] for n in ss._col_nodes.all()}
+    assert {d['_key']: d['_to'] for d in ss._col_data_link.all()} == {
+        '5_89_32': f'{ss._col_nodes.name}/{nodekeys["mynode"]}',
+        '5_89_33': f'{ss._col_nodes.name}/{nodekeys["mynode1"]}',
+        }
+
+    l3 = DataLink(
+        uuid.UUID('1234567890abcdef1234567890abcde3'),
+        DataUnitID(UPA('5/89/34')),
+        SampleNodeAddress(SampleAddress(id1, 1), 'mynode2'),
+        dt(500),
+        UserID('usera'))
+    err = NoSuchSampleNodeError('12345678-90ab-cdef-1234-567890abcdef ver 1 mynode2')
+    with raises(Exception) as got:
+        ss.create_data_link(l3)
+    assert_exception_correct(got.value, err)
+    with raises(Exception) as got:
+        ss.create_data_links([l3])
+    assert_exception_correct(got.value, err)
+    assert ss._col_data_link.count() == 2
+
+
+def test_consistency_checker_lease(samplestorage):
+    ss1 = samplestorage
+    ss2 = _build_storage(samplestorage)
+    _interrupted_save(ss1)
+    # this is very naughty
+    ss1._reaper_id = 'ss1'
+    ss2._reaper_id = 'ss2'
+
+    assert ss1.get_consistency_checker_status() is None
+
+    # ss1 takes the lease and runs the checker
+    ss1._now = lambda: dt(3000)
+    ss1._run_consistency_checker()
+    assert ss1.get_consistency_checker_status() == {
+        'holder': 'ss1',
+        'lease_expires': dt(3180),
+        'last_run': dt(3000),
+        'last_run_duration': datetime.timedelta(),
+        'repaired': 1
+    }
+    assert ss1._col_journal.count() == 2
+
+    # the lease is still held by ss1, so ss2 does nothing
+    ss2._now = lambda: dt(3050)
+    ss2._run_consistency_checker()
+    assert ss2.get_consistency_checker_status()['holder'] == 'ss1'
+    assert ss2._col_journal.count() == 2
+
+    # ss1 renews the lease
+    ss1._now = lambda: dt(3100)
+    ss1._run_consistency_checker()
+    assert ss1.get_consistency_checker_status() == {
+        'holder': 'ss1',
+        'lease_expires': dt(3280),
+        'last_run': dt(3100),
+        'last_run_duration': datetime.timedelta(),
+        'repaired': 0
+    }
+
+    # ss1 dies and the lease expires, so ss2 takes over
+    ss2._now = lambda: dt(7605)
+    ss2._run_consistency_checker()
+    assert ss2.get_consistency_checker_status() == {
+        'holder': 'ss2',
+        'lease_expires': dt(7785),
+        'last_run': dt(7605),
+        'last_run_duration': datetime.timedelta(),
+        'repaired': 2
+    }
+    assert ss2._col_journal.count() == 0
+
+    # ss1 comes back but can't take the lease
+    ss1._now = lambda: dt(7610)
+    ss1._run_consistency_checker()
+    assert ss1.get_consistency_checker_status()['holder'] == 'ss2'
+
+    # stopping the checker releases the lease, so ss1 can take over immediately
+    ss1.stop_consistency_checker()  # doesn't hold the lease so does nothing
+    assert ss1.get_consistency_checker_status()['lease_expires'] == dt(7785)
+    ss2.stop_consistency_checker()
+    assert ss1.get_consistency_checker_status()['lease_expires'] == dt(0)
+    ss1._run_consistency_checker()
+    assert ss1.get_consistency_checker_status() == {
+        'holder': 'ss1',
+        'lease_expires': dt(7790),
+        'last_run': dt(7610),
+        'last_run_duration': datetime.timedelta(),
+        'repaired': 0
+    }
+
+    # the lease document doesn't interfere with startup
+    _build_storage(samplestorage)
+
+
+def test_get_sample_cached(samplestorage):
+    ss = _build_storage(samplestorage, sample_cache_max_bytes=1000000)
+    id_ = uuid.UUID('1234567890abcdef1234567890abcdef')
+    n = SampleNode('root')
+    assert ss.save_sample(SavedSample(id_, UserID('u'), [n], dt(1), 'foo')) is True
+    assert ss.save_sample_version(SavedSample(id_, UserID('u'), [n], dt(2), 'bar')) == 2
+
+    s1 = SavedSample(id_, UserID('u'), [n], dt(1), 'foo', 1)
+    s2 = SavedSample(id_, UserID('u'), [n], dt(2), 'bar', 2)
+    assert ss.get_sample(id_, 1) == s1
+    assert ss.get_sample(id_) == s2
+    assert ss.get_sample_cache_stats() == {
+        'hits': 0, 'misses': 2, 'entries': 2, 'bytes': ss.get_sample_cache_stats()['bytes'],
+        'max_bytes': 1000000}
+
+    # this is very naughty, but proves the samples are served from the cache
+    ss._col_nodes.delete_match({})
+    assert ss.get_sample(id_, 1) == s1
+    assert ss.get_sample(id_, 2) == s2
+    assert ss.get_sample(id_) == s2
+    assert ss.get_samples([{'id': id_}, {'id': id_, 'version': 1}]) == [s2, s1]
+    assert ss.get_sample_cache_stats()['hits'] == 5
+    assert ss.get_sample_cache_stats()['misses'] == 2
+
+    # a new version is looked up rather than served from the cache
+    assert ss.save_sample_version(SavedSample(id_, UserID('u'), [n], dt(3), 'baz')) == 3
+    s3 = SavedSample(id_, UserID('u'), [n], dt(3), 'baz', 3)
+    assert ss.get_sample(id_) == s3
+    assert ss.get_samples([{'id': id_}]) == [s3]
+    assert ss.get_sample_cache_stats()['hits'] == 6
+    assert ss.get_sample_cache_stats()['misses'] == 3
+
+    # errors are still thrown
+    with raises(Exception) as got:
+        ss.get_sample(uuid.UUID('1234567890abcdef1234567890abcdee'))
+    assert_exception_correct(got.value, NoSuchSampleError('12345678-90ab-cdef-1234-567890abcdee'))
+
+    with raises(Exception) as got:
+        ss.get_sample(id_, 4)
+    assert_exception_correct(got.value, NoSuchSampleVersionError(
+        '12345678-90ab-cdef-1234-567890abcdef ver 4'))
+
+
+def test_get_samples_cached(samplestorage):
+    ss = _build_storage(samplestorage, sample_cache_max_bytes=1000000)
+    id1 = uuid.UUID('1234567890abcdef1234567890abcdef')
+    id2 = uuid.UUID('1234567890abcdef1234567890abcdee')
+    n = SampleNode('root')
+    assert ss.save_sample(SavedSample(id1, UserID('u'), [n], dt(1), 'foo')) is True
+    assert ss.save_sample(SavedSample(id2, UserID('u'), [n], dt(2), 'bar')) is True
+    s1 = SavedSample(id1, UserID('u'), [n], dt(1), 'foo', 1)
+    s2 = SavedSample(id2, UserID('u'), [n], dt(2), 'bar', 1)
+
+    assert ss.get_sample(id1) == s1
+    assert ss.get_samples([{'id': id1}, {'id': id2, 'version': 1}]) == [s1, s2]
+    assert ss.get_samples([{'id': id2}, {'id': id1, 'version': 1}]) == [s2, s1]
+    stats = ss.get_sample_cache_stats()
+    assert stats['hits'] == 3
+    assert stats['misses'] == 2
+    assert stats['entries'] == 2
+
+    with raises(Exception) as got:
+        ss.get_samples([{'id': id1}, {'id': uuid.UUID('1234567890abcdef1234567890abcded')}])
+    assert_exception_correct(got.value, NoSuchSampleError('12345678-90ab-cdef-1234-567890abcded'))
+
+
+def test_get_sample_cache_skips_incomplete_versions(samplestorage):
+    ss = _build_storage(samplestorage, sample_cache_max_bytes=1000000)
+    id1 = uuid.UUID('1234567890abcdef1234567890abcdef')
+    id2 = uuid.UUID('1234567890abcdef1234567890abcdee')
+    n = SampleNode('root')
+    assert ss.save_sample(SavedSample(id1, UserID('u'), [n], dt(1), 'foo')) is True
+    assert ss.save_sample(SavedSample(id2, UserID('u'), [n], dt(1), 'bar')) is True
+    s1 = SavedSample(id1, UserID('u'), [n], dt(1), 'foo', 1)
+    s2 = SavedSample(id2, UserID('u'), [n], dt(1), 'bar', 1)
+
+    # this is very naughty
+    ss._col_version.update_match({}, {'ver': -1})
+    assert ss.get_samples([{'id': id1}]) == [s1]
+    assert ss.get_sample(id2) == s2
+    assert ss.get_sample_cache_stats()['entries'] == 0
+
+    # the versions were repaired, so they're cached now
+    _wait_for_read_repairs(ss)
+    assert ss.get_samples([{'id': id1}]) == [s1]
+    assert ss.get_sample(id2) == s2
+    assert ss.get_sample_cache_stats()['entries'] == 2
+
+
+def test_read_repair_once_per_version(samplestorage):
+    id_ = uuid.UUID('1234567890abcdef1234567890abcdef')
+    n = SampleNode('root')
+    assert samplestorage.save_sample(SavedSample(id_, UserID('u'), [n], dt(1), 'foo')) is True
+    assert samplestorage.save_sample_version(SavedSample(id_, UserID('u'), [n], dt(2), 'foo')) == 2
+    s1 = SavedSample(id_, UserID('u'), [n], dt(1), 'foo', 1)
+    s2 = SavedSample(id_, UserID('u'), [n], dt(2), 'foo', 2)
+    assert samplestorage.get_read_repair_stats() == {'queued': 0, 'repaired': 0, 'failed': 0}
+
+    # this is very naughty
+    samplestorage._col_version.update_match({}, {'ver': -1})
+    # hold up the repair thread so the repairs can't complete before the reads
+    release = threading.Event()
+    samplestorage._read_repair_executor.submit(release.wait)
+    assert samplestorage.get_sample(id_) == s2
+    assert samplestorage.get_sample(id_, 1) == s1
+    assert samplestorage.get_samples([{'id': id_, 'version': 1}, {'id': id_}]) == [s1, s2]
+    assert samplestorage.get_sample_acls(id_) == SampleACL(UserID('u'), dt(1))
+    assert samplestorage.get_read_repair_stats() == {'queued': 2, 'repaired': 0, 'failed': 0}
+    for v in samplestorage._col_version.all():
+        assert v['ver'] == -1
+
+    release.set()
+    _wait_for_read_repairs(samplestorage)
+    assert samplestorage.get_read_repair_stats() == {'queued': 2, 'repaired': 2, 'failed': 0}
+    assert sorted(v['ver'] for v in samplestorage._col_version.all()) == [1, 2]
+
+    # versions are only repaired once per process
+    samplestorage._col_version.update_match({}, {'ver': -1})
+    assert samplestorage.get_sample(id_) == s2
+    _wait_for_read_repairs(samplestorage)
+    assert samplestorage.get_read_repair_stats() == {'queued': 2, 'repaired': 2, 'failed': 0}
+
+
+def test_read_repair_failure_requeues(samplestorage):
+    id_ = uuid.UUID('1234567890abcdef1234567890abcdef')
+    n = SampleNode('root')
+    assert samplestorage.save_sample(SavedSample(id_, UserID('u'), [n], dt(1), 'foo')) is True
+    s1 = SavedSample(id_, UserID('u'), [n], dt(1), 'foo', 1)
+
+    # this is very naughty
+    samplestorage._col_version.update_match({}, {'ver': -1})
+    commit = samplestorage._commit_version
+
+    def fail(*args):
+        raise SampleStorageError('oops')
+
+    samplestorage._commit_version = fail
+    assert samplestorage.get_sample(id_) == s1
+    _wait_for_read_repairs(samplestorage)
+    assert samplestorage.get_read_repair_stats() == {'queued': 1, 'repaired': 0, 'failed': 1}
+    assert samplestorage._col_version.all().next()['ver'] == -1
+
+    samplestorage._commit_version = commit
+    assert samplestorage.get_sample(id_) == s1
+    _wait_for_read_repairs(samplestorage)
+    assert samplestorage.get_read_repair_stats() == {'queued': 2, 'repaired': 1, 'failed': 1}
+    assert samplestorage._col_version.all().next()['ver'] == 1
+
+
+def test_get_sample_shared_cache(samplestorage, tmp_path):
+    path = str(tmp_path / 'cache')
+    ss1 = _build_storage(
+        samplestorage, shared_sample_cache_path=path, shared_sample_cache_max_bytes=1000000)
+    # simulates another worker process with a process cache
+    ss2 = _build_storage(
+        samplestorage, sample_cache_max_bytes=1000000, shared_sample_cache_path=path,
+        shared_sample_cache_max_bytes=1000000)
+    id1 = uuid.UUID('1234567890abcdef1234567890abcdef')
+    id2 = uuid.UUID('1234567890abcdef1234567890abcdee')
+    n1 = SampleNode('root')
+    n2 = SampleNode(
+        'kid1', SubSampleType.TECHNICAL_REPLICATE, 'root',
+        {'a': {'b': 'c', 'd': 5}, 'f': {'g': True}},
+        {'m': {'n': 1.5}},
+        [SourceMetadata('a', 'sk', {'b': 'bsrc', 'd': 6})])
+    assert ss1.save_sample(SavedSample(id1, UserID('u'), [n1, n2], dt(1), 'foo')) is True
+    assert ss1.save_sample(SavedSample(id2, UserID('u'), [n1], dt(2), 'bar')) is True
+    s1 = SavedSample(id1, UserID('u'), [n1, n2], dt(1), 'foo', 1)
+    s2 = SavedSample(id2, UserID('u'), [n1], dt(2), 'bar', 1)
+
+    assert ss1.get_sample(id1) == s1
+    assert ss1.get_samples([{'id': id2}]) == [s2]
+    assert ss1.get_shared_sample_cache_stats()['entries'] == 2
+
+    # this is very naughty, but proves the samples are served from the cache
+    ss1._col_nodes.delete_match({})
+    assert ss2.get_sample(id1) == s1
+    assert ss2.get_samples([{'id': id1}, {'id': id2, 'version': 1}]) == [s1, s2]
+    assert ss2.get_sample_cache_stats() == {
+        'hits': 1, 'misses': 2, 'entries': 2, 'bytes': ss2.get_sample_cache_stats()['bytes'],
+        'max_bytes': 1000000}
+    stats = ss2.get_shared_sample_cache_stats()
+    assert stats == {
+        'hits': 2, 'misses': 0, 'entries': 2, 'bytes': stats['bytes'], 'max_bytes': 1000000}
+
+
+def dt(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc)
+
+
+def test_save_and_get_sample(samplestorage):
+    n1 = SampleNode('root')
+    n2 = SampleNode(
+        'kid1', SubSampleType.TECHNICAL_REPLICATE, 'root',
+        {'a': {'b': 'c', 'd': 'e'}, 'f': {'g': 'h'}},
+        {'m': {'n': 'o'}},
+        [SourceMetadata('a', 'sk', {'a': 'b'}), SourceMetadata('f', 'sk', {'c': 'd'})])
+    n3 = SampleNode('kid2', SubSampleType.SUB_SAMPLE, 'kid1', {'a': {'b': 'c'}})
+    n4 = SampleNode('kid3', SubSampleType.TECHNICAL_REPLICATE, 'root',
+                    user_metadata={'f': {'g': 'h'}})
+
+    id_ = uuid.UUID('1234567890abcdef1234567890abcdef')
+
+    assert samplestorage.save_sample(
+        SavedSample(id_, UserID('auser'), [n1, n2, n3, n4], dt(8), 'foo')) is True
+
+    assert samplestorage.get_sample(id_) == SavedSample(
+        id_, UserID('auser'), [n1, n2, n3, n4], dt(8), 'foo', 1)
+
+    assert samplestorage.get_sample_acls(id_) == SampleACL(
+        UserID('auser'), dt(8), public_read=False)
+
+def test_save_and_get_samples(samplestorage):
+    n1 = SampleNode('root')
+    n2 = SampleNode(
+        'kid1', SubSampleType.TECHNICAL_REPLICATE, 'root',
+        {'a': {'b': 'c', 'd': 'e'}, 'f': {'g': 'h'}},
+        {'m': {'n': 'o'}},
+        [SourceMetadata('a', 'sk', {'a': 'b'}), SourceMetadata('f', 'sk', {'c': 'd'})])
+    n3 = SampleNode('kid2', SubSampleType.SUB_SAMPLE, 'kid1', {'a': {'b': 'c'}})
+    n4 = SampleNode('kid3', SubSampleType.TECHNICAL_REPLICATE, 'root',
+                    user_metadata={'f': {'g': 'h'}})
+
+    id1_ = uuid.UUID('1234567890abcdef1234567890fbcdef')
+    id2_ = uuid.UUID('1234567890abcdef1234567890fbcdea')
+    id3_ = uuid.UUID('1234567890abcdef1234567890fbcdeb')
+
+    # save three separate samples
+    assert samplestorage.save_sample(
+        SavedSample(id1_, UserID('auser'), [n1, n2, n3, n4], dt(8), 'foo')) is True
+    assert samplestorage.save_sample(
+        SavedSample(id2_, UserID('auser'), [n1, n2, n3], dt(8), 'bar')) is True
+    assert samplestorage.save_sample(
+        SavedSample(id3_, UserID('auser'), [n1, n2, n4], dt(8), 'baz')) is True
+
+    assert samplestorage.get_samples([
+        {"id": id1_, "version": 1},
+        {"id": id2_, "version": 1},
+        {"id": id3_, "version": 1}
+    ]) == [
+        SavedSample(id1_, UserID('auser'), [n1, n2, n3, n4], dt(8), 'foo', 1),
+        SavedSample(id2_, UserID('auser'), [n1, n2, n3], dt(8), 'bar', 1),
+        SavedSample(id3_, UserID('auser'), [n1, n2, n4], dt(8), 'baz', 1)
+    ]
+
+def test_get_version_if_unchanged(samplestorage):
+    n1 = SampleNode('root')
+    n2 = SampleNode(
+        'kid1', SubSampleType.TECHNICAL_REPLICATE, 'root',
+        {'a': {'b': 'c', 'd': 'e'}, 'f': {'g': 'h'}},
+        {'m': {'n': 'o'}},
+        [SourceMetadata('a', 'sk', {'a': 'b', 'c': 'd'})])
+    # same metadata as n2, in a different order
+    n2a = SampleNode(
+        'kid1', SubSampleType.TECHNICAL_REPLICATE, 'root',
+        {'f': {'g': 'h'}, 'a': {'d': 'e', 'b': 'c'}},
+        {'m': {'n': 'o'}},
+        [SourceMetadata('a', 'sk', {'c': 'd', 'a': 'b'})])
+    n2b = SampleNode(
+        'kid1', SubSampleType.TECHNICAL_REPLICATE, 'root',
+        {'a': {'b': 'c', 'd': 'e'}, 'f': {'g': 'h'}},
+        {'m': {'n': 'p'}},
+        [SourceMetadata('a', 'sk', {'a': 'b', 'c': 'd'})])
+    n3 = SampleNode('kid2', SubSampleType.SUB_SAMPLE, 'kid1')
+
+    id_ = uuid.UUID('1234567890abcdef1234567890abcdef')
+    id2 = uuid.UUID('1234567890abcdef1234567890abcdee')
+
+    def s(nodes, name='foo', user='u', time=1, id_=id_):
+        return SavedSample(id_, UserID(user), nodes, dt(time), name)
+
+    assert samplestorage.get_version_if_unchanged(s([n1, n2])) is None  # no sample
+
+    assert samplestorage.save_sample(s([n1, n2])) is True
+    assert samplestorage.get_version_if_unchanged(s([n1, n2])) == 1
+    # the user and save time are ignored
+    assert samplestorage.get_version_if_unchanged(s([n1, n2a], user='v', time=5)) == 1
+    assert samplestorage.get_version_if_unchanged(s([n1, n2], name='bar')) is None
+    assert samplestorage.get_version_if_unchanged(s([n1, n2b])) is None
+    assert samplestorage.get_version_if_unchanged(s([n1, n2, n3])) is None
+    assert samplestorage.get_version_if_unchanged(s([n1])) is None
+    assert samplestorage.get_version_if_unchanged(s([n1, n2], id_=id2)) is None
+
+    assert samplestorage.save_sample_version(s([n1, n2, n3])) == 2
+    assert samplestorage.get_version_if_unchanged(s([n1, n2])) is None
+    assert samplestorage.get_version_if_unchanged(s([n1, n2, n3])) == 2
+
+    # versions saved without a hash never match
+    # this is very naughty
+    samplestorage._col_version.update_match({}, {'hash': None}, keep_none=False)
+    assert samplestorage.get_version_if_unchanged(s([n1, n2, n3])) is None
+
+
+def _build_body_storage(samplestorage):
+    samplestorage._db.create_collection('node_body')
+    return _build_storage(samplestorage, node_body_collection='node_body')
+
+
+def test_save_and_get_sample_with_node_bodies(samplestorage):
+    ss = _build_body_storage(samplestorage)
+    n1 = SampleNode('root')
+    n2 = SampleNode(
+        'kid1', SubSampleType.TECHNICAL_REPLICATE, 'root',
+        {'a': {'b': 'c', 'd': 'e'}, 'f': {'g': 'h'}},
+        {'m': {'n': 'o'}},
+        [SourceMetadata('a', 'sk', {'a': 'b'}), SourceMetadata('f', 'sk', {'c': 'd'})])
+    n3 = SampleNode('kid2', SubSampleType.SUB_SAMPLE, 'kid1', {'a': {'b': 'c'}})
+    n4 = SampleNode('kid3', SubSampleType.TECHNICAL_REPLICATE, 'root',
+                    user_metadata={'f': {'g': 'h'}})
+    n4a = SampleNode('kid3', SubSampleType.TECHNICAL_REPLICATE, 'root',
+                     user_metadata={'f': {'g': 'i'}})
+    # same metadata as n2, in a different order
+    n2a = SampleNode(
+        'kid1', SubSampleType.TECHNICAL_REPLICATE, 'root',
+        {'f': {'g': 'h'}, 'a': {'d': 'e', 'b': 'c'}},
+        {'m': {'n': 'o'}},
+        [SourceMetadata('a', 'sk', {'a': 'b'}), SourceMetadata('f', 'sk', {'c': 'd'})])
+
+    id_ = uuid.UUID('1234567890abcdef1234567890abcdef')
+
+    assert ss.save_sample(
+        SavedSample(id_, UserID('auser'), [n1, n2, n3, n4], dt(8), 'foo')) is True
+    assert ss._col_node_body.count() == 4
+    assert ss.save_sample_version(
+        SavedSample(id_, UserID('auser'), [n1, n2a, n3, n4a], dt(9), 'foo')) == 2
+    # only the changed node body is saved
+    assert ss._col_node_body.count() == 5
+
+    # this is very naughty
+    for n in ss._col_nodes.all():
+        assert n['body'].startswith(str(id_) + '_')
+        for f in ['cmeta', 'ucmeta', 'smeta']:
+            assert f not in n
+
+    assert ss.get_sample(id_, 1) == SavedSample(
+        id_, UserID('auser'), [n1, n2, n3, n4], dt(8), 'foo', 1)
+    assert ss.get_sample(id_) == SavedSample(
+        id_, UserID('auser'), [n1, n2, n3, n4a], dt(9), 'foo', 2)
+    assert ss.get_samples([{'id': id_, 'version': 1}, {'id': id_}]) == [
+        SavedSample(id_, UserID('auser'), [n1, n2, n3, n4], dt(8), 'foo', 1),
+        SavedSample(id_, UserID('auser'), [n1, n2, n3, n4a], dt(9), 'foo', 2)]
+
+    # bodies are shared between samples only by ID
+    id2 = uuid.UUID('1234567890abcdef1234567890abcdee')
+    assert ss.save_samples([(SavedSample(id2, UserID('u'), [n1, n2], dt(10), 'bar'),
+                             False, None)]) == [1]
+    assert ss._col_node_body.count() == 7
+    assert ss.get_sample(id2) == SavedSample(id2, UserID('u'), [n1, n2], dt(10), 'bar', 1)
 
+    # nodes saved without a body can still be read
+    id3 = uuid.UUID('1234567890abcdef1234567890abcded')
     assert samplestorage.save_sample(
-        SavedSample(id_, UserID('u'), [n1, n2, n3, n4], dt(1), 'foo')) is True
+        SavedSample(id3, UserID('u'), [n1, n2], dt(10), 'baz')) is True
+    assert ss.get_sample(id3) == SavedSample(id3, UserID('u'), [n1, n2], dt(10), 'baz', 1)
 
-    assert samplestorage.save_sample_version(
-        SavedSample(id_, UserID('u'), [n1, n2, n3, n4], dt(1), 'bar')) == 2
 
+def test_get_sample_with_missing_node_body(samplestorage):
+    ss = _build_body_storage(samplestorage)
+    id_ = uuid.UUID('1234567890abcdef1234567890abcdef')
+    assert ss.save_sample(SavedSample(id_, UserID('u'), [TEST_NODE], dt(1), 'foo')) is True
     # this is very naughty
-    sample = samplestorage._col_sample.find({}).next()
-    uuidver2 = sample['vers'][1]
+    uuidver = ss._col_sample.get(str(id_))['vers'][0]
+    bodykey = ss._col_nodes.all().next()['body']
+    ss._col_node_body.delete(bodykey)
 
-    samplestorage._col_nodes.update_match({'uuidver': uuidver2, 'name': 'kid2'}, {'ver': -1})
+    err = SampleStorageError(
+        f'Corrupt DB: Missing body {bodykey} for node foo of version {uuidver} of sample {id_}')
+    with raises(Exception) as got:
+        ss.get_sample(id_)
+    assert_exception_correct(got.value, err)
+    with raises(Exception) as got:
+        ss.get_samples([{'id': id_}])
+    assert_exception_correct(got.value, err)
 
-    samplestorage.start_consistency_checker(interval_sec=1)
-    samplestorage.start_consistency_checker(interval_sec=1)  # test that running twice does nothing
 
-    time.sleep(0.5)
+def test_startup_fail_bad_node_body_collection(samplestorage):
+    with raises(Exception) as got:
+        _build_storage(samplestorage, node_body_collection='node_edges')
+    assert_exception_correct(got.value, StorageInitError(
+        'node body collection node_edges is not a vertex collection'))
 
-    assert samplestorage._col_nodes.find({'uuidver': uuidver2, 'name': 'kid2'}).next()['ver'] == -1
 
-    time.sleep(1)
+def test_get_samples_with_versions(samplestorage):
+    n1 = SampleNode('root')
+    n2 = SampleNode('kid1', SubSampleType.TECHNICAL_REPLICATE, 'root')
 
-    assert samplestorage._col_version.count() == 2
-    assert samplestorage._col_ver_edge.count() == 2
-    assert samplestorage._col_nodes.count() == 8
-    assert samplestorage._col_node_edge.count() == 8
+    id1 = uuid.UUID('1234567890abcdef1234567890fbcdef')
+    id2 = uuid.UUID('1234567890abcdef1234567890fbcdea')
+
+    assert samplestorage.save_sample(
+        SavedSample(id1, UserID('auser'), [n1, n2], dt(1), 'foo')) is True
+    assert samplestorage.save_sample_version(
+        SavedSample(id1, UserID('auser2'), [n1], dt(2), 'foo2')) == 2
+    assert samplestorage.save_sample(
+        SavedSample(id2, UserID('buser'), [n1, n2], dt(3), 'bar')) is True
+
+    # this is very naughty
+    uuidver2 = samplestorage._col_sample.get(str(id1))['vers'][1]
+    samplestorage._col_version.update_match({'uuidver': uuidver2}, {'ver': -1})
+
+    assert samplestorage.get_samples([
+        {'id': id1, 'version': 1},
+        {'id': id2},
+        {'id': id1, 'version': None},
+        {'id': id1, 'version': 2},
+    ]) == [
+        SavedSample(id1, UserID('auser'), [n1, n2], dt(1), 'foo', 1),
+        SavedSample(id2, UserID('buser'), [n1, n2], dt(3), 'bar', 1),
+        SavedSample(id1, UserID('auser2'), [n1], dt(2), 'foo2', 2),
+        SavedSample(id1, UserID('auser2'), [n1], dt(2), 'foo2', 2),
+    ]
 
+    _wait_for_read_repairs(samplestorage)
     for v in samplestorage._col_version.all():
-        assert v['ver'] == 2 if v['uuidver'] == uuidver2 else 1
+        assert v['ver'] in (1, 2)
 
-    for v in samplestorage._col_nodes.all():
-        assert v['ver'] == 2 if v['uuidver'] == uuidver2 else 1
+    assert samplestorage.get_samples([]) == []
 
-    # test that pausing stops updating
-    samplestorage.stop_consistency_checker()
-    samplestorage.stop_consistency_checker()  # test that running twice in a row does nothing
 
-    samplestorage._col_nodes.update_match({'uuidver': uuidver2, 'name': 'kid2'}, {'ver': -1})
+def test_get_samples_fail_no_sample(samplestorage):
+    id1 = uuid.UUID('1234567890abcdef1234567890fbcdef')
+    assert samplestorage.save_sample(
+        SavedSample(id1, UserID('auser'), [TEST_NODE], dt(1), 'foo')) is True
 
-    time.sleep(1.5)
-    assert samplestorage._col_nodes.find({'uuidver': uuidver2, 'name': 'kid2'}).next()['ver'] == -1
+    with raises(Exception) as got:
+        samplestorage.get_samples([
+            {'id': id1, 'version': 1},
+            {'id': uuid.UUID('1234567890abcdef1234567890fbcdea'), 'version': 1}])
+    assert_exception_correct(
+        got.value, NoSuchSampleError('12345678-90ab-cdef-1234-567890fbcdea'))
 
-    samplestorage.start_consistency_checker(1)
+    with raises(Exception) as got:
+        samplestorage.get_samples([{'id': id1, 'version': 1}, {'id': id1, 'version': 2}])
+    assert_exception_correct(
+        got.value, NoSuchSampleVersionError('12345678-90ab-cdef-1234-567890fbcdef ver 2'))
 
-    time.sleep(1.5)
 
-    assert samplestorage._col_nodes.find({'uuidver': uuidver2, 'name': 'kid2'}).next()['ver'] == 2
+def test_get_sample_set_acls(samplestorage):
+    id1 = uuid.UUID('1234567890abcdef1234567890fbcdef')
+    id2 = uuid.UUID('1234567890abcdef1234567890fbcdea')
+    assert samplestorage.save_sample(
+        SavedSample(id1, UserID('auser'), [TEST_NODE], dt(1), 'foo')) is True
+    assert samplestorage.save_sample(
+        SavedSample(id2, UserID('buser'), [TEST_NODE], dt(2), 'bar')) is True
 
-    # leaving the checker running can occasionally interfere with other tests, deleting documents
-    # that are in the middle of the save process. Stop the checker and wait until the job must've
-    # run.
-    samplestorage.stop_consistency_checker()
-    time.sleep(1)
+    assert samplestorage.get_sample_set_acls([id2, id1, id2]) == [
+        SampleACL(UserID('buser'), dt(2), public_read=False),
+        SampleACL(UserID('auser'), dt(1), public_read=False),
+        SampleACL(UserID('buser'), dt(2), public_read=False),
+    ]
 
+    with raises(Exception) as got:
+        samplestorage.get_sample_set_acls(
+            [id1, uuid.UUID('1234567890abcdef1234567890fbcdeb'), id2])
+    assert_exception_correct(
+        got.value, NoSuchSampleError('12345678-90ab-cdef-1234-567890fbcdeb'))
 
-def dt(timestamp):
-    return datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc)
+    assert samplestorage.get_sample_set_acls(
+        [id1, uuid.UUID('1234567890abcdef1234567890fbcdeb')], exception=False) == [
+            SampleACL(UserID('auser'), dt(1), public_read=False), None]
 
 
-def test_save_and_get_sample(samplestorage):
+def test_save_samples(samplestorage):
     n1 = SampleNode('root')
-    n2 = SampleNode(
-        'kid1', SubSampleType.TECHNICAL_REPLICATE, 'root',
-        {'a': {'b': 'c', 'd': 'e'}, 'f': {'g': 'h'}},
-        {'m': {'n': 'o'}},
-        [SourceMetadata('a', 'sk', {'a': 'b'}), SourceMetadata('f', 'sk', {'c': 'd'})])
-    n3 = SampleNode('kid2', SubSampleType.SUB_SAMPLE, 'kid1', {'a': {'b': 'c'}})
-    n4 = SampleNode('kid3', SubSampleType.TECHNICAL_REPLICATE, 'root',
-                    user_metadata={'f': {'g': 'h'}})
+    n2 = SampleNode('kid1', SubSampleType.TECHNICAL_REPLICATE, 'root', {'a': {'b': 'c'}})
 
-    id_ = uuid.UUID('1234567890abcdef1234567890abcdef')
+    id1 = uuid.UUID('1234567890abcdef1234567890fbcdef')
+    id2 = uuid.UUID('1234567890abcdef1234567890fbcdea')
+    id3 = uuid.UUID('1234567890abcdef1234567890fbcdeb')
+    id4 = uuid.UUID('1234567890abcdef1234567890fbcdec')
 
     assert samplestorage.save_sample(
-        SavedSample(id_, UserID('auser'), [n1, n2, n3, n4], dt(8), 'foo')) is True
+        SavedSample(id2, UserID('auser'), [n1], dt(1), 'foo')) is True
+    assert samplestorage.save_sample(
+        SavedSample(id3, UserID('auser'), [n1], dt(1), 'bar')) is True
 
-    assert samplestorage.get_sample(id_) == SavedSample(
-        id_, UserID('auser'), [n1, n2, n3, n4], dt(8), 'foo', 1)
+    res = samplestorage.save_samples([
+        (SavedSample(id1, UserID('buser'), [n1, n2], dt(2), 'baz'), False, None),
+        (SavedSample(id2, UserID('buser'), [n2, n1], dt(3), 'foo2'), True, None),
+        (SavedSample(id3, UserID('buser'), [n1], dt(3), 'bar2'), True, 1),
+        (SavedSample(id4, UserID('buser'), [n1], dt(3), 'bat'), True, None),
+        ])
+    assert res[:3] == [1, 2, 2]
+    assert_exception_correct(res[3], NoSuchSampleError('12345678-90ab-cdef-1234-567890fbcdec'))
 
-    assert samplestorage.get_sample_acls(id_) == SampleACL(
-        UserID('auser'), dt(8), public_read=False)
+    assert samplestorage.get_samples([
+        {'id': id1, 'version': None},
+        {'id': id2, 'version': 2},
+        {'id': id3, 'version': 2}]) == [
+            SavedSample(id1, UserID('buser'), [n1, n2], dt(2), 'baz', 1),
+            SavedSample(id2, UserID('buser'), [n2, n1], dt(3), 'foo2', 2),
+            SavedSample(id3, UserID('buser'), [n1], dt(3), 'bar2', 2),
+        ]
+    assert samplestorage.get_sample_acls(id1) == SampleACL(
+        UserID('buser'), dt(2), public_read=False)
 
-def test_save_and_get_samples(samplestorage):
-    n1 = SampleNode('root')
-    n2 = SampleNode(
-        'kid1', SubSampleType.TECHNICAL_REPLICATE, 'root',
-        {'a': {'b': 'c', 'd': 'e'}, 'f': {'g': 'h'}},
-        {'m': {'n': 'o'}},
-        [SourceMetadata('a', 'sk', {'a': 'b'}), SourceMetadata('f', 'sk', {'c': 'd'})])
-    n3 = SampleNode('kid2', SubSampleType.SUB_SAMPLE, 'kid1', {'a': {'b': 'c'}})
-    n4 = SampleNode('kid3', SubSampleType.TECHNICAL_REPLICATE, 'root',
-                    user_metadata={'f': {'g': 'h'}})
+    for v in samplestorage._col_version.all():
+        assert v['ver'] > 0
+    for v in samplestorage._col_nodes.all():
+        assert 'ver' not in v
 
-    id1_ = uuid.UUID('1234567890abcdef1234567890fbcdef')
-    id2_ = uuid.UUID('1234567890abcdef1234567890fbcdea')
-    id3_ = uuid.UUID('1234567890abcdef1234567890fbcdeb')
+    assert samplestorage.save_samples([]) == []
+
+
+def test_save_samples_fail_per_sample(samplestorage):
+    id1 = uuid.UUID('1234567890abcdef1234567890fbcdef')
+    id2 = uuid.UUID('1234567890abcdef1234567890fbcdea')
+    id3 = uuid.UUID('1234567890abcdef1234567890fbcdeb')
 
-    # save three separate samples
-    assert samplestorage.save_sample(
-        SavedSample(id1_, UserID('auser'), [n1, n2, n3, n4], dt(8), 'foo')) is True
     assert samplestorage.save_sample(
-        SavedSample(id2_, UserID('auser'), [n1, n2, n3], dt(8), 'bar')) is True
+        SavedSample(id1, UserID('auser'), [TEST_NODE], dt(1), 'foo')) is True
+    assert samplestorage.save_sample_version(
+        SavedSample(id1, UserID('auser'), [TEST_NODE], dt(1), 'foo')) == 2
+
+    res = samplestorage.save_samples([
+        (SavedSample(id1, UserID('auser'), [TEST_NODE], dt(2), 'bar'), False, None),
+        (SavedSample(id2, UserID('auser'), [TEST_NODE], dt(2), 'bar'), False, None),
+        ])
+    assert_exception_correct(res[0], ConcurrencyError(
+        'Sample 12345678-90ab-cdef-1234-567890fbcdef already exists'))
+    assert res[1] == 1
+
+    res = samplestorage.save_samples([
+        (SavedSample(id1, UserID('auser'), [TEST_NODE], dt(2), 'bar'), True, 1),
+        (SavedSample(id3, UserID('auser'), [TEST_NODE], dt(2), 'bar'), True, None),
+        ])
+    assert_exception_correct(res[0], ConcurrencyError(
+        'Version required for sample 12345678-90ab-cdef-1234-567890fbcdef is 1, but current ' +
+        'version is 2'))
+    assert_exception_correct(res[1], NoSuchSampleError('12345678-90ab-cdef-1234-567890fbcdeb'))
+
+    assert samplestorage.get_sample(id1).version == 2
+
+
+def test_save_samples_version_race_condition(samplestorage):
+    # tests the case where a version is saved between the version check and the version update
+    id1 = uuid.UUID('1234567890abcdef1234567890fbcdef')
     assert samplestorage.save_sample(
-        SavedSample(id3_, UserID('auser'), [n1, n2, n4], dt(8), 'baz')) is True
+        SavedSample(id1, UserID('auser'), [TEST_NODE], dt(1), 'foo')) is True
+    s = SavedSample(id1, UserID('auser'), [TEST_NODE], dt(2), 'bar')
+
+    results = [None]
+    # this is a very bad and naughty thing to do
+    samplestorage._push_sample_versions([(s, True, 1)], {0: uuid.uuid4()}, [0], results)
+    assert results == [2]
+    samplestorage._push_sample_versions([(s, True, 1)], {0: uuid.uuid4()}, [0], results)
+    assert_exception_correct(results[0], ConcurrencyError(
+        'Version required for sample 12345678-90ab-cdef-1234-567890fbcdef is 1, but current ' +
+        'version is 2'))
+
+
+def test_save_samples_fail_bad_input(samplestorage):
+    s = SavedSample(uuid.UUID('1234567890abcdef1234567890fbcdef'), UserID('u'), [TEST_NODE], dt(1))
+    _save_samples_fail(samplestorage, None, ValueError('samples cannot be None'))
+    _save_samples_fail(samplestorage, [(s, False, None), None], ValueError(
+        'Index 1 of iterable samples cannot be a value that evaluates to false'))
+    _save_samples_fail(samplestorage, [(s, False, None), (None, False, None)], ValueError(
+        'sample at index 1 cannot be a value that evaluates to false'))
+    _save_samples_fail(samplestorage, [(s, True, 0)], ValueError(
+        'prior_version at index 0 must be > 0'))
+    _save_samples_fail(samplestorage, [(s, True, None), (s, True, None)], ValueError(
+        'Duplicate sample ID at index 1: 12345678-90ab-cdef-1234-567890fbcdef'))
+
+
+def _save_samples_fail(samplestorage, samples, expected):
+    with raises(Exception) as got:
+        samplestorage.save_samples(samples)
+    assert_exception_correct(got.value, expected)
 
-    assert samplestorage.get_samples([
-        {"id": id1_, "version": 1},
-        {"id": id2_, "version": 1},
-        {"id": id3_, "version": 1}
-    ]) == [
-        SavedSample(id1_, UserID('auser'), [n1, n2, n3, n4], dt(8), 'foo', 1),
-        SavedSample(id2_, UserID('auser'), [n1, n2, n3], dt(8), 'bar', 1),
-        SavedSample(id3_, UserID('auser'), [n1, n2, n4], dt(8), 'baz', 1)
-    ]
 
 def test_save_sample_fail_bad_input(samplestorage):
     with raises(Exception) as got:
@@ -749,19 +1896,62 @@ def test_save_sample_fail_duplicate(samplestorage):
         SavedSample(id_, UserID('user1'), [TEST_NODE], dt(1), 'bar')) is False
 
 
-def test_save_sample_fail_duplicate_race_condition(samplestorage):
+def test_save_sample_fail_duplicate_leaves_docs_for_reaper(samplestorage):
     id_ = uuid.UUID('1234567890abcdef1234567890abcdef')
     assert samplestorage.save_sample(
         SavedSample(id_, UserID('user'), [TEST_NODE], dt(1), 'foo')) is True
 
-    # this is a very bad and naughty thing to do
-    assert samplestorage._save_sample_pt2(
+    assert samplestorage.save_sample(
         SavedSample(id_, UserID('user'), [TEST_NODE], dt(1), 'bar')) is False
 
+    # the version and node docs from the failed save are not committed
+    assert samplestorage._col_version.count() == 2
+    assert samplestorage._col_nodes.count() == 2
+    assert samplestorage._col_journal.count() == 1
+    assert samplestorage.get_sample(id_) == SavedSample(
+        id_, UserID('user'), [TEST_NODE], dt(1), 'foo', 1)
+
+
+def test_save_sample_chunked_inserts(samplestorage):
+    ss = _build_storage(samplestorage, insert_chunk_size=2)
+    n1 = SampleNode('root')
+    n2 = SampleNode('kid1', SubSampleType.TECHNICAL_REPLICATE, 'root')
+    n3 = SampleNode('kid2', SubSampleType.SUB_SAMPLE, 'kid1')
+    n4 = SampleNode('kid3', SubSampleType.TECHNICAL_REPLICATE, 'root')
+    n5 = SampleNode('kid4', SubSampleType.TECHNICAL_REPLICATE, 'root')
+    id1 = uuid.UUID('1234567890abcdef1234567890abcdef')
+    id2 = uuid.UUID('1234567890abcdef1234567890abcdea')
+
+    assert ss.save_sample(
+        SavedSample(id1, UserID('user'), [n1, n2, n3, n4, n5], dt(1), 'foo')) is True
+    assert ss.save_sample_version(
+        SavedSample(id1, UserID('user'), [n1, n2, n3], dt(2), 'bar')) == 2
+    assert ss.save_samples([
+        (SavedSample(id2, UserID('user'), [n1, n2, n3, n4], dt(3), 'baz'), False, None),
+        (SavedSample(id1, UserID('user'), [n1, n4, n5], dt(4), 'bat'), True, None)]) == [1, 3]
+
+    assert ss.get_sample(id1, 1) == SavedSample(
+        id1, UserID('user'), [n1, n2, n3, n4, n5], dt(1), 'foo', 1)
+    assert ss.get_sample(id1, 2) == SavedSample(
+        id1, UserID('user'), [n1, n2, n3], dt(2), 'bar', 2)
+    assert ss.get_sample(id1) == SavedSample(
+        id1, UserID('user'), [n1, n4, n5], dt(4), 'bat', 3)
+    assert ss.get_sample(id2) == SavedSample(
+        id2, UserID('user'), [n1, n2, n3, n4], dt(3), 'baz', 1)
+    assert ss._col_nodes.count() == 15
+    assert ss._col_journal.count() == 0
+
+
+def test_insert_chunk_size_fail_bad_args(samplestorage):
+    for size in [None, 0, -1]:
+        with raises(Exception) as got:
+            _build_storage(samplestorage, insert_chunk_size=size)
+        assert_exception_correct(got.value, ValueError('insert_chunk_size must be > 0'))
+
 
 def test_get_sample_with_non_updated_version_doc(samplestorage):
     # simulates the case where a save failed part way through. The version UUID was added to the
-    # sample doc but the node and version doc updates were not completed
+    # sample doc but the version doc update was not completed
     n1 = SampleNode('root')
     n2 = SampleNode('kid1', SubSampleType.TECHNICAL_REPLICATE, 'root')
     n3 = SampleNode('kid2', SubSampleType.SUB_SAMPLE, 'kid1')
@@ -775,24 +1965,23 @@ def test_get_sample_with_non_updated_version_doc(samplestorage):
     # this is very naughty
     # checked that these modifications actually work by viewing the db contents
     samplestorage._col_version.update_match({}, {'ver': -1})
-    samplestorage._col_nodes.update_match({'name': 'kid2'}, {'ver': -1})
 
     assert samplestorage.get_sample(id_) == SavedSample(
         id_, UserID('auser'), [n1, n2, n3, n4], dt(1), 'foo', 1)
 
+    _wait_for_read_repairs(samplestorage)
     for v in samplestorage._col_version.all():
         assert v['ver'] == 1
 
     for v in samplestorage._col_nodes.all():
-        assert v['ver'] == 1
+        assert 'ver' not in v
 
 
-def test_get_sample_with_non_updated_node_doc(samplestorage):
-    # simulates the case where a save failed part way through. The version UUID was added to the
-    # sample doc but the node doc updates were not completed
-    # the version doc update *must* have been updated for this test to exercise the
-    # node checking logic because a non-updated version doc will cause the nodes to be updated
-    # immediately.
+def test_get_sample_ignores_v1_node_versions(samplestorage):
+    # simulates node docs saved under v1 of the schema by a save that failed part way through.
+    # The version UUID was added to the sample doc and the version doc was updated, but the node
+    # doc updates were not completed. The version doc is the commit marker, so the node docs are
+    # left alone.
     n1 = SampleNode('root')
     n2 = SampleNode('kid1', SubSampleType.TECHNICAL_REPLICATE, 'root')
     n3 = SampleNode('kid2', SubSampleType.SUB_SAMPLE, 'kid1')
@@ -810,8 +1999,7 @@ def test_get_sample_with_non_updated_node_doc(samplestorage):
     assert samplestorage.get_sample(id_) == SavedSample(
         id_, UserID('auser'), [n1, n2, n3, n4], dt(1), 'foo', 1)
 
-    for v in samplestorage._col_nodes.all():
-        assert v['ver'] == 1
+    assert samplestorage._col_nodes.find({'name': 'kid1'}).next()['ver'] == -1
 
 
 def test_get_sample_with_missing_source_metadata_key(samplestorage, arango):
@@ -856,14 +2044,13 @@ def test_get_sample_with_missing_source_metadata_key(samplestorage, arango):
     del doc['uuidver']
     assert doc == {
         'id': str(id1),
-        'ver': 1,
         'saved': 7000,
         'name': 'mynode',
         'type': 'BIOLOGICAL_REPLICATE',
         'parent': None,
         'index': 0,
-        'cmeta': [{'k': 'c', 'ok': 'a', 'v': 'd'}],
-        'ucmeta': [],
+        'cmeta': {'a': {'c': 'd'}},
+        'ucmeta': {},
     }
 
     assert samplestorage.get_sample(id1) == SavedSample(
@@ -875,6 +2062,31 @@ def test_get_sample_with_missing_source_metadata_key(samplestorage, arango):
         1)
 
 
+def test_get_sample_with_v2_metadata(samplestorage):
+    '''
+    Checks that nodes with metadata stored in the v2 list format, which may exist during a
+    migration, can be read.
+    '''
+    id_ = uuid.UUID('1234567890abcdef1234567890abcdef')
+    n = SampleNode('mynode', SubSampleType.BIOLOGICAL_REPLICATE, None,
+                   {'a': {'c': 'd', 'e': 1}, 'f': {'g': True}},
+                   {'h': {'i': 2.5}},
+                   [SourceMetadata('a', 'sk', {'x': 'y'}), SourceMetadata('f', 'sk2', {'z': 1})])
+    assert samplestorage.save_sample(SavedSample(id_, UserID('user'), [n], dt(7), 'foo')) is True
+
+    # this is very naughty
+    samplestorage._col_nodes.update_match({'name': 'mynode'}, {
+        'cmeta': [{'ok': 'a', 'k': 'c', 'v': 'd'},
+                  {'ok': 'f', 'k': 'g', 'v': True},
+                  {'ok': 'a', 'k': 'e', 'v': 1}],
+        'ucmeta': [{'ok': 'h', 'k': 'i', 'v': 2.5}],
+        'smeta': [{'k': 'a', 'sk': 'sk', 'v': {'x': 'y'}}, {'k': 'f', 'sk': 'sk2', 'v': {'z': 1}}]
+        }, merge=False)
+
+    assert samplestorage.get_sample(id_) == SavedSample(
+        id_, UserID('user'), [n], dt(7), 'foo', 1)
+
+
 def test_get_sample_fail_bad_input(samplestorage):
     with raises(Exception) as got:
         samplestorage.get_sample(None)
@@ -963,7 +2175,7 @@ def test_get_sample_fail_no_node_docs_1_version(samplestorage):
         SavedSample(id_, UserID('user'), [TEST_NODE], dt(1), 'foo')) is True
 
     # this is very naughty
-    nodedoc_filters = {'id': '12345678-90ab-cdef-1234-567890abcdef', 'ver': 1}
+    nodedoc_filters = {'uuidver': samplestorage._col_sample.get(str(id_))['vers'][0]}
     nodedoc = samplestorage._col_nodes.find(nodedoc_filters).next()
     samplestorage._col_nodes.delete_match(nodedoc_filters)
 
@@ -984,7 +2196,7 @@ def test_get_sample_fail_no_node_docs_2_versions(samplestorage):
         SavedSample(id_, UserID('user'), [TEST_NODE], dt(1), 'bar')) == 2
 
     # this is very naughty
-    nodedoc_filters = {'id': '12345678-90ab-cdef-1234-567890abcdef', 'ver': 2}
+    nodedoc_filters = {'uuidver': samplestorage._col_sample.get(str(id_))['vers'][1]}
     nodedoc = samplestorage._col_nodes.find(nodedoc_filters).next()
     samplestorage._col_nodes.delete_match(nodedoc_filters)
 
@@ -1081,7 +2293,8 @@ def test_save_sample_version_fail_prior_version(samplestorage):
 
 
 def test_sample_version_update(samplestorage):
-    # tests that the versions on node and version documents are updated correctly
+    # tests that the versions on version documents are updated correctly and node documents
+    # are never updated
     id_ = uuid.UUID('1234567890abcdef1234567890abcdef')
     assert samplestorage.save_sample(
         SavedSample(id_, UserID('user'), [SampleNode('baz')], dt(1), 'foo')) is True
@@ -1105,8 +2318,8 @@ def test_sample_version_update(samplestorage):
     nodes = set()
     # this is naughty
     for n in samplestorage._col_nodes.find({'id': idstr}):
-        nodes.add((n['name'], n['ver']))
-    assert nodes == {('baz', 1), ('bat', 2)}
+        nodes.add((n['name'], n.get('ver')))
+    assert nodes == {('baz', None), ('bat', None)}
 
 
 def test_get_sample_acls_with_missing_public_read_key(samplestorage, arango):
@@ -1167,6 +2380,79 @@ def test_get_sample_acls_fail_no_sample(samplestorage):
         got.value, NoSuchSampleError('12345678-90ab-cdef-1234-567890abcdea'))
 
 
+def test_get_sample_acls_cache_strict(samplestorage):
+    ss2 = _build_storage(samplestorage)
+    id_ = uuid.UUID('1234567890abcdef1234567890abcdef')
+    assert samplestorage.save_sample(
+        SavedSample(id_, UserID('user'), [TEST_NODE], dt(1), 'foo')) is True
+
+    assert samplestorage.get_sample_acls(id_) == SampleACL(UserID('user'), dt(1))
+    # this is very naughty
+    assert samplestorage._acl_cache.get(str(id_)) == (SampleACL(UserID('user'), dt(1)), 1)
+
+    # changes made by other processes are seen immediately
+    ss2.replace_sample_acls(id_, SampleACL(UserID('user'), dt(5), read=[UserID('foo')]))
+    assert samplestorage.get_sample_acls(id_) == SampleACL(
+        UserID('user'), dt(5), read=[UserID('foo')])
+    assert samplestorage.get_sample_set_acls([id_]) == [SampleACL(
+        UserID('user'), dt(5), read=[UserID('foo')])]
+
+    ss2.update_sample_acls(id_, SampleACLDelta(write=[UserID('bar')]), dt(6))
+    assert samplestorage.get_sample_set_acls([id_]) == [SampleACL(
+        UserID('user'), dt(6), write=[UserID('bar')], read=[UserID('foo')])]
+
+
+def test_get_sample_acls_cache_staleness(samplestorage):
+    ss1 = _build_storage(samplestorage, acl_cache_staleness=datetime.timedelta(seconds=10))
+    ss2 = _build_storage(samplestorage)
+    id1 = uuid.UUID('1234567890abcdef1234567890abcdef')
+    id2 = uuid.UUID('1234567890abcdef1234567890abcdee')
+    assert ss1.save_sample(SavedSample(id1, UserID('user'), [TEST_NODE], dt(1), 'foo')) is True
+    assert ss1.save_sample(SavedSample(id2, UserID('user'), [TEST_NODE], dt(1), 'foo')) is True
+
+    ss1._now = lambda: dt(100)
+    assert ss1.get_sample_acls(id1) == SampleACL(UserID('user'), dt(1))
+    assert ss1.get_sample_set_acls([id1, id2]) == [
+        SampleACL(UserID('user'), dt(1)), SampleACL(UserID('user'), dt(1))]
+
+    # changes made by other processes aren't seen until the next poll
+    ss2.replace_sample_acls(id1, SampleACL(UserID('user'), dt(105), read=[UserID('foo')]))
+    ss1._now = lambda: dt(109)
+    assert ss1.get_sample_acls(id1) == SampleACL(UserID('user'), dt(1))
+
+    ss1._now = lambda: dt(110)
+    assert ss1.get_sample_acls(id1) == SampleACL(UserID('user'), dt(105), read=[UserID('foo')])
+    assert ss1.get_sample_set_acls([id2]) == [SampleACL(UserID('user'), dt(1))]
+
+    # changes made by this process are seen immediately
+    ss1.update_sample_acls(id2, SampleACLDelta(admin=[UserID('bar')]), dt(111))
+    assert ss1.get_sample_acls(id2) == SampleACL(UserID('user'), dt(111), admin=[UserID('bar')])
+    ss1.replace_sample_acls(id1, SampleACL(UserID('user'), dt(112)))
+    assert ss1.get_sample_set_acls([id1, id2]) == [
+        SampleACL(UserID('user'), dt(112)),
+        SampleACL(UserID('user'), dt(111), admin=[UserID('bar')])]
+
+    # the poll allows for clock skew between servers
+    ss2.replace_sample_acls(id2, SampleACL(UserID('user'), dt(101)))
+    ss1._now = lambda: dt(120)
+    assert ss1.get_sample_acls(id2) == SampleACL(UserID('user'), dt(101))
+
+    with raises(Exception) as got:
+        ss1.get_sample_acls(uuid.UUID('1234567890abcdef1234567890abcdea'))
+    assert_exception_correct(
+        got.value, NoSuchSampleError('12345678-90ab-cdef-1234-567890abcdea'))
+
+
+def test_acl_cache_fail_bad_args(samplestorage):
+    with raises(Exception) as got:
+        _build_storage(samplestorage, acl_cache_staleness=datetime.timedelta(seconds=-1))
+    assert_exception_correct(got.value, ValueError('acl_cache_staleness must be >= 0'))
+
+    with raises(Exception) as got:
+        _build_storage(samplestorage, acl_cache_max_size=0)
+    assert_exception_correct(got.value, ValueError('acl_cache_max_size must be > 0'))
+
+
 def test_replace_sample_acls(samplestorage):
     id_ = uuid.UUID('1234567890abcdef1234567890abcdef')
     assert samplestorage.save_sample(
@@ -2256,8 +3542,8 @@ def test_create_data_link_correct_missing_versions(samplestorage):
     Checks that the version correction code runs when needed on creating a data link.
     Since the method is tested extensively in the get_sample tests, we only run one test here
     to ensure the method is called.
-    This test simulates a server coming up after a dirty shutdown, where version and
-    node doc integer versions have not been updated
+    This test simulates a server coming up after a dirty shutdown, where the version
+    doc integer version has not been updated
     '''
     n1 = SampleNode('root')
     n2 = SampleNode('kid1', SubSampleType.TECHNICAL_REPLICATE, 'root')
@@ -2272,7 +3558,6 @@ def test_create_data_link_correct_missing_versions(samplestorage):
     # this is very naughty
     # checked that these modifications actually work by viewing the db contents
     samplestorage._col_version.update_match({}, {'ver': -1})
-    samplestorage._col_nodes.update_match({'name': 'kid2'}, {'ver': -1})
 
     assert samplestorage.create_data_link(DataLink(
         uuid.uuid4(),
@@ -2282,6 +3567,7 @@ def test_create_data_link_correct_missing_versions(samplestorage):
         UserID('user'))
     ) is None
 
+    _wait_for_read_repairs(samplestorage)
     assert samplestorage._col_version.count() == 1
     assert samplestorage._col_ver_edge.count() == 1
     assert samplestorage._col_nodes.count() == 4
@@ -2290,9 +3576,6 @@ def test_create_data_link_correct_missing_versions(samplestorage):
     for v in samplestorage._col_version.all():
         assert v['ver'] == 1
 
-    for v in samplestorage._col_nodes.all():
-        assert v['ver'] == 1
-
 
 def test_create_data_link_fail_no_link(samplestorage):
     _create_data_link_fail(samplestorage, None, ValueError(
@@ -2416,6 +3699,125 @@ def test_create_data_link_fail_link_exists(samplestorage):
         )
 
 
+def test_create_data_link_update_retries_after_concurrent_update(samplestorage):
+    sid = uuid.UUID('1234567890abcdef1234567890abcdef')
+    assert samplestorage.save_sample(SavedSample(
+        sid, UserID('user'), [SampleNode('mynode'), SampleNode('mynode1'), SampleNode('mynode2')],
+        dt(1), 'foo')) is True
+    lid1 = uuid.UUID('1234567890abcdef1234567890abcde1')
+    lid2 = uuid.UUID('1234567890abcdef1234567890abcde2')
+    lid3 = uuid.UUID('1234567890abcdef1234567890abcde3')
+    duid = DataUnitID(UPA('1/1/1'))
+
+    samplestorage.create_data_link(DataLink(
+        lid1, duid, SampleNodeAddress(SampleAddress(sid, 1), 'mynode'), dt(100), UserID('usera')))
+
+    # this is naughty, but need to check race condition
+    # another call updates the link after the link is read but before it's replaced
+    update_links = samplestorage._update_links
+    concurrent = []
+
+    def update_links_with_race(*args):
+        if not concurrent:
+            concurrent.append(True)
+            samplestorage.create_data_link(DataLink(
+                lid2, duid, SampleNodeAddress(SampleAddress(sid, 1), 'mynode1'), dt(200),
+                UserID('userb')),
+                update=True)
+        return update_links(*args)
+
+    samplestorage._update_links = update_links_with_race
+
+    assert samplestorage.create_data_link(DataLink(
+        lid3, duid, SampleNodeAddress(SampleAddress(sid, 1), 'mynode2'), dt(300),
+        UserID('userc')),
+        update=True) == lid2
+
+    assert samplestorage.get_data_link(lid1).expired == dt(199.999)
+    assert samplestorage.get_data_link(lid2).expired == dt(299.999)
+    assert samplestorage.get_data_link(duid=duid).id == lid3
+    assert _link_counts(samplestorage) == {
+        f'sver_{_uuid_vers(samplestorage, sid)[1]}': 1, 'obj_1_1_1': 1}
+
+
+def test_create_data_link_fail_too_many_concurrent_updates(samplestorage):
+    # the retries for changed links and for write-write conflicts share one attempt budget
+    sid = uuid.UUID('1234567890abcdef1234567890abcdef')
+    assert samplestorage.save_sample(SavedSample(
+        sid, UserID('user'), [SampleNode('mynode')], dt(1), 'foo')) is True
+    duid = DataUnitID(UPA('1/1/1'))
+    sna = SampleNodeAddress(SampleAddress(sid, 1), 'mynode')
+    link = DataLink(uuid.uuid4(), duid, sna, dt(100), UserID('usera'))
+    samplestorage.create_data_link(link)
+    key = samplestorage._create_link_key(link)
+    col = samplestorage._col_data_link.name
+
+    # this is naughty, but need to check the retries are bounded
+    samplestorage._link_update_attempts = 4
+    execute = samplestorage._db.execute_transaction
+    calls = []
+    transactions = []
+
+    def execute_with_conflicts(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            # another call changes the link after it's read, so the link is read again
+            samplestorage._col_data_link.update({'_key': key, 'touched': 1})
+        elif len(calls) == 2:
+            # another transaction writes the link and doesn't commit, so every later
+            # transaction has a write-write conflict
+            tdb = samplestorage._db.begin_transaction(write=[col])
+            transactions.append(tdb)
+            tdb.collection(col).update({'_key': key, 'touched': 2})
+        return execute(*args, **kwargs)
+
+    samplestorage._db.execute_transaction = execute_with_conflicts
+    try:
+        _create_data_link_fail(
+            samplestorage,
+            DataLink(uuid.uuid4(), duid, sna, dt(200), UserID('userb')),
+            ConcurrencyError('Too many concurrent data link changes, please try again'),
+            update=True)
+    finally:
+        for tdb in transactions:
+            tdb.abort_transaction()
+    assert len(calls) == 4
+    assert samplestorage.get_data_link(duid=duid).id == link.id
+
+
+def test_create_data_link_concurrent_links_respect_limit(samplestorage):
+    # links to the same sample version from different threads conflict on the sample version's
+    # link count and are retried, so exactly max_links links are saved
+    ss = _samplestorage_with_max_links(samplestorage, 3)
+    sid = uuid.UUID('1234567890abcdef1234567890abcdef')
+    assert ss.save_sample(
+        SavedSample(sid, UserID('user'), [SampleNode('mynode')], dt(1), 'foo')) is True
+    results = []
+
+    def create(objid):
+        try:
+            ss.create_data_link(DataLink(
+                uuid.uuid4(),
+                DataUnitID(UPA(f'1/{objid}/1')),
+                SampleNodeAddress(SampleAddress(sid, 1), 'mynode'),
+                dt(100),
+                UserID('user')))
+            results.append(None)
+        except TooManyDataLinksError as e:
+            results.append(e)
+
+    threads = [threading.Thread(target=create, args=(i + 1,)) for i in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len([r for r in results if r is None]) == 3
+    assert len(results) == 10
+    assert ss._col_data_link.count() == 3
+    assert _link_counts(ss)[f'sver_{_uuid_vers(ss, sid)[1]}'] == 3
+
+
 def test_create_data_link_fail_too_many_links_from_ws_obj_basic(samplestorage):
     ss = _samplestorage_with_max_links(samplestorage, 3)
 
@@ -2473,164 +3875,117 @@ def test_create_data_link_fail_too_many_links_from_sample_ver_basic(samplestorag
         uuid.uuid4(),
         DataUnitID(UPA('1/1/1')),
         SampleNodeAddress(SampleAddress(id1, 1), 'mynode'),
-        dt(500),
-        UserID('user'))
-    )
-
-    ss.create_data_link(DataLink(
-        uuid.uuid4(),
-        DataUnitID(UPA('1/1/2')),
-        SampleNodeAddress(SampleAddress(id1, 1), 'mynode2'),
-        dt(500),
-        UserID('user'))
-    )
-
-    _create_data_link_fail(
-        ss,
-        DataLink(
-            uuid.uuid4(),
-            DataUnitID(UPA('1/1/3')),
-            SampleNodeAddress(SampleAddress(id1, 1), 'mynode'),
-            dt(1),
-            UserID('user')),
-        TooManyDataLinksError(
-            'More than 2 links from sample 12345678-90ab-cdef-1234-567890abcdef version 1')
-        )
-
-
-def test_create_data_link_fail_too_many_links_from_ws_obj_time_travel(samplestorage):
-    # tests that links that do not co-exist with the new link are not counted against the total.
-    ss = _samplestorage_with_max_links(samplestorage, 3)
-
-    id1 = uuid.UUID('1234567890abcdef1234567890abcdef')
-    assert ss.save_sample(
-        SavedSample(id1, UserID('user'), [SampleNode('mynode')], dt(1), 'foo')) is True
-    assert ss.save_sample_version(
-        SavedSample(id1, UserID('user'), [SampleNode('mynode')], dt(1), 'foo')) == 2
-
-    # completely outside the new sample time range.
-    _create_and_expire_data_link(
-        ss,
-        DataLink(
-            uuid.uuid4(),
-            DataUnitID(UPA('1/1/1')),
-            SampleNodeAddress(SampleAddress(id1, 1), 'mynode'),
-            dt(100),
-            UserID('user')),
-        dt(299),
-        UserID('user')
-    )
-
-    # expire matches create
-    _create_and_expire_data_link(
-        ss,
-        DataLink(
-            uuid.uuid4(),
-            DataUnitID(UPA('1/1/1'), '1'),
-            SampleNodeAddress(SampleAddress(id1, 2), 'mynode'),
-            dt(100),
-            UserID('user')),
-        dt(300),
-        UserID('user')
-    )
-
-    # overlaps create
-    _create_and_expire_data_link(
-        ss,
-        DataLink(
-            uuid.uuid4(),
-            DataUnitID(UPA('1/1/1'), '2'),
-            SampleNodeAddress(SampleAddress(id1, 1), 'mynode'),
-            dt(250),
-            UserID('user')),
-        dt(350),
-        UserID('user')
+        dt(500),
+        UserID('user'))
     )
 
-    # contained inside
-    _create_and_expire_data_link(
-        ss,
-        DataLink(
-            uuid.uuid4(),
-            DataUnitID(UPA('1/1/1'), '3'),
-            SampleNodeAddress(SampleAddress(id1, 2), 'mynode'),
-            dt(325),
-            UserID('user')),
-        dt(375),
-        UserID('user')
+    ss.create_data_link(DataLink(
+        uuid.uuid4(),
+        DataUnitID(UPA('1/1/2')),
+        SampleNodeAddress(SampleAddress(id1, 1), 'mynode2'),
+        dt(500),
+        UserID('user'))
     )
 
     _create_data_link_fail(
         ss,
         DataLink(
             uuid.uuid4(),
-            DataUnitID(UPA('1/1/1'), '8'),
+            DataUnitID(UPA('1/1/3')),
             SampleNodeAddress(SampleAddress(id1, 1), 'mynode'),
-            dt(300),
+            dt(1),
             UserID('user')),
-        TooManyDataLinksError('More than 3 links from workspace object 1/1/1')
+        TooManyDataLinksError(
+            'More than 2 links from sample 12345678-90ab-cdef-1234-567890abcdef version 1')
         )
 
 
-def test_create_data_link_fail_too_many_links_from_sample_ver_time_travel(samplestorage):
-    # tests that links that do not co-exist with the new link are not counted against the total.
+def test_create_data_link_fail_too_many_links_from_ws_obj_expired_links(samplestorage):
+    # tests that expired links are not counted against the total, including links that
+    # co-existed with the new link.
     ss = _samplestorage_with_max_links(samplestorage, 3)
 
     id1 = uuid.UUID('1234567890abcdef1234567890abcdef')
     assert ss.save_sample(
         SavedSample(id1, UserID('user'), [SampleNode('mynode')], dt(1), 'foo')) is True
+    assert ss.save_sample_version(
+        SavedSample(id1, UserID('user'), [SampleNode('mynode')], dt(1), 'foo')) == 2
 
-    # completely outside the new sample time range.
-    _create_and_expire_data_link(
-        ss,
-        DataLink(
-            uuid.uuid4(),
-            DataUnitID(UPA('1/1/1')),
-            SampleNodeAddress(SampleAddress(id1, 1), 'mynode'),
-            dt(100),
-            UserID('user')),
-        dt(299),
-        UserID('user')
-    )
+    for i, (ver, created, expired) in enumerate(
+            [(1, 100, 299), (2, 100, 300), (1, 250, 350), (2, 325, 375)]):
+        _create_and_expire_data_link(
+            ss,
+            DataLink(
+                uuid.uuid4(),
+                DataUnitID(UPA('1/1/1'), str(i)),
+                SampleNodeAddress(SampleAddress(id1, ver), 'mynode'),
+                dt(created),
+                UserID('user')),
+            dt(expired),
+            UserID('user')
+        )
 
-    # expire matches create
-    _create_and_expire_data_link(
-        ss,
-        DataLink(
+    for i, ver in enumerate([1, 2, 1]):
+        ss.create_data_link(DataLink(
             uuid.uuid4(),
-            DataUnitID(UPA('1/1/2')),
-            SampleNodeAddress(SampleAddress(id1, 1), 'mynode'),
-            dt(100),
-            UserID('user')),
-        dt(300),
-        UserID('user')
-    )
+            DataUnitID(UPA('1/1/1'), str(i + 4)),
+            SampleNodeAddress(SampleAddress(id1, ver), 'mynode'),
+            dt(400),
+            UserID('user'))
+        )
 
-    # overlaps create
-    _create_and_expire_data_link(
+    _create_data_link_fail(
         ss,
         DataLink(
             uuid.uuid4(),
-            DataUnitID(UPA('1/1/3')),
-            SampleNodeAddress(SampleAddress(id1, 1), 'mynode'),
-            dt(250),
+            DataUnitID(UPA('1/1/1'), '8'),
+            SampleNodeAddress(SampleAddress(id1, 2), 'mynode'),
+            dt(300),
             UserID('user')),
-        dt(350),
-        UserID('user')
+        TooManyDataLinksError('More than 3 links from workspace object 1/1/1')
+        )
+
+    # expiring a link frees up space for another
+    ss.expire_data_link(dt(500), UserID('user'), duid=DataUnitID(UPA('1/1/1'), '4'))
+    ss.create_data_link(DataLink(
+        uuid.uuid4(),
+        DataUnitID(UPA('1/1/1'), '8'),
+        SampleNodeAddress(SampleAddress(id1, 2), 'mynode'),
+        dt(600),
+        UserID('user'))
     )
 
-    # contained inside
-    _create_and_expire_data_link(
-        ss,
-        DataLink(
+
+def test_create_data_link_fail_too_many_links_from_sample_ver_expired_links(samplestorage):
+    # tests that expired links are not counted against the total, including links that
+    # co-existed with the new link.
+    ss = _samplestorage_with_max_links(samplestorage, 3)
+
+    id1 = uuid.UUID('1234567890abcdef1234567890abcdef')
+    assert ss.save_sample(
+        SavedSample(id1, UserID('user'), [SampleNode('mynode')], dt(1), 'foo')) is True
+
+    for i, (created, expired) in enumerate([(100, 299), (100, 300), (250, 350), (325, 375)]):
+        _create_and_expire_data_link(
+            ss,
+            DataLink(
+                uuid.uuid4(),
+                DataUnitID(UPA(f'1/1/{i + 1}')),
+                SampleNodeAddress(SampleAddress(id1, 1), 'mynode'),
+                dt(created),
+                UserID('user')),
+            dt(expired),
+            UserID('user')
+        )
+
+    for i in range(3):
+        ss.create_data_link(DataLink(
             uuid.uuid4(),
-            DataUnitID(UPA('1/1/4')),
+            DataUnitID(UPA(f'1/2/{i + 1}')),
             SampleNodeAddress(SampleAddress(id1, 1), 'mynode'),
-            dt(325),
-            UserID('user')),
-        dt(375),
-        UserID('user')
-    )
+            dt(400),
+            UserID('user'))
+        )
 
     _create_data_link_fail(
         ss,
@@ -2644,6 +3999,16 @@ def test_create_data_link_fail_too_many_links_from_sample_ver_time_travel(sample
                               '12345678-90ab-cdef-1234-567890abcdef version 1')
         )
 
+    # expiring a link frees up space for another
+    ss.expire_data_link(dt(500), UserID('user'), duid=DataUnitID(UPA('1/2/1')))
+    ss.create_data_link(DataLink(
+        uuid.uuid4(),
+        DataUnitID(UPA('1/1/9')),
+        SampleNodeAddress(SampleAddress(id1, 1), 'mynode'),
+        dt(600),
+        UserID('user'))
+    )
+
 
 def test_create_data_link_update_links_from_ws_object_count_limit(samplestorage):
     '''
@@ -2794,6 +4159,8 @@ def _samplestorage_with_max_links(samplestorage, max_links):
         samplestorage._col_ws.name,
         samplestorage._col_data_link.name,
         samplestorage._col_schema.name,
+        samplestorage._col_journal.name,
+        samplestorage._col_link_count.name,
         max_links=max_links)
 
 
@@ -2803,6 +4170,251 @@ def _create_data_link_fail(samplestorage, link, expected, update=False):
     assert_exception_correct(got.value, expected)
 
 
+def test_create_data_links(samplestorage):
+    id1 = uuid.UUID('1234567890abcdef1234567890abcdef')
+    id2 = uuid.UUID('1234567890abcdef1234567890abcdee')
+    assert samplestorage.save_sample(SavedSample(
+        id1, UserID('user'), [SampleNode('mynode'), SampleNode('mynode1')], dt(1), 'foo')) is True
+    assert samplestorage.save_sample(SavedSample(
+        id2, UserID('user'), [SampleNode('mynode')], dt(1), 'foo')) is True
+
+    assert samplestorage.create_data_links([]) == []
+
+    assert samplestorage.create_data_link(DataLink(
+        uuid.UUID('1234567890abcdef1234567890abcde1'),
+        DataUnitID(UPA('5/89/32')),
+        SampleNodeAddress(SampleAddress(id1, 1), 'mynode'),
+        dt(500),
+        UserID('usera'))
+    ) is None
+
+    l1 = DataLink(
+        uuid.UUID('1234567890abcdef1234567890abcde2'),
+        DataUnitID(UPA('5/89/32')),
+        SampleNodeAddress(SampleAddress(id2, 1), 'mynode'),  # update the sample
+        dt(600),
+        UserID('userb'))
+    l2 = DataLink(
+        uuid.UUID('1234567890abcdef1234567890abcde3'),
+        DataUnitID(UPA('5/89/32'), 'dataunit1'),
+        SampleNodeAddress(SampleAddress(id1, 1), 'mynode1'),
+        dt(600),
+        UserID('userb'))
+    l3 = DataLink(
+        uuid.UUID('1234567890abcdef1234567890abcde4'),
+        DataUnitID(UPA('5/89/33')),
+        SampleNodeAddress(SampleAddress(id1, 1), 'mynode'),
+        dt(600),
+        UserID('userb'))
+
+    assert samplestorage.create_data_links([l1, l2, l3], update=True) == [
+        uuid.UUID('1234567890abcdef1234567890abcde1'), None, None]
+
+    assert samplestorage._col_data_link.count() == 4
+
+    assert samplestorage.get_data_link(duid=DataUnitID(UPA('5/89/32'))) == l1
+    assert samplestorage.get_data_link(duid=DataUnitID(UPA('5/89/32'), 'dataunit1')) == l2
+    assert samplestorage.get_data_link(duid=DataUnitID(UPA('5/89/33'))) == l3
+    assert samplestorage.get_data_link(
+        uuid.UUID('1234567890abcdef1234567890abcde1')) == DataLink(
+            uuid.UUID('1234567890abcdef1234567890abcde1'),
+            DataUnitID(UPA('5/89/32')),
+            SampleNodeAddress(SampleAddress(id1, 1), 'mynode'),
+            dt(500),
+            UserID('usera'),
+            dt(599.999),
+            UserID('userb'))
+
+    # noop
+    assert samplestorage.create_data_links([DataLink(
+        uuid.UUID('1234567890abcdef1234567890abcde5'),
+        DataUnitID(UPA('5/89/33')),
+        SampleNodeAddress(SampleAddress(id1, 1), 'mynode'),
+        dt(700),
+        UserID('userc'))], update=True) == [None]
+
+    assert samplestorage._col_data_link.count() == 4
+
+
+def test_create_data_links_fail_bad_input(samplestorage):
+    id1 = uuid.UUID('1234567890abcdef1234567890abcdef')
+    sna = SampleNodeAddress(SampleAddress(id1, 1), 'mynode')
+    l1 = DataLink(uuid.uuid4(), DataUnitID(UPA('1/1/1')), sna, dt(1), UserID('u'))
+
+    _create_data_links_fail(samplestorage, None, ValueError('links cannot be None'))
+    _create_data_links_fail(samplestorage, [l1, None], ValueError(
+        'Index 1 of iterable links cannot be a value that evaluates to false'))
+    _create_data_links_fail(samplestorage, [l1, DataLink(
+        uuid.uuid4(), DataUnitID(UPA('1/1/2')), sna, dt(1), UserID('u'), dt(2))],
+        ValueError('link at index 1 cannot be expired'))
+    _create_data_links_fail(samplestorage, [l1, DataLink(
+        uuid.uuid4(), DataUnitID(UPA('1/1/1')), sna, dt(1), UserID('u'))],
+        ValueError('Duplicate data unit ID at index 1: 1/1/1'))
+
+
+def test_create_data_links_fail_no_sample_or_node(samplestorage):
+    id1 = uuid.UUID('1234567890abcdef1234567890abcdef')
+    id2 = uuid.UUID('1234567890abcdef1234567890abcdee')
+    assert samplestorage.save_sample(
+        SavedSample(id1, UserID('user'), [SampleNode('mynode')], dt(1), 'foo')) is True
+
+    l1 = DataLink(uuid.uuid4(), DataUnitID(UPA('1/1/1')),
+                  SampleNodeAddress(SampleAddress(id1, 1), 'mynode'), dt(1), UserID('u'))
+
+    _create_data_links_fail(samplestorage, [l1, DataLink(
+        uuid.uuid4(), DataUnitID(UPA('1/1/2')),
+        SampleNodeAddress(SampleAddress(id2, 1), 'mynode'), dt(1), UserID('u'))],
+        NoSuchSampleError('12345678-90ab-cdef-1234-567890abcdee'))
+    _create_data_links_fail(samplestorage, [l1, DataLink(
+        uuid.uuid4(), DataUnitID(UPA('1/1/2')),
+        SampleNodeAddress(SampleAddress(id1, 2), 'mynode'), dt(1), UserID('u'))],
+        NoSuchSampleVersionError('12345678-90ab-cdef-1234-567890abcdef ver 2'))
+    _create_data_links_fail(samplestorage, [l1, DataLink(
+        uuid.uuid4(), DataUnitID(UPA('1/1/2')),
+        SampleNodeAddress(SampleAddress(id1, 1), 'mynode2'), dt(1), UserID('u'))],
+        NoSuchSampleNodeError('12345678-90ab-cdef-1234-567890abcdef ver 1 mynode2'))
+
+    assert samplestorage._col_data_link.count() == 0
+
+
+def test_create_data_links_fail_link_exists(samplestorage):
+    id1 = uuid.UUID('1234567890abcdef1234567890abcdef')
+    assert samplestorage.save_sample(
+        SavedSample(id1, UserID('user'), [SampleNode('mynode')], dt(1), 'foo')) is True
+    sna = SampleNodeAddress(SampleAddress(id1, 1), 'mynode')
+
+    samplestorage.create_data_link(
+        DataLink(uuid.uuid4(), DataUnitID(UPA('1/1/1'), 'du1'), sna, dt(500), UserID('user')))
+
+    _create_data_links_fail(samplestorage, [
+        DataLink(uuid.uuid4(), DataUnitID(UPA('1/1/2')), sna, dt(600), UserID('user')),
+        DataLink(uuid.uuid4(), DataUnitID(UPA('1/1/1'), 'du1'), sna, dt(600), UserID('user'))],
+        DataLinkExistsError('1/1/1:du1'))
+
+    # check the batch was not partially saved
+    assert samplestorage._col_data_link.count() == 1
+
+
+def test_create_data_links_fail_too_many_links(samplestorage):
+    ss = _samplestorage_with_max_links(samplestorage, 2)
+
+    id1 = uuid.UUID('1234567890abcdef1234567890abcdef')
+    id2 = uuid.UUID('1234567890abcdef1234567890abcdee')
+    assert ss.save_sample(
+        SavedSample(id1, UserID('user'), [SampleNode('mynode')], dt(1), 'foo')) is True
+    assert ss.save_sample(
+        SavedSample(id2, UserID('user'), [SampleNode('mynode')], dt(1), 'foo')) is True
+    sna1 = SampleNodeAddress(SampleAddress(id1, 1), 'mynode')
+    sna2 = SampleNodeAddress(SampleAddress(id2, 1), 'mynode')
+
+    ss.create_data_link(DataLink(uuid.uuid4(), DataUnitID(UPA('1/1/1')), sna1, dt(500),
+                                 UserID('user')))
+
+    _create_data_links_fail(ss, [
+        DataLink(uuid.uuid4(), DataUnitID(UPA('1/1/1'), '1'), sna2, dt(600), UserID('user')),
+        DataLink(uuid.uuid4(), DataUnitID(UPA('1/1/1'), '2'), sna2, dt(600), UserID('user'))],
+        TooManyDataLinksError('More than 2 links from workspace object 1/1/1'))
+
+    _create_data_links_fail(ss, [
+        DataLink(uuid.uuid4(), DataUnitID(UPA('1/1/2')), sna1, dt(600), UserID('user')),
+        DataLink(uuid.uuid4(), DataUnitID(UPA('1/1/3')), sna1, dt(600), UserID('user'))],
+        TooManyDataLinksError(
+            'More than 2 links from sample 12345678-90ab-cdef-1234-567890abcdef version 1'))
+
+    assert ss._col_data_link.count() == 1
+
+    # exactly at the limit succeeds
+    assert ss.create_data_links([
+        DataLink(uuid.uuid4(), DataUnitID(UPA('1/1/1'), '1'), sna2, dt(600), UserID('user')),
+        DataLink(uuid.uuid4(), DataUnitID(UPA('1/1/2')), sna1, dt(600), UserID('user'))]
+        ) == [None, None]
+
+
+def _create_data_links_fail(samplestorage, links, expected, update=False):
+    with raises(Exception) as got:
+        samplestorage.create_data_links(links, update)
+    assert_exception_correct(got.value, expected)
+
+
+def _link_counts(samplestorage):
+    # this is very naughty
+    return {d['_key']: d['count'] for d in samplestorage._col_link_count.all()}
+
+
+def _uuid_vers(samplestorage, id_):
+    return {d['ver']: d['uuidver'] for d in samplestorage._col_version.find({'id': str(id_)})}
+
+
+def test_data_link_counts(samplestorage):
+    id1 = uuid.UUID('1234567890abcdef1234567890abcdef')
+    assert samplestorage.save_sample(
+        SavedSample(id1, UserID('user'), [SampleNode('mynode')], dt(1), 'foo')) is True
+    assert samplestorage.save_sample_version(
+        SavedSample(id1, UserID('user'), [SampleNode('mynode')], dt(1), 'foo')) == 2
+    sv = _uuid_vers(samplestorage, id1)
+    sna1 = SampleNodeAddress(SampleAddress(id1, 1), 'mynode')
+    sna2 = SampleNodeAddress(SampleAddress(id1, 2), 'mynode')
+
+    samplestorage.create_data_link(
+        DataLink(uuid.uuid4(), DataUnitID(UPA('1/1/1')), sna1, dt(500), UserID('user')))
+    samplestorage.create_data_links([
+        DataLink(uuid.uuid4(), DataUnitID(UPA('1/1/1'), '1'), sna1, dt(500), UserID('user')),
+        DataLink(uuid.uuid4(), DataUnitID(UPA('1/1/2')), sna2, dt(500), UserID('user'))])
+    assert _link_counts(samplestorage) == {
+        f'sver_{sv[1]}': 2, f'sver_{sv[2]}': 1, 'obj_1_1_1': 2, 'obj_1_1_2': 1}
+
+    # updating a link to another sample version moves the count
+    samplestorage.create_data_link(
+        DataLink(uuid.uuid4(), DataUnitID(UPA('1/1/1')), sna2, dt(600), UserID('user')),
+        update=True)
+    samplestorage.create_data_links([
+        DataLink(uuid.uuid4(), DataUnitID(UPA('1/1/2')), sna1, dt(600), UserID('user'))],
+        update=True)
+    assert _link_counts(samplestorage) == {
+        f'sver_{sv[1]}': 2, f'sver_{sv[2]}': 1, 'obj_1_1_1': 2, 'obj_1_1_2': 1}
+
+    samplestorage.expire_data_link(dt(700), UserID('user'), duid=DataUnitID(UPA('1/1/1')))
+    samplestorage.expire_data_link(dt(700), UserID('user'), duid=DataUnitID(UPA('1/1/2')))
+    assert _link_counts(samplestorage) == {
+        f'sver_{sv[1]}': 1, f'sver_{sv[2]}': 0, 'obj_1_1_1': 1, 'obj_1_1_2': 0}
+
+
+def test_rebuild_data_link_counts(samplestorage):
+    id1 = uuid.UUID('1234567890abcdef1234567890abcdef')
+    assert samplestorage.save_sample(
+        SavedSample(id1, UserID('user'), [SampleNode('mynode')], dt(1), 'foo')) is True
+    assert samplestorage.save_sample_version(
+        SavedSample(id1, UserID('user'), [SampleNode('mynode')], dt(1), 'foo')) == 2
+    sv = _uuid_vers(samplestorage, id1)
+    sna1 = SampleNodeAddress(SampleAddress(id1, 1), 'mynode')
+    sna2 = SampleNodeAddress(SampleAddress(id1, 2), 'mynode')
+
+    assert samplestorage.rebuild_data_link_counts() == 0
+    assert _link_counts(samplestorage) == {}
+
+    samplestorage.create_data_links([
+        DataLink(uuid.uuid4(), DataUnitID(UPA('1/1/1')), sna1, dt(500), UserID('user')),
+        DataLink(uuid.uuid4(), DataUnitID(UPA('1/1/1'), '1'), sna1, dt(500), UserID('user')),
+        DataLink(uuid.uuid4(), DataUnitID(UPA('1/1/2')), sna2, dt(500), UserID('user')),
+        DataLink(uuid.uuid4(), DataUnitID(UPA('2/1/1')), sna2, dt(500), UserID('user'))])
+    samplestorage.expire_data_link(dt(600), UserID('user'), duid=DataUnitID(UPA('2/1/1')))
+
+    # simulate counts that are missing or wrong, e.g. after an upgrade
+    samplestorage._col_link_count.truncate()
+    samplestorage._col_link_count.insert({'_key': 'obj_3_1_1', 'count': 6})
+
+    assert samplestorage.rebuild_data_link_counts() == 4
+    assert _link_counts(samplestorage) == {
+        f'sver_{sv[1]}': 2, f'sver_{sv[2]}': 1, 'obj_1_1_1': 2, 'obj_1_1_2': 1}
+
+    # the rebuilt counts are enforced
+    ss = _samplestorage_with_max_links(samplestorage, 2)
+    _create_data_link_fail(
+        ss,
+        DataLink(uuid.uuid4(), DataUnitID(UPA('1/1/1'), '2'), sna2, dt(700), UserID('user')),
+        TooManyDataLinksError('More than 2 links from workspace object 1/1/1'))
+
+
 def test_get_data_link_fail_no_bad_args(samplestorage):
     _get_data_link_fail(samplestorage, None, None, ValueError(
         'exactly one of id_ or duid must be provided'))
@@ -3461,12 +5073,82 @@ def test_get_links_from_sample_fail_no_sample_version(samplestorage):
 
 
 def _get_links_from_sample_fail(
-        samplestorage, sample_address, wsids, timestamp, expected):
+        samplestorage, sample_address, wsids, timestamp, expected, limit=None):
     with raises(Exception) as got:
-        samplestorage.get_links_from_sample(sample_address, wsids, timestamp)
+        samplestorage.get_links_from_sample(sample_address, wsids, timestamp, limit=limit)
     assert_exception_correct(got.value, expected)
 
 
+def _paged_link(id_, upa, sample, node):
+    return DataLink(
+        uuid.UUID(id_), DataUnitID(UPA(upa)), SampleNodeAddress(sample, node), dt(-100),
+        UserID('usera'))
+
+
+def test_get_links_from_sample_paged(samplestorage):
+    sid = uuid.UUID('1234567890abcdef1234567890abcdef')
+    assert samplestorage.save_sample(SavedSample(
+        sid, UserID('user'), [SampleNode('mynode')], dt(1), 'foo')) is True
+    sa = SampleAddress(sid, 1)
+    # created out of ID order
+    l1 = _paged_link('30000000-0000-0000-0000-000000000000', '1/1/1', sa, 'mynode')
+    l2 = _paged_link('10000000-0000-0000-0000-000000000000', '1/2/1', sa, 'mynode')
+    l3 = _paged_link('50000000-0000-0000-0000-000000000000', '1/3/1', sa, 'mynode')
+    l4 = _paged_link('20000000-0000-0000-0000-000000000000', '1/4/1', sa, 'mynode')
+    for link in [l1, l2, l3, l4]:
+        samplestorage.create_data_link(link)
+    # expired, so skipped by the page
+    _create_and_expire_data_link(
+        samplestorage,
+        _paged_link('40000000-0000-0000-0000-000000000000', '1/5/1', sa, 'mynode'),
+        dt(1),
+        UserID('userb'))
+
+    ss = samplestorage
+    assert ss.get_links_from_sample(sa, [1], dt(2)) == [l2, l4, l1, l3]
+    assert ss.get_links_from_sample(sa, [1], dt(2), limit=3) == [l2, l4, l1]
+    assert ss.get_links_from_sample(sa, None, dt(2), limit=3, after=l1.id) == [l3]
+    assert ss.get_links_from_sample(sa, [1], dt(2), limit=2, after=l2.id) == [l4, l1]
+    assert ss.get_links_from_sample(sa, [1], dt(2), after=l4.id) == [l1, l3]
+    assert ss.get_links_from_sample(sa, [1], dt(2), limit=2, after=l3.id) == []
+
+
+def test_get_links_from_sample_fail_bad_limit(samplestorage):
+    sa = SampleAddress(uuid.uuid4(), 1)
+    for limit in [0, -1]:
+        _get_links_from_sample_fail(
+            samplestorage, sa, [1], dt(1), ValueError('limit must be > 0'), limit=limit)
+
+
+def test_get_batch_links_from_samples_paged(samplestorage):
+    sid1 = uuid.UUID('1234567890abcdef1234567890abcdef')
+    sid2 = uuid.UUID('1234567890abcdef1234567890abcdee')
+    assert samplestorage.save_sample(SavedSample(
+        sid1, UserID('user'), [SampleNode('mynode')], dt(1), 'foo')) is True
+    assert samplestorage.save_sample(SavedSample(
+        sid2, UserID('user'), [SampleNode('mynode2')], dt(1), 'foo')) is True
+    sa1 = SampleAddress(sid1, 1)
+    sa2 = SampleAddress(sid2, 1)
+    l1 = _paged_link('30000000-0000-0000-0000-000000000000', '1/1/1', sa1, 'mynode')
+    l2 = _paged_link('10000000-0000-0000-0000-000000000000', '1/2/1', sa2, 'mynode2')
+    l3 = _paged_link('40000000-0000-0000-0000-000000000000', '1/3/1', sa1, 'mynode')
+    l4 = _paged_link('20000000-0000-0000-0000-000000000000', '1/4/1', sa2, 'mynode2')
+    for link in [l1, l2, l3, l4]:
+        samplestorage.create_data_link(link)
+
+    gb = samplestorage.get_batch_links_from_samples
+    assert gb([sa1, sa2], None, dt(2)) == [l2, l4, l1, l3]
+    # pages span the samples
+    assert gb([sa1, sa2], None, dt(2), limit=3) == [l2, l4, l1]
+    assert gb([sa1, sa2], None, dt(2), limit=3, after=l1.id) == [l3]
+    assert gb([sa2, sa1], [1], dt(2), limit=2, after=l2.id) == [l4, l1]
+    assert gb([sa1], [1], dt(2), after=l2.id) == [l1, l3]
+
+    with raises(Exception) as got:
+        gb([sa1], None, dt(2), limit=0)
+    assert_exception_correct(got.value, ValueError('limit must be > 0'))
+
+
 def test_get_links_from_data(samplestorage):
     sid1 = uuid.UUID('1234567890abcdef1234567890abcdef')
     sid2 = uuid.UUID('1234567890abcdef1234567890abcdee')
@@ -3636,9 +5318,199 @@ def test_get_links_from_data_fail_bad_args(samplestorage):
         'timestamp cannot be a naive datetime'))
 
 
-def _get_links_from_data_fail(samplestorage, upa, ts, expected):
+def _get_links_from_data_fail(samplestorage, upa, ts, expected, limit=None):
+    with raises(Exception) as got:
+        samplestorage.get_links_from_data(upa, ts, limit=limit)
+    assert_exception_correct(got.value, expected)
+
+
+def test_get_links_streamed(samplestorage):
+    ss = _build_storage(samplestorage, link_stream_batch_size=2)
+    sid1 = uuid.UUID('1234567890abcdef1234567890abcdef')
+    sid2 = uuid.UUID('1234567890abcdef1234567890abcdee')
+    assert ss.save_sample(SavedSample(
+        sid1, UserID('user'), [SampleNode('mynode')], dt(1), 'foo')) is True
+    assert ss.save_sample(SavedSample(
+        sid2, UserID('user'), [SampleNode('mynode2')], dt(1), 'foo')) is True
+    sa1 = SampleAddress(sid1, 1)
+    sa2 = SampleAddress(sid2, 1)
+    links = [
+        DataLink(uuid.UUID(f'{i}0000000-0000-0000-0000-000000000000'),
+                 DataUnitID(UPA('1/1/1'), str(i)), SampleNodeAddress(sa1, 'mynode'), dt(-100),
+                 UserID('usera'))
+        for i in range(1, 6)]
+    l6 = _paged_link('60000000-0000-0000-0000-000000000000', '1/2/1', sa2, 'mynode2')
+    for link in links + [l6]:
+        ss.create_data_link(link)
+
+    # without a limit the links are fetched from the database as the iterator is consumed
+    got = ss.get_links_from_sample(sa1, [1], dt(2))
+    assert not isinstance(got, list)
+    assert list(got) == links
+    got = ss.get_batch_links_from_samples([sa2, sa1], None, dt(2))
+    assert not isinstance(got, list)
+    assert list(got) == links + [l6]
+    got = ss.get_links_from_data(UPA('1/1/1'), dt(2), after=links[1].id)
+    assert not isinstance(got, list)
+    assert list(got) == links[2:]
+
+    # a partially consumed iterator can be abandoned
+    got = ss.get_links_from_data(UPA('1/1/1'), dt(2))
+    assert next(got) == links[0]
+    got.close()
+
+    # with a limit the results are bounded and returned as a list
+    assert ss.get_links_from_sample(sa1, [1], dt(2), limit=3) == links[:3]
+    assert ss.get_batch_links_from_samples([sa1], None, dt(2), limit=6) == links
+    assert ss.get_links_from_data(UPA('1/2/1'), dt(2), limit=1) == [l6]
+
+    # errors are thrown when the method is called, not when the iterator is consumed
+    with raises(Exception) as got:
+        ss.get_links_from_sample(SampleAddress(sid1, 2), [1], dt(2))
+    assert_exception_correct(got.value, NoSuchSampleVersionError(f'{sid1} ver 2'))
+
+
+def test_link_stream_batch_size_fail_bad_args(samplestorage):
+    for size in [None, -1]:
+        with raises(Exception) as got:
+            _build_storage(samplestorage, link_stream_batch_size=size)
+        assert_exception_correct(got.value, ValueError('link_stream_batch_size must be >= 0'))
+
+
+def test_get_links_from_data_paged(samplestorage):
+    sid = uuid.UUID('1234567890abcdef1234567890abcdef')
+    assert samplestorage.save_sample(SavedSample(
+        sid, UserID('user'), [SampleNode('mynode'), SampleNode('mynode2')], dt(1),
+        'foo')) is True
+    sa = SampleAddress(sid, 1)
+    l1 = DataLink(
+        uuid.UUID('30000000-0000-0000-0000-000000000000'), DataUnitID(UPA('1/1/1'), 'a'),
+        SampleNodeAddress(sa, 'mynode'), dt(-100), UserID('usera'))
+    l2 = DataLink(
+        uuid.UUID('10000000-0000-0000-0000-000000000000'), DataUnitID(UPA('1/1/1'), 'b'),
+        SampleNodeAddress(sa, 'mynode2'), dt(-100), UserID('usera'))
+    l3 = DataLink(
+        uuid.UUID('20000000-0000-0000-0000-000000000000'), DataUnitID(UPA('1/1/1')),
+        SampleNodeAddress(sa, 'mynode'), dt(-100), UserID('usera'))
+    for link in [l1, l2, l3]:
+        samplestorage.create_data_link(link)
+
+    gd = samplestorage.get_links_from_data
+    assert gd(UPA('1/1/1'), dt(2)) == [l2, l3, l1]
+    assert gd(UPA('1/1/1'), dt(2), limit=2) == [l2, l3]
+    assert gd(UPA('1/1/1'), dt(2), limit=2, after=l3.id) == [l1]
+    assert gd(UPA('1/1/1'), dt(2), after=l2.id) == [l3, l1]
+    assert gd(UPA('1/1/1'), dt(2), limit=2, after=l1.id) == []
+
+
+def test_get_links_from_data_fail_bad_limit(samplestorage):
+    for limit in [0, -1]:
+        _get_links_from_data_fail(
+            samplestorage, UPA('1/1/1'), dt(1), ValueError('limit must be > 0'), limit=limit)
+
+
+def _history_link(id_, duid, sample, node, created):
+    return DataLink(
+        uuid.UUID(id_), duid, SampleNodeAddress(sample, node), created, UserID('usera'))
+
+
+def test_get_link_history(samplestorage):
+    sid1 = uuid.UUID('1234567890abcdef1234567890abcdef')
+    sid2 = uuid.UUID('1234567890abcdef1234567890abcdee')
+    assert samplestorage.save_sample(SavedSample(
+        sid1, UserID('user'), [SampleNode('mynode')], dt(1), 'foo')) is True
+    assert samplestorage.save_sample_version(
+        SavedSample(sid1, UserID('user'), [SampleNode('mynode1')], dt(2), 'foo')) == 2
+    assert samplestorage.save_sample(SavedSample(
+        sid2, UserID('user'), [SampleNode('mynode2')], dt(3), 'foo')) is True
+    sa1 = SampleAddress(sid1, 1)
+    sa12 = SampleAddress(sid1, 2)
+    sa2 = SampleAddress(sid2, 1)
+
+    # created out of time and ID order
+    l1 = _history_link('50000000-0000-0000-0000-000000000000', DataUnitID(UPA('1/1/1'), 'a'),
+                       sa1, 'mynode', dt(10))
+    l2 = _history_link('20000000-0000-0000-0000-000000000000', DataUnitID(UPA('1/1/1')),
+                       sa12, 'mynode1', dt(5))
+    l3 = _history_link('40000000-0000-0000-0000-000000000000', DataUnitID(UPA('2/1/1')),
+                       sa1, 'mynode', dt(5))
+    l4 = _history_link('10000000-0000-0000-0000-000000000000', DataUnitID(UPA('1/1/1'), 'b'),
+                       sa2, 'mynode2', dt(20))
+    # different object version
+    l5 = _history_link('30000000-0000-0000-0000-000000000000', DataUnitID(UPA('1/1/2')),
+                       sa1, 'mynode', dt(1))
+    # expired links are included
+    l6 = _history_link('60000000-0000-0000-0000-000000000000', DataUnitID(UPA('1/1/1'), 'a'),
+                       sa12, 'mynode1', dt(-1))
+    _create_and_expire_data_link(samplestorage, l6, dt(7), UserID('userb'))
+    l6 = DataLink(l6.id, l6.duid, l6.sample_node_address, l6.created, l6.created_by, dt(7),
+                  UserID('userb'))
+    for link in [l1, l2, l3, l4, l5]:
+        samplestorage.create_data_link(link)
+
+    gh = samplestorage.get_link_history
+    assert gh(sid1, None, None, None) == [l6, l5, l2, l3, l1]
+    assert gh(sid1, None, None, [1]) == [l6, l5, l2, l1]
+    assert gh(sid1, None, None, []) == []
+    assert gh(None, UPA('1/1/1'), None, None) == [l6, l2, l1, l4]
+    assert gh(None, UPA('1/1/1'), None, [2]) == [l6, l2, l1, l4]  # wsids ignored for the UPA
+    assert gh(None, UPA('1/1/1'), 'a', None) == [l6, l1]
+    assert gh(sid1, UPA('1/1/1'), None, [1]) == [l6, l2, l1]
+    assert gh(sid1, UPA('1/1/1'), 'a', None) == [l6, l1]
+    assert gh(sid2, UPA('1/1/2'), None, None) == []
+
+
+def test_get_link_history_paged(samplestorage):
+    sid = uuid.UUID('1234567890abcdef1234567890abcdef')
+    assert samplestorage.save_sample(SavedSample(
+        sid, UserID('user'), [SampleNode('mynode')], dt(1), 'foo')) is True
+    sa = SampleAddress(sid, 1)
+    # links created at the same time are sorted by ID
+    l1 = _history_link('30000000-0000-0000-0000-000000000000', DataUnitID(UPA('1/1/1'), 'a'),
+                       sa, 'mynode', dt(5))
+    l2 = _history_link('10000000-0000-0000-0000-000000000000', DataUnitID(UPA('1/1/1'), 'b'),
+                       sa, 'mynode', dt(5))
+    l3 = _history_link('20000000-0000-0000-0000-000000000000', DataUnitID(UPA('1/1/1'), 'c'),
+                       sa, 'mynode', dt(6))
+    l4 = _history_link('40000000-0000-0000-0000-000000000000', DataUnitID(UPA('1/1/1'), 'd'),
+                       sa, 'mynode', dt(4))
+    for link in [l1, l2, l3, l4]:
+        samplestorage.create_data_link(link)
+
+    ss = _build_storage(samplestorage, link_stream_batch_size=1)
+    for gh in [samplestorage.get_link_history, ss.get_link_history]:
+        for s, u in [(sid, None), (None, UPA('1/1/1')), (sid, UPA('1/1/1'))]:
+            assert list(gh(s, u, None, None)) == [l4, l2, l1, l3]
+            assert gh(s, u, None, None, limit=2) == [l4, l2]
+            assert gh(s, u, None, [1], limit=2, after=(dt(5), l2.id)) == [l1, l3]
+            assert gh(s, u, None, None, limit=1, after=(dt(5), l1.id)) == [l3]
+            assert list(gh(s, u, None, None, after=(dt(4), l4.id))) == [l2, l1, l3]
+            assert gh(s, u, None, None, limit=2, after=(dt(6), l3.id)) == []
+
+
+def test_get_link_history_fail_bad_args(samplestorage):
+    sid = uuid.uuid4()
+    u = UPA('1/1/1')
+    _get_link_history_fail(samplestorage, None, None, None, [1], None, None, ValueError(
+        'At least one of sample or upa must be provided'))
+    _get_link_history_fail(samplestorage, sid, None, 'a', [1], None, None, ValueError(
+        'dataid requires an upa'))
+    _get_link_history_fail(samplestorage, sid, u, None, [1, None], None, None, ValueError(
+        'Index 1 of iterable readable_wsids cannot be a value that evaluates to false'))
+    for limit in [0, -1]:
+        _get_link_history_fail(samplestorage, sid, u, None, [1], limit, None, ValueError(
+            'limit must be > 0'))
+    _get_link_history_fail(
+        samplestorage, sid, u, None, [1], None, (datetime.datetime.fromtimestamp(1), sid),
+        ValueError('after time cannot be a naive datetime'))
+    _get_link_history_fail(samplestorage, sid, u, None, [1], None, (dt(1), None), ValueError(
+        'after ID cannot be a value that evaluates to false'))
+
+
+def _get_link_history_fail(
+        samplestorage, sample, upa, dataid, wsids, limit, after, expected):
     with raises(Exception) as got:
-        samplestorage.get_links_from_data(upa, ts)
+        samplestorage.get_link_history(sample, upa, dataid, wsids, limit=limit, after=after)
     assert_exception_correct(got.value, expected)
 
 
@@ -0,0 +1,103 @@
+import datetime
+import uuid
+
+from pytest import raises
+from core.test_utils import assert_exception_correct
+from SampleService.core.sample import SavedSample, SampleNode, SubSampleType, SourceMetadata
+from SampleService.core.storage.sample_cache import SampleCache, estimate_size
+from SampleService.core.user import UserID
+
+ID1 = uuid.UUID('1234567890abcdef1234567890abcdef')
+ID2 = uuid.UUID('1234567890abcdef1234567890abcdee')
+
+
+def dt(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc)
+
+
+def _sample(id_, version, name='foo'):
+    return SavedSample(id_, UserID('u'), [SampleNode('root')], dt(1), name, version)
+
+
+def test_init_fail():
+    for max_bytes in [None, -1]:
+        with raises(Exception) as got:
+            SampleCache(max_bytes)
+        assert_exception_correct(got.value, ValueError('max_bytes must be >= 0'))
+
+
+def test_get_and_put():
+    c = SampleCache(100000)
+    assert c.enabled is True
+    assert c.get(ID1, 1) is None
+
+    s1 = _sample(ID1, 1)
+    s2 = _sample(ID1, 2)
+    c.put(s1)
+    c.put(s2)
+    c.put(s2)  # replacing an entry doesn't change the size
+
+    assert c.get(ID1, 1) is s1
+    assert c.get(ID1, 2) is s2
+    assert c.get(ID1, 3) is None
+    assert c.get(ID2, 1) is None
+
+    assert c.get_stats() == {
+        'hits': 2,
+        'misses': 3,
+        'entries': 2,
+        'bytes': estimate_size(s1) + estimate_size(s2),
+        'max_bytes': 100000}
+
+
+def test_evict_least_recently_used():
+    s1 = _sample(ID1, 1)
+    s2 = _sample(ID1, 2)
+    s3 = _sample(ID2, 1)
+    size = estimate_size(s1)
+    assert estimate_size(s2) == size
+    assert estimate_size(s3) == size
+    c = SampleCache(2 * size)
+
+    c.put(s1)
+    c.put(s2)
+    assert c.get(ID1, 1) is s1  # s2 is now the least recently used
+    c.put(s3)
+
+    assert c.get(ID1, 1) is s1
+    assert c.get(ID1, 2) is None
+    assert c.get(ID2, 1) is s3
+    assert c.get_stats() == {
+        'hits': 3, 'misses': 1, 'entries': 2, 'bytes': 2 * size, 'max_bytes': 2 * size}
+
+
+def test_put_too_large():
+    s1 = _sample(ID1, 1)
+    c = SampleCache(estimate_size(s1) - 1)
+    c.put(s1)
+    assert c.get(ID1, 1) is None
+    assert c.get_stats()['entries'] == 0
+
+
+def test_disabled():
+    c = SampleCache(0)
+    assert c.enabled is False
+    c.put(_sample(ID1, 1))
+    assert c.get(ID1, 1) is None
+    assert c.get_stats() == {
+        'hits': 0, 'misses': 1, 'entries': 0, 'bytes': 0, 'max_bytes': 0}
+
+
+def test_estimate_size_includes_metadata():
+    bare = SavedSample(ID1, UserID('u'), [SampleNode('root')], dt(1), 'foo', 1)
+    meta = SavedSample(
+        ID1,
+        UserID('u'),
+        [SampleNode('root', SubSampleType.BIOLOGICAL_REPLICATE, None,
+                    {'a': {'b': 'c' * 1000}},
+                    {'d': {'e': 'f' * 1000}},
+                    [SourceMetadata('a', 'sk', {'g': 'h' * 1000})])],
+        dt(1),
+        'foo',
+        1)
+    assert estimate_size(meta) > estimate_size(bare) + 3000
@@ -0,0 +1,178 @@
+import multiprocessing
+import sqlite3
+import time
+import uuid
+
+from pytest import raises
+from core.test_utils import assert_exception_correct
+from SampleService.core.storage.shared_sample_cache import SharedSampleCache
+
+ID1 = uuid.UUID('1234567890abcdef1234567890abcdef')
+ID2 = uuid.UUID('1234567890abcdef1234567890abcdee')
+
+
+def test_init_fail(tmp_path):
+    for max_bytes in [None, -1]:
+        with raises(Exception) as got:
+            SharedSampleCache(str(tmp_path / 'cache'), max_bytes)
+        assert_exception_correct(got.value, ValueError('max_bytes must be >= 0'))
+
+
+def test_get_and_put(tmp_path):
+    c = SharedSampleCache(str(tmp_path / 'cache'), 1000)
+    assert c.enabled is True
+    assert c.get(ID1, 1) is None
+
+    c.put(ID1, 1, b'foo')
+    c.put(ID1, 2, b'bar')
+    c.put(ID1, 2, b'bar')  # adding an entry twice does nothing
+
+    assert c.get(ID1, 1) == b'foo'
+    assert c.get(ID1, 2) == b'bar'
+    assert c.get(ID1, 3) is None
+    assert c.get(ID2, 1) is None
+
+    assert c.get_stats() == {
+        'hits': 2, 'misses': 3, 'entries': 2, 'bytes': 6, 'max_bytes': 1000}
+
+
+def test_shared_between_instances(tmp_path):
+    c1 = SharedSampleCache(str(tmp_path / 'cache'), 1000)
+    c1.put(ID1, 1, b'foo')
+
+    # simulates a recycled worker process
+    c2 = SharedSampleCache(str(tmp_path / 'cache'), 1000)
+    assert c2.get(ID1, 1) == b'foo'
+    c2.put(ID2, 1, b'bar')
+    assert c1.get(ID2, 1) == b'bar'
+    assert c1.get_stats() == {
+        'hits': 1, 'misses': 0, 'entries': 2, 'bytes': 6, 'max_bytes': 1000}
+
+
+def _put_in_child(path):
+    SharedSampleCache(path, 1000).put(ID2, 1, b'child')
+
+
+def test_shared_between_processes(tmp_path):
+    path = str(tmp_path / 'cache')
+    c = SharedSampleCache(path, 1000)
+    c.put(ID1, 1, b'foo')
+
+    p = multiprocessing.Process(target=_put_in_child, args=(path,))
+    p.start()
+    p.join()
+    assert p.exitcode == 0
+
+    assert c.get(ID2, 1) == b'child'
+    assert c.get_stats()['entries'] == 2
+
+
+def test_evict_least_recently_used(tmp_path):
+    now = [1000.0]
+    c = SharedSampleCache(str(tmp_path / 'cache'), 30, timer=lambda: now[0])
+
+    c.put(ID1, 1, b'a' * 10)
+    now[0] += 1
+    c.put(ID1, 2, b'b' * 10)
+    now[0] += 100
+    # touch the first entry so the second entry is the least recently used
+    assert c.get(ID1, 1) == b'a' * 10
+    now[0] += 1
+    c.put(ID1, 3, b'c' * 10)
+    assert c.get_stats()['bytes'] == 30
+
+    now[0] += 1
+    # evicts the least recently used entry plus 10% of the cache size
+    c.put(ID2, 1, b'd' * 10)
+    assert c.get(ID1, 2) is None
+    assert c.get(ID1, 1) is None
+    assert c.get(ID1, 3) == b'c' * 10
+    assert c.get(ID2, 1) == b'd' * 10
+    assert c.get_stats()['bytes'] == 20
+    assert c.get_stats()['entries'] == 2
+
+
+def test_recent_reads_do_not_update_used_time(tmp_path):
+    now = [1000.0]
+    c = SharedSampleCache(str(tmp_path / 'cache'), 100, timer=lambda: now[0])
+
+    c.put(ID1, 1, b'a' * 40)
+    now[0] += 1
+    c.put(ID1, 2, b'b' * 40)
+    now[0] += 1
+    assert c.get(ID1, 1) == b'a' * 40  # too recent to update the used time
+    now[0] += 1
+    c.put(ID2, 1, b'c' * 40)
+
+    assert c.get(ID1, 1) is None
+    assert c.get(ID1, 2) == b'b' * 40
+    assert c.get(ID2, 1) == b'c' * 40
+
+
+def test_evictions_bounded(tmp_path):
+    c = SharedSampleCache(str(tmp_path / 'cache'), 1000)
+    for i in range(200):
+        c.put(ID1, i + 1, b'a' * 5)
+
+    # only 100 entries are evicted per put, so the cache exceeds its bound until the next put
+    c.put(ID2, 1, b'b' * 1000)
+    assert c.get_stats()['entries'] == 101
+    assert c.get_stats()['bytes'] == 1500
+    assert c.get(ID1, 100) is None
+    assert c.get(ID1, 101) == b'a' * 5
+
+    c.put(ID2, 2, b'c')
+    assert c.get_stats()['entries'] == 2
+    assert c.get_stats()['bytes'] == 1001
+
+
+def test_locked_cache_does_not_block(tmp_path):
+    now = [1000.0]
+    path = str(tmp_path / 'cache')
+    c = SharedSampleCache(path, 1000, timer=lambda: now[0])
+    c.put(ID1, 1, b'foo')
+    now[0] += 100
+
+    # another process holds the write lock
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute('BEGIN IMMEDIATE')
+    start = time.time()
+    assert c.get(ID1, 1) == b'foo'  # reads don't need the lock, and don't write
+    c.put(ID2, 1, b'bar')  # skipped
+    assert time.time() - start < 1
+    other.execute('ROLLBACK')
+    other.close()
+
+    assert c.get(ID2, 1) is None
+    # the last used time recorded by the read is written by the next put
+    c.put(ID2, 1, b'bar')
+    assert c.get(ID2, 1) == b'bar'
+    assert c._get_connection().execute(
+        'SELECT used FROM samples WHERE ver = 1 AND id = ?', (str(ID1),)).fetchone()[0] == 1100
+
+
+def test_put_too_large(tmp_path):
+    c = SharedSampleCache(str(tmp_path / 'cache'), 2)
+    c.put(ID1, 1, b'foo')
+    assert c.get(ID1, 1) is None
+    assert c.get_stats()['entries'] == 0
+
+
+def test_disabled(tmp_path):
+    for c in [SharedSampleCache(None, 1000), SharedSampleCache(str(tmp_path / 'cache'), 0)]:
+        assert c.enabled is False
+        c.put(ID1, 1, b'foo')
+        assert c.get(ID1, 1) is None
+        assert c.get_stats()['entries'] == 0
+    assert not (tmp_path / 'cache').exists()
+
+
+def test_read_error_is_a_miss(tmp_path):
+    c = SharedSampleCache(str(tmp_path / 'cache'), 1000)
+    c.put(ID1, 1, b'foo')
+    # this is very naughty
+    c._get_connection().execute('DROP TABLE samples')
+
+    assert c.get(ID1, 1) is None
+    c.put(ID1, 1, b'foo')  # doesn't throw
+    assert c.get_stats()['misses'] == 1
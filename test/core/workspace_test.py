@@ -332,6 +332,99 @@ def _has_permission_fail_ws_exception(ws_exception, expected):
     assert_exception_correct(got.value, expected)
 
 
+def test_has_permissions():
+    wsc = create_autospec(Workspace, spec_set=True, instance=True)
+
+    ws = WS(wsc)
+    wsc.administer.assert_called_once_with({'command': 'listModRequests'})
+
+    wsc.administer.side_effect = [
+        {'perms': [{'a': 'w', 'b': 'r'}, {'a': 'a'}]},
+        {'infos': [['objinfo'], ['objinfo'], ['objinfo']]}]
+
+    ws.has_permissions(
+        UserID('a'),
+        WorkspaceAccessType.WRITE,
+        [UPA('42/65/3'), UPA('7/1/1'), UPA('42/65/3'), UPA('42/2/1')])
+
+    wsc.administer.assert_any_call({'command': 'getPermissionsMass',
+                                    'params': {'workspaces': [{'id': 42}, {'id': 7}]}})
+    wsc.administer.assert_called_with({'command': 'getObjectInfo',
+                                       'params': {'objects': [{'ref': '42/65/3'},
+                                                              {'ref': '7/1/1'},
+                                                              {'ref': '42/2/1'}],
+                                                  'ignoreErrors': 1}})
+    assert wsc.administer.call_count == 3
+
+
+def test_has_permissions_empty():
+    wsc = create_autospec(Workspace, spec_set=True, instance=True)
+
+    ws = WS(wsc)
+
+    ws.has_permissions(UserID('a'), WorkspaceAccessType.READ, [])
+
+    assert wsc.administer.call_count == 1
+
+
+def test_has_permissions_fail_bad_input():
+    wsc = create_autospec(Workspace, spec_set=True, instance=True)
+    ws = WS(wsc)
+    r = WorkspaceAccessType.READ
+    u = UserID('b')
+
+    for perm, upas, expected in [
+            (None, [UPA('1/1/1')], ValueError('perm cannot be a value that evaluates to false')),
+            (r, None, ValueError('upas cannot be None')),
+            (r, [UPA('1/1/1'), None], ValueError(
+                'Index 1 of iterable upas cannot be a value that evaluates to false'))]:
+        with raises(Exception) as got:
+            ws.has_permissions(u, perm, upas)
+        assert_exception_correct(got.value, expected)
+
+
+def test_has_permissions_fail_unauthorized():
+    wsc = create_autospec(Workspace, spec_set=True, instance=True)
+
+    ws = WS(wsc)
+
+    wsc.administer.side_effect = [{'perms': [{'b': 'w'}, {'b': 'r', '*': 'r'}]}]
+
+    with raises(Exception) as got:
+        ws.has_permissions(
+            UserID('b'), WorkspaceAccessType.WRITE, [UPA('3/4/5'), UPA('6/7/8'), UPA('6/1/1')])
+    assert_exception_correct(got.value, UnauthorizedError('User b cannot write to upa 6/7/8'))
+
+
+def test_has_permissions_fail_on_get_perms_no_workspace():
+    wsc = create_autospec(Workspace, spec_set=True, instance=True)
+
+    ws = WS(wsc)
+
+    wsc.administer.side_effect = ServerError(
+        'JSONRPCError', -32500, 'No workspace with id 22 exists')
+
+    with raises(Exception) as got:
+        ws.has_permissions(UserID('b'), WorkspaceAccessType.READ, [UPA('22/1/1')])
+    assert_exception_correct(
+        got.value, NoSuchWorkspaceDataError('No workspace with id 22 exists'))
+
+
+def test_has_permissions_fail_no_object():
+    wsc = create_autospec(Workspace, spec_set=True, instance=True)
+
+    ws = WS(wsc)
+
+    wsc.administer.side_effect = [
+        {'perms': [{'a': 'w', 'b': 'r', 'c': 'a'}]},
+        {'infos': [['objinfo'], None]}]
+
+    with raises(Exception) as got:
+        ws.has_permissions(
+            UserID('b'), WorkspaceAccessType.READ, [UPA('67/8/90'), UPA('67/8/91')])
+    assert_exception_correct(got.value, NoSuchWorkspaceDataError('Object 67/8/91 does not exist'))
+
+
 def test_get_user_workspaces():
     _get_user_workspaces([], [], [])
     _get_user_workspaces([8, 89], [], [8, 89])